@@ -0,0 +1,298 @@
+"""
+投稿フロー（Selenium）全体のベンチマーク。模擬サイト（mock_x.py）に対してヘッドレスの Chrome で実行する。
+
+シナリオ:
+    thread  post_tweet 2.py の login() → post_to_twitter()（動画付きの本投稿とリプライの連結）
+    single  同上（1チャンクのみ。プロフィールでの URL 取得を省く経路）
+    sheets  post_tweet.py の AutoPoster.post_tweet_with_selenium()（サイドバーのボタンからの投稿）
+
+1回ごとに所要時間・WebDriver コマンド数・スパン（post_tweet.head / post_tweet.reply / selector.find）の時間を計り、
+模擬サイトに保存された投稿と照らして結果を分類する。
+
+    ok             成功と判定し、投稿もそろっている
+    false_success  成功と判定したが、投稿が欠けている・スレッドがつながっていない
+    false_failure  失敗と判定したが、投稿はそろっている（再試行すると二重投稿になる）
+    failed         失敗と判定し、投稿もそろっていない
+同じ本文が2回以上保存された場合は二重投稿として数える。
+
+    python3 bench_browser_flow.py --runs 5
+    python3 bench_browser_flow.py --scenario thread --fail "post_error=0.2,popup=0.1" --sleep-scale 0.2
+    python3 bench_browser_flow.py --latency "render=lognormal:800,0.6;upload=fixed:4000" --media-mb 8
+
+--sleep-scale は投稿スクリプト内の固定の time.sleep だけを縮める（WebDriverWait・アップロード監視の待ちはそのまま）。
+ヘッドレスの Chrome はOSのクリップボードを読めないため、pyperclip.copy は模擬サイトのクリップボードに向ける。
+selenium と Chrome（と post_tweet.py / post_tweet 2.py が読み込むパッケージ）が必要。
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+import tracing
+import mock_x
+from dom_queries import WebDriverCommandCounter
+from run_history import percentile
+from selector_registry import SelectorRegistry
+from text_splitter import split_for_twitter, weighted_limit
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ("thread", "single", "sheets")
+OUTCOMES = ("ok", "false_success", "false_failure", "failed")
+PHASE_SPANS = ("post_tweet.head", "post_tweet.reply", "selector.find")
+DEFAULT_TEXT = (
+    "転職活動で一番大事なのは、自分の強みを言語化することです。"
+    "面接では「なぜこの会社なのか」を必ず聞かれます。事前に企業研究をして、"
+    "自分の経験とどう結びつくかを整理しておきましょう。\n\n"
+    "また、逆質問の準備も忘れずに！入社後の働き方をイメージできる質問をすると、"
+    "意欲が伝わりやすくなります。最後に、面接後のお礼メールは簡潔に送るのがおすすめです。"
+    "書類選考で落ちる場合は、職務経歴書の最初の3行を見直してみてください。"
+    "採用担当者が最初に読むのはそこだけ、ということも珍しくありません。"
+)
+
+logger = logging.getLogger("bench_browser_flow")
+
+
+class ScaledTime:
+    """投稿スクリプトの固定待機（time.sleep）だけを縮める time モジュールの代わり。"""
+
+    def __init__(self, scale):
+        self.scale = scale
+
+    def sleep(self, secs):
+        time.sleep(secs * self.scale)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class ServerClipboard:
+    """pyperclip の代わりに、模擬サイトのクリップボードへコピーする。"""
+
+    def __init__(self, state):
+        self.state = state
+
+    def copy(self, text):
+        self.state.clipboard = text
+
+    def paste(self):
+        return self.state.clipboard
+
+
+class _SpanCollector:
+    """1回の実行中に閉じたスパンの時間を名前ごとに集める（tracing のリスナー）。"""
+
+    def __init__(self):
+        self.durations = {}
+
+    def __call__(self, record):
+        if record["name"] in PHASE_SPANS:
+            self.durations.setdefault(record["name"], []).append(record["dur_ms"])
+
+
+def make_driver(headed=False):
+    from selenium import webdriver
+
+    options = webdriver.ChromeOptions()
+    if not headed:
+        options.add_argument("--headless=new")
+    options.add_argument("--window-size=1280,1000")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument(f"--user-data-dir={tempfile.mkdtemp(prefix='mock_x_chrome_')}")
+    return webdriver.Chrome(options=options)
+
+
+def load_notion_module(server, sleep_scale):
+    from posting_daemon import load_post_module
+
+    module = load_post_module("bench_browser")
+    module.args = argparse.Namespace(account="bench", mode="question")
+    module.TWITTER_USERNAME = server.username
+    module.TWITTER_EMAIL = "mock@example.com"
+    module.TWITTER_PASSWORD = "mock-password"
+    module.SLACK_WEBHOOK_URL = None  # 失敗時の Slack 通知は送らない
+    # 本番のセレクタ統計（.cache/selector_stats.json）を汚さない
+    module.SELECTORS = SelectorRegistry(stats_path=None)
+    module.pyperclip = ServerClipboard(server.state)
+    module.time = ScaledTime(sleep_scale)
+    return module
+
+
+def load_sheets_poster(server, driver, sleep_scale):
+    import post_tweet
+
+    post_tweet.time = ScaledTime(sleep_scale)
+    post_tweet.pyperclip = ServerClipboard(server.state)
+    # config/ の設定ファイルを読まずに、投稿に必要な属性だけを持つインスタンスを作る
+    poster = post_tweet.AutoPoster.__new__(post_tweet.AutoPoster)
+    poster.config = {"twitter_account": {"username": server.username, "password": "mock-password"}}
+    poster.logger = logger
+    poster.driver = driver
+    poster.driver.implicitly_wait(10)  # _initialize_webdriver() と同じ設定
+    poster.is_logged_in = False
+    poster.account_name = "bench"
+    poster.api_v1 = poster.api_v2_client = None
+    poster.selectors = SelectorRegistry(stats_path=None)
+    return poster
+
+
+def make_media(media_dir, size_mb, index):
+    if size_mb <= 0:
+        return None
+    path = os.path.join(media_dir, f"bench_video_{index}.mp4")
+    with open(path, "wb") as f:
+        f.write(os.urandom(int(size_mb * 1024 * 1024)))
+    return path
+
+
+def classify(success, new_tweets, expected_texts, thread):
+    """
+    フローの判定と、模擬サイトに保存された投稿から結果を分類する。
+    Returns:
+        tuple: (結果, 二重投稿の数)
+    """
+    texts = [" ".join(t["text"].split()) for t in new_tweets]
+    duplicates = len(texts) - len(set(texts))
+    wanted = [" ".join(t.split()) for t in expected_texts]
+    complete = all(text in texts for text in wanted)
+    if complete and thread:
+        ordered = []
+        for text in wanted:
+            ordered.append(next(t for t in new_tweets if " ".join(t["text"].split()) == text))
+        complete = all(ordered[i]["reply_to"] == ordered[i - 1]["id"] for i in range(1, len(ordered)))
+    if success:
+        return ("ok" if complete else "false_success"), duplicates
+    return ("false_failure" if complete else "failed"), duplicates
+
+
+def run_scenario(scenario, server, args, chunks):
+    """
+    1つのシナリオを args.runs 回実行する。
+    Returns:
+        dict: 計測結果。
+    """
+    driver = make_driver(args.headed)
+    media_dir = tempfile.mkdtemp(prefix="mock_x_media_")
+    collector = _SpanCollector()
+    tracing.add_listener(collector)
+    runs = []
+    try:
+        if scenario == "sheets":
+            flow = load_sheets_poster(server, driver, args.sleep_scale)
+        else:
+            flow = load_notion_module(server, args.sleep_scale)
+        expected = chunks[:1] if scenario in ("single", "sheets") else chunks
+        for index in range(args.runs):
+            before = len(server.state.snapshot()["tweets"])
+            media_path = make_media(media_dir, args.media_mb, index)
+            started = time.perf_counter()
+            with WebDriverCommandCounter(driver) as counter:
+                try:
+                    if scenario == "sheets":
+                        success = bool(flow.post_tweet_with_selenium(expected[0], media_path))
+                    else:
+                        flow.login(driver)
+                        success = bool(flow.post_to_twitter(driver, expected, media_path))
+                except Exception as e:
+                    logger.warning(f"⚠️ {scenario} の {index + 1} 回目で例外: {e}")
+                    success = False
+            elapsed = time.perf_counter() - started
+            new_tweets = server.state.snapshot()["tweets"][before:]
+            outcome, duplicates = classify(success, new_tweets, expected, scenario == "thread")
+            runs.append({
+                "secs": elapsed,
+                "commands": counter.total,
+                "posts": len(new_tweets),
+                "outcome": outcome,
+                "duplicates": duplicates,
+            })
+            print(f"   {scenario} {index + 1}/{args.runs}: {outcome}（{elapsed:.1f}秒、コマンド {counter.total}）")
+    finally:
+        tracing.remove_listener(collector)
+        driver.quit()
+        shutil.rmtree(media_dir, ignore_errors=True)
+
+    secs = sorted(r["secs"] for r in runs)
+    return {
+        "scenario": scenario,
+        "runs": len(runs),
+        "outcomes": {name: sum(1 for r in runs if r["outcome"] == name) for name in OUTCOMES},
+        "p50_secs": round(percentile(secs, 50), 2),
+        "p95_secs": round(percentile(secs, 95), 2),
+        "max_secs": round(secs[-1], 2),
+        "commands_per_run": round(sum(r["commands"] for r in runs) / len(runs), 1),
+        "posts_per_run": round(sum(r["posts"] for r in runs) / len(runs), 2),
+        "duplicates": sum(r["duplicates"] for r in runs),
+        "spans": {
+            name: {"count": len(values), "p50_ms": round(percentile(sorted(values), 50), 1),
+                   "p95_ms": round(percentile(sorted(values), 95), 1)}
+            for name, values in collector.durations.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="投稿フロー（Selenium）のベンチマーク（模擬サイトで実行）")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="シナリオ。複数指定可（省略時は thread と single）")
+    parser.add_argument("--runs", type=int, default=3, help="シナリオごとの実行回数")
+    parser.add_argument("--text-file", help="投稿する本文のファイル（省略時は同梱のサンプル）")
+    parser.add_argument("--media-mb", type=float, default=2.0, help="添付する動画の大きさ（MB、0で添付なし）")
+    parser.add_argument("--latency", default=mock_x.DEFAULT_LATENCY, help="模擬サイトの応答時間（mock_x.py 参照）")
+    parser.add_argument("--fail", default="", help="失敗の注入率（例: post_error=0.1,popup=0.05）")
+    parser.add_argument("--seed", type=int, default=0, help="模擬サイトの乱数のシード")
+    parser.add_argument("--snapshots", default=mock_x.DEFAULT_SNAPSHOT_DIR, help="実際の画面の HTML のディレクトリ")
+    parser.add_argument("--snapshot-rate", type=float, default=0.5, help="/home・/compose/post を HTML から返す割合")
+    parser.add_argument("--sleep-scale", type=float, default=1.0, help="投稿スクリプトの固定待機の倍率")
+    parser.add_argument("--headed", action="store_true", help="ブラウザの画面を表示する")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    if args.text_file:
+        with open(args.text_file, "r", encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = DEFAULT_TEXT
+    chunks = split_for_twitter(text, weighted_limit(140))
+
+    server = mock_x.MockXServer(
+        username="mock_user", latency=args.latency, failures=args.fail, seed=args.seed,
+        snapshots=mock_x.load_snapshots(args.snapshots), snapshot_rate=args.snapshot_rate,
+    ).start()
+    # 投稿スクリプトは読み込み時に接続先を決めるため、読み込む前に設定する
+    os.environ["AUTO_POST_TWITTER_BASE_URL"] = server.url
+    print(f"🧪 模擬サイト: {server.url}（チャンク {len(chunks)} 件、HTML {len(server.snapshots)} 件）")
+
+    results = []
+    try:
+        for scenario in args.scenario or ["thread", "single"]:
+            results.append(run_scenario(scenario, server, args, chunks))
+    finally:
+        server.stop()
+    injected = server.state.snapshot()["injected"]
+
+    if args.json:
+        print(json.dumps({"results": results, "injected": injected}, ensure_ascii=False, indent=2))
+        return 0
+    print(f"{'シナリオ':<8} {'回数':>4} {'ok':>4} {'誤成功':>6} {'誤失敗':>6} {'失敗':>4} "
+          f"{'p50(秒)':>8} {'p95(秒)':>8} {'コマンド/回':>10} {'投稿/回':>7} {'二重投稿':>8}")
+    for r in results:
+        o = r["outcomes"]
+        print(
+            f"{r['scenario']:<8} {r['runs']:>4} {o['ok']:>4} {o['false_success']:>6} {o['false_failure']:>6} "
+            f"{o['failed']:>4} {r['p50_secs']:>8.2f} {r['p95_secs']:>8.2f} {r['commands_per_run']:>10} "
+            f"{r['posts_per_run']:>7} {r['duplicates']:>8}"
+        )
+        for name, span in sorted(r["spans"].items()):
+            print(f"   {name:<20} {span['count']:>4} 回  p50 {span['p50_ms'] / 1000:6.2f}秒  p95 {span['p95_ms'] / 1000:6.2f}秒")
+    if injected:
+        print("💉 注入した失敗: " + ", ".join(f"{name}={count}" for name, count in sorted(injected.items())))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""
+Notion・Google Sheets を使う処理のベンチマークと回帰確認（ネットワークなしで実行できる）。
+
+対象:
+    promote         promote_used_to_pending_minimum_batch.promote_if_needed()（投稿待ちの件数確認と補充）
+    get_valid_page  post_tweet 2.py の get_valid_page()（投稿待ちの取得）
+    sheets          post_tweet.py の fetch_posts_from_google_sheets()（シートからの投稿ストック取得）
+
+まず --record で実際の API に1回ずつ接続し、通信と結果を .cache/cassettes/ に記録する
+（トークン類は伏せ字にして保存。http_cassette.py）。以降はカセットから再生して --repeat 回計測し、
+結果が記録時と同じかを確認する（違う・記録にない通信があった場合は終了コード 1）。
+
+    python3 bench_http_flows.py --record --account 名前 --mode question --flow promote --flow get_valid_page
+    python3 bench_http_flows.py --record --flow sheets --sheet シート名 --worksheet ワークシート名
+    python3 bench_http_flows.py --account 名前 --latency "api.notion.com=lognormal:180,0.4"
+
+再生時の accounts.json は不要（データベースIDなどはカセットに保存している）。再生時のリクエストも
+記録時と同じ値で伏せ字にしてから照合する（accounts.json があればそのトークン類、なければ
+カセットに保存した値に含まれていたものだけ）。
+sheets はサービスアカウントの鍵で署名したトークン要求を行うため、再生時も鍵ファイル（config の
+google_key_file）が必要。promote は記録時に実際に「使用済み」→「投稿待ち」の変更を行うことがある。
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import contextlib
+
+import http_cassette
+from run_history import percentile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+FLOWS = ("promote", "get_valid_page", "sheets")
+REPLAY_TOKEN = "replay-token"
+
+
+def _digest(value):
+    data = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+def _account_context(account, mode):
+    with open(os.path.join(SCRIPT_DIR, "accounts.json"), "r", encoding="utf-8") as f:
+        config = json.load(f)[account]
+    return {
+        "account": account,
+        "mode": mode,
+        "database_id": config["database_ids"][mode],
+        "token": config["notion_token"],
+        "secrets": [config.get("notion_token"), config.get("slack_webhook_url"), config.get("password")],
+    }
+
+
+def run_promote(ctx):
+    from notion_client import Client
+    import promote_used_to_pending_minimum_batch as promote
+
+    pending, promoted = promote.promote_if_needed(Client(auth=ctx["token"]), ctx["database_id"])
+    return {"pending": pending, "promoted": promoted}
+
+
+def run_get_valid_page(ctx):
+    from notion_client import Client
+    from posting_daemon import load_post_module
+
+    module = ctx.get("module")
+    if module is None:
+        module = ctx["module"] = load_post_module("bench")
+    module.args = argparse.Namespace(account=ctx["account"], mode=ctx["mode"])
+    module.notion = Client(auth=ctx["token"])
+    module.DATABASE_ID = ctx["database_id"]
+    module.SLACK_WEBHOOK_URL = None  # 見つからなかった場合の Slack 通知は送らない
+    content, page_id, video_url, edited_at = module.get_valid_page()
+    return {"page_id": page_id, "content_sha1": _digest(content), "has_video": bool(video_url), "edited_at": edited_at}
+
+
+def run_sheets(ctx):
+    import post_tweet
+
+    bot_config = {"google_sheets_source": {"enabled": True, "worksheet_name": ctx["worksheet"]}}
+    posts = post_tweet.fetch_posts_from_google_sheets(
+        bot_config, logging.getLogger("bench_http_flows"), {"sheet_name": ctx["sheet"]}
+    )
+    return {"rows": len(posts), "sha1": _digest(posts)}
+
+
+RUNNERS = {"promote": run_promote, "get_valid_page": run_get_valid_page, "sheets": run_sheets}
+
+
+def cassette_name(flow, args):
+    if flow == "sheets":
+        return f"sheets_{args.worksheet}"
+    return f"{flow}_{args.account}_{args.mode}"
+
+
+def record_flow(flow, args):
+    """実際の API に1回接続して、通信と結果をカセットに記録する。"""
+    if flow == "sheets":
+        ctx = {"sheet": args.sheet, "worksheet": args.worksheet, "secrets": []}
+    else:
+        ctx = _account_context(args.account, args.mode)
+    path = http_cassette.cassette_path(cassette_name(flow, args), args.cassette_dir)
+    with http_cassette.use_cassette(path, mode=http_cassette.MODE_RECORD, secrets=ctx["secrets"]) as cassette:
+        started = time.perf_counter()
+        result = RUNNERS[flow](ctx)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        cassette.meta = {
+            key: value for key, value in ctx.items() if key not in ("token", "secrets", "module")
+        }
+        # 再生時はこの値からリクエストを作るため、値に含まれる（＝既に保存される）トークン類は
+        # 再生時にも同じように伏せ字にできるよう残しておく
+        stored_values = [value for value in cassette.meta.values() if isinstance(value, str)]
+        cassette.meta["replay_secrets"] = [
+            secret for secret in ctx["secrets"] if secret and any(secret in value for value in stored_values)
+        ]
+        cassette.meta.update({"flow": flow, "expected": result, "recorded_ms": round(elapsed_ms, 1)})
+    print(f"📼 {flow}: {len(cassette.interactions)} 件の通信を記録（{elapsed_ms:.0f}ms）→ {path}")
+    print(f"   結果: {json.dumps(result, ensure_ascii=False)}")
+
+
+def _replay_secrets(flow, args):
+    """再生時に伏せ字にする値のうち、accounts.json から分かるもの（なければ空）。"""
+    if flow == "sheets":
+        return []
+    try:
+        return _account_context(args.account, args.mode)["secrets"]
+    except (OSError, ValueError, KeyError):
+        return []
+
+
+def replay_flow(flow, args):
+    """
+    カセットから再生して repeat 回計測する。
+    Returns:
+        dict: 計測結果。
+    """
+    path = http_cassette.cassette_path(cassette_name(flow, args), args.cassette_dir)
+    with http_cassette.use_cassette(path, latency=args.latency, seed=args.seed) as cassette:
+        # カセットを読み込んでから、記録時に伏せ字にした値を設定する
+        cassette.secrets = tuple(
+            s for s in list(cassette.meta.get("replay_secrets", [])) + _replay_secrets(flow, args) if s
+        )
+        ctx = dict(cassette.meta, token=REPLAY_TOKEN)
+        expected = cassette.meta.get("expected")
+        durations, mismatches = [], 0
+        for _ in range(args.repeat):
+            with contextlib.redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+                result = RUNNERS[flow](ctx)
+                durations.append((time.perf_counter() - started) * 1000)
+            if result != expected:
+                mismatches += 1
+                last_mismatch = result
+        durations.sort()
+        summary = {
+            "flow": flow,
+            "runs": args.repeat,
+            "p50_ms": round(percentile(durations, 50), 1),
+            "p95_ms": round(percentile(durations, 95), 1),
+            "max_ms": round(durations[-1], 1),
+            "recorded_ms": cassette.meta.get("recorded_ms"),
+            "requests_per_run": round(cassette.played / args.repeat, 1),
+            "network_ratio": round(cassette.simulated_ms / sum(durations), 3) if sum(durations) else 0.0,
+            "mismatches": mismatches,
+            "misses": sorted(set(cassette.misses)),
+        }
+        if mismatches:
+            summary["expected"] = expected
+            summary["actual"] = last_mismatch
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Notion・Google Sheets を使う処理のベンチマーク（カセットで再生）")
+    parser.add_argument("--flow", action="append", choices=FLOWS, help="対象の処理。複数指定可（省略時は全て）")
+    parser.add_argument("--record", action="store_true", help="実際の API に接続してカセットを記録する")
+    parser.add_argument("--account", default="default", help="アカウント名（accounts.jsonで定義）")
+    parser.add_argument("--mode", choices=["question", "joboffer"], default="question")
+    parser.add_argument("--sheet", help="sheets の記録に使うスプレッドシート名")
+    parser.add_argument("--worksheet", help="sheets のワークシート名（カセット名にも使う）")
+    parser.add_argument("--cassette-dir", default=http_cassette.DEFAULT_CASSETTE_DIR)
+    parser.add_argument("--latency", default="recorded", help="再生時の応答時間（http_cassette.py 参照）")
+    parser.add_argument("--seed", type=int, default=0, help="応答時間の乱数のシード")
+    parser.add_argument("--repeat", type=int, default=5, help="再生時の計測の繰り返し回数")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    flows = args.flow or list(FLOWS)
+    if "sheets" in flows and not args.worksheet:
+        if args.flow:
+            parser.error("sheets には --worksheet が必要です")
+        flows.remove("sheets")
+    if args.record and "sheets" in flows and not args.sheet:
+        parser.error("sheets の記録には --sheet が必要です")
+
+    if args.record:
+        for flow in flows:
+            record_flow(flow, args)
+        return 0
+
+    results = []
+    for flow in flows:
+        try:
+            results.append(replay_flow(flow, args))
+        except FileNotFoundError as e:
+            print(f"⚠️ {flow}: {e}")
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print(f"{'処理':<16} {'回数':>4} {'p50(ms)':>9} {'p95(ms)':>9} {'最大(ms)':>9} {'記録時':>8} {'通信/回':>7} {'通信待ち':>8}  結果")
+        for r in results:
+            ok = "✅" if not r["mismatches"] and not r["misses"] else "❌"
+            print(
+                f"{r['flow']:<16} {r['runs']:>4} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['max_ms']:>9.1f} "
+                f"{r['recorded_ms'] or 0:>8.0f} {r['requests_per_run']:>7} {r['network_ratio']:>8.0%}  {ok}"
+            )
+            for miss in r["misses"]:
+                print(f"   ❌ 記録にない通信: {miss}")
+            if r["mismatches"]:
+                print(f"   ❌ 結果が記録時と違います（{r['mismatches']}/{r['runs']}回）: {json.dumps(r['actual'], ensure_ascii=False)}")
+    failed = any(r["mismatches"] or r["misses"] for r in results)
+    return 1 if failed or not results else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+テキスト正規化のマイクロベンチマーク。
+
+post_tweet 2.py にあった従来の実装（呼び出しごとの正規表現コンパイル、
+文字ごとの unicodedata.category 呼び出し）と text_normalize の実装を、
+同じコンテンツで比較する。計測の前に両者の出力が一致することを確認する。
+
+コンテンツは --file（.txt / .json / .jsonl）で指定する。未指定の場合は
+日本語・英語・絵文字・制御文字を混ぜた合成テキストを使う。
+"""
+
+import re
+import sys
+import json
+import timeit
+import argparse
+import unicodedata
+
+import text_normalize
+from text_normalize import COMPARE_NORMALIZER, compare_prefix
+
+# --- 従来の実装（比較用にそのまま残す） ---
+
+def legacy_remove_non_bmp(text):
+    return "".join(c for c in text if c <= "\uffff")
+
+
+def legacy_remove_emojis(text):
+    emoji_pattern = re.compile(
+        "["
+        "\U0001f600-\U0001f64f"
+        "\U0001f300-\U0001f5ff"
+        "\U0001f680-\U0001f6ff"
+        "\U0001f1e0-\U0001f1ff"
+        "\U00002700-\U000027bf"
+        "\U0001f900-\U0001f9ff"
+        "\U00002600-\U000026ff"
+        "\u200d"
+        "♀-♂"
+        "\ufe0f"
+        "]+",
+        flags=re.UNICODE,
+    )
+    return emoji_pattern.sub(r"", text)
+
+
+def legacy_strip_invisible(text):
+    return "".join(
+        c
+        for c in text
+        if c.isprintable() and not unicodedata.category(c).startswith("C")
+    )
+
+
+def legacy_is_effectively_empty(text):
+    stripped = text.strip()
+    if not stripped:
+        return True
+    for c in stripped:
+        if unicodedata.category(c)[0] not in ["C", "Z"]:
+            return False
+    return True
+
+
+def legacy_compare_key(text):
+    return legacy_strip_invisible(
+        legacy_remove_emojis(unicodedata.normalize("NFKC", legacy_remove_non_bmp(text)))
+    ).replace(" ", "")
+
+
+def legacy_compare_prefix(text, length=20):
+    return legacy_strip_invisible(
+        legacy_remove_emojis(unicodedata.normalize("NFKC", legacy_remove_non_bmp(text))[:length])
+    ).replace(" ", "")
+
+
+# --- 入力 ---
+
+def synthetic_texts(count):
+    base = (
+        "転職活動で一番大事なのは、自分の強みを言語化することです。\n"
+        "面接では「なぜこの会社なのか」を必ず聞かれます\U0001f646\u200d♀\ufe0f✨ "
+        "Prepare your answers in advance! \u200b\u2028\u00a0\u3000"
+        "ＡＢＣ１２３ｶﾀｶﾅ \U0001f44d\U0001f3fb \U0001f1ef\U0001f1f5 \U000e0067\t\r\n"
+    )
+    return [base * (1 + i % 8) for i in range(count)]
+
+
+def edge_cases():
+    return [
+        "",
+        " ",
+        "\u3000\u200b\n\t",
+        "\u200b a",
+        "\U000e0001",
+        "\U000f0000x",
+        "\U0001f646\u200d♀\ufe0f",
+        "a\u00adb\ufeffc\u2060d",
+        "\U0001d400\U0001d401",
+    ]
+
+
+def load_texts(paths):
+    texts = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                texts.extend(json.loads(line)["text"] for line in f if line.strip())
+            elif path.endswith(".json"):
+                texts.extend(
+                    item["text"] if isinstance(item, dict) else item for item in json.load(f)
+                )
+            else:
+                texts.append(f.read())
+    return texts
+
+
+# --- 計測 ---
+
+CASES = [
+    ("remove_non_bmp", legacy_remove_non_bmp, text_normalize.remove_non_bmp),
+    ("remove_emojis", legacy_remove_emojis, text_normalize.remove_emojis),
+    ("strip_invisible", legacy_strip_invisible, text_normalize.strip_invisible),
+    ("is_effectively_empty", legacy_is_effectively_empty, text_normalize.is_effectively_empty),
+    ("compare_key", legacy_compare_key, COMPARE_NORMALIZER),
+    ("compare_prefix", legacy_compare_prefix, lambda text: compare_prefix(text, 20)),
+]
+
+
+def verify(texts):
+    mismatches = 0
+    for name, legacy, current in CASES:
+        for text in texts:
+            if legacy(text) != current(text):
+                mismatches += 1
+                print(f"❌ 出力不一致: {name} {text[:40]!r}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="テキスト正規化のマイクロベンチマーク")
+    parser.add_argument("--file", action="append", default=[], help="コンテンツファイル (.txt/.json/.jsonl)。複数指定可")
+    parser.add_argument("--count", type=int, default=500, help="合成テキストの件数（--file未指定時）")
+    parser.add_argument("--repeat", type=int, default=5, help="計測の繰り返し回数（最小値を採用）")
+    args = parser.parse_args()
+
+    texts = load_texts(args.file) if args.file else synthetic_texts(args.count)
+    total_chars = sum(len(t) for t in texts)
+    print(f"📚 テキスト数: {len(texts)} / 総文字数: {total_chars}")
+
+    # 文字クラスの初回作成コストは別に計測する
+    setup = timeit.timeit(lambda: COMPARE_NORMALIZER("a\u200b"), number=1)
+    print(f"🧰 文字クラスの初回作成: {setup * 1000:.1f} ms")
+
+    if verify(texts + edge_cases()):
+        print("❌ 従来実装と出力が一致しません。")
+        return 1
+    print("✅ 従来実装と出力が一致することを確認しました。")
+
+    print(f"{'処理':<22} {'従来(ms)':>10} {'新(ms)':>10} {'倍率':>7} {'新 MB/s':>9}")
+    for name, legacy, current in CASES:
+        legacy_time = min(
+            timeit.repeat(lambda: [legacy(t) for t in texts], number=1, repeat=args.repeat)
+        )
+        current_time = min(
+            timeit.repeat(lambda: [current(t) for t in texts], number=1, repeat=args.repeat)
+        )
+        throughput = total_chars / current_time / 1e6 if current_time else float("inf")
+        print(
+            f"{name:<22} {legacy_time * 1000:>10.2f} {current_time * 1000:>10.2f} "
+            f"{legacy_time / current_time:>6.1f}x {throughput:>9.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+テキスト分割のベンチマーク。
+
+従来の split_text()（コードポイント単位で limit 文字ごとに切る）と
+text_splitter.split_for_twitter() を同じコンテンツで比較し、
+スレッドの総チャンク数・文の途中での分割率・上限超過チャンク数・処理時間を表示する。
+
+コンテンツは --file（.txt / .json / .jsonl）か、--account / --mode で
+Notion データベースの「回答（編集済み）」から取得する。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+from text_splitter import (
+    MAX_WEIGHTED_LENGTH,
+    PENALTY_SENTENCE,
+    _break_penalty,
+    _tokenize,
+    split_for_twitter,
+    weighted_length,
+    weighted_limit,
+)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLE_TEXTS = [
+    "転職活動で一番大事なのは、自分の強みを言語化することです。"
+    "面接では「なぜこの会社なのか」を必ず聞かれます。事前に企業研究をして、"
+    "自分の経験とどう結びつくかを整理しておきましょう。\n\n"
+    "また、逆質問の準備も忘れずに！入社後の働き方をイメージできる質問をすると、"
+    "意欲が伝わりやすくなります。最後に、面接後のお礼メールは簡潔に送るのがおすすめです。",
+    "Q. 未経験からエンジニアになれますか？\n"
+    "A. なれます。ただし、独学だけで終わらせず、実際に動くものを作って公開することが大切です。"
+    "ポートフォリオは量より質。READMEに工夫した点と苦労した点を書いておくと、"
+    "採用担当者が評価しやすくなります🙆‍♀️ 詳しくは https://example.com/guide をどうぞ。",
+]
+
+
+def legacy_split(text, limit):
+    """従来の split_text() と同じ、コードポイント単位の固定長分割。"""
+    return [text[i : i + limit] for i in range(0, len(text), limit)]
+
+
+def load_texts_from_file(path):
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line)["text"] for line in f if line.strip()]
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return [item["text"] if isinstance(item, dict) else item for item in data]
+    with open(path, "r", encoding="utf-8") as f:
+        return [f.read()]
+
+
+def load_texts_from_notion(account, mode):
+    from notion_client import Client
+
+    with open(os.path.join(SCRIPT_DIR, "accounts.json"), "r", encoding="utf-8") as f:
+        config = json.load(f)[account]
+    notion = Client(auth=config["notion_token"])
+    texts = []
+    start_cursor = None
+    while True:
+        query = {
+            "database_id": config["database_ids"][mode],
+            "page_size": 100,
+            "filter": {"property": "回答（編集済み）", "rich_text": {"is_not_empty": True}},
+        }
+        if start_cursor:
+            query["start_cursor"] = start_cursor
+        response = notion.databases.query(**query)
+        for page in response.get("results", []):
+            texts.append(
+                "".join(
+                    block["text"]["content"]
+                    for block in page["properties"]["回答（編集済み）"]["rich_text"]
+                )
+            )
+        if not response.get("has_more"):
+            return texts
+        start_cursor = response.get("next_cursor")
+
+
+def mid_sentence_breaks(chunks):
+    """チャンク境界のうち、文末以外で区切られたものの数を返す。"""
+    count = 0
+    for chunk in chunks[:-1]:
+        units = _tokenize(chunk)
+        if units and _break_penalty(units + [("", 0)], len(units)) > PENALTY_SENTENCE:
+            count += 1
+    return count
+
+
+def measure(name, splitter, texts, repeat):
+    chunk_counts = []
+    breaks = 0
+    overflow = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        results = [splitter(text) for text in texts]
+    elapsed = (time.perf_counter() - started) / repeat
+    for chunks in results:
+        chunk_counts.append(len(chunks))
+        breaks += mid_sentence_breaks(chunks)
+        overflow += sum(1 for c in chunks if weighted_length(c) > MAX_WEIGHTED_LENGTH)
+    boundaries = sum(max(0, c - 1) for c in chunk_counts)
+    return {
+        "name": name,
+        "total_chunks": sum(chunk_counts),
+        "mean_chunks": statistics.mean(chunk_counts) if chunk_counts else 0,
+        "mid_sentence_rate": breaks / boundaries if boundaries else 0.0,
+        "overflow_chunks": overflow,
+        "ms_per_text": elapsed / max(1, len(texts)) * 1000,
+        "chunk_counts": chunk_counts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="テキスト分割（従来方式と重み付きDP方式）のベンチマーク")
+    parser.add_argument("--file", action="append", default=[], help="コンテンツファイル (.txt/.json/.jsonl)。複数指定可")
+    parser.add_argument("--account", help="Notionから取得する場合のアカウント名 (accounts.jsonで定義)")
+    parser.add_argument("--mode", choices=["question", "joboffer"], default="question")
+    parser.add_argument("--limit", type=int, default=140, help="1チャンクあたりの文字数（全角換算）")
+    parser.add_argument("--repeat", type=int, default=5, help="計測の繰り返し回数")
+    args = parser.parse_args()
+
+    texts = []
+    for path in args.file:
+        texts.extend(load_texts_from_file(path))
+    if args.account:
+        texts.extend(load_texts_from_notion(args.account, args.mode))
+    if not texts:
+        print("ℹ️ 入力が指定されていないため、同梱のサンプルテキストを使用します。")
+        texts = SAMPLE_TEXTS
+
+    max_weight = weighted_limit(args.limit)
+    print(f"📚 テキスト数: {len(texts)} / 総文字数: {sum(len(t) for t in texts)} / 上限: {args.limit}文字 (重み付き {max_weight})")
+
+    legacy = measure("legacy", lambda t: legacy_split(t, args.limit), texts, args.repeat)
+    weighted = measure("weighted_dp", lambda t: split_for_twitter(t, max_weight), texts, args.repeat)
+
+    print(f"{'方式':<12} {'総チャンク':>10} {'平均':>6} {'文途中率':>8} {'上限超過':>8} {'ms/件':>8}")
+    for result in (legacy, weighted):
+        print(
+            f"{result['name']:<12} {result['total_chunks']:>10} {result['mean_chunks']:>6.2f} "
+            f"{result['mid_sentence_rate']:>8.1%} {result['overflow_chunks']:>8} {result['ms_per_text']:>8.2f}"
+        )
+    fewer = sum(1 for a, b in zip(legacy["chunk_counts"], weighted["chunk_counts"]) if b < a)
+    more = sum(1 for a, b in zip(legacy["chunk_counts"], weighted["chunk_counts"]) if b > a)
+    print(f"🧵 スレッドが短くなったテキスト: {fewer} 件 / 長くなったテキスト: {more} 件")
+    if more:
+        print("ℹ️ 長くなったものは、従来方式が重み付き上限を超えるチャンク（投稿不可）を作っていたケースです。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
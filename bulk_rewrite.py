@@ -0,0 +1,481 @@
+"""
+投稿待ちの本文をまとめてリライトするバッチジョブ。
+
+全アカウント・全モードの「投稿待ち」を集め、アカウントごとのスタイルプロンプトで
+1つのバッチジョブとして投入する。結果は rewrite_stage と同じキャッシュ
+（.cache/rewrites.sqlite3）に保存されるため、投稿時はそのまま lookup() で使われる。
+
+バッチの投入先はクライアントを差し替えられる。
+- openai: OpenAI の Batch API（通常料金の半額、24時間以内に完了）
+- stub:   ローカルのスタブ（API を呼ばずに動作確認・テストを行う）
+
+使用例:
+    python3 bulk_rewrite.py submit                 # 全アカウント・全モードを投入
+    python3 bulk_rewrite.py submit --client stub   # スタブで動作確認
+    python3 bulk_rewrite.py collect                # 完了したジョブの結果をキャッシュへ取り込む
+    python3 bulk_rewrite.py status                 # 進捗・スループット・1件あたりのコスト
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import argparse
+
+from rewrite_stage import (
+    DEFAULT_MODEL,
+    STYLE_PROMPT_FILES,
+    RewriteCache,
+    build_messages,
+    fetch_pending_contents,
+    load_style_prompt,
+    rewrite_key,
+)
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_JOBS_DIR = os.path.join(SCRIPT_DIR, ".cache", "rewrite_batches")
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# 100万トークンあたりの料金（USD、通常料金）。Batch API はこの半額
+PRICES_PER_MILLION = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+}
+BATCH_DISCOUNT = 0.5
+
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class OpenAIBatchClient:
+    """OpenAI の Batch API を使うクライアント。"""
+
+    name = "openai"
+
+    def __init__(self, client, jobs_dir=DEFAULT_JOBS_DIR):
+        self.client = client
+        self.jobs_dir = jobs_dir
+
+    def submit(self, requests):
+        """
+        リクエストをJSONLにしてアップロードし、バッチを作成する。
+        Args:
+            requests (list): {"custom_id", "method", "url", "body"} のリスト。
+        Returns:
+            str: バッチID。
+        """
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        input_path = os.path.join(self.jobs_dir, f"input_{uuid.uuid4().hex}.jsonl")
+        _write_jsonl(input_path, requests)
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h",
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        """
+        バッチの状態を返す。
+        Returns:
+            dict: status / total / completed / failed / created_at / completed_at。
+        """
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            "status": batch.status,
+            "total": getattr(counts, "total", 0),
+            "completed": getattr(counts, "completed", 0),
+            "failed": getattr(counts, "failed", 0),
+            "created_at": batch.created_at,
+            "completed_at": batch.completed_at,
+            "output_file_id": batch.output_file_id,
+        }
+
+    def results(self, batch_id):
+        """完了したバッチの結果行（OpenAI の出力JSONLと同じ形式）を返す。"""
+        output_file_id = self.status(batch_id).get("output_file_id")
+        if not output_file_id:
+            return []
+        text = self.client.files.content(output_file_id).text
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+class LocalBatchStub:
+    """
+    API を呼ばずにバッチの流れを再現するスタブ。
+    投入から complete_after 秒経つと完了扱いになり、本文に prefix を付けた結果を返す。
+    出力は OpenAI の出力JSONLと同じ形式なので、collect の処理はそのまま確認できる。
+    """
+
+    name = "stub"
+
+    def __init__(self, jobs_dir=DEFAULT_JOBS_DIR, complete_after=0.0, prefix="[rewritten] ", fail_every=0):
+        self.state_dir = os.path.join(jobs_dir, "stub")
+        self.complete_after = complete_after
+        self.prefix = prefix
+        self.fail_every = fail_every
+
+    def _path(self, batch_id):
+        return os.path.join(self.state_dir, f"{batch_id}.jsonl")
+
+    def submit(self, requests):
+        os.makedirs(self.state_dir, exist_ok=True)
+        batch_id = f"batch_stub_{uuid.uuid4().hex[:12]}"
+        _write_jsonl(self._path(batch_id), requests)
+        return batch_id
+
+    def status(self, batch_id):
+        path = self._path(batch_id)
+        created_at = int(os.path.getmtime(path))
+        with open(path, "r", encoding="utf-8") as f:
+            total = sum(1 for line in f if line.strip())
+        done = time.time() >= created_at + self.complete_after
+        failed = total // self.fail_every if (done and self.fail_every) else 0
+        return {
+            "status": "completed" if done else "in_progress",
+            "total": total,
+            "completed": total - failed if done else 0,
+            "failed": failed,
+            "created_at": created_at,
+            "completed_at": int(created_at + self.complete_after) if done else None,
+        }
+
+    def results(self, batch_id):
+        rows = []
+        with open(self._path(batch_id), "r", encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        for index, request in enumerate(requests, start=1):
+            if self.fail_every and index % self.fail_every == 0:
+                rows.append({
+                    "custom_id": request["custom_id"],
+                    "response": None,
+                    "error": {"code": "stub_error", "message": "スタブによる失敗"},
+                })
+                continue
+            content = request["body"]["messages"][-1]["content"]
+            prompt_chars = sum(len(m["content"]) for m in request["body"]["messages"])
+            rows.append({
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "body": {
+                        "model": request["body"]["model"],
+                        "choices": [{"message": {"role": "assistant", "content": self.prefix + content}}],
+                        "usage": {"prompt_tokens": prompt_chars, "completion_tokens": len(content)},
+                    },
+                },
+                "error": None,
+            })
+        return rows
+
+
+def _write_jsonl(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+class BatchJobStore:
+    """投入したジョブの控え（custom_id と元の本文・スタイルの対応）を保存する。"""
+
+    def __init__(self, jobs_dir=DEFAULT_JOBS_DIR):
+        self.jobs_dir = jobs_dir
+
+    def _path(self, batch_id):
+        return os.path.join(self.jobs_dir, f"{batch_id}.json")
+
+    def save(self, job):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        path = self._path(job["batch_id"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def load(self, batch_id):
+        with open(self._path(batch_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def all(self):
+        if not os.path.isdir(self.jobs_dir):
+            return []
+        jobs = []
+        for name in sorted(os.listdir(self.jobs_dir)):
+            if name.endswith(".json"):
+                with open(os.path.join(self.jobs_dir, name), "r", encoding="utf-8") as f:
+                    jobs.append(json.load(f))
+        return sorted(jobs, key=lambda job: job["submitted_at"])
+
+
+def make_client(kind, jobs_dir=DEFAULT_JOBS_DIR, stub_complete_after=0.0):
+    """
+    バッチクライアントを作る。
+    Args:
+        kind (str): "openai" または "stub"。
+        jobs_dir (str, optional): ジョブの控えを置くディレクトリ。
+        stub_complete_after (float, optional): スタブが完了扱いになるまでの秒数。
+    Returns:
+        OpenAIBatchClient or LocalBatchStub
+    """
+    if kind == "stub":
+        return LocalBatchStub(jobs_dir, complete_after=stub_complete_after)
+    from dotenv import load_dotenv
+    from openai import OpenAI
+
+    load_dotenv()
+    if not os.getenv("OPENAI_API_KEY"):
+        raise ValueError("❌ OPENAI_API_KEY が .env に定義されていません")
+    return OpenAIBatchClient(OpenAI(api_key=os.getenv("OPENAI_API_KEY")), jobs_dir)
+
+
+def collect_pending_items(accounts, account_names=None, modes=None):
+    """
+    指定アカウント・モードの「投稿待ち」本文とスタイルプロンプトを集める。
+    Args:
+        accounts (dict): accounts.json の内容。
+        account_names (list, optional): 対象アカウント。省略時は全アカウント。
+        modes (list, optional): 対象モード。省略時は全モード。
+    Returns:
+        list: {"account", "mode", "page_id", "content", "style_prompt"} のリスト。
+    """
+    from notion_client import Client
+
+    items = []
+    for account in account_names or list(accounts):
+        config = accounts.get(account)
+        if not config:
+            logger.error(f"❌ アカウント '{account}' は accounts.json に存在しません。")
+            continue
+        notion = Client(auth=config["notion_token"])
+        for mode in modes or list(STYLE_PROMPT_FILES):
+            database_id = config.get("database_ids", {}).get(mode)
+            if not database_id:
+                continue
+            style_prompt = load_style_prompt(account, mode)
+            try:
+                pending = fetch_pending_contents(notion, database_id)
+            except Exception as e:
+                logger.error(f"❌ [{account}/{mode}] 投稿待ちの取得に失敗: {e}")
+                continue
+            logger.info(f"📦 [{account}/{mode}] 投稿待ち {len(pending)} 件")
+            for page_id, content in pending:
+                items.append({
+                    "account": account,
+                    "mode": mode,
+                    "page_id": page_id,
+                    "content": content,
+                    "style_prompt": style_prompt,
+                })
+    return items
+
+
+def submit_items(items, client, cache, store, model=DEFAULT_MODEL):
+    """
+    キャッシュにない本文だけをバッチとして投入する。同じ本文・スタイルは1件にまとめる。
+    Args:
+        items (list): collect_pending_items() の戻り値。
+        client: バッチクライアント。
+        cache (RewriteCache): リライトキャッシュ。
+        store (BatchJobStore): ジョブの控え。
+        model (str, optional): モデル名。
+    Returns:
+        dict or None: 保存したジョブの控え。投入対象がなければNone。
+    """
+    unique = {}
+    for item in items:
+        if item["content"].strip():
+            key = rewrite_key(item["content"], item["style_prompt"], model)
+            unique.setdefault(key, item)
+    cached = cache.contains(unique.keys())
+    # 未完了のジョブに含まれているものも二重に投入しない
+    in_flight = set()
+    for job in store.all():
+        if not job.get("collected_at"):
+            in_flight.update(job["items"])
+    pending = {k: v for k, v in unique.items() if k not in cached and k not in in_flight}
+    logger.info(
+        f"📝 対象 {len(unique)} 件（キャッシュ済み {len(cached & set(unique))} 件、"
+        f"処理中のジョブ {len(in_flight & set(unique))} 件、新規 {len(pending)} 件）"
+    )
+    if not pending:
+        return None
+
+    requests = [
+        {
+            "custom_id": key,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {"model": model, "messages": build_messages(item["content"], item["style_prompt"])},
+        }
+        for key, item in pending.items()
+    ]
+    batch_id = client.submit(requests)
+    job = {
+        "batch_id": batch_id,
+        "client": client.name,
+        "model": model,
+        "submitted_at": time.time(),
+        "collected_at": None,
+        "items": {
+            key: {
+                "account": item["account"],
+                "mode": item["mode"],
+                "page_id": item["page_id"],
+                "content": item["content"],
+                "style_prompt": item["style_prompt"],
+            }
+            for key, item in pending.items()
+        },
+    }
+    store.save(job)
+    logger.info(f"🚀 バッチを投入しました: {batch_id}（{len(pending)} 件）")
+    return job
+
+
+def collect_job(job, client, cache, store):
+    """
+    完了したジョブの結果をリライトキャッシュに取り込む。
+    Args:
+        job (dict): ジョブの控え。
+        client: バッチクライアント。
+        cache (RewriteCache): リライトキャッシュ。
+        store (BatchJobStore): ジョブの控え。
+    Returns:
+        dict: ジョブの控え（取り込み結果の集計を含む）。
+    """
+    status = client.status(job["batch_id"])
+    job["status"] = status["status"]
+    job["created_at"] = status.get("created_at")
+    job["completed_at"] = status.get("completed_at")
+    if status["status"] not in FINAL_STATUSES:
+        logger.info(
+            f"⏳ {job['batch_id']}: {status['status']} ({status['completed']}/{status['total']})"
+        )
+        store.save(job)
+        return job
+
+    stored = failed = 0
+    prompt_tokens = completion_tokens = 0
+    for row in client.results(job["batch_id"]):
+        item = job["items"].get(row.get("custom_id"))
+        response = row.get("response") or {}
+        if not item or row.get("error") or response.get("status_code") != 200:
+            failed += 1
+            continue
+        body = response["body"]
+        rewritten = (body["choices"][0]["message"].get("content") or "").strip()
+        if not rewritten:
+            failed += 1
+            continue
+        usage = body.get("usage") or {}
+        prompt_tokens += usage.get("prompt_tokens") or 0
+        completion_tokens += usage.get("completion_tokens") or 0
+        cache.put(item["content"], item["style_prompt"], job["model"], rewritten, usage, source="batch")
+        stored += 1
+    # 結果が返らなかったものも失敗として数える（次回の submit で再投入される）
+    failed += len(job["items"]) - stored - failed
+    job.update({
+        "collected_at": time.time(),
+        "stored": stored,
+        "failed": failed,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+    })
+    store.save(job)
+    logger.info(f"✅ {job['batch_id']}: {stored} 件をキャッシュに保存（失敗 {failed} 件）")
+    return job
+
+
+def job_cost(job):
+    """
+    ジョブの推定コスト（USD、Batch 割引込み）を返す。料金表にないモデルはNone。
+    """
+    prices = PRICES_PER_MILLION.get(job["model"])
+    if not prices or job.get("prompt_tokens") is None:
+        return None
+    input_price, output_price = prices
+    return (
+        job["prompt_tokens"] * input_price + job["completion_tokens"] * output_price
+    ) / 1_000_000 * BATCH_DISCOUNT
+
+
+def format_status(job):
+    """status コマンドで表示する1行を作る。"""
+    items = len(job["items"])
+    line = f"{job['batch_id']:<32} {job['client']:<6} {job['model']:<14} {items:>5} 件 "
+    if not job.get("collected_at"):
+        return line + f"{job.get('status', 'submitted')}"
+    stored = job.get("stored", 0)
+    started = job.get("created_at") or job["submitted_at"]
+    finished = job.get("completed_at") or job["collected_at"]
+    elapsed = max(1.0, finished - started)
+    line += f"保存 {stored} / 失敗 {job.get('failed', 0)} | {stored / elapsed * 60:.1f} 件/分"
+    cost = job_cost(job)
+    if cost is not None and stored:
+        line += f" | ${cost:.4f} (${cost / stored:.6f}/件)"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="投稿待ちの本文をバッチでまとめてリライトする")
+    parser.add_argument("--client", choices=["openai", "stub"], default="openai", help="バッチの投入先")
+    parser.add_argument("--jobs-dir", default=DEFAULT_JOBS_DIR, help="ジョブの控えを置くディレクトリ")
+    parser.add_argument("--stub-complete-after", type=float, default=0.0, help="スタブが完了扱いになるまでの秒数")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = subparsers.add_parser("submit", help="投稿待ちを集めてバッチを投入する")
+    submit_parser.add_argument("--account", action="append", help="対象アカウント（省略時は全アカウント）")
+    submit_parser.add_argument("--mode", choices=list(STYLE_PROMPT_FILES), action="append", help="対象モード（省略時は全モード）")
+    submit_parser.add_argument("--model", default=DEFAULT_MODEL)
+
+    collect_parser = subparsers.add_parser("collect", help="完了したジョブの結果をキャッシュへ取り込む")
+    collect_parser.add_argument("batch_id", nargs="*", help="対象のバッチID（省略時は未取り込みの全ジョブ）")
+    collect_parser.add_argument("--wait", type=float, default=0, help="完了を待つ最大秒数")
+
+    subparsers.add_parser("status", help="ジョブの進捗・スループット・1件あたりのコストを表示する")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(message)s", datefmt="%H:%M:%S")
+    store = BatchJobStore(args.jobs_dir)
+
+    if args.command == "status":
+        jobs = store.all()
+        if not jobs:
+            print("ℹ️ 投入済みのジョブはありません。")
+        for job in jobs:
+            print(format_status(job))
+        return 0
+
+    client = make_client(args.client, args.jobs_dir, args.stub_complete_after)
+    cache = RewriteCache()
+
+    if args.command == "submit":
+        with open(os.path.join(SCRIPT_DIR, "accounts.json"), "r", encoding="utf-8") as f:
+            accounts = json.load(f)
+        items = collect_pending_items(accounts, args.account, args.mode)
+        submit_items(items, client, cache, store, args.model)
+        return 0
+
+    deadline = time.monotonic() + args.wait
+    while True:
+        targets = [store.load(b) for b in args.batch_id] if args.batch_id else [
+            job for job in store.all() if not job.get("collected_at") and job["client"] == client.name
+        ]
+        remaining = [job for job in (collect_job(j, client, cache, store) for j in targets)
+                     if not job.get("collected_at")]
+        if not remaining or time.monotonic() >= deadline:
+            break
+        time.sleep(min(30, max(1, deadline - time.monotonic())))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
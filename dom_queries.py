@@ -0,0 +1,160 @@
+"""
+投稿フローで使うDOM問い合わせをまとめたヘルパー。
+
+find_element / get_attribute / is_displayed などは1回ごとにWebDriverへの
+HTTPリクエストになるため、記事（article）を1件ずつ調べると数百往復になる。
+ここでは1回の execute_script で必要な情報をまとめて取得し、構造化したdictで返す。
+また、1投稿あたりのWebDriverコマンド数を数えるカウンターも提供する。
+"""
+
+import threading
+from collections import Counter
+
+import tracing
+
+# ページ上のツイート記事をまとめて取得するスクリプト。
+# arguments[0]: 投稿者判定に使うユーザー名（@なし、空なら判定しない）
+_COLLECT_ARTICLES_SCRIPT = """
+var username = (arguments[0] || '').toLowerCase();
+var articles = document.querySelectorAll('article[data-testid="tweet"]');
+var results = [];
+for (var i = 0; i < articles.length; i++) {
+    var article = articles[i];
+    var links = article.querySelectorAll('a[href*="/status/"]');
+    var statusUrls = [];
+    var timeUrl = null;
+    for (var j = 0; j < links.length; j++) {
+        var href = links[j].href;
+        if (statusUrls.indexOf(href) === -1) { statusUrls.push(href); }
+        if (timeUrl === null && links[j].querySelector('time')) { timeUrl = href; }
+    }
+    var timeEl = article.querySelector('time');
+    var byUser = false;
+    if (username) {
+        var userName = article.querySelector('div[data-testid="User-Name"]');
+        var source = userName ? userName.innerText : article.innerText;
+        byUser = source.toLowerCase().indexOf('@' + username) !== -1;
+    }
+    results.push({
+        index: i,
+        text: article.innerText || '',
+        status_urls: statusUrls,
+        time_url: timeUrl,
+        datetime: timeEl ? timeEl.getAttribute('datetime') : null,
+        by_user: byUser
+    });
+}
+return results;
+"""
+
+# 要素の状態をまとめて取得するスクリプト。arguments[0]: CSSセレクタ
+_ELEMENT_STATE_SCRIPT = """
+var el = document.querySelector(arguments[0]);
+if (!el) { return null; }
+var rect = el.getBoundingClientRect();
+return {
+    text: (el.textContent || '').trim(),
+    displayed: !(rect.width === 0 && rect.height === 0),
+    enabled: !(el.disabled || el.getAttribute('aria-disabled') === 'true'),
+    busy: el.getAttribute('aria-busy') === 'true'
+};
+"""
+
+
+def collect_tweet_articles(driver, username=None):
+    """
+    現在のページにあるツイート記事の情報を1回のJS実行でまとめて取得する。
+    Args:
+        driver (selenium.webdriver.chrome.webdriver.WebDriver): WebDriverインスタンス。
+        username (str, optional): 投稿者判定に使うユーザー名（@なし）。
+    Returns:
+        list: 記事ごとのdict。キーは index, text, status_urls, time_url, datetime, by_user。
+    """
+    return driver.execute_script(_COLLECT_ARTICLES_SCRIPT, username or "") or []
+
+
+def get_element_state(driver, css_selector):
+    """
+    CSSセレクタに一致する最初の要素の状態（テキスト・表示・有効・busy）を取得する。
+    Args:
+        driver (selenium.webdriver.chrome.webdriver.WebDriver): WebDriverインスタンス。
+        css_selector (str): 対象要素のCSSセレクタ。
+    Returns:
+        dict or None: text, displayed, enabled, busy を持つdict。要素がなければNone。
+    """
+    return driver.execute_script(_ELEMENT_STATE_SCRIPT, css_selector)
+
+
+def pick_status_url(article, username=None):
+    """
+    記事情報からステータスURLを選ぶ。time要素を持つリンクを優先する。
+    Args:
+        article (dict): collect_tweet_articles が返す記事情報。
+        username (str, optional): 指定するとそのユーザーのURLに限定する。
+    Returns:
+        str or None: ステータスURL。見つからなければNone。
+    """
+    candidates = []
+    if article.get("time_url"):
+        candidates.append(article["time_url"])
+    candidates.extend(article.get("status_urls") or [])
+    for url in candidates:
+        if "/status/" not in url:
+            continue
+        if username and f"/{username}/status/".lower() not in url.lower():
+            continue
+        return url
+    return None
+
+
+class WebDriverCommandCounter:
+    """
+    WebDriverに送られたコマンド数を数えるコンテキストマネージャー。
+    WebElementの操作も最終的に driver.execute を通るため、これを差し替えて数える。
+    トレース（tracing.py）が有効な場合は、コマンドごとのスパンも記録する。
+
+    使用例:
+        with WebDriverCommandCounter(driver) as counter:
+            post_tweet(driver, ...)
+        log(counter.summary())
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._original_execute = None
+
+    def __enter__(self):
+        original_execute = self.driver.execute
+        # 既に別のラッパーが差し込まれている場合は、終了時にそれを戻す
+        self._original_execute = vars(self.driver).get("execute")
+
+        def counting_execute(driver_command, params=None):
+            with self._lock:
+                self.counts[driver_command] += 1
+            return original_execute(driver_command, params)
+
+        def traced_execute(driver_command, params=None):
+            with tracing.span(f"webdriver.{driver_command}"):
+                return counting_execute(driver_command, params)
+
+        self.driver.execute = traced_execute if tracing.enabled() else counting_execute
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._original_execute is not None:
+            self.driver.execute = self._original_execute
+        else:
+            # インスタンス属性を消してクラスのメソッドに戻す
+            del self.driver.execute
+        return False
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def summary(self, top=5):
+        """合計とコマンド別の上位件数を1行の文字列で返す。"""
+        breakdown = ", ".join(f"{name}={n}" for name, n in self.counts.most_common(top))
+        return f"WebDriverコマンド数: {self.total} ({breakdown})"
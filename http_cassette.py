@@ -0,0 +1,494 @@
+"""
+HTTP 通信を記録・再生するためのカセット（ネットワークなしでのベンチマーク・回帰確認用）。
+
+requests（Slack・動画のダウンロード・gspread / google-auth）と httpx（notion_client・openai）の
+トランスポートに割り込み、1往復ごとのリクエストとレスポンスを JSON のカセットファイルに保存する。
+再生時はネットワークに出ずにカセットから同じレスポンスを返し、指定した分布で応答時間を再現する。
+
+    with http_cassette.use_cassette(".cache/cassettes/promote.json", mode="record"):
+        ...  # 実際の API に接続し、往復を記録する
+    with http_cassette.use_cassette(".cache/cassettes/promote.json", latency="lognormal:180,0.4"):
+        ...  # カセットから再生する（記録にない通信は CassetteMiss）
+
+モード:
+    record  実際に通信して記録し、終了時にカセットを書き出す
+    replay  カセットからのみ応答する（既定）
+    auto    カセットがあれば replay、なければ record
+
+保存前にトークン類を伏せ字にする（Authorization・Cookie ヘッダーは保存しない）。
+Notion のトークン（secret_ / ntn_）、OpenAI のキー（sk-）、Slack のトークンと Webhook の URL、
+Google のアクセストークン・JWT・秘密鍵、S3 の署名付き URL の署名、use_cassette(secrets=...) で渡した値が対象。
+照合（メソッド + URL + 本文）も伏せ字にした後の値で行うため、署名の時刻などが変わっても一致する。
+同じリクエストが複数記録されている場合は記録順に返し、使い切ったら最初に戻る。
+
+応答時間（latency）の指定:
+    recorded            記録時の応答時間（既定）。recorded:0.5 のように倍率も付けられる
+    none                待たない
+    fixed:MS            固定
+    uniform:LO,HI       一様分布（ミリ秒）
+    normal:MEAN,SD      正規分布（0 未満は 0）
+    lognormal:MEDIAN,SIGMA  対数正規分布（外部 API の応答時間に近い裾の長い分布）
+    ホストごとに変える場合は "api.notion.com=lognormal:180,0.4;hooks.slack.com=fixed:300;none"
+    のように ; で区切る（ホスト指定のないものが既定）。乱数は seed で固定できる。
+
+    python3 http_cassette.py show .cache/cassettes/promote_default_question.json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import base64
+import random
+import hashlib
+import logging
+import argparse
+import datetime
+import threading
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CASSETTE_DIR = os.path.join(SCRIPT_DIR, ".cache", "cassettes")
+CASSETTE_VERSION = 1
+
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+MODE_AUTO = "auto"
+
+REDACTED = "<REDACTED>"
+# 保存するヘッダー（これ以外は、認証情報を含みうるため保存しない）
+KEPT_REQUEST_HEADERS = ("content-type", "notion-version", "accept")
+DROPPED_RESPONSE_HEADERS = ("set-cookie", "content-encoding", "transfer-encoding", "content-length", "connection")
+# クエリ文字列のうち値を伏せるパラメーター
+SECRET_QUERY_PARAMS = (
+    "key", "api_key", "access_token", "token", "client_secret",
+    "x-amz-signature", "x-amz-credential", "x-amz-security-token",
+)
+# keep グループに当たった部分は残し、その後ろを伏せ字にする
+SECRET_PATTERNS = [
+    re.compile(r"\b(?:secret|ntn)_[A-Za-z0-9]{20,}"),
+    re.compile(r"\bsk-[A-Za-z0-9_\-]{20,}"),
+    re.compile(r"\bxox[abposr]-[A-Za-z0-9\-]+"),
+    re.compile(r"(?P<keep>hooks\.slack\.com/services/)[A-Za-z0-9/]+"),
+    re.compile(r"\bya29\.[A-Za-z0-9_\-\.]+"),
+    re.compile(r"\beyJ[A-Za-z0-9_\-]+\.[A-Za-z0-9_\-]+\.[A-Za-z0-9_\-]*"),
+    re.compile(r"-----BEGIN [A-Z ]*PRIVATE KEY-----.*?-----END [A-Z ]*PRIVATE KEY-----", re.S),
+    re.compile(r"(?P<keep>X-Amz-(?:Signature|Credential|Security-Token)=)[^&\"\s]+"),
+    re.compile(r'(?P<keep>"(?:access_token|refresh_token|id_token|private_key|client_secret)":\s*")[^"]+'),
+]
+TEXT_CONTENT_TYPES = ("json", "text", "xml", "x-www-form-urlencoded", "javascript")
+
+_state = {"cassette": None, "installed": False}
+_install_lock = threading.Lock()
+
+
+class CassetteMiss(ConnectionError):
+    """再生中に、カセットに記録されていないリクエストが来た。"""
+
+
+class LatencyModel:
+    """再生時の応答時間を決める（ホストごとの分布と既定の分布）。"""
+
+    def __init__(self, spec="recorded", seed=None):
+        self.spec = spec or "recorded"
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._default = ("recorded", (1.0,))
+        self._by_host = {}
+        for entry in self.spec.split(";"):
+            entry = entry.strip()
+            if not entry:
+                continue
+            host, _, dist = entry.rpartition("=")
+            parsed = self._parse(dist)
+            if host:
+                self._by_host[host.strip().lower()] = parsed
+            else:
+                self._default = parsed
+
+    @staticmethod
+    def _parse(dist):
+        kind, _, params = dist.strip().partition(":")
+        kind = kind.lower()
+        values = tuple(float(v) for v in params.split(",") if v.strip())
+        expected = {"recorded": (0, 1), "none": (0, 0), "fixed": (1, 1), "uniform": (2, 2),
+                    "normal": (2, 2), "lognormal": (2, 2)}
+        if kind not in expected or not expected[kind][0] <= len(values) <= expected[kind][1]:
+            raise ValueError(f"応答時間の指定が正しくありません: {dist}")
+        if kind == "recorded" and not values:
+            values = (1.0,)
+        return kind, values
+
+    def delay_ms(self, host, recorded_ms):
+        """
+        1回の応答で待つ時間を返す。
+        Args:
+            host (str): リクエスト先のホスト名。
+            recorded_ms (float): 記録時の応答時間（ミリ秒）。
+        Returns:
+            float: 待つ時間（ミリ秒）。
+        """
+        kind, values = self._by_host.get((host or "").lower(), self._default)
+        with self._lock:
+            if kind == "recorded":
+                return max(0.0, (recorded_ms or 0.0) * values[0])
+            if kind == "none":
+                return 0.0
+            if kind == "fixed":
+                return values[0]
+            if kind == "uniform":
+                return self._random.uniform(values[0], values[1])
+            if kind == "normal":
+                return max(0.0, self._random.gauss(values[0], values[1]))
+            return self._random.lognormvariate(0.0, values[1]) * values[0]
+
+
+def redact_text(text, secrets=()):
+    """
+    文字列からトークン類を伏せ字にする。
+    Args:
+        text (str): 対象の文字列。
+        secrets (iterable, optional): 追加で伏せる値（アカウント設定のトークンなど）。
+    Returns:
+        str: 伏せ字にした文字列。
+    """
+    if not text:
+        return text
+    for secret in secrets:
+        if secret:
+            text = text.replace(secret, REDACTED)
+    for pattern in SECRET_PATTERNS:
+        text = pattern.sub(_redact_match, text)
+    return text
+
+
+def _redact_match(match):
+    return (match.groupdict().get("keep") or "") + REDACTED
+
+
+def redact_url(url, secrets=()):
+    """URL のクエリのうち認証に使うパラメーターの値と、パス中のトークンを伏せ字にする。"""
+    parts = urlsplit(url)
+    query = [
+        (name, REDACTED if name.lower() in SECRET_QUERY_PARAMS else value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+    ]
+    base = redact_text(urlunsplit((parts.scheme, parts.netloc, parts.path, "", "")), secrets)
+    return f"{base}?{urlencode(sorted(query), safe='<>')}" if query else base
+
+
+def _is_text(content_type):
+    content_type = (content_type or "").lower()
+    return any(marker in content_type for marker in TEXT_CONTENT_TYPES)
+
+
+def _encode_body(body, content_type, secrets):
+    """本文を保存用の dict にする（テキストは伏せ字にして文字列、それ以外は base64）。"""
+    if not body:
+        return {"text": ""}
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    if _is_text(content_type):
+        try:
+            return {"text": redact_text(body.decode("utf-8"), secrets)}
+        except UnicodeDecodeError:
+            pass
+    return {"base64": base64.b64encode(body).decode("ascii")}
+
+
+def _decode_body(stored):
+    if "base64" in stored:
+        return base64.b64decode(stored["base64"])
+    return stored.get("text", "").encode("utf-8")
+
+
+def _body_digest(stored):
+    """照合用の本文のハッシュ。JSON はキー順をそろえてから計算する。"""
+    text = stored.get("text")
+    if text is None:
+        data = stored.get("base64", "").encode("ascii")
+    else:
+        try:
+            text = json.dumps(json.loads(text), ensure_ascii=False, sort_keys=True)
+        except ValueError:
+            pass
+        data = text.encode("utf-8")
+    return hashlib.sha1(data).hexdigest()[:16] if data else ""
+
+
+class Cassette:
+    """記録した往復の一覧。スレッドセーフ（Slack 通知の送信スレッドなどからも呼ばれる）。"""
+
+    def __init__(self, path, mode=MODE_REPLAY, latency=None, seed=None, secrets=()):
+        if mode == MODE_AUTO:
+            mode = MODE_REPLAY if os.path.exists(path) else MODE_RECORD
+        if mode not in (MODE_RECORD, MODE_REPLAY):
+            raise ValueError(f"不明なモードです: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency if isinstance(latency, LatencyModel) else LatencyModel(latency, seed)
+        self.secrets = tuple(s for s in secrets if s)
+        self.meta = {}
+        self.interactions = []
+        self.misses = []
+        self.played = 0
+        self.simulated_ms = 0.0
+        self._index = {}
+        self._cursors = {}
+        self._lock = threading.Lock()
+        if mode == MODE_REPLAY:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"カセットが見つかりません（先に record で記録してください）: {self.path}")
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"カセットの形式が違います（version={data.get('version')}）: {self.path}")
+        self.meta = data.get("meta", {})
+        self.interactions = data.get("interactions", [])
+        for position, interaction in enumerate(self.interactions):
+            self._index.setdefault(self._key(interaction["request"]), []).append(position)
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        data = {
+            "version": CASSETTE_VERSION,
+            "recorded_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "meta": self.meta,
+            "interactions": self.interactions,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _key(stored_request):
+        return (stored_request["method"], stored_request["url"], stored_request.get("body_sha1", ""))
+
+    def stored_request(self, method, url, headers, body):
+        """リクエストを伏せ字にした保存・照合用の dict にする。"""
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        stored_body = _encode_body(body, headers.get("content-type"), self.secrets)
+        return {
+            "method": method.upper(),
+            "url": redact_url(url, self.secrets),
+            "headers": {k: v for k, v in headers.items() if k in KEPT_REQUEST_HEADERS},
+            "body": stored_body,
+            "body_sha1": _body_digest(stored_body),
+        }
+
+    def record(self, stored_request, status, reason, headers, body, elapsed_ms):
+        headers = {k.lower(): v for k, v in (headers or {}).items() if k.lower() not in DROPPED_RESPONSE_HEADERS}
+        if "location" in headers:
+            headers["location"] = redact_url(headers["location"], self.secrets)
+        interaction = {
+            "request": stored_request,
+            "response": {
+                "status": status,
+                "reason": reason,
+                "headers": headers,
+                "body": _encode_body(body, headers.get("content-type"), self.secrets),
+            },
+            "elapsed_ms": round(elapsed_ms, 1),
+        }
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def play(self, stored_request):
+        """
+        記録から応答を探し、設定した応答時間だけ待ってから返す。
+        Returns:
+            dict: {"status", "reason", "headers", "body"(bytes), "elapsed_ms"}。
+        Raises:
+            CassetteMiss: 記録にないリクエストの場合。
+        """
+        key = self._key(stored_request)
+        with self._lock:
+            positions = self._index.get(key)
+            if not positions:
+                self.misses.append(f"{key[0]} {key[1]}")
+                raise CassetteMiss(f"カセットに記録されていないリクエストです: {key[0]} {key[1]}")
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            interaction = self.interactions[positions[cursor % len(positions)]]
+            self.played += 1
+        delay = self.latency.delay_ms(urlsplit(stored_request["url"]).hostname, interaction.get("elapsed_ms"))
+        with self._lock:
+            self.simulated_ms += delay
+        if delay:
+            time.sleep(delay / 1000.0)
+        response = interaction["response"]
+        return {
+            "status": response["status"],
+            "reason": response.get("reason") or "",
+            "headers": response.get("headers", {}),
+            "body": _decode_body(response.get("body", {})),
+            "elapsed_ms": delay,
+        }
+
+    def stats(self):
+        """カセットの往復数と、ホストごとの記録時の応答時間を返す。"""
+        by_host = {}
+        for interaction in self.interactions:
+            host = urlsplit(interaction["request"]["url"]).hostname or "-"
+            by_host.setdefault(host, []).append(interaction.get("elapsed_ms") or 0.0)
+        return {
+            host: {
+                "requests": len(values),
+                "mean_ms": round(sum(values) / len(values), 1),
+                "max_ms": round(max(values), 1),
+            }
+            for host, values in sorted(by_host.items())
+        }
+
+
+# --- トランスポートへの割り込み ---
+
+def _requests_send(original):
+    import requests
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import get_encoding_from_headers
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        cassette = _state["cassette"]
+        if cassette is None:
+            return original(self, request, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+        body = request.body if isinstance(request.body, (bytes, str)) else None
+        stored = cassette.stored_request(request.method, request.url, request.headers, body)
+        if cassette.mode == MODE_RECORD:
+            started = time.perf_counter()
+            response = original(self, request, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+            content = response.content
+            cassette.record(stored, response.status_code, response.reason, response.headers, content,
+                            (time.perf_counter() - started) * 1000)
+            return response
+
+        played = cassette.play(stored)
+        response = requests.Response()
+        response.status_code = played["status"]
+        response.reason = played["reason"]
+        response.headers = CaseInsensitiveDict(played["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = played["body"]
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.elapsed = datetime.timedelta(milliseconds=played["elapsed_ms"])
+        return response
+
+    return send
+
+
+def _httpx_handle_request(original):
+    import httpx
+
+    def handle_request(self, request):
+        cassette = _state["cassette"]
+        if cassette is None:
+            return original(self, request)
+        stored = cassette.stored_request(request.method, str(request.url), dict(request.headers), request.read())
+        if cassette.mode == MODE_RECORD:
+            started = time.perf_counter()
+            response = original(self, request)
+            content = response.read()
+            response.close()
+            cassette.record(stored, response.status_code, response.reason_phrase, dict(response.headers), content,
+                            (time.perf_counter() - started) * 1000)
+            headers = [(k, v) for k, v in response.headers.items() if k.lower() not in DROPPED_RESPONSE_HEADERS]
+            return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+
+        played = cassette.play(stored)
+        return httpx.Response(played["status"], headers=played["headers"], content=played["body"], request=request)
+
+    return handle_request
+
+
+def _install_patches():
+    """requests / httpx が入っていれば、トランスポートに割り込む（プロセスで1回だけ）。"""
+    with _install_lock:
+        if _state["installed"]:
+            return
+        try:
+            from requests.adapters import HTTPAdapter
+
+            HTTPAdapter.send = _requests_send(HTTPAdapter.send)
+        except ImportError:
+            pass
+        try:
+            import httpx
+
+            httpx.HTTPTransport.handle_request = _httpx_handle_request(httpx.HTTPTransport.handle_request)
+        except ImportError:
+            pass
+        _state["installed"] = True
+
+
+@contextmanager
+def use_cassette(path, mode=MODE_REPLAY, latency=None, seed=None, secrets=()):
+    """
+    with 文の区間の HTTP 通信をカセットで記録・再生する。
+    Args:
+        path (str): カセットファイルのパス。
+        mode (str, optional): "record" / "replay" / "auto"。
+        latency (str, optional): 再生時の応答時間の指定（省略時は記録時の応答時間）。
+        seed (int, optional): 応答時間の乱数のシード。
+        secrets (iterable, optional): 追加で伏せ字にする値。
+    Yields:
+        Cassette: 使用中のカセット（meta に記録したい情報を入れられる）。
+    """
+    cassette = Cassette(path, mode=mode, latency=latency, seed=seed, secrets=secrets)
+    _install_patches()
+    with _install_lock:
+        if _state["cassette"] is not None:
+            raise RuntimeError("別のカセットが使用中です")
+        _state["cassette"] = cassette
+    try:
+        yield cassette
+    finally:
+        with _install_lock:
+            _state["cassette"] = None
+        if cassette.mode == MODE_RECORD:
+            cassette.save()
+            logger.info(f"📼 {len(cassette.interactions)} 件の通信を記録しました: {path}")
+
+
+def cassette_path(name, cassette_dir=None):
+    """カセット名から保存先のパスを作る。"""
+    return os.path.join(cassette_dir or DEFAULT_CASSETTE_DIR, f"{name}.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP 通信のカセット")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    show_parser = subparsers.add_parser("show", help="カセットの内容（ホストごとの往復数と応答時間）を表示する")
+    show_parser.add_argument("path")
+    show_parser.add_argument("--requests", action="store_true", help="往復を1件ずつ表示する")
+    args = parser.parse_args()
+
+    cassette = Cassette(args.path, mode=MODE_REPLAY)
+    print(f"📼 {args.path}（{len(cassette.interactions)} 件）")
+    if cassette.meta:
+        print(f"   meta: {json.dumps(cassette.meta, ensure_ascii=False)}")
+    for host, entry in cassette.stats().items():
+        print(f"   {host:<32} {entry['requests']:>5} 件  平均 {entry['mean_ms']:>8.1f}ms  最大 {entry['max_ms']:>8.1f}ms")
+    if args.requests:
+        for interaction in cassette.interactions:
+            request = interaction["request"]
+            print(
+                f"   {interaction['response']['status']} {request['method']:<6} {request['url']}"
+                f"  ({interaction.get('elapsed_ms', 0):.0f}ms)"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
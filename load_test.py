@@ -0,0 +1,512 @@
+"""
+複数アカウントの負荷試験。合成したアカウントを posting_daemon.py のスケジューラーで並行して動かし、
+アカウント数・同時実行数を増やしたときにどこで詰まるか（クリップボードの取り違え、Chrome のメモリ、
+Notion のレート制限など）を調べる。
+
+    1. 作業ディレクトリ（既定は一時ディレクトリ）に N 件の合成アカウントの accounts.json を作る
+    2. 模擬サーバーを起動する: X（mock_x.py、全アカウントで1つのクリップボードを共有）、
+       Notion・Slack（mock_backends.py、Notion はトークンごとに既定 3件/秒で 429 を返す）
+    3. PostingDaemon の投稿枠の振り分け（daily_slots）と同時実行数の制御（_dispatch）で、
+       各アカウントの投稿ジョブ（ストック補充 → post_tweet 2.py の run_posting）を --rounds 回ずつ実行する
+    4. スループット・ジョブ時間と待ち時間のパーセンタイル・エラー率・処理ごとの時間（トレーススパン）、
+       模擬サーバーごとの要求数・エラー、このマシンの CPU とメモリ（Chrome を含む）を集計する
+
+    python3 load_test.py --accounts 4 --concurrency 1 --rounds 2
+    python3 load_test.py --accounts 8 --concurrency 4 --interval 60 --sleep-scale 0.3
+    python3 load_test.py --accounts 6 --shared-integration --notion-rps 3 --fail "post_error=0.05"
+
+--interval は投稿枠の間隔（秒）。daily_slots() と同じくアカウントごとに均等にずらす（0 なら全員同時に連続実行）。
+前のジョブが長引いて次の枠を過ぎた場合、デーモンと同じくその枠は飛ばし「取りこぼし」として数える。
+状態ストア・再試行キュー・投稿台帳などは作業ディレクトリの .cache/ に作り、本番の状態には触れない。
+本文には段落ごとにアカウントのタグを入れておき、別アカウントの本文が投稿された場合を取り違えとして数える。
+
+Sheets（config/config_loader）を使う post_tweet.py の経路はこの試験の対象外。
+selenium・Chrome と post_tweet 2.py が読み込むパッケージが必要。psutil があれば Chrome のメモリも測る。
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import threading
+
+import tracing
+import log_setup
+import mock_x
+import mock_backends
+from bench_browser_flow import ScaledTime, ServerClipboard
+from bench_text_split import SAMPLE_TEXTS
+from run_history import percentile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ACCOUNT_PREFIX = "lt"
+TAG_PATTERN = re.compile(r"（(" + ACCOUNT_PREFIX + r"\d{3})-\d+）")
+SENTENCE_END = re.compile(r"(?<=[。！？\n])")
+PHASE_SPANS = (
+    "daemon.job", "daemon.promote", "notion.query", "notion.retrieve", "notion.update",
+    "http.download_video", "post_tweet.browser_start", "post_tweet.login", "post_tweet.post",
+)
+
+logger = logging.getLogger("load_test")
+
+
+def page_text(account, number, base):
+    """本文の各文の前にアカウントのタグを入れる（どのチャンクからも投稿元のアカウントが分かるように）。"""
+    tag = f"（{account}-{number}）"
+    return "".join(tag + s if s.strip() else s for s in SENTENCE_END.split(base))
+
+
+def account_names(count):
+    return [f"{ACCOUNT_PREFIX}{i + 1:03d}" for i in range(count)]
+
+
+def write_accounts(path, names, slack_url, shared_integration):
+    """
+    合成アカウントの accounts.json を作る（posting_daemon.py・post_tweet 2.py と同じ形式）。
+    Returns:
+        dict: アカウント名 → 設定。
+    """
+    accounts = {}
+    for name in names:
+        accounts[name] = {
+            "email": f"{name}@loadtest.invalid",
+            "username": name,
+            "password": "loadtest-password",
+            "notion_token": "secret_loadtest" if shared_integration else f"secret_loadtest_{name}",
+            "database_ids": {"question": f"{name}-question", "joboffer": f"{name}-joboffer"},
+            "slack_webhook_url": f"{slack_url}/services/{name}",
+        }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(accounts, f, ensure_ascii=False, indent=2)
+    return accounts
+
+
+def isolate_state(cache_dir):
+    """状態ストア・再試行キュー・投稿台帳・実行履歴・レート制限・セレクタ統計を cache_dir に切り替える。"""
+    import state_store
+    import retry_queue
+    import posting_ledger
+    import run_history
+    import rate_limit_ledger
+    import selector_registry
+
+    os.makedirs(cache_dir, exist_ok=True)
+    state_store._default_store = state_store.StateStore(
+        os.path.join(cache_dir, "state.sqlite3"), legacy_counter_dir=cache_dir
+    )
+    retry_queue._default_queue = retry_queue.RetryQueue(os.path.join(cache_dir, "retry_queue.sqlite3"))
+    posting_ledger._default_ledger = posting_ledger.PostingLedger(os.path.join(cache_dir, "posting_ledger.sqlite3"))
+    run_history._default_history = run_history.RunHistory(os.path.join(cache_dir, "run_history.sqlite3"))
+    rate_limit_ledger._default_ledger = rate_limit_ledger.RateLimitLedger(os.path.join(cache_dir, "rate_limits.sqlite3"))
+    selector_registry._default_registry = selector_registry.SelectorRegistry(stats_path=None)
+
+
+class SpanCollector:
+    """閉じたスパンの時間とエラー数を名前ごとに集める（tracing のリスナー。複数スレッドから呼ばれる）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {}
+        self.errors = {}
+
+    def __call__(self, record):
+        if record["name"] not in PHASE_SPANS:
+            return
+        with self._lock:
+            self.durations.setdefault(record["name"], []).append(record["dur_ms"])
+            if record["status"] != "ok":
+                self.errors[record["name"]] = self.errors.get(record["name"], 0) + 1
+
+    def summary(self):
+        with self._lock:
+            result = {}
+            for name, values in self.durations.items():
+                values = sorted(values)
+                result[name] = {
+                    "count": len(values),
+                    "errors": self.errors.get(name, 0),
+                    "p50_ms": round(percentile(values, 50), 1),
+                    "p95_ms": round(percentile(values, 95), 1),
+                    "max_ms": round(values[-1], 1),
+                }
+            return result
+
+
+class ResourceSampler:
+    """
+    このプロセスと子プロセス（chromedriver・Chrome）の CPU・メモリを一定間隔で測る。
+    psutil がなければ、このプロセスの getrusage() の値だけを返す。
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.samples = 0
+        self.peak_rss = {}
+        self.peak_procs = {}
+        self.peak_load = 0.0
+        self._cpu = {}
+        self._stop = threading.Event()
+        self._thread = None
+        try:
+            import psutil
+
+            self._psutil = psutil
+            self._process = psutil.Process()
+        except ImportError:
+            self._psutil = None
+
+    @staticmethod
+    def _group(name):
+        name = name.lower()
+        if "chromedriver" in name:
+            return "chromedriver"
+        if "chrom" in name:
+            return "chrome"
+        return "other"
+
+    def _sample(self):
+        if hasattr(os, "getloadavg"):
+            self.peak_load = max(self.peak_load, os.getloadavg()[0])
+        if self._psutil is None:
+            return
+        rss, procs = {}, {}
+        for proc in [self._process] + self._process.children(recursive=True):
+            try:
+                group = "harness" if proc.pid == self._process.pid else self._group(proc.name())
+                info = proc.memory_info()
+                cpu = proc.cpu_times()
+            except (self._psutil.NoSuchProcess, self._psutil.AccessDenied):
+                continue
+            rss[group] = rss.get(group, 0) + info.rss
+            procs[group] = procs.get(group, 0) + 1
+            self._cpu[proc.pid] = (group, cpu.user + cpu.system)
+        for group, value in rss.items():
+            self.peak_rss[group] = max(self.peak_rss.get(group, 0), value)
+        rss_total = sum(rss.values())
+        self.peak_rss["total"] = max(self.peak_rss.get("total", 0), rss_total)
+        for group, count in procs.items():
+            self.peak_procs[group] = max(self.peak_procs.get(group, 0), count)
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        測定を止めて結果を返す。
+        Returns:
+            dict: ピークのメモリ（MB）・プロセス数・CPU 時間（秒）・ロードアベレージ。
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        # ru_maxrss は Linux ではKB、macOS ではバイト
+        maxrss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+        cpu = {}
+        for group, secs in self._cpu.values():
+            cpu[group] = cpu.get(group, 0.0) + secs
+        if not cpu:
+            cpu["harness"] = usage.ru_utime + usage.ru_stime
+        return {
+            "psutil": self._psutil is not None,
+            "samples": self.samples,
+            "peak_rss_mb": {
+                group: round(value / 1024 / 1024, 1)
+                for group, value in (self.peak_rss or {"harness": maxrss}).items()
+            },
+            "peak_processes": dict(self.peak_procs),
+            "cpu_secs": {group: round(secs, 1) for group, secs in cpu.items()},
+            "peak_load_avg": round(self.peak_load, 2),
+        }
+
+
+def prepare_workers(daemon, x_server, sleep_scale):
+    """
+    各アカウントの投稿モジュールを先に読み込み、クリップボードと待機時間を差し替える。
+    configure() はジョブごとに run_job() が呼ぶ。
+    """
+    from posting_daemon import load_post_module
+
+    clipboard = ServerClipboard(x_server.state)
+    for worker in daemon.workers.values():
+        module = load_post_module(worker.name)
+        module.pyperclip = clipboard
+        if sleep_scale != 1.0:
+            module.time = ScaledTime(sleep_scale)
+        worker._module = module
+
+
+async def account_loop(daemon, worker, offsets, interval, started, jobs):
+    """
+    アカウントの投稿枠ごとに PostingDaemon._dispatch() でジョブを実行する。
+    ジョブが長引いて次の枠まで過ぎた枠は、デーモンと同じく飛ばす。
+    """
+    for index, offset in enumerate(offsets):
+        when = started + offset
+        now = time.monotonic()
+        following = started + offsets[index + 1] if index + 1 < len(offsets) else None
+        if interval > 0 and following is not None and now >= following:
+            jobs.append({"account": worker.name, "slot": index, "result": "missed"})
+            continue
+        if when > now:
+            await asyncio.sleep(when - now)
+        dispatched = time.monotonic()
+        await daemon._dispatch(worker)
+        total = time.monotonic() - dispatched
+        duration = worker.last_duration or 0.0
+        jobs.append({
+            "account": worker.name,
+            "slot": index,
+            "mode": worker.last_mode,
+            "result": worker.last_result,
+            "job_secs": duration,
+            # 同時実行数の上限（セマフォ）で待った時間
+            "wait_secs": round(max(0.0, total - duration), 2),
+            "late_secs": round(max(0.0, dispatched - when), 2),
+        })
+
+
+async def run_load(daemon, names, rounds, interval):
+    from posting_daemon import daily_slots
+
+    daemon._semaphore = asyncio.Semaphore(daemon.max_concurrent)
+    jobs = []
+    started = time.monotonic()
+    tasks = []
+    for index, name in enumerate(names):
+        if interval > 0:
+            offsets = daily_slots(index, len(names), interval=interval, window=rounds * interval)
+        else:
+            offsets = [0.0] * rounds
+        tasks.append(account_loop(daemon, daemon.workers[name], offsets, interval, started, jobs))
+    await asyncio.gather(*tasks)
+    return jobs, time.monotonic() - started
+
+
+def verify_posts(x_state, names):
+    """
+    模擬サイトに保存された投稿を調べる。
+    Returns:
+        dict: アカウントごとの投稿数・本投稿数、取り違え・二重投稿の数。
+    """
+    tweets = x_state.snapshot()["tweets"]
+    per_account = {name: {"posts": 0, "threads": 0} for name in names}
+    mixups, untagged = 0, 0
+    seen = {}
+    for tweet in tweets:
+        stats = per_account.setdefault(tweet["username"], {"posts": 0, "threads": 0})
+        stats["posts"] += 1
+        stats["threads"] += 0 if tweet["reply_to"] else 1
+        owners = set(TAG_PATTERN.findall(tweet["text"]))
+        if not owners:
+            untagged += 1
+        elif owners != {tweet["username"]}:
+            mixups += 1
+        key = (tweet["username"], " ".join(tweet["text"].split()))
+        seen[key] = seen.get(key, 0) + 1
+    return {
+        "posts": len(tweets),
+        "per_account": per_account,
+        "clipboard_mixups": mixups,
+        "untagged": untagged,
+        "duplicates": sum(count - 1 for count in seen.values() if count > 1),
+    }
+
+
+def summarize_jobs(jobs, wall_secs):
+    results = {}
+    for job in jobs:
+        results[job["result"]] = results.get(job["result"], 0) + 1
+    done = [j for j in jobs if j["result"] in ("success", "failure")]
+    job_secs = sorted(j["job_secs"] for j in done)
+    wait_secs = sorted(j["wait_secs"] for j in jobs if "wait_secs" in j)
+    minutes = wall_secs / 60 if wall_secs else 0
+    summary = {
+        "wall_secs": round(wall_secs, 1),
+        "jobs": len(jobs),
+        "results": results,
+        "error_rate": round(results.get("failure", 0) / len(done), 3) if done else 0.0,
+        "posts_per_min": round(results.get("success", 0) / minutes, 2) if minutes else 0.0,
+        "jobs_per_min": round(len(done) / minutes, 2) if minutes else 0.0,
+    }
+    for key, values in (("job", job_secs), ("wait", wait_secs)):
+        if values:
+            summary[f"{key}_p50_secs"] = round(percentile(values, 50), 1)
+            summary[f"{key}_p95_secs"] = round(percentile(values, 95), 1)
+            summary[f"{key}_max_secs"] = round(values[-1], 1)
+    return summary
+
+
+def print_report(report):
+    jobs = report["jobs"]
+    print(f"\n📊 {report['accounts']} アカウント × {report['rounds']} 回、同時実行 {report['concurrency']}"
+          f"（{jobs['wall_secs']}秒）")
+    print("   結果: " + ", ".join(f"{name}={count}" for name, count in sorted(jobs["results"].items()))
+          + f"  エラー率 {jobs['error_rate']:.0%}")
+    print(f"   スループット: 投稿成功 {jobs['posts_per_min']}件/分、ジョブ {jobs['jobs_per_min']}件/分")
+    if "job_p50_secs" in jobs:
+        print(f"   ジョブ時間: p50 {jobs['job_p50_secs']}秒 / p95 {jobs['job_p95_secs']}秒 / 最大 {jobs['job_max_secs']}秒")
+    if "wait_p50_secs" in jobs:
+        print(f"   実行待ち:   p50 {jobs['wait_p50_secs']}秒 / p95 {jobs['wait_p95_secs']}秒 / 最大 {jobs['wait_max_secs']}秒")
+
+    posts = report["posts"]
+    print(f"\n📝 投稿 {posts['posts']} 件（取り違え {posts['clipboard_mixups']}、二重投稿 {posts['duplicates']}、"
+          f"タグなし {posts['untagged']}）")
+
+    print(f"\n{'処理':<26} {'回数':>5} {'エラー':>6} {'p50(ms)':>9} {'p95(ms)':>9} {'最大(ms)':>9}")
+    for name in PHASE_SPANS:
+        span = report["spans"].get(name)
+        if span:
+            print(f"{name:<26} {span['count']:>5} {span['errors']:>6} {span['p50_ms']:>9.0f} "
+                  f"{span['p95_ms']:>9.0f} {span['max_ms']:>9.0f}")
+
+    print("\n🌐 模擬サーバー:")
+    for host, stats in report["hosts"].items():
+        requests_text = ", ".join(f"{op}={count}" for op, count in sorted(stats["requests"].items()))
+        errors_text = ", ".join(f"{op}={count}" for op, count in sorted(stats["errors"].items())) or "なし"
+        print(f"   {host:<7} 要求 {requests_text or 'なし'}  エラー {errors_text}")
+    if report["injected"]:
+        print("   💉 注入した失敗: " + ", ".join(f"{k}={v}" for k, v in sorted(report["injected"].items())))
+
+    res = report["resources"]
+    print("\n🖥️ リソース" + ("" if res["psutil"] else "（psutil がないため、このプロセスのみ）") + ":")
+    print("   ピークのメモリ(MB): " + ", ".join(f"{k}={v}" for k, v in sorted(res["peak_rss_mb"].items())))
+    if res["peak_processes"]:
+        print("   ピークのプロセス数: " + ", ".join(f"{k}={v}" for k, v in sorted(res["peak_processes"].items())))
+    print("   CPU時間(秒): " + ", ".join(f"{k}={v}" for k, v in sorted(res["cpu_secs"].items()))
+          + f"  ロードアベレージ最大 {res['peak_load_avg']}")
+
+
+def main():
+    from posting_daemon import DEFAULT_MAX_CONCURRENT
+
+    parser = argparse.ArgumentParser(description="複数アカウントの負荷試験（模擬サーバーで実行）")
+    parser.add_argument("--accounts", type=int, default=4, help="合成するアカウント数")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_CONCURRENT, help="ジョブの同時実行数")
+    parser.add_argument("--rounds", type=int, default=2, help="アカウントごとのジョブ数")
+    parser.add_argument("--interval", type=float, default=0.0, help="投稿枠の間隔（秒、0 なら連続実行）")
+    parser.add_argument("--pages", type=int, default=None, help="データベースごとの投稿待ちページ数（省略時は rounds）")
+    parser.add_argument("--used-pages", type=int, default=2, help="データベースごとの使用済みページ数（ストック補充用）")
+    parser.add_argument("--media-mb", type=float, default=2.0, help="添付動画の大きさ（MB）")
+    parser.add_argument("--shared-integration", action="store_true", help="全アカウントで1つの Notion トークンを使う")
+    parser.add_argument("--notion-rps", type=float, default=mock_backends.DEFAULT_NOTION_RPS,
+                        help="Notion のトークンごとの上限（件/秒、0 で無制限）")
+    parser.add_argument("--notion-latency", default=mock_backends.DEFAULT_NOTION_LATENCY)
+    parser.add_argument("--slack-latency", default=mock_backends.DEFAULT_SLACK_LATENCY)
+    parser.add_argument("--x-latency", default=mock_x.DEFAULT_LATENCY, help="X の模擬サイトの応答時間")
+    parser.add_argument("--fail", default="", help="X の模擬サイトでの失敗の注入率（mock_x.py 参照）")
+    parser.add_argument("--seed", type=int, default=0, help="模擬サーバーの乱数のシード")
+    parser.add_argument("--sleep-scale", type=float, default=1.0, help="投稿スクリプトの固定待機の倍率")
+    parser.add_argument("--cold-browser", action="store_true", help="ジョブごとにブラウザを閉じる（keep_browser=False）")
+    parser.add_argument("--headed", action="store_true", help="ブラウザの画面を表示する")
+    parser.add_argument("--workdir", help="作業ディレクトリ（省略時は一時ディレクトリを作り、終了後に削除）")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    from posting_daemon import PostingDaemon
+    from slack_notifier import get_slack_notifier
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="load_test_"))
+    os.makedirs(workdir, exist_ok=True)
+    log_setup.setup_logging("load_test", log_dir=os.path.join(workdir, "logs"), console_level="WARNING")
+    isolate_state(os.path.join(workdir, ".cache"))
+
+    names = account_names(args.accounts)
+    x_server = mock_x.MockXServer(
+        latency=args.x_latency, failures=args.fail, seed=args.seed, snapshots=[], require_login=True,
+        users={f"{name}@loadtest.invalid": name for name in names},
+    ).start()
+    notion = mock_backends.MockNotionServer(
+        latency=args.notion_latency, seed=args.seed, rps=args.notion_rps, media_mb=args.media_mb
+    ).start()
+    slack = mock_backends.MockSlackServer(latency=args.slack_latency, seed=args.seed).start()
+    accounts = write_accounts(os.path.join(workdir, "accounts.json"), names, slack.url, args.shared_integration)
+    pages = args.pages if args.pages is not None else args.rounds
+    for name, config in accounts.items():
+        for mode, database_id in config["database_ids"].items():
+            base = SAMPLE_TEXTS[0] if mode == "question" else SAMPLE_TEXTS[-1]
+            notion.add_database(database_id, [page_text(name, n, base) for n in range(pages)])
+            notion.add_database(
+                database_id, [page_text(name, pages + n, base) for n in range(args.used_pages)], status="使用済み"
+            )
+
+    # post_tweet 2.py は accounts.json・chrome_profiles/・動画ファイルをカレントディレクトリに置く
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    os.environ["AUTO_POST_TWITTER_BASE_URL"] = x_server.url
+    if not args.headed:
+        os.environ["AUTO_POST_HEADLESS"] = "1"
+    # configure() が確認するだけで、リライトは事前キャッシュを引くため API は呼ばない
+    os.environ.setdefault("OPENAI_API_KEY", "sk-loadtest-unused")
+
+    print(f"🧪 {len(names)} アカウント、同時実行 {args.concurrency}、作業ディレクトリ {workdir}")
+    print(f"   X {x_server.url} / Notion {notion.url} / Slack {slack.url}")
+
+    daemon = PostingDaemon(
+        names, max_concurrent=args.concurrency, jitter_minutes=0,
+        socket_path=os.path.join(workdir, ".cache", "posting_daemon.sock"), keep_browser=not args.cold_browser,
+    )
+    collector = SpanCollector()
+    tracing.add_listener(collector)
+    sampler = ResourceSampler().start()
+    try:
+        with mock_backends.redirect_hosts({"api.notion.com": notion.url}):
+            prepare_workers(daemon, x_server, args.sleep_scale)
+            jobs, wall_secs = asyncio.run(run_load(daemon, names, args.rounds, args.interval))
+            for worker in daemon.workers.values():
+                worker.close()
+            daemon._executor.shutdown(wait=True)
+            get_slack_notifier().close()
+    finally:
+        resources = sampler.stop()
+        tracing.remove_listener(collector)
+        os.chdir(previous_cwd)
+        x_server.stop()
+        notion.stop()
+        slack.stop()
+
+    report = {
+        "accounts": len(names),
+        "concurrency": args.concurrency,
+        "rounds": args.rounds,
+        "jobs": summarize_jobs(jobs, wall_secs),
+        "posts": verify_posts(x_server.state, names),
+        "spans": collector.summary(),
+        "hosts": {"x": {"requests": {"all": x_server.state.snapshot()["requests"]}, "errors": {}},
+                  "notion": notion.stats(), "slack": slack.stats()},
+        "injected": x_server.state.snapshot()["injected"],
+        "notion_status": {
+            name: {mode: notion.status_counts(db) for mode, db in config["database_ids"].items()}
+            for name, config in accounts.items()
+        },
+        "slack_messages": sum(len(m) for m in slack.messages.values()),
+        "resources": resources,
+        "job_log": jobs,
+    }
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    log_setup.shutdown()
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
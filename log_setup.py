@@ -0,0 +1,176 @@
+"""
+キュー経由でログを書き出す共通のロギング設定。
+
+各スクリプトのログ呼び出しはキューに積むだけで戻り（数マイクロ秒）、ファイルやコンソールへの
+書き込みはバックグラウンドのスレッド（QueueListener）が行う。
+
+    logs/<名前>.jsonl   1行1レコードの JSON（ts, level, logger, msg と、account / mode / trace などの項目）
+                        サイズ（既定 10MB × 10世代）または時刻（AUTO_POST_LOG_ROTATE_WHEN=midnight など）でローテーションする
+    コンソール          "[HH:MM:SS] メッセージ" 形式。端末から実行した場合は INFO 以上、
+                        launchd などから実行した場合（標準出力が端末でない）は WARNING 以上だけを出し、
+                        ~/Library/Logs/com.auto_post/*.log がローテーションなしで膨らまないようにする
+
+bind() で囲んだ区間のログにはアカウントなどの項目が付く（常駐スケジューラーでアカウントを見分ける）。
+
+    logger = log_setup.setup_logging("post_tweet")
+    with log_setup.bind(account="アカウント名", mode="question"):
+        logger.info("🔍 投稿待ちの投稿を取得中...")
+
+環境変数:
+    AUTO_POST_LOG_DIR            出力先ディレクトリ（既定 logs/）
+    AUTO_POST_LOG_LEVEL          ファイルに出すレベル（既定 INFO）
+    AUTO_POST_LOG_CONSOLE_LEVEL  コンソールに出すレベル
+    AUTO_POST_LOG_MAX_BYTES      1ファイルの最大サイズ（既定 10485760）
+    AUTO_POST_LOG_BACKUPS        残す世代数（既定 10）
+    AUTO_POST_LOG_ROTATE_WHEN    指定すると時刻でローテーションする（"midnight", "H" など）
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import datetime
+import threading
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+import tracing
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_LOG_DIR = os.path.join(SCRIPT_DIR, "logs")
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 10
+CONSOLE_FORMAT = "[%(asctime)s] %(message)s"
+CONSOLE_DATEFMT = "%H:%M:%S"
+
+_context = contextvars.ContextVar("auto_post_log_context", default={})
+_state = {"listener": None}
+_setup_lock = threading.Lock()
+
+# LogRecord が元から持つ属性（これ以外は extra= で渡された項目として JSON に含める）
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+@contextmanager
+def bind(**fields):
+    """
+    区間内のログに項目を付ける（入れ子にすると項目が追加される）。
+    Args:
+        **fields: 付ける項目（account="...", mode="..." など）。
+    """
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """bind() の項目とトレースID（tracing.py が有効なとき）をレコードに付ける。ログを出したスレッドで動く。"""
+
+    def filter(self, record):
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        span = tracing.current_span()
+        if span is not tracing.NOOP_SPAN:
+            record.trace = span.trace_id
+            record.span = span.span_id
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """1レコードを1行の JSON にする。"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _level(value, default):
+    if not value:
+        return default
+    return int(value) if str(value).isdigit() else logging.getLevelName(str(value).upper())
+
+
+def _file_handler(path):
+    backups = int(os.getenv("AUTO_POST_LOG_BACKUPS", DEFAULT_BACKUPS))
+    when = os.getenv("AUTO_POST_LOG_ROTATE_WHEN", "").strip()
+    if when:
+        return TimedRotatingFileHandler(path, when=when, backupCount=backups, encoding="utf-8")
+    max_bytes = int(os.getenv("AUTO_POST_LOG_MAX_BYTES", DEFAULT_MAX_BYTES))
+    return RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+
+
+def setup_logging(name, log_dir=None, level=None, console_level=None):
+    """
+    ルートロガーにキュー経由のハンドラーを設定し、name のロガーを返す。
+    プロセス内で2回目以降の呼び出しは設定を変えずにロガーだけを返す。
+    Args:
+        name (str): ロガー名。ログファイル名（<name>.jsonl）にも使う。
+        log_dir (str, optional): 出力先ディレクトリ。省略時は AUTO_POST_LOG_DIR か logs/。
+        level (str or int, optional): ファイルに出すレベル。
+        console_level (str or int, optional): コンソールに出すレベル。
+    Returns:
+        logging.Logger: name のロガー。
+    """
+    with _setup_lock:
+        if _state["listener"] is not None:
+            return logging.getLogger(name)
+
+        log_dir = log_dir or os.getenv("AUTO_POST_LOG_DIR") or DEFAULT_LOG_DIR
+        file_level = _level(level or os.getenv("AUTO_POST_LOG_LEVEL"), logging.INFO)
+        default_console = logging.INFO if sys.stdout.isatty() else logging.WARNING
+        console_level = _level(console_level or os.getenv("AUTO_POST_LOG_CONSOLE_LEVEL"), default_console)
+
+        handlers = []
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            file_handler = _file_handler(os.path.join(log_dir, f"{name}.jsonl"))
+            file_handler.setLevel(file_level)
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+        except OSError as e:
+            print(f"⚠️ ログファイルを開けないため、コンソールにのみ出力します: {e}", file=sys.stderr)
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setLevel(console_level)
+        console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT, CONSOLE_DATEFMT))
+        handlers.append(console_handler)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.addFilter(ContextFilter())
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(min(h.level for h in handlers))
+
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        _state["listener"] = listener
+        atexit.register(shutdown)
+        return logging.getLogger(name)
+
+
+def shutdown():
+    """キューに残ったログを書き出してバックグラウンドのスレッドを止める（プロセス終了時に呼ばれる）。"""
+    with _setup_lock:
+        listener, _state["listener"] = _state["listener"], None
+    if listener is not None:
+        listener.stop()
@@ -0,0 +1,414 @@
+"""
+投稿ボットの稼働状況を Prometheus 形式のメトリクスとして公開する。
+
+トレーススパン（tracing.py）のリスナーとして動き、終了したスパンから次の値を集計する。
+呼び出し側でメトリクスを個別に更新する必要はなく、スパン名と属性の付け方だけで決まる。
+
+    auto_post_posts_{attempted,succeeded,failed}_total{account,mode}  実行スパン（post_tweet.run など）の結果
+    auto_post_run_duration_seconds{account,mode}                       実行全体の所要時間
+    auto_post_external_call_duration_seconds{service,operation}       notion / sheets / openai / slack / twitter_api / http
+    auto_post_external_call_errors_total{service,operation}           上記の失敗回数（エラー率は _count との比）
+    auto_post_media_downloaded_bytes_total{operation}                  動画・画像のダウンロード量
+    auto_post_browser_start_seconds                                    WebDriver の起動時間
+    auto_post_pending_pages{account,mode}                              投稿待ちの件数（pending 属性を持つスパン）
+    auto_post_retry_queue_jobs{account,status}                         再試行キューの件数（出力時に retry_queue.py から読む）
+
+短命なプロセス（run_full_posting.py から起動される各スクリプト）でも値が積み上がるよう、
+集計はメモリに溜めて実行スパンの終了時・プロセス終了時に .cache/metrics.sqlite3 へ加算する。
+
+公開方法:
+    python3 metrics.py textfile [--path ...]   node_exporter の textfile collector 用に書き出す
+    python3 metrics.py serve [--port 9464]     http://127.0.0.1:9464/metrics で公開する
+    python3 posting_daemon.py run --metrics-port 9464   デーモンに組み込んで公開する
+AUTO_POST_METRICS_TEXTFILE を設定すると、書き込みのたびにそのパスへ textfile も出力する。
+AUTO_POST_METRICS=0 で集計を止められる。
+"""
+
+import os
+import sys
+import json
+import math
+import atexit
+import sqlite3
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_METRICS_PATH = os.path.join(SCRIPT_DIR, ".cache", "metrics.sqlite3")
+DEFAULT_TEXTFILE_PATH = os.path.join(SCRIPT_DIR, ".cache", "metrics", "auto_post.prom")
+DEFAULT_HTTP_PORT = 9464
+METRICS_ENV = "AUTO_POST_METRICS"
+TEXTFILE_ENV = "AUTO_POST_METRICS_TEXTFILE"
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+CALL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RUN_BUCKETS = (5, 10, 30, 60, 120, 300, 600, 1200, 1800)
+BROWSER_BUCKETS = (1, 2, 5, 10, 20, 30, 60)
+
+# 名前: (種類, 説明, ヒストグラムのバケット)
+METRICS = {
+    "auto_post_posts_attempted_total": (COUNTER, "投稿を試みた回数（投稿済み・対象なしは除く）", None),
+    "auto_post_posts_succeeded_total": (COUNTER, "投稿に成功した回数", None),
+    "auto_post_posts_failed_total": (COUNTER, "投稿に失敗した回数（再試行待ちを含む）", None),
+    "auto_post_run_duration_seconds": (HISTOGRAM, "1回の投稿実行の所要時間", RUN_BUCKETS),
+    "auto_post_external_call_duration_seconds": (HISTOGRAM, "外部サービス呼び出しの所要時間", CALL_BUCKETS),
+    "auto_post_external_call_errors_total": (COUNTER, "外部サービス呼び出しの失敗回数", None),
+    "auto_post_media_downloaded_bytes_total": (COUNTER, "ダウンロードしたメディアのバイト数", None),
+    "auto_post_browser_start_seconds": (HISTOGRAM, "WebDriver の起動時間", BROWSER_BUCKETS),
+    "auto_post_pending_pages": (GAUGE, "投稿待ちの件数", None),
+    "auto_post_retry_queue_jobs": (GAUGE, "再試行キューのジョブ数", None),
+}
+
+# 実行全体を表すスパン（結果の属性 outcome / success を持つ）
+RUN_SPANS = ("post_tweet.run", "post_tweet_sheets.post")
+# 外部サービス呼び出しとして扱うスパン名の接頭辞
+EXTERNAL_SERVICES = ("notion", "sheets", "openai", "slack", "twitter_api", "http")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    name TEXT NOT NULL,
+    suffix TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    le TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, suffix, labels, le)
+)
+"""
+
+
+def _format_le(bound):
+    return "+Inf" if math.isinf(bound) else repr(float(bound))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _label_text(labels, le=None):
+    pairs = [(key, labels[key]) for key in sorted(labels)]
+    if le:
+        pairs.append(("le", le))
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class MetricsRegistry:
+    """メトリクスの差分をメモリに溜め、SQLite に書き込んで Prometheus 形式で出力する。"""
+
+    def __init__(self, path=DEFAULT_METRICS_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # (name, suffix, labels_json, le) -> 加算する値（ゲージは設定する値）
+        self._pending = {}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute(_SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _labels_key(labels):
+        return json.dumps({k: str(v) for k, v in labels.items() if v is not None}, sort_keys=True, ensure_ascii=False)
+
+    def inc(self, name, amount=1, **labels):
+        """カウンターを加算する。"""
+        key = (name, "", self._labels_key(labels), "")
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        """ゲージを設定する。"""
+        with self._lock:
+            self._pending[(name, "", self._labels_key(labels), "")] = value
+
+    def observe(self, name, value, **labels):
+        """ヒストグラムに1件記録する。"""
+        buckets = METRICS[name][2]
+        labels_key = self._labels_key(labels)
+        with self._lock:
+            for bound in tuple(buckets) + (math.inf,):
+                if value <= bound:
+                    key = (name, "_bucket", labels_key, _format_le(bound))
+                    self._pending[key] = self._pending.get(key, 0) + 1
+            for suffix, amount in (("_sum", value), ("_count", 1)):
+                key = (name, suffix, labels_key, "")
+                self._pending[key] = self._pending.get(key, 0) + amount
+
+    def flush(self):
+        """溜めた差分を SQLite に書き込む。"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        with self._transaction() as conn:
+            for (name, suffix, labels, le), value in pending.items():
+                if METRICS[name][0] == GAUGE:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO samples (name, suffix, labels, le, value) VALUES (?, ?, ?, ?, ?)",
+                        (name, suffix, labels, le, value),
+                    )
+                    continue
+                conn.execute(
+                    "INSERT OR IGNORE INTO samples (name, suffix, labels, le, value) VALUES (?, ?, ?, ?, 0)",
+                    (name, suffix, labels, le),
+                )
+                conn.execute(
+                    "UPDATE samples SET value = value + ? WHERE name = ? AND suffix = ? AND labels = ? AND le = ?",
+                    (value, name, suffix, labels, le),
+                )
+
+    def _retry_queue_samples(self):
+        """再試行キューのジョブ数を数える（出力時に読むので、キューの状態がそのまま反映される）。"""
+        try:
+            from retry_queue import get_retry_queue
+
+            queue = get_retry_queue()
+            counts = {}
+            for status, jobs in (("pending", queue.pending()), ("dead", queue.dead_letters())):
+                for job in jobs:
+                    key = (job["account"], status)
+                    counts[key] = counts.get(key, 0) + 1
+        except Exception as e:
+            logger.debug(f"再試行キューの件数を取得できませんでした: {e}")
+            return []
+        return [
+            ("auto_post_retry_queue_jobs", "", self._labels_key({"account": account, "status": status}), "", count)
+            for (account, status), count in counts.items()
+        ]
+
+    def render(self):
+        """
+        保存済みの値を Prometheus のテキスト形式で返す。
+        Returns:
+            str: exposition format のテキスト。
+        """
+        rows = [
+            (row["name"], row["suffix"], row["labels"], row["le"], row["value"])
+            for row in self._connection().execute("SELECT * FROM samples")
+        ]
+        rows.extend(self._retry_queue_samples())
+
+        suffix_order = {"_bucket": 0, "_sum": 1, "_count": 2, "": 0}
+
+        def sort_key(row):
+            name, suffix, labels, le, _ = row
+            return (name, labels, suffix_order[suffix], float(le.replace("+Inf", "inf")) if le else 0.0)
+
+        lines = []
+        current = None
+        for name, suffix, labels, le, value in sorted(rows, key=sort_key):
+            if name not in METRICS:
+                continue
+            if name != current:
+                kind, help_text, _ = METRICS[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                current = name
+            number = int(value) if float(value).is_integer() else value
+            lines.append(f"{name}{suffix}{_label_text(json.loads(labels), le)} {number}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path=DEFAULT_TEXTFILE_PATH):
+        """
+        textfile collector 用のファイルを一時ファイル経由でアトミックに書き出す。
+        Args:
+            path (str, optional): 出力先（拡張子 .prom）。
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def observe_span(self, record):
+        """
+        終了したスパンの記録からメトリクスを更新する（tracing のリスナー）。
+        Args:
+            record (dict): tracing.Span が書き出す記録。
+        """
+        name = record["name"]
+        attrs = record.get("attrs", {})
+        seconds = record["dur_ms"] / 1000.0
+        service, _, operation = name.partition(".")
+
+        if name in RUN_SPANS:
+            labels = {"account": attrs.get("account") or "", "mode": attrs.get("mode") or ""}
+            outcome = attrs.get("outcome")
+            if not outcome and "success" in attrs:
+                outcome = "success" if attrs["success"] else "failed"
+            if not outcome:
+                outcome = "success" if record["status"] == "ok" else "failed"
+            if outcome != "skipped":
+                self.inc("auto_post_posts_attempted_total", **labels)
+                if outcome == "success":
+                    self.inc("auto_post_posts_succeeded_total", **labels)
+                else:
+                    self.inc("auto_post_posts_failed_total", **labels)
+            self.observe("auto_post_run_duration_seconds", seconds, **labels)
+        elif service in EXTERNAL_SERVICES and operation:
+            self.observe("auto_post_external_call_duration_seconds", seconds, service=service, operation=operation)
+            if record["status"] != "ok":
+                self.inc("auto_post_external_call_errors_total", service=service, operation=operation)
+            if service == "http" and attrs.get("bytes"):
+                self.inc("auto_post_media_downloaded_bytes_total", attrs["bytes"], operation=operation)
+        elif operation == "browser_start":
+            self.observe("auto_post_browser_start_seconds", seconds)
+
+        if "pending" in attrs and attrs.get("account"):
+            self.set(
+                "auto_post_pending_pages", attrs["pending"], account=attrs["account"], mode=attrs.get("mode") or ""
+            )
+        if name in RUN_SPANS:
+            # 常駐プロセスでも実行ごとに反映されるよう、実行の区切りで書き込む
+            flush()
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+_installed = False
+
+
+def get_metrics_registry():
+    """プロセス内で共有するデフォルトのレジストリを返す。"""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = MetricsRegistry()
+        return _default_registry
+
+
+def metrics_enabled():
+    """メトリクスを集計するか（AUTO_POST_METRICS=0 で無効）。"""
+    return os.getenv(METRICS_ENV, "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def _observe(record):
+    get_metrics_registry().observe_span(record)
+
+
+def flush():
+    """溜めた差分を書き込み、AUTO_POST_METRICS_TEXTFILE があれば textfile も更新する。"""
+    if not _installed:
+        return
+    try:
+        registry = get_metrics_registry()
+        registry.flush()
+        textfile = os.getenv(TEXTFILE_ENV, "").strip()
+        if textfile:
+            registry.write_textfile(textfile)
+    except Exception as e:
+        # 計測のために本処理を止めない
+        logger.warning(f"⚠️ メトリクスの書き込みに失敗しました: {e}")
+
+
+def install():
+    """
+    スパンの集計を始める（エントリーポイントで1回呼ぶ。2回目以降は何もしない）。
+    プロセス終了時に未書き込みの差分を書き込む。
+    """
+    global _installed
+    if _installed or not metrics_enabled():
+        return
+    _installed = True
+    tracing.add_listener(_observe)
+    atexit.register(flush)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        try:
+            flush()
+            body = get_metrics_registry().render().encode("utf-8")
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics: " + format % args)
+
+
+def start_http_server(port=DEFAULT_HTTP_PORT, host="127.0.0.1"):
+    """
+    /metrics を返す HTTP サーバーをバックグラウンドのスレッドで起動する。
+    Args:
+        port (int, optional): 待ち受けるポート。
+        host (str, optional): 待ち受けるアドレス（既定はローカルのみ）。
+    Returns:
+        ThreadingHTTPServer: 起動したサーバー（shutdown() で止める）。
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"📈 メトリクスを http://{host}:{port}/metrics で公開しています。")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="投稿ボットのメトリクス（Prometheus 形式）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("show", help="現在の値を表示する")
+    textfile_parser = subparsers.add_parser("textfile", help="textfile collector 用に書き出す")
+    textfile_parser.add_argument("--path", default=DEFAULT_TEXTFILE_PATH, help="出力先の .prom ファイル")
+    serve_parser = subparsers.add_parser("serve", help="HTTP で公開する")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_HTTP_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(message)s", datefmt="%H:%M:%S")
+    registry = get_metrics_registry()
+    if args.command == "show":
+        sys.stdout.write(registry.render())
+        return 0
+    if args.command == "textfile":
+        registry.write_textfile(args.path)
+        print(f"✅ {args.path} に書き出しました。")
+        return 0
+
+    server = start_http_server(args.port, args.host)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+"""
+負荷試験（load_test.py）用の Notion API・Slack Webhook の模擬サーバー。
+
+MockNotionServer
+    投稿スクリプトが使う範囲の Notion API を http://127.0.0.1:<port> で提供する。
+        POST  /v1/databases/<ID>/query   絞り込み（and/or、select の equals、is_empty/is_not_empty）とページ送り
+        GET   /v1/pages/<ID>
+        PATCH /v1/pages/<ID>             プロパティの更新（ステータスの変更）
+        GET   /files/<ページID>.mp4       動画ファイル（Notion の添付ファイルURLの代わり）
+    インテグレーションのトークンごとに平均 rps 件/秒（既定 3、Notion の公開値）のトークンバケットで制限し、
+    超えた要求には 429 rate_limited と Retry-After を返す。
+MockSlackServer
+    POST /services/... で Incoming Webhook の代わりに "ok" を返し、受け取った通知を数える。
+
+notion_client はURLを固定で持つため、redirect_hosts() で api.notion.com への通信をこちらに向ける
+（http_cassette.py と同じく requests / httpx のトランスポートに割り込む）。
+
+応答時間は http_cassette.LatencyModel と同じ書式で、ホスト名の代わりに項目名
+（query / retrieve / update / file / webhook）を指定する。
+"""
+
+import re
+import json
+import time
+import uuid
+import random
+import logging
+import datetime
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from http_cassette import LatencyModel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NOTION_LATENCY = "query=lognormal:250,0.3;retrieve=lognormal:150,0.3;update=lognormal:200,0.3;file=fixed:100;none"
+DEFAULT_SLACK_LATENCY = "webhook=lognormal:120,0.3;none"
+DEFAULT_NOTION_RPS = 3.0
+STATUS_PROPERTY = "ステータス"
+VIDEO_PROPERTY = "動画"
+CONTENT_PROPERTY = "回答（編集済み）"
+
+_PAGE_PATH = re.compile(r"^/v1/pages/([^/]+)$")
+_QUERY_PATH = re.compile(r"^/v1/databases/([^/]+)/query$")
+_FILE_PATH = re.compile(r"^/files/([^/]+)\.mp4$")
+
+_redirects = {}
+_redirect_lock = threading.Lock()
+_redirect_state = {"installed": False}
+
+
+def _now_iso():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def _property_matches(page, condition):
+    """Notion の絞り込み条件（投稿スクリプトが使う範囲）にページが合うか。"""
+    if "and" in condition:
+        return all(_property_matches(page, c) for c in condition["and"])
+    if "or" in condition:
+        return any(_property_matches(page, c) for c in condition["or"])
+    prop = page["properties"].get(condition.get("property"), {})
+    for kind, rule in condition.items():
+        if kind == "property" or not isinstance(rule, dict):
+            continue
+        value = prop.get(kind)
+        if "equals" in rule:
+            actual = (value or {}).get("name") if kind in ("select", "status") else value
+            if actual != rule["equals"]:
+                return False
+        if rule.get("is_not_empty") and not value:
+            return False
+        if rule.get("is_empty") and value:
+            return False
+    return True
+
+
+class _MockServer:
+    """模擬サーバーの共通部分。handle() の戻り値（ステータス、JSON、ヘッダー）を返す。"""
+
+    name = "mock"
+
+    def __init__(self, host="127.0.0.1", port=0, latency=None, seed=None):
+        self.latency = latency if isinstance(latency, LatencyModel) else LatencyModel(latency or "none", seed)
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.errors = {}
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name=f"mock-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _count(self, op, status):
+        with self._lock:
+            self.requests[op] = self.requests.get(op, 0) + 1
+            if status >= 400:
+                key = f"{op}:{status}"
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {"requests": dict(self.requests), "errors": dict(self.errors)}
+
+    def handle(self, method, path, headers, body):
+        raise NotImplementedError
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _dispatch(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                op, status, payload, headers = server.handle(method, urlsplit(self.path).path, self.headers, body)
+                server._count(op, status)
+                if isinstance(payload, bytes):
+                    data, content_type = payload, "application/octet-stream"
+                elif isinstance(payload, str):
+                    data, content_type = payload.encode("utf-8"), "text/plain; charset=utf-8"
+                else:
+                    data, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_PATCH(self):
+                self._dispatch("PATCH")
+
+        return Handler
+
+
+class MockNotionServer(_MockServer):
+    """Notion API の模擬サーバー。"""
+
+    name = "notion"
+
+    def __init__(self, host="127.0.0.1", port=0, latency=None, seed=None, rps=DEFAULT_NOTION_RPS,
+                 burst=None, media_mb=1.0):
+        super().__init__(host, port, latency or DEFAULT_NOTION_LATENCY, seed)
+        self.rps = rps
+        self.burst = burst if burst is not None else max(1.0, rps * 3)
+        self.media = b"\0" * int(media_mb * 1024 * 1024)
+        self.databases = {}
+        self.pages = {}
+        self._buckets = {}
+        self._random = random.Random(seed)
+
+    def add_database(self, database_id, texts, status="投稿待ち"):
+        """
+        データベースを作り、texts の本文でページを登録する。
+        Args:
+            database_id (str): データベースID。
+            texts (list): 各ページの「回答（編集済み）」の本文。
+            status (str, optional): ページのステータス。
+        Returns:
+            list: 登録したページID。
+        """
+        ids = []
+        with self._lock:
+            pages = self.databases.setdefault(database_id, [])
+            for text in texts:
+                page_id = str(uuid.UUID(int=self._random.getrandbits(128)))
+                now = _now_iso()
+                self.pages[page_id] = {
+                    "object": "page",
+                    "id": page_id,
+                    "created_time": now,
+                    "last_edited_time": now,
+                    "parent": {"type": "database_id", "database_id": database_id},
+                    "properties": {
+                        STATUS_PROPERTY: {"type": "select", "select": {"name": status}},
+                        VIDEO_PROPERTY: {"type": "files", "files": [{
+                            "name": f"{page_id}.mp4",
+                            "type": "file",
+                            "file": {"url": f"{self.url}/files/{page_id}.mp4", "expiry_time": now},
+                        }]},
+                        CONTENT_PROPERTY: {"type": "rich_text", "rich_text": [
+                            {"type": "text", "text": {"content": text}, "plain_text": text}
+                        ]},
+                    },
+                }
+                pages.append(page_id)
+                ids.append(page_id)
+        return ids
+
+    def status_counts(self, database_id):
+        """データベースのステータスごとのページ数。"""
+        with self._lock:
+            counts = {}
+            for page_id in self.databases.get(database_id, []):
+                status = self.pages[page_id]["properties"][STATUS_PROPERTY]["select"]["name"]
+                counts[status] = counts.get(status, 0) + 1
+            return counts
+
+    def _allow(self, token):
+        """トークンバケットで要求を通すか決める。通さない場合は再試行までの秒数を返す。"""
+        if self.rps <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(token, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rps)
+            if tokens >= 1:
+                self._buckets[token] = (tokens - 1, now)
+                return None
+            self._buckets[token] = (tokens, now)
+            return (1 - tokens) / self.rps
+
+    @staticmethod
+    def _error(status, code, message):
+        return {"object": "error", "status": status, "code": code, "message": message}
+
+    def handle(self, method, path, headers, body):
+        file_match = _FILE_PATH.match(path)
+        if method == "GET" and file_match:
+            time.sleep(self.latency.delay_ms("file", 0.0) / 1000.0)
+            if file_match.group(1) not in self.pages:
+                return "file", 404, b"", None
+            return "file", 200, self.media, None
+
+        query_match, page_match = _QUERY_PATH.match(path), _PAGE_PATH.match(path)
+        if query_match and method == "POST":
+            op = "query"
+        elif page_match and method == "GET":
+            op = "retrieve"
+        elif page_match and method == "PATCH":
+            op = "update"
+        else:
+            return "other", 404, self._error(404, "object_not_found", f"{method} {path}"), None
+
+        token = (headers.get("Authorization") or "").replace("Bearer ", "", 1)
+        retry_after = self._allow(token)
+        if retry_after is not None:
+            return op, 429, self._error(429, "rate_limited", "Rate limited"), {
+                "Retry-After": str(max(1, int(retry_after + 0.999)))
+            }
+        time.sleep(self.latency.delay_ms(op, 0.0) / 1000.0)
+        payload = json.loads(body or b"{}")
+
+        with self._lock:
+            if op == "query":
+                database_id = query_match.group(1)
+                if database_id not in self.databases:
+                    return op, 404, self._error(404, "object_not_found", f"database {database_id}"), None
+                pages = [self.pages[p] for p in self.databases[database_id]]
+                pages = [p for p in pages if _property_matches(p, payload.get("filter") or {})]
+                pages.sort(key=lambda p: p["created_time"])
+                start = int(payload.get("start_cursor") or 0)
+                size = min(int(payload.get("page_size") or 100), 100)
+                chunk = pages[start:start + size]
+                has_more = start + size < len(pages)
+                return op, 200, {
+                    "object": "list",
+                    "results": json.loads(json.dumps(chunk)),
+                    "has_more": has_more,
+                    "next_cursor": str(start + size) if has_more else None,
+                }, None
+
+            page = self.pages.get(page_match.group(1))
+            if page is None:
+                return op, 404, self._error(404, "object_not_found", f"page {page_match.group(1)}"), None
+            if op == "update":
+                for name, value in (payload.get("properties") or {}).items():
+                    page["properties"].setdefault(name, {}).update(value)
+                page["last_edited_time"] = _now_iso()
+            return op, 200, json.loads(json.dumps(page)), None
+
+
+class MockSlackServer(_MockServer):
+    """Slack Incoming Webhook の模擬サーバー。受け取った通知をパスごとに保持する。"""
+
+    name = "slack"
+
+    def __init__(self, host="127.0.0.1", port=0, latency=None, seed=None):
+        super().__init__(host, port, latency or DEFAULT_SLACK_LATENCY, seed)
+        self.messages = {}
+
+    def handle(self, method, path, headers, body):
+        if method != "POST" or not path.startswith("/services/"):
+            return "other", 404, "no_service", None
+        time.sleep(self.latency.delay_ms("webhook", 0.0) / 1000.0)
+        text = json.loads(body or b"{}").get("text", "")
+        with self._lock:
+            self.messages.setdefault(path, []).append(text)
+        return "webhook", 200, "ok", None
+
+
+def _rewrite(url):
+    """リダイレクト先が登録されたホストなら、URLを模擬サーバーのものに置き換える。"""
+    parts = urlsplit(url)
+    target = _redirects.get(parts.hostname)
+    if target is None:
+        return None
+    base = urlsplit(target)
+    return parts._replace(scheme=base.scheme, netloc=base.netloc).geturl()
+
+
+def _install_redirects():
+    """requests / httpx のトランスポートに割り込む（プロセスで1回だけ）。"""
+    with _redirect_lock:
+        if _redirect_state["installed"]:
+            return
+        try:
+            from requests.adapters import HTTPAdapter
+
+            original_send = HTTPAdapter.send
+
+            def send(self, request, *args, **kwargs):
+                rewritten = _rewrite(request.url)
+                if rewritten:
+                    request.url = rewritten
+                return original_send(self, request, *args, **kwargs)
+
+            HTTPAdapter.send = send
+        except ImportError:
+            pass
+        try:
+            import httpx
+
+            original_handle = httpx.HTTPTransport.handle_request
+
+            def handle_request(self, request):
+                rewritten = _rewrite(str(request.url))
+                if rewritten:
+                    request.url = httpx.URL(rewritten)
+                return original_handle(self, request)
+
+            httpx.HTTPTransport.handle_request = handle_request
+        except ImportError:
+            pass
+        _redirect_state["installed"] = True
+
+
+@contextmanager
+def redirect_hosts(mapping):
+    """
+    with 文の区間、指定したホストへの HTTP 通信を模擬サーバーに向ける。
+    Args:
+        mapping (dict): ホスト名 → 模擬サーバーのURL（例: {"api.notion.com": "http://127.0.0.1:8766"}）。
+    """
+    _install_redirects()
+    with _redirect_lock:
+        _redirects.update(mapping)
+    try:
+        yield
+    finally:
+        with _redirect_lock:
+            for host in mapping:
+                _redirects.pop(host, None)
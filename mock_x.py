@@ -0,0 +1,770 @@
+"""
+投稿フロー（Selenium）をローカルで動かすための X（Twitter）の模擬サイト。
+
+twitter.com の代わりに http://127.0.0.1:<port> で次の画面を提供する。要素の data-testid・role・
+aria 属性は実際の画面と同じにしてあるため、投稿スクリプトのセレクタ・待ち方をそのまま試せる。
+
+    /home                ホーム（SideNav_NewTweet_Button、インラインの投稿欄、自分の投稿）
+    /compose/post        投稿ダイアログ（tweetTextarea_0、fileInput、attachments、tweetButton）
+    /<ユーザー名>          プロフィールのタイムライン（article[data-testid="tweet"]）
+    /<ユーザー名>/status/<ID>  ツイート詳細（親・本人・リプライと inline_reply_offscreen の返信欄）
+    /i/flow/login        ログイン画面（name="text" → name="password"）
+
+投稿欄は contenteditable で、⌘/Ctrl+V（貼り付け）・⌘/Ctrl+Enter（送信）・Esc（ポップアップを閉じる）に反応する。
+ヘッドレスの Chrome はOSのクリップボードを読めないため、clipboard="server" の場合は
+⌘/Ctrl+V で /__mock/clipboard の内容を貼り付ける（ベンチマークは pyperclip.copy をここに向ける）。
+動画を選ぶと進捗バー（role="progressbar"）→「処理中」→ プレビューの順に表示し、終わるまで送信ボタンを無効にする。
+投稿は /i/api/tweet でサーバーに保存され、/__mock/state で確認できる。
+users（ログインID → ユーザー名）を渡すと、ログイン画面で入力したIDごとに別のアカウントとして扱う
+（ユーザー名はCookieに持つ）。クリップボードはサイト全体で1つなので、OSのクリップボードと同じく
+複数のアカウントが並行して貼り付けると内容を取り違える。
+
+応答時間（http_cassette.LatencyModel と同じ書式で、ホスト名の代わりに項目名を指定）:
+    page        HTML を返すまでの時間
+    render      ページ表示後に投稿欄が現れるまでの時間
+    post        投稿 API の応答時間
+    upload      動画のアップロードにかかる時間（ファイルサイズ分は upload_mbps で加算）
+    processing  アップロード後の「処理中」の時間
+
+失敗の注入（発生率 0〜1）:
+    post_error      投稿 API が 500 を返す（投稿は保存されない）
+    ghost_post      投稿は保存されるが 500 を返す（再送すると二重投稿になる）
+    button_stuck    送信ボタンが有効にならない（⌘/Ctrl+Enter なら送れる）
+    selector_drift  投稿欄・送信ボタンの data-testid が変わる（tweetTextarea_1 / tweetButtonInline）
+    upload_stall    アップロードが途中で止まる
+    popup           プレミアム加入のポップアップが投稿欄を覆う（Esc で閉じる）
+    login_wall      セッションが切れてログイン画面に飛ばされる
+
+error_screenshots/ に保存された実際の画面の HTML（投稿失敗時に post_tweet.py が保存するもの）があれば、
+/home・/compose/post の一部をその HTML で返す（スクリプトと外部 CSS を取り除き、模擬の動作だけを付ける）。
+実際の DOM の深さ・属性でセレクタを試すためのもので、要素が欠けている画面はそのまま失敗を再現する。
+
+    python3 mock_x.py serve --port 8765 --fail "post_error=0.1,popup=0.05"
+    AUTO_POST_TWITTER_BASE_URL=http://127.0.0.1:8765 python3 "post_tweet 2.py" --account 名前
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import html
+import random
+import argparse
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+from http_cassette import LatencyModel
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SNAPSHOT_DIR = os.path.join(SCRIPT_DIR, "error_screenshots")
+DEFAULT_LATENCY = "page=fixed:50;render=fixed:150;post=fixed:300;upload=fixed:1500;processing=fixed:800;none"
+DEFAULT_UPLOAD_MBPS = 20.0
+FAILURES = ("post_error", "ghost_post", "button_stuck", "selector_drift", "upload_stall", "popup", "login_wall")
+AUTH_COOKIE = "auth_token"
+# 実在しない範囲のID（先頭の桁で本物と見分けられるようにする）
+FIRST_TWEET_ID = 9000000000000000000
+
+_SCRIPT_TAG = re.compile(r"<script\b[^>]*>.*?</script\s*>", re.S | re.I)
+_EXTERNAL_TAG = re.compile(r"<(?:link|base|meta\s+http-equiv)\b[^>]*>", re.I)
+
+_PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="ja" dir="ltr">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 0; display: flex; }}
+nav {{ width: 220px; padding: 12px; }}
+main {{ width: 600px; border-left: 1px solid #ddd; border-right: 1px solid #ddd; min-height: 100vh; }}
+[role="textbox"] {{ min-height: 48px; padding: 8px; border: 1px solid #ccc; white-space: pre-wrap; }}
+[role="dialog"] {{ position: fixed; top: 40px; left: 260px; width: 560px; background: #fff;
+                  border: 1px solid #999; padding: 12px; z-index: 10; }}
+[data-testid="sheetDialog"] {{ position: fixed; inset: 0; background: rgba(0,0,0,.4); z-index: 20; }}
+article {{ padding: 12px; border-bottom: 1px solid #eee; }}
+input[type="file"] {{ position: absolute; width: 1px; height: 1px; opacity: 0; }}
+[data-testid="toast"] {{ position: fixed; bottom: 20px; left: 40%; background: #1d9bf0; color: #fff; padding: 8px; }}
+</style>
+</head>
+<body>
+<nav>
+<a href="/home" data-testid="AppTabBar_Home_Link">ホーム</a><br>
+<a href="/{username}" data-testid="AppTabBar_Profile_Link">プロフィール</a><br>
+<a href="/compose/post" data-testid="SideNav_NewTweet_Button" role="link">ポストする</a>
+</nav>
+<main role="main">
+<div id="composer-root"></div>
+<section aria-label="タイムライン" data-testid="primaryColumn">{articles}</section>
+</main>
+{dialog}
+{boot}
+</body>
+</html>
+"""
+
+_LOGIN_TEMPLATE = """<!DOCTYPE html>
+<html lang="ja">
+<head><meta charset="utf-8"><title>X にログイン / X</title></head>
+<body>
+<form id="login" method="post" action="/i/flow/login">
+<div id="step"><input name="text" autocomplete="username" aria-label="メールアドレス"></div>
+</form>
+<script>
+(function () {
+  var form = document.getElementById('login');
+  var values = {};
+  form.addEventListener('keydown', function (e) {
+    if (e.key !== 'Enter') { return; }
+    e.preventDefault();
+    var input = e.target;
+    values[input.name] = input.value;
+    if (input.name === 'text') {
+      setTimeout(function () {
+        document.getElementById('step').innerHTML =
+          '<input type="password" name="password" autocomplete="current-password" aria-label="パスワード">';
+      }, 300);
+    } else {
+      var hidden = document.createElement('input');
+      hidden.type = 'hidden'; hidden.name = 'text'; hidden.value = values.text || '';
+      form.appendChild(hidden);
+      form.submit();
+    }
+  });
+})();
+</script>
+</body>
+</html>
+"""
+
+# 画面の動作（投稿欄・アップロード・送信・ポップアップ）。window.__MOCK__ の設定で動く
+_APP_JS = r"""
+(function () {
+  var M = window.__MOCK__;
+  var composers = [];
+
+  function q(selector, root) { return (root || document).querySelector(selector); }
+  function textOf(box) { return (box.innerText || '').replace(/\u00a0/g, ' ').trim(); }
+
+  function toast(text) {
+    var el = document.createElement('div');
+    el.setAttribute('data-testid', 'toast');
+    el.setAttribute('role', 'alert');
+    el.innerHTML = '<div>' + text + '</div>';
+    document.body.appendChild(el);
+    setTimeout(function () { el.remove(); }, 4000);
+  }
+
+  function composerHtml(inline) {
+    var box = M.drift ? 'tweetTextarea_1' : 'tweetTextarea_0';
+    var button = (M.drift || inline) ? 'tweetButtonInline' : 'tweetButton';
+    var label = M.page === 'status' ? '返信をポスト' : 'ポスト本文';
+    return '<div class="DraftEditor-root"><div data-testid="' + box + '" role="textbox" aria-label="' + label +
+      '" aria-multiline="true" contenteditable="true" spellcheck="true"></div></div>' +
+      '<div data-testid="attachments"></div>' +
+      '<div data-testid="toolBar"><input type="file" data-testid="fileInput" multiple accept="image/*,video/*">' +
+      '<button type="button" data-testid="' + button + '" role="button" disabled aria-disabled="true">' +
+      (M.page === 'status' ? '返信' : 'ポストする') + '</button></div>';
+  }
+
+  function refresh(c) {
+    var uploading = c.upload && !c.upload.done;
+    var hasContent = textOf(c.box).length > 0 || (c.upload && c.upload.done);
+    var enabled = hasContent && !uploading && !c.sending && !M.stuck;
+    c.button.disabled = !enabled;
+    c.button.setAttribute('aria-disabled', enabled ? 'false' : 'true');
+  }
+
+  function insertText(c, text) {
+    c.box.focus();
+    document.execCommand('insertText', false, text);
+    refresh(c);
+  }
+
+  function startUpload(c, file) {
+    var total = M.upload_ms + (file.size / (M.upload_mbps * 1024 * 1024)) * 1000;
+    c.upload = {name: file.name, size: file.size, done: false};
+    c.attachments.innerHTML = '<div role="progressbar" aria-valuemin="0" aria-valuemax="100" aria-valuenow="0"></div>' +
+      '<span>アップロード中 0%</span>';
+    refresh(c);
+    var started = Date.now();
+    var timer = setInterval(function () {
+      var ratio = Math.min(1, (Date.now() - started) / Math.max(total, 1));
+      if (M.upload_stall) { ratio = Math.min(ratio, 0.6); }
+      var percent = Math.floor(ratio * 100);
+      var bar = q('[role="progressbar"]', c.attachments);
+      if (bar) { bar.setAttribute('aria-valuenow', String(percent)); }
+      var label = q('span', c.attachments);
+      if (label) { label.textContent = 'アップロード中 ' + percent + '%'; }
+      if (ratio < 1) { return; }
+      clearInterval(timer);
+      c.attachments.innerHTML = '<span>処理中…</span>';
+      setTimeout(function () {
+        c.attachments.innerHTML = '<div data-testid="attachments-media"><video muted></video>' +
+          '<button type="button" aria-label="メディアを削除">×</button></div>';
+        c.upload.done = true;
+        refresh(c);
+      }, M.processing_ms);
+    }, 100);
+  }
+
+  function submit(c) {
+    if (c.sending) { return; }
+    var text = textOf(c.box);
+    if ((!text && !(c.upload && c.upload.done)) || (c.upload && !c.upload.done)) { return; }
+    c.sending = true;
+    c.box.setAttribute('aria-busy', 'true');
+    refresh(c);
+    fetch('/i/api/tweet', {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify({text: text, reply_to: M.reply_to || null,
+                            media: c.upload ? c.upload.name : null, page: M.page, snapshot: M.snapshot || null})
+    }).then(function (res) {
+      return res.json().then(function (data) { return {ok: res.ok, data: data}; });
+    }).then(function (res) {
+      c.sending = false;
+      c.box.removeAttribute('aria-busy');
+      if (!res.ok) {
+        toast('問題が発生しました。もう一度お試しください。');
+        refresh(c);
+        return;
+      }
+      c.box.innerHTML = '';
+      c.attachments.innerHTML = '';
+      c.upload = null;
+      refresh(c);
+      toast('ポストを送信しました');
+      var timeline = q('[data-testid="primaryColumn"]');
+      if (M.page === 'compose') {
+        setTimeout(function () { location.href = '/home'; }, M.redirect_ms);
+      } else if (timeline && M.page === 'status') {
+        timeline.insertAdjacentHTML('beforeend', res.data.article_html);
+      } else if (timeline) {
+        timeline.insertAdjacentHTML('afterbegin', res.data.article_html);
+      }
+    }).catch(function () {
+      c.sending = false;
+      c.box.removeAttribute('aria-busy');
+      toast('問題が発生しました。もう一度お試しください。');
+      refresh(c);
+    });
+  }
+
+  function attach(root) {
+    var box = q('[data-testid^="tweetTextarea_"][role="textbox"]', root) || q('[role="textbox"]', root);
+    var button = q('[data-testid="tweetButton"], [data-testid="tweetButtonInline"]', root);
+    if (!box || !button) { return null; }
+    box.innerHTML = '';
+    box.setAttribute('contenteditable', 'true');
+    var attachments = q('[data-testid="attachments"]', root);
+    if (!attachments) {
+      attachments = document.createElement('div');
+      attachments.setAttribute('data-testid', 'attachments');
+      box.parentNode.appendChild(attachments);
+    }
+    var c = {box: box, button: button, attachments: attachments, upload: null, sending: false};
+    box.addEventListener('input', function () { refresh(c); });
+    box.addEventListener('paste', function (e) {
+      var text = e.clipboardData && e.clipboardData.getData('text/plain');
+      if (text) { e.preventDefault(); insertText(c, text); }
+    });
+    button.addEventListener('click', function () { submit(c); });
+    var fileInput = q('input[type="file"]', root) || q('input[type="file"]');
+    if (fileInput) {
+      fileInput.addEventListener('change', function () {
+        if (fileInput.files.length) { startUpload(c, fileInput.files[0]); }
+      });
+    }
+    refresh(c);
+    composers.push(c);
+    return c;
+  }
+
+  function activeComposer() {
+    for (var i = 0; i < composers.length; i++) {
+      if (composers[i].box.contains(document.activeElement)) { return composers[i]; }
+    }
+    return composers[0];
+  }
+
+  function readServerClipboard() {
+    var xhr = new XMLHttpRequest();
+    xhr.open('GET', '/__mock/clipboard', false);
+    xhr.send(null);
+    return xhr.status === 200 ? xhr.responseText : '';
+  }
+
+  document.addEventListener('keydown', function (e) {
+    var popup = q('[data-testid="sheetDialog"]');
+    if (e.key === 'Escape' && popup) { popup.remove(); return; }
+    if (!(e.ctrlKey || e.metaKey)) { return; }
+    var c = activeComposer();
+    if (!c) { return; }
+    if (e.key === 'Enter') { e.preventDefault(); submit(c); }
+    if ((e.key === 'v' || e.key === 'V') && M.clipboard === 'server' && c.box.contains(document.activeElement)) {
+      e.preventDefault();
+      insertText(c, readServerClipboard());
+    }
+  }, true);
+
+  function render() {
+    if (M.snapshot) {
+      var roots = document.querySelectorAll('[role="dialog"], main, body');
+      for (var i = 0; i < roots.length && !composers.length; i++) { attach(roots[i]); }
+    } else {
+      var holder = M.page === 'compose' ? q('#compose-dialog') : q('#composer-root');
+      if (M.page === 'status') {
+        holder.innerHTML = '<div data-testid="inline_reply_offscreen">' + composerHtml(true) + '</div>';
+      } else {
+        holder.innerHTML = composerHtml(M.page === 'home');
+      }
+      attach(holder);
+    }
+    if (M.popup) {
+      document.body.insertAdjacentHTML('beforeend',
+        '<div data-testid="sheetDialog" role="dialog" aria-modal="true"><div>X Premium にアップグレード</div></div>');
+    }
+  }
+
+  setTimeout(render, M.render_ms);
+})();
+"""
+
+
+def parse_failures(spec):
+    """
+    "post_error=0.1,popup=0.05" 形式の失敗の注入率を dict にする。
+    Args:
+        spec (str): 失敗の種類と発生率（0〜1）のカンマ区切り。
+    Returns:
+        dict: {失敗の種類: 発生率}
+    """
+    rates = {}
+    for entry in (spec or "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, rate = entry.partition("=")
+        name = name.strip()
+        if name not in FAILURES:
+            raise ValueError(f"不明な失敗の種類です: {name}（{', '.join(FAILURES)}）")
+        rates[name] = float(rate) if rate else 1.0
+    return rates
+
+
+def load_snapshots(snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+    """
+    error_screenshots/ の HTML を模擬サイトで使える形にして読み込む。
+    Returns:
+        list: {"name", "page"("home" / "compose"), "html"} のリスト。
+    """
+    if not snapshot_dir or not os.path.isdir(snapshot_dir):
+        return []
+    snapshots = []
+    for name in sorted(os.listdir(snapshot_dir)):
+        if not name.endswith(".html"):
+            continue
+        with open(os.path.join(snapshot_dir, name), "r", encoding="utf-8", errors="replace") as f:
+            source = f.read()
+        source = _EXTERNAL_TAG.sub("", _SCRIPT_TAG.sub("", source))
+        page = "compose" if 'aria-modal="true"' in source or "post_url_error" in name else "home"
+        snapshots.append({"name": name, "page": page, "html": source})
+    return snapshots
+
+
+class MockXState:
+    """投稿されたツイートとクリップボードの内容（スレッドセーフ）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tweets = []
+        self.clipboard = ""
+        self.injected = {}
+        self.requests = 0
+        self._next_id = FIRST_TWEET_ID
+
+    def add_tweet(self, username, text, reply_to=None, media=None, source=None):
+        with self._lock:
+            self._next_id += 1
+            tweet = {
+                "id": str(self._next_id),
+                "username": username,
+                "text": text,
+                "reply_to": reply_to,
+                "media": media,
+                "source": source,
+                "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            }
+            self.tweets.append(tweet)
+            return dict(tweet)
+
+    def get(self, tweet_id):
+        with self._lock:
+            return next((dict(t) for t in self.tweets if t["id"] == tweet_id), None)
+
+    def timeline(self, username):
+        """プロフィールに表示する投稿（リプライ以外、新しい順）。"""
+        with self._lock:
+            return [dict(t) for t in reversed(self.tweets) if t["username"] == username and not t["reply_to"]]
+
+    def conversation(self, tweet_id):
+        """詳細画面に表示する投稿（親をさかのぼった列・本人・直接のリプライ）。"""
+        with self._lock:
+            by_id = {t["id"]: t for t in self.tweets}
+            focal = by_id.get(tweet_id)
+            if focal is None:
+                return []
+            ancestors = []
+            parent = by_id.get(focal["reply_to"])
+            while parent is not None:
+                ancestors.insert(0, dict(parent))
+                parent = by_id.get(parent["reply_to"])
+            replies = [dict(t) for t in self.tweets if t["reply_to"] == tweet_id]
+            return ancestors + [dict(focal)] + replies
+
+    def count_injected(self, name):
+        with self._lock:
+            self.injected[name] = self.injected.get(name, 0) + 1
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "tweets": [dict(t) for t in self.tweets],
+                "injected": dict(self.injected),
+                "requests": self.requests,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.tweets = []
+            self.injected = {}
+            self.clipboard = ""
+
+
+def article_html(tweet):
+    """1件の投稿を実際の画面と同じ構造の article にする。"""
+    created = datetime.datetime.fromisoformat(tweet["created_at"])
+    username = html.escape(tweet["username"])
+    body = html.escape(tweet["text"]).replace("\n", "<br>")
+    media = '<div data-testid="videoPlayer"><video muted></video></div>' if tweet.get("media") else ""
+    return (
+        f'<article data-testid="tweet" role="article" tabindex="0">'
+        f'<div data-testid="User-Name"><a href="/{username}"><span>{username}</span></a>'
+        f'<a href="/{username}" tabindex="-1"><span>@{username}</span></a></div>'
+        f'<a href="/{username}/status/{tweet["id"]}"><time datetime="{tweet["created_at"]}">'
+        f'{created.strftime("%m月%d日")}</time></a>'
+        f'<div data-testid="tweetText" lang="ja" dir="auto">{body}</div>{media}'
+        f"</article>"
+    )
+
+
+class MockXServer:
+    """模擬サイトのHTTPサーバー。start() でバックグラウンドのスレッドから応答する。"""
+
+    def __init__(self, username="mock_user", host="127.0.0.1", port=0, latency=None, failures=None,
+                 seed=None, snapshots=None, snapshot_rate=0.5, require_login=False, clipboard="server", users=None):
+        self.username = username
+        # ログインID（メールアドレス・ユーザー名）→ ユーザー名。複数アカウントで1つのサイトを共有する場合に使う
+        self.users = dict(users or {})
+        self.latency = latency if isinstance(latency, LatencyModel) else LatencyModel(latency or DEFAULT_LATENCY, seed)
+        self.failures = failures if isinstance(failures, dict) else parse_failures(failures)
+        self.snapshots = load_snapshots() if snapshots is None else snapshots
+        self.snapshot_rate = snapshot_rate if self.snapshots else 0.0
+        self.require_login = require_login
+        self.clipboard = clipboard
+        self.upload_mbps = DEFAULT_UPLOAD_MBPS
+        self.state = MockXState()
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-x", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """フォアグラウンドで応答する（Ctrl+C で止める）。"""
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._httpd.server_close()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def roll(self, name):
+        """失敗を注入するかを決める（注入した回数を数える）。"""
+        rate = self.failures.get(name, 0.0)
+        if rate <= 0:
+            return False
+        with self._random_lock:
+            hit = self._random.random() < rate
+        if hit:
+            self.state.count_injected(name)
+        return hit
+
+    def delay(self, name):
+        """項目ごとの応答時間（ミリ秒）。"""
+        return self.latency.delay_ms(name, 0.0)
+
+    def resolve_user(self, login_id):
+        """ログイン画面で入力されたIDからユーザー名を決める（未登録なら既定のユーザー名）。"""
+        if login_id in self.users:
+            return self.users[login_id]
+        if login_id in self.users.values():
+            return login_id
+        return self.username
+
+    def _boot(self, page, username, reply_to=None, snapshot=None):
+        config = {
+            "page": page,
+            "username": username,
+            "reply_to": reply_to,
+            "snapshot": snapshot,
+            "render_ms": round(self.delay("render")),
+            "upload_ms": round(self.delay("upload")),
+            "processing_ms": round(self.delay("processing")),
+            "upload_mbps": self.upload_mbps,
+            "redirect_ms": 300,
+            "clipboard": self.clipboard,
+            "stuck": page != "profile" and self.roll("button_stuck"),
+            "drift": page != "profile" and self.roll("selector_drift"),
+            "upload_stall": page == "compose" and self.roll("upload_stall"),
+            "popup": page != "profile" and self.roll("popup"),
+        }
+        return (
+            f"<script>window.__MOCK__ = {json.dumps(config, ensure_ascii=False)};</script>"
+            f'<script src="/__mock/app.js"></script>'
+        )
+
+    def render_page(self, page, tweet_id=None, username=None, owner=None):
+        """
+        画面の HTML を作る。
+        Args:
+            page (str): "home" / "compose" / "profile" / "status"。
+            tweet_id (str, optional): status の場合のツイートID。
+            username (str, optional): ログイン中のユーザー名（省略時は既定のユーザー名）。
+            owner (str, optional): profile の場合に表示するユーザー名（省略時はログイン中のユーザー）。
+        Returns:
+            str or None: HTML。ツイートが見つからなければNone。
+        """
+        username = username or self.username
+        owner = owner or username
+        if page in ("home", "compose") and self.snapshots:
+            with self._random_lock:
+                use_snapshot = self._random.random() < self.snapshot_rate
+                candidates = [s for s in self.snapshots if s["page"] == page] or self.snapshots
+                chosen = self._random.choice(candidates)
+            if use_snapshot:
+                boot = self._boot(page, username, snapshot=chosen["name"])
+                source = chosen["html"]
+                index = source.lower().rfind("</body>")
+                return source[:index] + boot + source[index:] if index != -1 else source + boot
+
+        reply_to = None
+        if page == "status":
+            tweets = self.state.conversation(tweet_id)
+            if not tweets:
+                return None
+            reply_to = tweet_id
+            title = "X"
+        else:
+            tweets = self.state.timeline(owner)
+            title = {"home": "ホーム / X", "compose": "ポストする / X", "profile": f"@{owner} / X"}[page]
+        dialog = (
+            '<div role="dialog" aria-modal="true" aria-labelledby="modal-header"><div id="compose-dialog"></div></div>'
+            if page == "compose" else ""
+        )
+        return _PAGE_TEMPLATE.format(
+            title=title,
+            username=html.escape(username),
+            articles="".join(article_html(t) for t in tweets),
+            dialog=dialog,
+            boot=self._boot(page, username, reply_to=reply_to),
+        )
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body=b"", content_type="text/html; charset=utf-8", headers=None):
+                if isinstance(body, str):
+                    body = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-store")
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, status, data):
+                self._send(status, json.dumps(data, ensure_ascii=False), "application/json; charset=utf-8")
+
+            def _logged_in(self):
+                return self._cookie_user() is not None
+
+            def _cookie_user(self):
+                for item in (self.headers.get("Cookie") or "").split(";"):
+                    name, _, value = item.strip().partition("=")
+                    if name == AUTH_COOKIE and value:
+                        return unquote(value)
+                return None
+
+            def _current_user(self):
+                user = self._cookie_user()
+                return user if user in server.users.values() else server.username
+
+            def _to_login(self, clear_cookie=False):
+                headers = {"Location": "/i/flow/login"}
+                if clear_cookie:
+                    headers["Set-Cookie"] = f"{AUTH_COOKIE}=; Path=/; Max-Age=0"
+                self._send(302, headers=headers)
+
+            def _read_body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length) if length else b""
+
+            def do_GET(self):
+                server.state.count_request()
+                path = urlsplit(self.path).path.rstrip("/") or "/"
+                if path == "/__mock/app.js":
+                    return self._send(200, _APP_JS, "application/javascript; charset=utf-8")
+                if path == "/__mock/state":
+                    return self._json(200, server.state.snapshot())
+                if path == "/__mock/clipboard":
+                    return self._send(200, server.state.clipboard, "text/plain; charset=utf-8")
+                if path == "/favicon.ico":
+                    return self._send(204)
+                if path == "/i/flow/login":
+                    time.sleep(server.delay("page") / 1000.0)
+                    return self._send(200, _LOGIN_TEMPLATE)
+
+                parts = path.strip("/").split("/")
+                if path in ("/", "/home"):
+                    page, tweet_id = "home", None
+                elif path == "/compose/post":
+                    page, tweet_id = "compose", None
+                elif len(parts) == 1:
+                    page, tweet_id = "profile", None
+                elif len(parts) == 3 and parts[1] == "status":
+                    page, tweet_id = "status", parts[2]
+                else:
+                    return self._send(404, "<title>ページが見つかりません / X</title>")
+
+                if server.require_login and not self._logged_in():
+                    return self._to_login()
+                if page in ("home", "compose") and server.roll("login_wall"):
+                    return self._to_login(clear_cookie=True)
+                time.sleep(server.delay("page") / 1000.0)
+                body = server.render_page(
+                    page, tweet_id, username=self._current_user(),
+                    owner=parts[0] if page == "profile" else None,
+                )
+                if body is None:
+                    return self._send(404, "<title>このポストは表示できません / X</title>")
+                self._send(200, body)
+
+            def do_POST(self):
+                server.state.count_request()
+                path = urlsplit(self.path).path
+                body = self._read_body()
+                if path == "/i/flow/login":
+                    login_id = (parse_qs(body.decode("utf-8")).get("text") or [""])[0]
+                    user = server.resolve_user(login_id)
+                    return self._send(302, headers={
+                        "Location": "/home",
+                        "Set-Cookie": f"{AUTH_COOKIE}={quote(user)}; Path=/; Max-Age=31536000",
+                    })
+                if path == "/__mock/clipboard":
+                    server.state.clipboard = body.decode("utf-8")
+                    return self._send(204)
+                if path == "/__mock/reset":
+                    server.state.reset()
+                    return self._send(204)
+                if path != "/i/api/tweet":
+                    return self._send(404)
+
+                payload = json.loads(body or b"{}")
+                time.sleep(server.delay("post") / 1000.0)
+                if server.roll("post_error"):
+                    return self._json(500, {"errors": [{"message": "Internal error", "code": 131}]})
+                reply_to = payload.get("reply_to")
+                if reply_to and server.state.get(reply_to) is None:
+                    return self._json(404, {"errors": [{"message": "No status found", "code": 144}]})
+                tweet = server.state.add_tweet(
+                    self._current_user(), payload.get("text") or "", reply_to=reply_to,
+                    media=payload.get("media"), source=payload.get("snapshot") or payload.get("page"),
+                )
+                if server.roll("ghost_post"):
+                    return self._json(500, {"errors": [{"message": "Internal error", "code": 131}]})
+                self._json(200, {"tweet": tweet, "article_html": article_html(tweet)})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="投稿フロー確認用の X の模擬サイト")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="模擬サイトを起動する")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--username", default="mock_user", help="自分のアカウントとして扱うユーザー名")
+    serve_parser.add_argument("--latency", default=DEFAULT_LATENCY, help="応答時間（page=..., render=... など）")
+    serve_parser.add_argument("--fail", default="", help="失敗の注入率（例: post_error=0.1,popup=0.05）")
+    serve_parser.add_argument("--seed", type=int, help="乱数のシード")
+    serve_parser.add_argument("--snapshots", default=DEFAULT_SNAPSHOT_DIR, help="実際の画面の HTML のディレクトリ")
+    serve_parser.add_argument("--snapshot-rate", type=float, default=0.5, help="/home・/compose/post を HTML から返す割合")
+    serve_parser.add_argument("--require-login", action="store_true", help="ログインするまでログイン画面に飛ばす")
+    serve_parser.add_argument(
+        "--clipboard", choices=["server", "native"], default="native",
+        help="⌘/Ctrl+V で貼り付ける内容（native: OSのクリップボード、server: /__mock/clipboard）",
+    )
+    snapshots_parser = subparsers.add_parser("snapshots", help="HTML に含まれる投稿画面の要素を一覧する")
+    snapshots_parser.add_argument("--dir", default=DEFAULT_SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    if args.command == "snapshots":
+        snapshots = load_snapshots(args.dir)
+        if not snapshots:
+            print(f"ℹ️ {args.dir} に HTML がありません。")
+        for snapshot in snapshots:
+            testids = sorted(set(re.findall(r'data-testid="([^"]+)"', snapshot["html"])))
+            wanted = [t for t in testids if t.startswith(("tweetTextarea", "tweetButton", "fileInput", "SideNav", "attachments"))]
+            print(f"{snapshot['name']:<40} {snapshot['page']:<8} {', '.join(wanted) or '（投稿欄なし）'}")
+        return 0
+
+    server = MockXServer(
+        username=args.username, host=args.host, port=args.port, latency=args.latency,
+        failures=args.fail, seed=args.seed, snapshots=load_snapshots(args.snapshots),
+        snapshot_rate=args.snapshot_rate, require_login=args.require_login, clipboard=args.clipboard,
+    )
+    print(f"🧪 模擬サイトを起動しました: {server.url}（ユーザー名 @{server.username}、HTML {len(server.snapshots)} 件）")
+    print(f"   AUTO_POST_TWITTER_BASE_URL={server.url} を設定して投稿スクリプトを実行してください。")
+    server.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,13 @@
 import os
-import re
 import time
 import json
 import random
+import logging
 import datetime
 import argparse
 import platform
 import requests
 import pyperclip
-import unicodedata
 import sys
 from openai import OpenAI
 from dotenv import load_dotenv
@@ -28,7 +27,41 @@ from selenium.common.exceptions import (
     NoSuchElementException,
 )
 
+import tracing
+import metrics
+import log_setup
+import profiling
+from slack_notifier import get_slack_notifier
+import run_history
+from selector_registry import get_registry
+from upload_monitor import wait_for_media_ready
+from text_splitter import split_for_twitter, weighted_limit
+from text_normalize import COMPARE_NORMALIZER, compare_prefix, is_effectively_empty
+from rewrite_stage import RewriteStage, load_style_prompt
+from posting_ledger import (
+    ACTION_FINISH,
+    ACTION_RESUME,
+    ACTION_SKIP,
+    ACTION_VERIFY,
+    get_posting_ledger,
+    is_resumable,
+    thread_progress,
+)
+from rate_limit_ledger import account_key
+from retry_queue import STATUS_DEAD, classify_failure, get_retry_queue
+from dom_queries import (
+    WebDriverCommandCounter,
+    collect_tweet_articles,
+    get_element_state,
+    pick_status_url,
+)
+
+# 常駐スケジューラーからアカウントごとに読み込まれても同じロガーに出す
+logger = logging.getLogger("post_tweet")
+
 # === Notion & Twitter定数 ===
+# 模擬サイト（mock_x.py）で投稿フローを試すときは AUTO_POST_TWITTER_BASE_URL で差し替える
+TWITTER_BASE_URL = os.getenv("AUTO_POST_TWITTER_BASE_URL", "https://twitter.com").rstrip("/")
 CHAR_LIMIT = random.randint(135, 150)
 VIDEO_FILE_NAME = "notion_video.mp4"
 
@@ -43,29 +76,11 @@ USER_AGENTS = [
 
 def log(message):
     """
-    現在時刻と共にメッセージをコンソールに出力する。
+    メッセージをログに出力する。書き込みはキュー経由でバックグラウンドで行う（log_setup.py）。
     Args:
         message (str): 出力するメッセージ。
     """
-    now = datetime.datetime.now().strftime("%H:%M:%S")
-    print(f"[{now}] {message}")
-
-
-def is_effectively_empty(text):
-    """
-    テキストが実質的に空かどうか（空白や制御文字のみでないか）を判定する。
-    Args:
-        text (str): 判定対象のテキスト。
-    Returns:
-        bool: 実質的に空であればTrue、そうでなければFalse。
-    """
-    stripped = text.strip()
-    if not stripped:
-        return True
-    for c in stripped:
-        if unicodedata.category(c)[0] not in ["C", "Z"]:  # Control / Separator
-            return False
-    return True
+    logger.info(message)
 
 
 def load_config(account_name, path="accounts.json"):
@@ -94,72 +109,103 @@ def load_config(account_name, path="accounts.json"):
 
 def send_slack_notify(message: str) -> bool:
     """
-    Slackにメッセージを通知する。
+    Slackへの通知をキューに積む。送信はバックグラウンドで行い、
+    同じ時間帯の通知は1通のダイジェストにまとめる（slack_notifier.py）。
     Args:
         message (str): Slackに送信するメッセージ。
     Returns:
-        bool: 通知が成功した場合はTrue、失敗した場合はFalse。
+        bool: キューに積めた場合はTrue、Webhook URLが未設定の場合はFalse。
     """
-    payload = {"text": message}
-    try:
-        res = requests.post(SLACK_WEBHOOK_URL, json=payload)
-        res.raise_for_status()
-        log("✅ Slack通知送信成功")
-        return True
-    except Exception as e:
-        log(f"❌ Slack通知に失敗: {e}")
-        return False
+    queued = get_slack_notifier().notify(message, SLACK_WEBHOOK_URL, account=args.account)
+    if not queued:
+        log("⚠️ Slack Webhook URLが未設定のため通知しません")
+    return queued
 
 
-def get_valid_page():
+def get_valid_page(exclude_ids=()):
     """
     Notionデータベースから「投稿待ち」ステータスで条件を満たす最初のページを取得する。
     条件: ステータスが「投稿待ち」、動画ファイルが存在、回答（編集済み）が空でない。
+    Args:
+        exclude_ids (collection, optional): 選ばないページID（再試行待ち・デッドレター）。
     Returns:
-        tuple: (content, page_id, video_url)
+        tuple: (content, page_id, video_url, edited_at)
                content (str): 投稿するテキスト内容。
                page_id (str): NotionページのID。
                video_url (str): 添付動画のURL。
-               対象が見つからない場合やエラー時は (None, None, None) を返す。
+               edited_at (str): ページの最終更新日時（使用済み→投稿待ちの再利用ごとに変わる）。
+               対象が見つからない場合やエラー時は (None, None, None, None) を返す。
     """
     log("🔍 投稿待ちの投稿を取得中...")
     try:
-        results = notion.databases.query(
-            database_id=DATABASE_ID,
-            page_size=100,  # 十分な数を取得
-            filter={
-                "and": [
-                    {"property": "ステータス", "select": {"equals": "投稿待ち"}},
-                    {"property": "動画", "files": {"is_not_empty": True}},
-                    {
-                        "property": "回答（編集済み）",
-                        "rich_text": {"is_not_empty": True},
-                    },
-                ]
-            },
-            sorts=[
-                {"timestamp": "created_time", "direction": "ascending"}
-            ],  # 古いものから
-        ).get("results")
+        with tracing.span("notion.query", filter="投稿待ち") as sp:
+            results = notion.databases.query(
+                database_id=DATABASE_ID,
+                page_size=100,  # 十分な数を取得
+                filter={
+                    "and": [
+                        {"property": "ステータス", "select": {"equals": "投稿待ち"}},
+                        {"property": "動画", "files": {"is_not_empty": True}},
+                        {
+                            "property": "回答（編集済み）",
+                            "rich_text": {"is_not_empty": True},
+                        },
+                    ]
+                },
+                sorts=[
+                    {"timestamp": "created_time", "direction": "ascending"}
+                ],  # 古いものから
+            ).get("results")
+            sp.set(results=len(results or []))
+        # 投稿待ちの件数は実行全体のスパン（account/mode 付き）に載せる（run_posting を参照）
+        _run_stats["pending"] = len(results or [])
     except Exception as e:
         log(f"❌ 投稿待ちの取得に失敗しました: {e}")
         send_slack_notify(f"❌ 投稿待ちの取得に失敗: {e}")
-        return None, None, None
+        return None, None, None, None
 
+    results = [page for page in results or [] if page["id"] not in exclude_ids]
     if not results:
         log("❌ 投稿待ちに投稿対象が見つかりませんでした → 終了")
         send_slack_notify("❌ 投稿待ちに投稿対象が見つかりませんでした")
-        return None, None, None
+        return None, None, None, None
 
     page = results[0]  # 最初の1件を取得
     log(f"✅ 投稿対象を取得 → ページID: {page['id']}")
+    return _page_contents(page)
+
+
+def get_page(page_id):
+    """
+    再試行するページをIDで取得する。「投稿待ち」でなくなっている場合は対象外とする。
+    Args:
+        page_id (str): NotionページのID。
+    Returns:
+        tuple: (content, page_id, video_url, edited_at)。対象外・エラー時は (None, None, None, None)。
+    """
+    try:
+        with tracing.span("notion.retrieve", page_id=page_id):
+            page = notion.pages.retrieve(page_id=page_id)
+        properties = page["properties"]
+        status = (properties["ステータス"].get("select") or {}).get("name")
+        if status != "投稿待ち" or not properties["動画"]["files"]:
+            log(f"⚠️ 再試行対象のページ {page_id} は投稿待ちではなくなっています（{status}）")
+            return None, None, None, None
+        return _page_contents(page)
+    except Exception as e:
+        log(f"❌ 再試行対象のページ取得に失敗: {e}")
+        return None, None, None, None
+
+
+def _page_contents(page):
     content = "".join(
         block["text"]["content"]
         for block in page["properties"]["回答（編集済み）"]["rich_text"]
     )
     page_id = page["id"]
+    # Notionのファイル URL は期限付きのため、再試行時は毎回ページから取り直す
     video_url = page["properties"]["動画"]["files"][0]["file"]["url"]
-    return content, page_id, video_url
+    return content, page_id, video_url, page.get("last_edited_time")
 
 
 def get_driver():
@@ -174,6 +220,10 @@ def get_driver():
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
     options.add_experimental_option("useAutomationExtension", False)
     options.add_argument("--start-maximized")
+    # 負荷試験（load_test.py）など、画面を出さずに多数のブラウザを動かす場合
+    if os.getenv("AUTO_POST_HEADLESS", "").strip().lower() in ("1", "true", "yes", "on"):
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1280,1000")
 
     user_agent = random.choice(USER_AGENTS)
     options.add_argument(f"user-agent={user_agent}")
@@ -196,16 +246,16 @@ def login(driver):
     Args:
         driver (selenium.webdriver.chrome.webdriver.WebDriver): WebDriverインスタンス。
     """
-    driver.get("https://twitter.com/home")
+    driver.get(f"{TWITTER_BASE_URL}/home")
     time.sleep(random.uniform(2.5, 3.5))
 
     if "ログイン" not in driver.title and "/login" not in driver.current_url:
         log("✅ 既にログイン状態 → ログイン処理スキップ")
-        driver.get("https://twitter.com/compose/post")  # 投稿画面へ
+        driver.get(f"{TWITTER_BASE_URL}/compose/post")  # 投稿画面へ
         return
 
     log("🔐 ログイン処理を開始（セッション未保持のため）")
-    driver.get("https://twitter.com/i/flow/login")
+    driver.get(f"{TWITTER_BASE_URL}/i/flow/login")
 
     # メールアドレス入力
     email_input = WebDriverWait(driver, 20).until(
@@ -235,23 +285,43 @@ def login(driver):
     time.sleep(random.uniform(6.0, 7.0))  # ログイン完了待ち
 
     log("✅ ログイン成功 → 投稿画面に移動")
-    driver.get("https://twitter.com/compose/post")
+    driver.get(f"{TWITTER_BASE_URL}/compose/post")
+
+
+# リプライ送信ボタンの候補（SelectorRegistryが直近の成功順に並べ替える）
+REPLY_BUTTON_SELECTORS = [
+    (
+        By.XPATH,
+        '//div[@data-testid="inline_reply_offscreen"]//button[@data-testid="tweetButtonInline"]',
+    ),
+    (
+        By.XPATH,
+        '//div[@data-testid="inline_reply_offscreen"]//button[@data-testid="tweetButton"]',
+    ),
+    (By.XPATH, '//div[@role="dialog"]//button[@data-testid="tweetButton"]'),
+    (By.XPATH, '(//button[@data-testid="tweetButton"])[1]'),
+    (By.CSS_SELECTOR, 'button[data-testid="tweetButton"]'),
+    (By.CSS_SELECTOR, 'button[data-testid="tweetButtonInline"]'),
+]
+SELECTORS = get_registry()
 
 
 def split_text(text, limit=CHAR_LIMIT):
     """
-    指定された文字数制限に基づいてテキストを分割する。
+    Twitterの重み付き文字数（全角2・半角1）で長さを測り、文末や句読点で区切りながら
+    チャンク数が最小になるようにテキストを分割する。
     Args:
         text (str): 分割対象のテキスト。
-        limit (int, optional): 1チャンクあたりの最大文字数。デフォルトはCHAR_LIMIT。
+        limit (int, optional): 1チャンクあたりの最大文字数（全角換算）。デフォルトはCHAR_LIMIT。
     Returns:
         list: 分割されたテキストのリスト。
     """
-    log(f"🔍 テキストを {limit} 文字ごとに分割中...")
-    return [text[i : i + limit] for i in range(0, len(text), limit)]
+    max_weight = weighted_limit(limit)
+    log(f"🔍 テキストを重み付き {max_weight} 文字以内に分割中...")
+    return split_for_twitter(text, max_weight)
 
 
-def paste_and_send(driver, selector, content):
+def paste_and_send(driver, selector, content, on_click=None):
     """
     指定されたCSSセレクタの要素にコンテンツをペーストし、投稿を試みる。
     投稿ボタンのクリックとキーボードショートカットを試行し、成功判定を行う。
@@ -259,6 +329,7 @@ def paste_and_send(driver, selector, content):
         driver (selenium.webdriver.chrome.webdriver.WebDriver): WebDriverインスタンス。
         selector (str): テキスト入力エリアのCSSセレクタ。
         content (str): 投稿するテキスト内容。
+        on_click (callable, optional): 送信ボタンのクリック・⌘/Ctrl+Enter の直前に毎回呼ばれる。
     Returns:
         bool: 投稿に成功した場合はTrue、失敗した場合はFalse。
     """
@@ -302,6 +373,8 @@ def paste_and_send(driver, selector, content):
             time.sleep(random.uniform(0.5, 1.2))
             driver.execute_script("arguments[0].scrollIntoView(true);", send_button)
             time.sleep(0.3)
+            if on_click:
+                on_click()
             driver.execute_script("arguments[0].click();", send_button)
             log(f"📩 送信ボタン ({primary_send_button_css}) をクリックしました。")
             send_action_successful = True
@@ -322,6 +395,8 @@ def paste_and_send(driver, selector, content):
                     text_area_for_keys
                 ).click().perform()
                 time.sleep(random.uniform(0.3, 0.7))
+                if on_click:
+                    on_click()
                 ActionChains(driver).key_down(keys_modifier).send_keys(
                     Keys.ENTER
                 ).key_up(keys_modifier).perform()
@@ -347,12 +422,11 @@ def paste_and_send(driver, selector, content):
         time.sleep(random.uniform(5.0, 7.5))
 
         try:
-            text_area_check = WebDriverWait(driver, 7).until(
+            WebDriverWait(driver, 7).until(
                 EC.presence_of_element_located((By.CSS_SELECTOR, selector))
             )
-            current_text_area_content = text_area_check.get_attribute(
-                "textContent"
-            ).strip()
+            text_area_state = get_element_state(driver, selector)
+            current_text_area_content = text_area_state["text"] if text_area_state else ""
             log(
                 f"💬 テキストエリア内容確認: '{current_text_area_content[:100].replace(chr(10), '↵')}'"
             )
@@ -385,10 +459,12 @@ def download_video(url):
         str or None: 保存された動画ファイルの絶対パス。ダウンロード失敗時はNone。
     """
     try:
-        res = requests.get(url)
-        res.raise_for_status()  # HTTPエラーチェック
-        with open(VIDEO_FILE_NAME, "wb") as f:
-            f.write(res.content)
+        with tracing.span("http.download_video") as sp:
+            res = requests.get(url)
+            res.raise_for_status()  # HTTPエラーチェック
+            sp.add_bytes(len(res.content))
+            with open(VIDEO_FILE_NAME, "wb") as f:
+                f.write(res.content)
         return os.path.abspath(VIDEO_FILE_NAME)
     except Exception as e:
         log(f"❌ 動画のダウンロードに失敗: {e}")
@@ -396,7 +472,7 @@ def download_video(url):
         return None
 
 
-def post_tweet(driver, content, media_path=None, single_post_mode=False):
+def post_tweet(driver, content, media_path=None, single_post_mode=False, on_sent=None, on_sending=None):
     """
     Twitterにツイートを投稿する。メディア添付、単一投稿モードに対応。
     投稿後、成功した場合はツイートのURLを返す。
@@ -405,6 +481,8 @@ def post_tweet(driver, content, media_path=None, single_post_mode=False):
         content (str): 投稿するテキスト内容。
         media_path (str, optional): 添付するメディアファイルのパス。デフォルトはNone。
         single_post_mode (bool, optional): 単一投稿モードか否か。Trueの場合、URL取得をスキップ。デフォルトはFalse。
+        on_sent (callable, optional): 送信直後に on_sent(None)、URL取得後に on_sent(tweet_url) で呼ばれる。
+        on_sending (callable, optional): 送信ボタンを押す直前に on_sending() で呼ばれる。
     Returns:
         str or None: 投稿成功時はツイートURL、単一投稿成功時は "SUCCESS_SINGLE_POST"。失敗時はNone。
     """
@@ -415,55 +493,53 @@ def post_tweet(driver, content, media_path=None, single_post_mode=False):
                 EC.presence_of_element_located((By.XPATH, '//input[@type="file"]'))
             )
             upload_input.send_keys(media_path)
-            time.sleep(random.uniform(3.0, 3.5))  # アップロード完了待ち
+            # 固定待機ではなく、アップロードと動画処理の完了を検知して次へ進む
+            upload_result = wait_for_media_ready(driver, media_path)
+            if upload_result.ready:
+                log(f"✅ メディアの準備完了 ({upload_result.elapsed:.1f}秒)")
+            else:
+                log(
+                    f"⚠️ メディアの準備完了を {upload_result.elapsed:.1f}秒 以内に確認できませんでした。送信を試みます。"
+                )
 
         # paste_and_send関数を呼び出して投稿処理
         if not paste_and_send(
             driver,
             'div[data-testid="tweetTextarea_0"][role="textbox"][aria-label="ポスト本文"]',
             content,
+            on_click=on_sending,
         ):
             log("❌ paste_and_send での投稿に失敗しました。")
             return None  # paste_and_sendがFalseを返したら投稿失敗
 
+        # 送信済みであることを先に記録する（URL取得前に落ちても再投稿しないため）
+        if on_sent:
+            on_sent(None)
+
         if single_post_mode:
             log("✅ 1投稿のみのためプロフ遷移スキップ → 投稿成功と判定")
             return "SUCCESS_SINGLE_POST"
 
         # 投稿後にプロフィールへ移動し、最新のツイートURLを取得
         time.sleep(random.uniform(2.0, 2.5))
-        profile_url = f"https://twitter.com/{TWITTER_USERNAME}"
+        profile_url = f"{TWITTER_BASE_URL}/{TWITTER_USERNAME}"
         driver.get(profile_url)
         time.sleep(random.uniform(3.0, 4.0))  # プロフィールページ読み込み待ち
 
-        # 最新のツイートのリンク要素を取得
-        # より確実に自分のツイートを取得するために、ユーザー名を含むXPathを検討することもできる
-        latest_tweet_link_elements = driver.find_elements(
-            By.XPATH,
-            f'//article[@data-testid="tweet" and .//span[contains(text(), "@{TWITTER_USERNAME}")]]//a[contains(@href, "/status/")]',
-        )
-        if not latest_tweet_link_elements:
+        # 最新のツイート情報を1回のJS実行でまとめて取得し、自分の投稿のURLを選ぶ
+        articles = collect_tweet_articles(driver, TWITTER_USERNAME)
+        own_articles = [a for a in articles if a["by_user"]]
+        if not own_articles:
             log("❌ プロフィールページで最新のツイートリンクが見つかりませんでした。")
             return None
 
-        # 複数のリンクが見つかる可能性があるので、最もそれらしいもの（通常は最初のもの）を選ぶ
-        # さらに、投稿内容と照合するロジックを追加するとより堅牢になる
+        # 通常は最初の記事が最新の投稿。time要素を持つリンクを優先して採用する
         tweet_url = None
-        for link_element in latest_tweet_link_elements:
-            href = link_element.get_attribute("href")
-            if href and f"/{TWITTER_USERNAME}/status/" in href:
-                # time要素を持つリンクを優先する (より投稿に近い要素である可能性)
-                try:
-                    link_element.find_element(By.XPATH, ".//time")
-                    tweet_url = href
-                    log(f"  ツイートURL候補 (time要素あり): {tweet_url}")
-                    break  # time要素を持つものが見つかればそれを採用
-                except NoSuchElementException:
-                    if (
-                        not tweet_url
-                    ):  # まだURLが設定されていなければ、最初の候補として保持
-                        tweet_url = href
-                        log(f"  ツイートURL候補 (time要素なし): {tweet_url}")
+        for article in own_articles:
+            tweet_url = pick_status_url(article, TWITTER_USERNAME)
+            if tweet_url:
+                log(f"  ツイートURL候補: {tweet_url}")
+                break
 
         if not tweet_url:
             log("❌ 適切なツイートURLの特定に失敗しました。")
@@ -489,6 +565,8 @@ def post_tweet(driver, content, media_path=None, single_post_mode=False):
             return None
 
         log(f"✅ 投稿完了 → 自身の最新投稿URLを取得: {tweet_url}")
+        if on_sent:
+            on_sent(tweet_url)
         return tweet_url
     except Exception as e:
         log(f"❌ 投稿またはURL取得で例外発生: {e}")
@@ -503,6 +581,28 @@ def post_tweet(driver, content, media_path=None, single_post_mode=False):
                 log(f"⚠️ # 投稿用に一時保存された動画を削除に失敗しました: {e}")
 
 
+def find_posted_tweet(driver, content):
+    """
+    プロフィールの最新の投稿から、content を投稿したツイートを探す（送信したか不明な場合の確認用）。
+    Args:
+        driver (selenium.webdriver.chrome.webdriver.WebDriver): WebDriverインスタンス。
+        content (str): 投稿したはずのテキスト（スレッドの場合は先頭のチャンク）。
+    Returns:
+        str or None: 見つかったツイートのURL。見つからなければNone。
+    """
+    driver.get(f"{TWITTER_BASE_URL}/{TWITTER_USERNAME}")
+    time.sleep(random.uniform(3.0, 4.0))  # プロフィールページ読み込み待ち
+    content_key = compare_prefix(content.strip(), 20)
+    for article in collect_tweet_articles(driver, TWITTER_USERNAME):
+        if not article["by_user"] or content_key not in COMPARE_NORMALIZER(article["text"]):
+            continue
+        tweet_url = pick_status_url(article, TWITTER_USERNAME)
+        if tweet_url:
+            log(f"🔎 送信済みの投稿を確認しました: {tweet_url}")
+            return tweet_url
+    return None
+
+
 def close_premium_popup(driver):
     """
     Twitterのプレミアム加入を促すポップアップをEscキーで閉じる試みを行う。
@@ -516,58 +616,6 @@ def close_premium_popup(driver):
         log(f"❌ Escキー送信に失敗: {e}")
 
 
-def remove_non_bmp(text):
-    """
-    テキストからBMP（基本多言語面）以外の文字を除去する。
-    Args:
-        text (str): 対象のテキスト。
-    Returns:
-        str: BMP外の文字が除去されたテキスト。
-    """
-    return "".join(c for c in text if c <= "\uffff")
-
-
-def remove_emojis(text):
-    """
-    テキストから絵文字を除去する。
-    Args:
-        text (str): 対象のテキスト。
-    Returns:
-        str: 絵文字が除去されたテキスト。
-    """
-    emoji_pattern = re.compile(
-        "["
-        "\U0001f600-\U0001f64f"
-        "\U0001f300-\U0001f5ff"
-        "\U0001f680-\U0001f6ff"
-        "\U0001f1e0-\U0001f1ff"
-        "\U00002700-\U000027bf"
-        "\U0001f900-\U0001f9ff"
-        "\U00002600-\U000026ff"
-        "\u200d"
-        "\u2640-\u2642"
-        "\ufe0f"
-        "]+",
-        flags=re.UNICODE,
-    )
-    return emoji_pattern.sub(r"", text)
-
-
-def strip_invisible(text):
-    """
-    テキストから非表示文字（制御文字など）を除去する。
-    Args:
-        text (str): 対象のテキスト。
-    Returns:
-        str: 非表示文字が除去されたテキスト。
-    """
-    return "".join(
-        c
-        for c in text
-        if c.isprintable() and not unicodedata.category(c).startswith("C")
-    )
-
-
 def check_driver_window(driver, operation_name=""):
     """
     WebDriverのウィンドウハンドルが存在するか確認する。
@@ -675,112 +723,41 @@ def reply_to_tweet(driver, tweet_url, reply_content, is_last_reply=False):
             ):
                 return None
 
-            reply_button_inline_xpath = '//div[@data-testid="inline_reply_offscreen"]//button[@data-testid="tweetButtonInline"]'
-            reply_specific_button_xpath = '//div[@data-testid="inline_reply_offscreen"]//button[@data-testid="tweetButton"]'
-            reply_send_button_xpath_primary = (
-                '(//button[@data-testid="tweetButton"])[1]'
-            )
-            reply_send_button_xpath_dialog = (
-                '//div[@role="dialog"]//button[@data-testid="tweetButton"]'
+            # 全候補を一括で探索（直近で成功した候補を優先、表示中かつ有効なもののみ）
+            the_button_element, matched = SELECTORS.find(
+                driver,
+                "reply_button",
+                REPLY_BUTTON_SELECTORS,
+                timeout=10,
+                require_interactable=True,
             )
-            selectors_to_try = [
-                (By.XPATH, reply_button_inline_xpath, "XPath (Reply Inline Button)"),
-                (
-                    By.XPATH,
-                    reply_specific_button_xpath,
-                    "XPath (Reply Screen Specific)",
-                ),
-                (By.XPATH, reply_send_button_xpath_dialog, "XPath (Dialog)"),
-                (By.XPATH, reply_send_button_xpath_primary, "XPath (Primary)"),
-                (
-                    By.CSS_SELECTOR,
-                    'button[data-testid="tweetButton"]',
-                    "CSS Selector (General tweetButton)",
-                ),
-                (
-                    By.CSS_SELECTOR,
-                    'button[data-testid="tweetButtonInline"]',
-                    "CSS Selector (General tweetButtonInline)",
-                ),
-            ]
-
-            for by_type, selector_value, selector_name in selectors_to_try:
-                if send_action_successful:
-                    break
-                if not check_driver_window(driver, f"セレクタ {selector_name} 試行前"):
-                    return None
-                the_button_element = None
+            if the_button_element:
+                selector_value = matched[1]
                 try:
-                    log(
-                        f"🔍 リプライ送信ボタン ({selector_value}) を{selector_name}で探しています..."
-                    )
-                    presence_wait_duration = 10
-                    the_button_element = WebDriverWait(
-                        driver, presence_wait_duration
-                    ).until(EC.presence_of_element_located((by_type, selector_value)))
-                    log(f"  ✅ 要素 ({selector_name}) がDOMに存在します。")
-
-                    if not the_button_element.is_displayed():
-                        log(
-                            f"  ⚠️ 要素 ({selector_name}) はDOMに存在しますが、表示されていません。スキップします。"
-                        )
-                        continue
-                    if not the_button_element.is_enabled():
-                        log(
-                            f"  ⚠️ 要素 ({selector_name}) は表示されていますが、有効ではありません (is_enabled()=False)。スキップします。"
-                        )
-                        continue
-                    log(f"  ℹ️ 要素 ({selector_name}) の状態: 表示=True, 有効=True")
-
+                    log(f"✅ リプライ送信ボタン ({selector_value}) がクリック可能です。")
                     driver.execute_script(
                         "arguments[0].scrollIntoView({block: 'center', inline: 'center'});",
                         the_button_element,
                     )
-                    log(f"  📜 要素 ({selector_name}) を中央にスクロールしました。")
                     time.sleep(random.uniform(0.5, 1.0))
-
-                    clickable_wait_duration = 5
-                    WebDriverWait(driver, clickable_wait_duration).until(
-                        EC.element_to_be_clickable(the_button_element)
-                    )
-                    log(
-                        f"✅ リプライ送信ボタン ({selector_name} - {selector_value}) がクリック可能です。"
-                    )
-                    if not the_button_element.is_enabled():
-                        log(
-                            f"  ⚠️ クリック直前でボタンが無効化されました ({selector_name})。スキップします。"
-                        )
-                        continue
                     driver.execute_script("arguments[0].click();", the_button_element)
                     log(
-                        f"📩 リプライ送信ボタン ({selector_name} - {selector_value}) をJavaScriptでクリックしました。"
+                        f"📩 リプライ送信ボタン ({selector_value}) をJavaScriptでクリックしました。"
                     )
                     send_action_successful = True
-                    break
-                except TimeoutException as e_timeout:
-                    log(
-                        f"⚠️ {selector_name} ({selector_value}) でタイムアウト (試行 {attempt + 1}): {str(e_timeout).splitlines()[0]}"
-                    )
-                    if the_button_element:
-                        try:
-                            log(
-                                f"  ℹ️ タイムアウト時の要素状態: 表示={the_button_element.is_displayed()}, 有効={the_button_element.is_enabled()}, 位置={the_button_element.location}, サイズ={the_button_element.size}, テキスト='{the_button_element.text[:30]}'"
-                            )
-                        except Exception as e_state:
-                            log(f"  ℹ️ タイムアウト時の要素状態取得失敗: {e_state}")
-                    else:
-                        log(
-                            f"  ℹ️ 要素 ({selector_name}) がDOM内で見つからなかったか、存在確認の段階でタイムアウトしました。"
-                        )
                 except NoSuchWindowException as e_btn_click_nw:
                     log(
-                        f"⚠️ {selector_name} ({selector_value}) でボタン操作中にウィンドウが閉じました (試行 {attempt + 1}): {type(e_btn_click_nw).__name__} - {e_btn_click_nw}"
+                        f"⚠️ ボタン操作中にウィンドウが閉じました (試行 {attempt + 1}): {type(e_btn_click_nw).__name__} - {e_btn_click_nw}"
                     )
                     return None
                 except Exception as e_button_click:
                     log(
-                        f"⚠️ {selector_name} ({selector_value}) でリプライ送信ボタンの処理中に予期せぬエラー (試行 {attempt + 1}): {type(e_button_click).__name__} - {str(e_button_click).splitlines()[0]}"
+                        f"⚠️ リプライ送信ボタン ({selector_value}) の処理中に予期せぬエラー (試行 {attempt + 1}): {type(e_button_click).__name__} - {str(e_button_click).splitlines()[0]}"
                     )
+            else:
+                log(
+                    f"⚠️ リプライ送信ボタンがいずれの候補でも見つからないか、有効になりませんでした (試行 {attempt + 1})。"
+                )
 
             if send_action_successful:
                 break
@@ -843,12 +820,10 @@ def reply_to_tweet(driver, tweet_url, reply_content, is_last_reply=False):
                     driver, f"リプライエリア内容確認 {check_count+1}回目"
                 ):
                     return None
-                reply_area_check = driver.find_element(
-                    By.CSS_SELECTOR, reply_area_selector
-                )
-                current_reply_area_content = reply_area_check.get_attribute(
-                    "textContent"
-                ).strip()
+                reply_area_state = get_element_state(driver, reply_area_selector)
+                if reply_area_state is None:
+                    raise NoSuchElementException(reply_area_selector)
+                current_reply_area_content = reply_area_state["text"]
                 if not current_reply_area_content:
                     log(
                         "✅ リプライ入力エリアが空になりました。リプライ成功と判定します。"
@@ -891,126 +866,62 @@ def reply_to_tweet(driver, tweet_url, reply_content, is_last_reply=False):
             if not check_driver_window(driver, "リプライURL取得のための記事検索前"):
                 return None
 
-            articles = driver.find_elements(By.XPATH, '//article[@data-testid="tweet"]')
+            # 記事のテキスト・リンク・投稿者を1回のJS実行でまとめて取得
+            articles = collect_tweet_articles(driver, TWITTER_USERNAME)
             log(f"📦 現在のページで検出された投稿記事数: {len(articles)}")
 
             if articles:
-                normalized_reply_content_for_comp = strip_invisible(
-                    remove_emojis(
-                        unicodedata.normalize(
-                            "NFKC", remove_non_bmp(reply_content.strip())
-                        )[:20]
-                    )
-                ).replace(" ", "")
+                # 従来どおり、Unicode正規化の後・絵文字などの除去の前に20文字で切る
+                normalized_reply_content_for_comp = compare_prefix(reply_content.strip(), 20)
                 found_matching_article = False
                 for article in reversed(articles):
-                    if not check_driver_window(driver, "記事ループでのURL取得試行中"):
-                        return None
-                    article_text_raw = article.text
-                    preview_comp = strip_invisible(
-                        remove_emojis(
-                            unicodedata.normalize(
-                                "NFKC", remove_non_bmp(article_text_raw)
-                            )
-                        )
-                    ).replace(" ", "")
-                    user_name_in_article_xpath = f".//div[@data-testid='User-Name']//span[contains(text(), '@{TWITTER_USERNAME}')]"
+                    article_text_raw = article["text"]
+                    preview_comp = COMPARE_NORMALIZER(article_text_raw)
 
-                    if normalized_reply_content_for_comp in preview_comp:
-                        try:
-                            article.find_element(By.XPATH, user_name_in_article_xpath)
-                            log(
-                                f"✅ 内容が一致する可能性のある記事を発見。記事テキスト抜粋: {article_text_raw.strip().replace(chr(10), '↵')[:70]}..."
-                            )
-                            url_element = None
-                            try:
-                                url_element = article.find_element(
-                                    By.XPATH,
-                                    './/a[contains(@href, "/status/") and .//time]',
-                                )
-                            except NoSuchElementException:
-                                log(
-                                    "  ⓘ time要素を持つstatusリンクは見つかりませんでした。"
-                                )
-                            if not url_element:
-                                try:
-                                    url_element = article.find_element(
-                                        By.XPATH, './/a[contains(@href, "/status/")]'
-                                    )
-                                except NoSuchElementException:
-                                    log(
-                                        "  ⚠️ 一般的なstatusリンクも見つかりませんでした。この記事からはURLを取得できません。"
-                                    )
-                                    continue
-                            potential_url = url_element.get_attribute("href")
-                            if (
-                                TWITTER_USERNAME in potential_url
-                                and "/status/" in potential_url
-                            ):
-                                new_reply_url = potential_url
-                                log(f"🌐 URL取得成功 (内容一致): {new_reply_url}")
-                                found_matching_article = True
-                                break
-                        except NoSuchElementException:
-                            log(
-                                f"  ⓘ 内容スニペットは一致したが、ユーザー名またはリンク特定できず。"
-                            )
-                            continue
-                        except Exception as e_link_extract:
-                            log(f"  ⚠️ 記事からのリンク抽出中にエラー: {e_link_extract}")
-                            continue
-                if not found_matching_article and articles:
+                    if normalized_reply_content_for_comp not in preview_comp:
+                        continue
+                    if not article["by_user"]:
+                        log(
+                            f"  ⓘ 内容スニペットは一致したが、ユーザー名またはリンク特定できず。"
+                        )
+                        continue
+                    log(
+                        f"✅ 内容が一致する可能性のある記事を発見。記事テキスト抜粋: {article_text_raw.strip().replace(chr(10), '↵')[:70]}..."
+                    )
+                    potential_url = pick_status_url(article)
+                    if not potential_url:
+                        log(
+                            "  ⚠️ statusリンクが見つかりませんでした。この記事からはURLを取得できません。"
+                        )
+                        continue
+                    if TWITTER_USERNAME in potential_url:
+                        new_reply_url = potential_url
+                        log(f"🌐 URL取得成功 (内容一致): {new_reply_url}")
+                        found_matching_article = True
+                        break
+                if not found_matching_article:
                     log(
                         "⚠️ 内容一致でのURL特定に失敗。old_reply_to_tweet.py のように最新記事からの取得を試みます。"
                     )
                     last_article = articles[-1]
-                    try:
-                        preview_last = (
-                            last_article.text.strip()
-                            .replace("\n", " ")
-                            .replace("  ", " ")
-                        )
-                        normalized_preview_last = remove_emojis(
-                            unicodedata.normalize("NFKC", remove_non_bmp(preview_last))
+                    normalized_preview_last = COMPARE_NORMALIZER(last_article["text"])
+                    chunk_comp_last = normalized_reply_content_for_comp[:15]
+                    if chunk_comp_last in normalized_preview_last:
+                        log(
+                            "✅ 最新記事の内容が投稿チャンクと部分一致（フォールバック）。"
                         )
-                        chunk_comp_last = normalized_reply_content_for_comp[:15]
-                        if chunk_comp_last in strip_invisible(
-                            normalized_preview_last.replace(" ", "")
-                        ):
+                        new_reply_url = pick_status_url(last_article)
+                        if new_reply_url:
                             log(
-                                "✅ 最新記事の内容が投稿チャンクと部分一致（フォールバック）。"
+                                f"🌐 URL取得成功 (フォールバック - 最新記事): {new_reply_url}"
                             )
-                            url_element = None
-                            try:
-                                url_element = last_article.find_element(
-                                    By.XPATH,
-                                    './/a[contains(@href, "/status/") and .//time]',
-                                )
-                            except NoSuchElementException:
-                                log(
-                                    "  ⓘ (フォールバック) time要素を持つstatusリンクは見つかりませんでした。"
-                                )
-                            if not url_element:
-                                try:
-                                    url_element = last_article.find_element(
-                                        By.XPATH, './/a[contains(@href, "/status/")]'
-                                    )
-                                except NoSuchElementException:
-                                    log(
-                                        "  ⚠️ (フォールバック) 一般的なstatusリンクも見つかりませんでした。"
-                                    )
-                            if url_element:
-                                new_reply_url = url_element.get_attribute("href")
-                                log(
-                                    f"🌐 URL取得成功 (フォールバック - 最新記事): {new_reply_url}"
-                                )
                         else:
                             log(
-                                f"❌ 最新記事の内容も投稿チャンクと一致しませんでした。プレビュー: {preview_last[:50]}..., チャンク比較用: {chunk_comp_last}"
+                                "  ⚠️ (フォールバック) statusリンクが見つかりませんでした。"
                             )
-                    except Exception as e_fallback:
+                    else:
                         log(
-                            f"⚠️ 最新記事からのURL取得(フォールバック)に失敗: {e_fallback}"
+                            f"❌ 最新記事の内容も投稿チャンクと一致しませんでした。プレビュー: {last_article['text'][:50]}..., チャンク比較用: {chunk_comp_last}"
                         )
             else:
                 log("⚠️ 現在のページにツイート記事が見つかりませんでした。URL取得不可。")
@@ -1048,35 +959,72 @@ def reply_to_tweet(driver, tweet_url, reply_content, is_last_reply=False):
         return None
 
 
-def post_to_twitter(driver, chunks, video_url):
+def post_to_twitter(driver, chunks, media_path, on_sent=None, on_step=None, resume_from=None, on_sending=None):
     """
-    一連のテキストチャンクと動画URLを受け取り、Twitterにスレッド形式で投稿する。
-    最初のチャンクには動画を添付する。
+    一連のテキストチャンクをTwitterにスレッド形式で投稿する。最初のチャンクには動画を添付する。
     Args:
         driver (selenium.webdriver.chrome.webdriver.WebDriver): WebDriverインスタンス。
         chunks (list): 投稿するテキストチャンクのリスト。
-        video_url (str): 添付する動画のURL。
+        media_path (str): 添付する動画ファイルのパス（download_video() でダウンロード済みのもの）。
+        on_sent (callable, optional): 本投稿の送信時に呼ばれるコールバック（post_tweet参照）。
+        on_step (callable, optional): 1段投稿するごとに on_step(index, tweet_url) で呼ばれる。
+        resume_from (tuple, optional): (次のチャンク番号, 最後に投稿したツイートのURL)。
+            指定すると本投稿は行わず、そのツイートへのリプライから再開する。
+        on_sending (callable, optional): 本投稿の送信ボタンを押す直前に呼ばれる（post_tweet参照）。
     Returns:
         bool: 全ての投稿が成功した場合はTrue、途中で失敗した場合はFalse。
     """
-    media_path = download_video(video_url)
-    if not media_path:
-        log("❌ 動画のダウンロードに失敗したため投稿中止")
-        return False
+    # 1投稿（スレッド全体）あたりのWebDriverコマンド数を計測する
+    with WebDriverCommandCounter(driver) as command_counter:
+        success = _post_thread(
+            driver, chunks, media_path, on_sent=on_sent, on_step=on_step, resume_from=resume_from,
+            on_sending=on_sending,
+        )
+    log(f"📊 {command_counter.summary()}")
+    return success
 
-    single_post_mode = len(chunks) == 1
-    tweet_outcome = post_tweet(
-        driver, chunks[0], media_path, single_post_mode=single_post_mode
-    )
 
-    if single_post_mode:
-        if tweet_outcome == "SUCCESS_SINGLE_POST":
-            log("✅ 本投稿(単一モード)成功")
-            return True
-        else:
-            log(f"❌ 本投稿(単一モード)に失敗。post_tweet結果: {tweet_outcome}")
-            return False
-    else:  # スレッド投稿の場合
+def _post_thread(driver, chunks, media_path, on_sent=None, on_step=None, resume_from=None, on_sending=None):
+    """
+    ダウンロード済みの動画を添付して本投稿を行い、残りのチャンクをリプライで連結する。
+    Args:
+        driver (selenium.webdriver.chrome.webdriver.WebDriver): WebDriverインスタンス。
+        chunks (list): 投稿するテキストチャンクのリスト。
+        media_path (str): 添付する動画ファイルのパス。
+        on_sent (callable, optional): 本投稿の送信時に呼ばれるコールバック（post_tweet参照）。
+        on_step (callable, optional): 1段投稿するごとに on_step(index, tweet_url) で呼ばれる。
+        resume_from (tuple, optional): (次のチャンク番号, 最後に投稿したツイートのURL)。
+        on_sending (callable, optional): 本投稿の送信ボタンを押す直前に呼ばれる（post_tweet参照）。
+    Returns:
+        bool: 全ての投稿が成功した場合はTrue、途中で失敗した場合はFalse。
+    """
+    def step_done(index, tweet_url):
+        if on_step:
+            on_step(index, tweet_url)
+
+    if resume_from:
+        start_index, current_url = resume_from
+        log(f"🔁 {start_index + 1}段目からスレッドを再開します（対象: {current_url}）")
+    else:
+        single_post_mode = len(chunks) == 1
+        with tracing.span("post_tweet.head", chunks=len(chunks)) as sp:
+            tweet_outcome = post_tweet(
+                driver, chunks[0], media_path, single_post_mode=single_post_mode, on_sent=on_sent,
+                on_sending=on_sending,
+            )
+            if not tweet_outcome:
+                sp.fail()
+
+        if single_post_mode:
+            if tweet_outcome == "SUCCESS_SINGLE_POST":
+                log("✅ 本投稿(単一モード)成功")
+                step_done(0, None)
+                return True
+            else:
+                log(f"❌ 本投稿(単一モード)に失敗。post_tweet結果: {tweet_outcome}")
+                return False
+
+        # スレッド投稿の場合
         if not tweet_outcome or "/status/" not in tweet_outcome:
             log(
                 f"❌ 本投稿(多段の初回)に失敗またはURL取得失敗 (結果: {tweet_outcome}) → リプライ投稿を中止"
@@ -1085,50 +1033,58 @@ def post_to_twitter(driver, chunks, video_url):
 
         current_url = tweet_outcome
         log(f"✅ 本投稿(多段の初回)成功。最初の投稿URL: {current_url}")
-
+        step_done(0, current_url)
         # chunks[0] は最初の投稿で使ったので、リプライは chunks[1:] から
-        reply_chunks = chunks[1:]
-        num_reply_chunks = len(reply_chunks)
-
-        for i, chunk_content in enumerate(reply_chunks):
-            reply_number = i + 2  # 2段目から始まる
-            is_this_the_last_reply_in_thread = i == num_reply_chunks - 1
-
-            if is_effectively_empty(chunk_content):
-                log(f"⚠️ {reply_number}段目の内容が実質空のためスキップ")
-                continue
-
-            log(f"📎 {reply_number}段目リプライ投稿中（対象: {current_url})...")
+        start_index = 1
+
+    last_index = len(chunks) - 1
+    for index in range(start_index, len(chunks)):
+        chunk_content = chunks[index]
+        reply_number = index + 1  # 2段目から始まる
+        is_this_the_last_reply_in_thread = index == last_index
+
+        if is_effectively_empty(chunk_content):
+            log(f"⚠️ {reply_number}段目の内容が実質空のためスキップ")
+            # 再開時のリプライ先は変わらない
+            step_done(index, current_url)
+            continue
+
+        log(f"📎 {reply_number}段目リプライ投稿中（対象: {current_url})...")
+        with tracing.span("post_tweet.reply", index=index) as sp:
             reply_result = reply_to_tweet(
                 driver,
                 current_url,
                 chunk_content,
                 is_last_reply=is_this_the_last_reply_in_thread,
             )
-
             if not reply_result:
-                log(
-                    f"❌ {reply_number}段目のリプライ投稿またはそのURL取得に失敗 → スレッド投稿を中断します"
-                )
-                send_slack_notify(
-                    f"❌ {reply_number}段目のリプライ投稿/URL取得失敗: {TWITTER_USERNAME} - 対象URL: {current_url}"
-                )
-                return False
+                sp.fail()
 
-            if reply_result == "SUCCESS_LAST_REPLY":
-                log(f"✅ {reply_number}段目(最終リプライ)成功。")
-                break  # これが最後のチャンクだったので、スレッド投稿完了
-            elif "/status/" in reply_result:
-                current_url = reply_result
-                log(
-                    f"✅ {reply_number}段目リプライ成功。次のリプライは {current_url} に対して行われます。"
-                )
-                time.sleep(random.uniform(1.0, 2.0))  # 次のリプライまでの待機
-            else:  # 予期しない戻り値
-                log(
-                    f"❌ {reply_number}段目のリプライで予期しない結果 ({reply_result}) → スレッド投稿を中断します"
-                )
-                return False
+        if not reply_result:
+            log(
+                f"❌ {reply_number}段目のリプライ投稿またはそのURL取得に失敗 → スレッド投稿を中断します"
+            )
+            send_slack_notify(
+                f"❌ {reply_number}段目のリプライ投稿/URL取得失敗: {TWITTER_USERNAME} - 対象URL: {current_url}"
+            )
+            return False
+
+        if reply_result == "SUCCESS_LAST_REPLY":
+            log(f"✅ {reply_number}段目(最終リプライ)成功。")
+            step_done(index, None)
+            break  # これが最後のチャンクだったので、スレッド投稿完了
+        elif "/status/" in reply_result:
+            current_url = reply_result
+            step_done(index, current_url)
+            log(
+                f"✅ {reply_number}段目リプライ成功。次のリプライは {current_url} に対して行われます。"
+            )
+            time.sleep(random.uniform(1.0, 2.0))  # 次のリプライまでの待機
+        else:  # 予期しない戻り値
+            log(
+                f"❌ {reply_number}段目のリプライで予期しない結果 ({reply_result}) → スレッド投稿を中断します"
+            )
+            return False
 
     log("✅ 全てのスレッド投稿が完了しました。")
     return True
@@ -1139,46 +1095,20 @@ def mark_as_posted(page_id):
     指定されたNotionページのステータスを「使用済み」に更新する。
     Args:
         page_id (str): 更新するNotionページのID。
+    Returns:
+        bool: 更新に成功した場合はTrue。
     """
     try:
-        notion.pages.update(
-            page_id=page_id, properties={"ステータス": {"select": {"name": "使用済み"}}}
-        )
+        with tracing.span("notion.update", page_id=page_id):
+            notion.pages.update(
+                page_id=page_id, properties={"ステータス": {"select": {"name": "使用済み"}}}
+            )
         log(f"✅ 投稿完了 → Notion ステータス更新（{page_id}）")
+        return True
     except Exception as e:
         log(f"❌ Notion ステータス更新失敗: {e}")
         send_slack_notify(f"❌ Notion ステータス更新失敗: {e}")
-
-
-def load_style_prompt(account="default", path="style_prompts.json"):
-    """
-    指定されたアカウントまたはデフォルトのスタイルプロンプトをJSONファイルから読み込む。
-    Args:
-        account (str, optional): アカウント名。デフォルトは "default"。
-        path (str, optional): スタイルプロンプトファイルのパス。デフォルトは "style_prompts.json"。
-    Returns:
-        str: スタイルプロンプト。
-    Raises:
-        FileNotFoundError: スタイルプロンプトファイルが見つからない場合。
-        KeyError: 指定アカウントもdefaultもスタイル定義が存在しない場合。
-    """
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"Style prompt ファイルが見つかりません: {path}")
-
-    with open(path, "r", encoding="utf-8") as f:
-        styles = json.load(f)
-
-    if account in styles:
-        return styles[account]
-    elif "default" in styles:
-        log(
-            f"⚠️ アカウント '{account}' 用のスタイルが見つかりません。defaultを使用します。"
-        )
-        return styles["default"]
-    else:
-        raise KeyError(
-            f"スタイル定義が存在しません（アカウント: {account}, defaultもなし）"
-        )
+        return False
 
 
 # --- メイン処理 ---
@@ -1194,84 +1124,361 @@ parser.add_argument(
     help="投稿モード（'question' または 'joboffer'）。Notionデータベースの選択に使用。",
 )
 
-if "pytest" not in sys.modules:
-    args = parser.parse_args()
-else:
-    # pytest実行時はデフォルト値で動作させる
-    args = argparse.Namespace(account="default", mode="question")
 
-load_dotenv()  # .envファイルから環境変数を読み込む
+# configure() を繰り返し呼んでもクライアントを作り直さないよう、作成に使ったキーと一緒に保持する
+client = None
+notion = None
+_client_keys = {}
+
 
-if not os.getenv("OPENAI_API_KEY"):
-    raise ValueError("❌ OPENAI_API_KEY が .env に定義されていません")
+def configure(account="default", mode="question"):
+    """
+    アカウントとモードの設定を読み込み、モジュールのグローバル変数に展開する。
+    常駐スケジューラー（posting_daemon.py）はアカウントごとにこのモジュールを読み込み、
+    configure() を呼んでから run_posting() を繰り返し実行する。
+    OpenAI/Notion のクライアントはキーが変わらない限り前回のものを使い回す。
+    Args:
+        account (str, optional): アカウント名 (accounts.jsonで定義)。
+        mode (str, optional): 投稿モード（'question' または 'joboffer'）。
+    """
+    global args, client, config, notion
+    global TWITTER_EMAIL, TWITTER_USERNAME, TWITTER_PASSWORD
+    global NOTION_TOKEN, DATABASE_ID, SLACK_WEBHOOK_URL
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))  # OpenAIクライアント初期化
+    args = argparse.Namespace(account=account, mode=mode)
 
-config = load_config(args.account)  # アカウント設定読み込み
+    load_dotenv()  # .envファイルから環境変数を読み込む
 
-# グローバル変数として設定値を展開
-TWITTER_EMAIL = config["email"]
-TWITTER_USERNAME = config["username"]
-TWITTER_PASSWORD = config["password"]
-NOTION_TOKEN = config["notion_token"]
-DATABASE_ID = config["database_ids"][args.mode]  # モードに応じたDB IDを使用
-SLACK_WEBHOOK_URL = config["slack_webhook_url"]
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    if not openai_api_key:
+        raise ValueError("❌ OPENAI_API_KEY が .env に定義されていません")
 
-if __name__ == "__main__":
-    if "pytest" in sys.modules:
-        log("⚠️ pytest 実行中のため、メインスクリプトをスキップします")
+    if client is None or _client_keys.get("openai") != openai_api_key:
+        client = OpenAI(api_key=openai_api_key)  # OpenAIクライアント初期化
+        _client_keys["openai"] = openai_api_key
+
+    config = load_config(account)  # アカウント設定読み込み
+
+    # グローバル変数として設定値を展開
+    TWITTER_EMAIL = config["email"]
+    TWITTER_USERNAME = config["username"]
+    TWITTER_PASSWORD = config["password"]
+    NOTION_TOKEN = config["notion_token"]
+    DATABASE_ID = config["database_ids"][mode]  # モードに応じたDB IDを使用
+    SLACK_WEBHOOK_URL = config["slack_webhook_url"]
+    if notion is None or _client_keys.get("notion") != NOTION_TOKEN:
+        notion = Client(auth=NOTION_TOKEN)  # Notionクライアント初期化
+        _client_keys["notion"] = NOTION_TOKEN
+
+
+@tracing.traced("post_tweet.fetch")
+def fetch_target(retry_queue):
+    """
+    投稿するページを決める。再試行キューで時刻の来たページを優先し、なければ新しいページを取得する。
+    Args:
+        retry_queue (RetryQueue): 再試行キュー。
+    Returns:
+        tuple: (content, page_id, video_url, edited_at)。get_valid_page() と同じ。
+    """
+    for job in retry_queue.due(args.account, args.mode):
+        content, page_id, video_url, edited_at = get_page(job["source_id"])
+        if content and video_url:
+            log(
+                f"🔁 再試行キューのページを優先して投稿します（{job['failure_class']}, {job['attempts']}回失敗）"
+            )
+            return content, page_id, video_url, edited_at
+        # 投稿待ちでなくなったページは再試行しない
+        retry_queue.record_success(args.account, job["source_id"])
+    return get_valid_page(retry_queue.held_ids(args.account))  # 投稿対象取得
+
+
+def schedule_retry(page_id, phase, error):
+    """
+    投稿に失敗したページを再試行キューに入れる。上限に達した場合はデッドレターに移し、
+    ページを「使用済み」にして次の投稿の妨げにならないようにする。
+    Args:
+        page_id (str): NotionページのID。
+        phase (str): 失敗した処理段階（"login" / "upload" / "post" など）。
+        error (Exception or str): 発生した例外、またはエラー内容。
+    Returns:
+        dict: 再試行キューに記録したジョブ。
+    """
+    # レート制限台帳は X のユーザー名で引く（Sheets 経由の API 投稿と同じキー）
+    rate_limit_account = account_key(config, args.account)
+    failure_class = classify_failure(phase, error, rate_limit_account)
+    job = get_retry_queue().record_failure(
+        args.account, page_id, failure_class, error, mode=args.mode, rate_limit_account=rate_limit_account
+    )
+    if job["status"] == STATUS_DEAD:
+        log(
+            f"☠️ {job['attempts']}回失敗したためデッドレターに移します（{failure_class}）→ ページ {page_id} を使用済みにします"
+        )
+        send_slack_notify(
+            f"☠️ 投稿を断念: {TWITTER_USERNAME} のページ {page_id}（{failure_class}: {error}）"
+        )
+        mark_as_posted(page_id)
     else:
-        page_id_for_finally = None  # finallyブロックで使うためのpage_id
-        driver_instance = None  # finallyブロックで使うためのdriver
+        retry_at = datetime.datetime.fromtimestamp(job["next_attempt_at"])
+        log(
+            f"🔁 {failure_class} の失敗として {retry_at:%H:%M:%S} 以降に再試行します（{job['attempts']}回目の失敗）"
+        )
+    return job
+
+
+# 実行中に分かった値のうち、実行全体のスパンに載せるもの（metrics.py の投稿待ち件数など）
+_run_stats = {}
+
+
+def run_posting(driver=None, keep_driver=False):
+    """
+    投稿を1回実行する（_run_posting を実行全体のトレーススパンで囲み、実行履歴に残す）。
+    引数・戻り値は _run_posting と同じ。
+    """
+    _run_stats.clear()
+    with log_setup.bind(account=args.account, mode=args.mode), run_history.record_run(
+        "post_tweet.run", account=args.account, mode=args.mode
+    ) as sp:
         try:
-            notion = Client(auth=NOTION_TOKEN)  # Notionクライアント初期化
-            driver_instance = get_driver()  # WebDriver取得
+            success, driver = _run_posting(driver, keep_driver)
+        finally:
+            sp.set(**_run_stats)
+        sp.set(success=success)
+        if not success:
+            sp.fail()
+    return success, driver
 
-            login(driver_instance)  # Twitterログイン
 
-            content, page_id_for_finally, video_url = get_valid_page()  # 投稿対象取得
-            if not content or not video_url:
-                log("❌ 投稿対象がありません → 処理終了")
-                # exit() # スクリプト終了
+def _run_posting(driver=None, keep_driver=False):
+    """
+    投稿待ちを1件取得して投稿し、Notionのステータスを更新する。
+    再試行キューに時刻の来たページがあれば、新しいページより先にそちらを投稿する。
+    失敗したページは「使用済み」にせず、失敗の種類に応じた時間をおいて再試行する。
+    Args:
+        driver (WebDriver, optional): 再利用するWebDriver。Noneなら新しく起動する。
+        keep_driver (bool, optional): Trueなら終了後もWebDriverを閉じない（常駐プロセス用）。
+    Returns:
+        tuple: (success, driver)
+               success (bool): 投稿に成功した場合はTrue。
+               driver (WebDriver or None): 閉じずに残したWebDriver。閉じた場合はNone。
+    """
+    page_id_for_finally = None  # finallyブロックで使うためのpage_id
+    driver_instance = driver  # finallyブロックで使うためのdriver
+    success = False
+    ledger = get_posting_ledger()
+    ledger_key = None  # 投稿台帳のキー（本文取得後に決まる）
+    action, entry = None, {}
+    sent = False  # 本投稿を送信したか（スレッドの途中で失敗しても True）
+    retry_queue = get_retry_queue()
+    phase = "fetch"  # 失敗の分類に使う現在の処理段階
+    failure = None  # 送信前に失敗した場合のエラー内容
+    try:
+        content, page_id_for_finally, video_url, edited_at = fetch_target(retry_queue)
+        if content and video_url:
+            # 同じページ・同じ本文を既に送信していないか台帳で確認する。
+            # ページは使用済み→投稿待ちで再利用されるため、最終更新日時も含めて区別する
+            ledger_key, action, entry = ledger.begin(
+                args.account, f"{page_id_for_finally}@{edited_at}", content
+            )
+            # 実行履歴用: 今回より前に試した回数（送信済みの記録なら前回の試行も再試行に数える）
+            attempts = entry.get("attempts") or 0
+            tracing.current_span().set(
+                page_id=page_id_for_finally,
+                retries=attempts if action in (ACTION_RESUME, ACTION_FINISH) else max(attempts - 1, 0),
+            )
+        if not content or not video_url:
+            log("❌ 投稿対象がありません → 処理終了")
+        elif action == ACTION_RESUME:
+            # 前回スレッドの途中で失敗している → 保存した分割のまま続きのリプライから投稿する
+            progress = thread_progress(entry)
+            sent = True
+            phase = "login"
+            if driver_instance is None:
+                with tracing.span("post_tweet.browser_start"):
+                    driver_instance = get_driver()  # WebDriver取得
+            with tracing.span("post_tweet.login"):
+                login(driver_instance)  # Twitterログイン
+            phase = "reply"
+            with tracing.span("post_tweet.post", chunks=len(progress["chunks"]), resumed=True):
+                success = post_to_twitter(
+                    driver_instance,
+                    progress["chunks"],
+                    None,
+                    on_step=lambda index, url: ledger.record_step(ledger_key, index, url),
+                    resume_from=(progress["next_index"], progress["last"]),
+                )
+            if not success:
+                failure = "スレッドの再開に失敗"
+            send_slack_notify(
+                f"{'✅' if success else '❌'} スレッド再開{'成功' if success else '失敗'}: {TWITTER_USERNAME}"
+            )
+        elif action == ACTION_VERIFY:
+            # 前回、送信ボタンを押した後に止まっている（送信されたか不明）→ 再投稿はせず、
+            # プロフィールで確認できればそこから続け、確認できなければステータス更新だけ行う
+            progress = thread_progress(entry)
+            chunks = progress["chunks"] if progress else [content]
+            sent = True
+            phase = "login"
+            if driver_instance is None:
+                with tracing.span("post_tweet.browser_start"):
+                    driver_instance = get_driver()  # WebDriver取得
+            with tracing.span("post_tweet.login"):
+                login(driver_instance)  # Twitterログイン
+            phase = "reply"
+            with tracing.span("post_tweet.verify"):
+                head_url = find_posted_tweet(driver_instance, chunks[0])
+            if head_url:
+                ledger.record_step(ledger_key, 0, head_url)
+                if len(chunks) > 1:
+                    with tracing.span("post_tweet.post", chunks=len(chunks), resumed=True):
+                        success = post_to_twitter(
+                            driver_instance,
+                            chunks,
+                            None,
+                            on_step=lambda index, url: ledger.record_step(ledger_key, index, url),
+                            resume_from=(1, head_url),
+                        )
+                    if not success:
+                        failure = "スレッドの再開に失敗"
+                else:
+                    success = True
             else:
-                log("📄 元の投稿内容:")
-                log(content)
-
-                # スタイルプロンプトの読み込み (GPT書き換え用だが現在はコメントアウトされている)
-                # account_name = args.account
-                # if args.mode == "joboffer":
-                #     style_prompt = load_style_prompt(
-                #         account_name, path="style_prompts_joboffers.json"
-                #     )
-                # else:
-                #     style_prompt = load_style_prompt(
-                #         account_name, path="style_prompts_questions.json"
-                #     )
-                # content_modified = rewrite_with_gpt(content, style_prompt) # GPT書き換え処理 (現在未使用)
-                # log("📝 GPTによる書き換え後の投稿内容:")
-                # log(content_modified)
-                # chunks = split_text(content_modified) # 書き換え後の内容を分割
-
-                chunks = split_text(content)  # 現在は元の内容を分割
+                log(
+                    "⚠️ 送信中に中断した投稿をプロフィールで確認できませんでした"
+                    " → 二重投稿を避けるため再投稿せず、Notionのステータスのみ更新します"
+                )
+                send_slack_notify(
+                    f"⚠️ 要確認: {TWITTER_USERNAME} のページ {page_id_for_finally} は送信中に中断し、投稿を確認できませんでした"
+                )
+                ledger.mark_sent(ledger_key)
+                success = True
+        elif action in (ACTION_FINISH, ACTION_SKIP):
+            # 前回、送信後にステータス更新まで進まずに終了している → 送信はせず更新だけ行う
+            log(
+                f"⏭️ このページは投稿済みです（ツイートID: {entry.get('tweet_id') or '不明'}）"
+                " → 再投稿せずNotionのステータスのみ更新します"
+            )
+            sent = True
+            success = True
+        else:
+            log("📄 元の投稿内容:")
+            log(content)
 
+            # リライトは rewrite_stage.py prefetch で事前に済ませておき、
+            # ここではキャッシュを引くだけにする（投稿時に OpenAI を呼ばない）
+            content_to_post = content
+            try:
+                style_prompt = load_style_prompt(args.account, args.mode)
+                content_to_post, is_rewritten = RewriteStage().lookup(
+                    content, style_prompt
+                )
+                if is_rewritten:
+                    log("📝 事前リライト済みの投稿内容を使用します:")
+                    log(content_to_post)
+            except Exception as e:
+                log(f"⚠️ リライトキャッシュの参照に失敗したため元の内容を使用します: {e}")
+
+            chunks = split_text(content_to_post)
+            # 途中で失敗しても同じ分割で再開できるよう、チャンクを保存しておく
+            ledger.start_thread(ledger_key, chunks)
+
+            def on_sent(tweet_url):
+                nonlocal sent
+                sent = True
+                ledger.mark_sent(ledger_key, tweet_url=tweet_url)
+
+            phase = "login"
+            if driver_instance is None:
+                with tracing.span("post_tweet.browser_start"):
+                    driver_instance = get_driver()  # WebDriver取得
+            with tracing.span("post_tweet.login"):
+                login(driver_instance)  # Twitterログイン
+
+            phase = "upload"
+            with tracing.span("post_tweet.upload"):
+                media_path = download_video(video_url)
+            if not media_path:
+                log("❌ 動画のダウンロードに失敗したため投稿中止")
+                failure = "動画のダウンロードに失敗"
+            else:
                 # Twitterへ投稿実行
-                success = post_to_twitter(driver_instance, chunks, video_url)
-                if success:
-                    send_slack_notify(
-                        f"✅ 投稿成功: {TWITTER_USERNAME} のツイートが完了しました"
-                    )
-                else:
-                    send_slack_notify(
-                        f"❌ 投稿失敗: {TWITTER_USERNAME} のツイートに失敗しました"
+                phase = "post"
+                with tracing.span("post_tweet.post", chunks=len(chunks)):
+                    success = post_to_twitter(
+                        driver_instance,
+                        chunks,
+                        media_path,
+                        on_sent=on_sent,
+                        on_sending=lambda: ledger.mark_sending(ledger_key),
+                        on_step=lambda index, url: ledger.record_step(ledger_key, index, url),
                     )
+                if not success:
+                    failure = "投稿画面の操作に失敗"
+                    if sent:
+                        phase = "reply"
+            if success:
+                send_slack_notify(
+                    f"✅ 投稿成功: {TWITTER_USERNAME} のツイートが完了しました"
+                )
+            else:
+                send_slack_notify(
+                    f"❌ 投稿失敗: {TWITTER_USERNAME} のツイートに失敗しました"
+                )
 
+    except Exception as e:
+        log(f"❌ 全体で例外発生: {e}")
+        send_slack_notify(f"❌ 致命的なエラーが発生: {e}")
+        failure = e
+        # 状態が不明なブラウザは使い回さない
+        keep_driver = False
+    finally:
+        # 処理の最後に必ず実行されるブロック
+        outcome = run_history.OUTCOME_SUCCESS if success else run_history.OUTCOME_FAILED
+        if failure is None and (not page_id_for_finally or action in (ACTION_FINISH, ACTION_SKIP)):
+            outcome = run_history.OUTCOME_SKIPPED
+        try:
+            if page_id_for_finally and sent and not success and is_resumable(
+                ledger.get(ledger_key)
+            ):
+                # スレッドの途中で失敗 → 使用済みにせず、再試行で続きから投稿する
+                ledger.mark_failed(ledger_key, failure)
+                if schedule_retry(page_id_for_finally, phase, failure)["status"] != STATUS_DEAD:
+                    outcome = run_history.OUTCOME_RETRY
+            elif page_id_for_finally and sent:
+                # 送信済みなら使用済みにする（続きから再開できない途中失敗も含む）
+                marked = mark_as_posted(page_id_for_finally)
+                if ledger_key and marked:
+                    ledger.mark_confirmed(ledger_key)
+                retry_queue.record_success(args.account, page_id_for_finally)
+            elif page_id_for_finally and failure is not None:
+                # 送信前の失敗はページを消費せず、再試行キューに入れる
+                if ledger_key:
+                    ledger.mark_failed(ledger_key, failure)
+                if schedule_retry(page_id_for_finally, phase, failure)["status"] != STATUS_DEAD:
+                    outcome = run_history.OUTCOME_RETRY
         except Exception as e:
-            log(f"❌ 全体で例外発生: {e}")
-            send_slack_notify(f"❌ 致命的なエラーが発生: {e}")
-        finally:
-            # 処理の最後に必ず実行されるブロック
-            if page_id_for_finally:  # page_idが取得されていればNotionステータス更新
-                mark_as_posted(page_id_for_finally)
-            if driver_instance:  # driverが初期化されていれば閉じる
+            log(f"⚠️ 投稿台帳・再試行キューの更新に失敗: {e}")
+        tracing.current_span().set(outcome=outcome)
+        if driver_instance and not keep_driver:  # driverが初期化されていれば閉じる
+            try:
                 driver_instance.quit()
-            log("🏁 スクリプト処理終了")
+            except Exception as e:
+                log(f"⚠️ WebDriverの終了に失敗: {e}")
+            driver_instance = None
+        log("🏁 スクリプト処理終了")
+    return success, driver_instance
+
+
+if "pytest" in sys.modules:
+    # pytest実行時はデフォルト値で動作させる
+    configure()
+
+if __name__ == "__main__":
+    if "pytest" in sys.modules:
+        log("⚠️ pytest 実行中のため、メインスクリプトをスキップします")
+    else:
+        args = parser.parse_args()
+        log_setup.setup_logging("post_tweet")
+        metrics.install()
+        configure(args.account, args.mode)
+        with profiling.profile_run("post_tweet"):
+            run_posting()
@@ -5,6 +5,7 @@ import time
 import re
 import datetime
 import requests
+from urllib3.exceptions import NewConnectionError
 import pyperclip
 import unicodedata
 import mimetypes
@@ -21,7 +22,6 @@ from selenium import webdriver
 import logging
 from dateutil import parser as date_parser
 import pytz
-from utils.slack_notify import notify_slack
 import json
 
 # config_loader のインポートパス修正
@@ -31,14 +31,30 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 from config import config_loader # config ディレクトリ内の config_loader を直接指定
 
-from utils.logger import setup_logger # utils.logger は相対パスで解決される想定
 from utils.webdriver_utils import get_driver, quit_driver # WebDriverユーティリティ
 from utils.twitter_login_selenium import login_to_twitter_with_selenium
+import tracing
+import metrics
+import log_setup
+import profiling
+from slack_notifier import get_slack_notifier
+import run_history
+from selector_registry import get_registry
+from dom_queries import WebDriverCommandCounter
+from upload_monitor import wait_for_media_ready
+from twitter_media_upload import ChunkedMediaUploader, MediaUploadError
+from posting_ledger import (
+    ACTION_POST, ACTION_RESUME, ACTION_SKIP, ACTION_VERIFY, get_posting_ledger, is_resumable, thread_progress
+)
+from retry_queue import FAILURE_RATE_LIMIT, STATUS_DEAD, classify_failure, get_retry_queue
+from twitter_api_clients import get_client_registry
+from text_splitter import split_for_twitter, weighted_limit
+from rate_limit_ledger import account_key, get_rate_limit_ledger
 
 # グローバルロガー設定 (main関数外でも使えるように)
-# main関数内で設定されている logger を参照するか、ここで新たに設定するか検討。
 # ここでは、スクリプトのトップレベルで設定し、各関数で利用できるようにする。
-logger = setup_logger(log_dir_name='logs/auto_post_logs', logger_name='AutoPostBot_Global')
+# 書き込みはキュー経由でバックグラウンドで行い、logs/auto_post_logs/ でサイズごとにローテーションする
+logger = log_setup.setup_logging('AutoPostBot_Global', log_dir=os.path.join('logs', 'auto_post_logs'))
 
 # TODO: このスクリプトは現在SeleniumベースのスクレイピングでXへの投稿を行っていますが、
 # 将来的には X API v2 (User Context, Tweepyライブラリ利用) を使った方式に移行する予定です。
@@ -76,9 +92,66 @@ CHAR_LIMIT = random.randint(
     char_limit_config.get("max", 150)
 )
 VIDEO_FILE_NAME = posting_config.get("video_download_filename", "temp_video.mp4")
+# 模擬サイト（mock_x.py）で投稿フローを試すときは AUTO_POST_TWITTER_BASE_URL で差し替える
+TWITTER_BASE_URL = os.getenv("AUTO_POST_TWITTER_BASE_URL", "https://twitter.com").rstrip("/")
 USER_AGENTS = config.get("user_agents", []) # get_bot_configが解決してくれる
 USE_TWITTER_API = config.get("posting_settings", {}).get("use_twitter_api", False) # API利用フラグ
-logger.info(f"DEBUG: USE_TWITTER_API flag is set to: {USE_TWITTER_API} (Type: {type(USE_TWITTER_API)})") # DEBUG LOG
+logger.debug("USE_TWITTER_API flag is set to: %r", USE_TWITTER_API)
+
+
+# 投稿画面で試すセレクタ候補（SelectorRegistryが直近の成功順に並べ替える）
+TEXTAREA_SELECTORS = [
+    (By.CSS_SELECTOR, 'div[data-testid="tweetTextarea_0"]'),
+    (By.CSS_SELECTOR, 'div[data-testid="tweetTextarea_1"]'),
+    (By.CSS_SELECTOR, 'div[role="textbox"]'),
+    (By.CSS_SELECTOR, 'div[aria-label="ポスト本文"]'),
+    (By.CSS_SELECTOR, 'div[aria-label="Post text"]'),
+    (By.CSS_SELECTOR, 'div[data-testid="tweetTextInput"]'),
+]
+POST_BUTTON_SELECTORS = [
+    (By.XPATH, '//button[@data-testid="tweetButton"]'),
+    (By.XPATH, '//div[@role="dialog"]//button[@data-testid="tweetButton"]'),
+    (By.XPATH, '//button[@data-testid="tweetButtonInline"]'),
+]
+SUCCESS_POPUP_SELECTORS = [
+    (By.XPATH, f"//div[contains(text(), '{popup_text}')]")
+    for popup_text in [
+        "ポストを送信しました",
+        "投稿しました",
+        "ツイートを投稿しました",
+        "Your post was sent",
+        "Your Tweet was sent",
+    ]
+]
+
+
+# API投稿の各ステップ（ツイート作成）の最大試行回数。再試行は接続前の失敗に限る
+API_STEP_RETRIES = 3
+# レート制限の解除をこの秒数まではプロセス内で待ち、それより先なら再試行キューで解除時刻に回す
+RATE_LIMIT_MAX_WAIT_SECS = 15 * 60
+
+
+class TweetSendUncertain(Exception):
+    """ツイート作成のリクエストは送ったが応答を受け取れず、作成されたか分からない。"""
+
+
+def request_never_sent(error):
+    """
+    接続を確立する前に失敗した（リクエストが X に届いていない）エラーかを判定する。
+    読み取りタイムアウトや接続断・サーバーエラーは、ツイートが作成済みの可能性があるため False。
+    Args:
+        error (Exception): 発生した例外。
+    Returns:
+        bool: 再送しても二重投稿にならない場合はTrue。
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError):
+        return False
+    reason = error.args[0] if error.args else None
+    # MaxRetryError に包まれている場合は中の原因を見る（名前解決の失敗も NewConnectionError）
+    reason = getattr(reason, "reason", reason)
+    return isinstance(reason, NewConnectionError)
 
 
 def simple_log(message):
@@ -86,8 +159,10 @@ def simple_log(message):
     logger.info(message)
 
 def split_text(text, limit=CHAR_LIMIT):
-    simple_log(f"🔍 テキストを {limit} 文字ごとに分割中...")
-    return [text[i:i + limit] for i in range(0, len(text), limit)]
+    """Twitterの重み付き文字数で、文末・句読点を優先しつつチャンク数が最小になるよう分割する。"""
+    max_weight = weighted_limit(limit)
+    simple_log(f"🔍 テキストを重み付き {max_weight} 文字以内に分割中...")
+    return split_for_twitter(text, max_weight)
 
 def convert_drive_url(url):
     """ Google Driveの共有URLを直接ダウンロード可能なURLに変換する """
@@ -106,7 +181,7 @@ def convert_drive_url(url):
 
 
 def post_tweet(driver, text, media_path=None):
-    driver.get("https://twitter.com/compose/post")
+    driver.get(f"{TWITTER_BASE_URL}/compose/post")
     time.sleep(3)
 
     try:
@@ -122,7 +197,8 @@ def post_tweet(driver, text, media_path=None):
         if media_path:
             file_input = driver.find_element(By.XPATH, '//input[@type="file"]')
             file_input.send_keys(media_path)
-            time.sleep(3)
+            upload_result = wait_for_media_ready(driver, media_path)
+            simple_log(f"メディアアップロード待機: 完了={upload_result.ready} ({upload_result.elapsed:.1f}秒)")
 
         # 投稿ボタンを明示的に待ってクリック
         post_button = WebDriverWait(driver, 10).until(
@@ -139,53 +215,14 @@ def post_tweet(driver, text, media_path=None):
 
 
 
-def get_twitter_conn_v1(twitter_api_config_param):
-    logger.debug(f"get_twitter_conn_v1 called with twitter_api_config_param: {twitter_api_config_param}") # ★追加
-    # bot_config から twitter_account セクションを取得する代わりに、渡された twitter_api_config_param を直接使用
-    api_key = twitter_api_config_param.get("consumer_key") # settings.json に追加想定 -> twitter_api セクションのキーに変更
-    api_secret_key = twitter_api_config_param.get("consumer_secret") # settings.json に追加想定 -> twitter_api セクションのキーに変更
-    access_token = twitter_api_config_param.get("access_token") # settings.json に追加想定 -> twitter_api セクションのキーに変更
-    access_token_secret = twitter_api_config_param.get("access_token_secret") # settings.json に追加想定 -> twitter_api セクションのキーに変更
+def get_twitter_conn_v1(twitter_api_config_param, account_name="default"):
+    # クライアントはプロセス内で使い回し、verify_credentials() の結果はTTL付きでキャッシュされる
+    return get_client_registry().get_v1(account_name, twitter_api_config_param)
 
-    # ★追加: 各キーの値もデバッグ表示
-    logger.debug(f"API Key for v1 auth: '{api_key}'")
-    logger.debug(f"API Secret Key for v1 auth: '{api_secret_key}'")
-    logger.debug(f"Access Token for v1 auth: '{access_token}'")
-    logger.debug(f"Access Token Secret for v1 auth: '{access_token_secret}'")
-
-    if not all([api_key, api_secret_key, access_token, access_token_secret]):
-        logger.error("Twitter API (v1.1) の認証情報が不足しています。config.ymlのtwitter_apiセクションを確認してください。")
-        return None
-
-    auth = tweepy.OAuth1UserHandler(api_key, api_secret_key, access_token, access_token_secret)
-    api = tweepy.API(auth=auth)
-    if api.verify_credentials():
-        logger.info("Twitter API v1.1 クライアントの認証に成功しました。")
-        return api
-    else:
-        logger.error("Twitter API v1.1 クライアントの認証に失敗しました。")
-        return None
-
-def get_twitter_conn_v2(twitter_api_config_param):
-    # bot_config から twitter_account セクションを取得する代わりに、渡された twitter_api_config_param を直接使用
-    # v2の場合、Clientのコンストラクタはbearer_token, consumer_key, consumer_secret, access_token, access_token_secretを直接取る
-    # tweepy.Client は引数名を正確に指定する必要がある。
-    try:
-        client = tweepy.Client(
-            bearer_token=twitter_api_config_param.get("bearer_token"),
-            consumer_key=twitter_api_config_param.get("consumer_key"),
-            consumer_secret=twitter_api_config_param.get("consumer_secret"),
-            access_token=twitter_api_config_param.get("access_token"),
-            access_token_secret=twitter_api_config_param.get("access_token_secret")
-        )
-        # クライアントが実際に認証できるか簡単なテスト（例: me() エンドポイントを叩くなど）はここでは行わない
-        # tweepy.Client のインスタンス化が成功すればOKとする
-        # 実際にAPIを叩くのは post_tweet_with_api メソッド内
-        logger.info("Twitter API v2 クライアントの準備ができました。")
-        return client
-    except Exception as e:
-        logger.error(f"Twitter API v2 クライアントの作成に失敗: {e}", exc_info=True)
-        return None
+def get_twitter_conn_v2(twitter_api_config_param, account_name="default"):
+    # tweepy.Client のインスタンス化が成功すればOKとする（認証確認は行わない）
+    # 実際にAPIを叩くのは post_tweet_with_api メソッド内
+    return get_client_registry().get_v2(account_name, twitter_api_config_param)
 
 def fetch_posts_from_google_sheets(bot_config_param, logger_param, global_config=None):
     from config import config_loader  # 関数の先頭でインポート
@@ -214,7 +251,9 @@ def fetch_posts_from_google_sheets(bot_config_param, logger_param, global_config
     
     try:
         logger_param.info(f"'{sheet_name}' - '{worksheet_name}' から投稿ストックを取得中 (キーファイル: {key_file_path})...")
-        posts = config_loader.load_records_from_sheet(sheet_name, worksheet_name, key_file_path)
+        with tracing.span("sheets.fetch", worksheet=worksheet_name) as sp:
+            posts = config_loader.load_records_from_sheet(sheet_name, worksheet_name, key_file_path)
+            sp.set(rows=len(posts))
         logger_param.info(f"{len(posts)} 件の投稿ストックを取得しました。")
         if posts:
             logger_param.debug(f"取得データサンプル（最初の1件）: {posts[0]}")
@@ -224,16 +263,28 @@ def fetch_posts_from_google_sheets(bot_config_param, logger_param, global_config
         return []
 
 class AutoPoster:
-    def __init__(self, config_path='config.yml', logger_param=None, profile_name_suffix=None):
+    def __init__(self, config_path='config.yml', logger_param=None, profile_name_suffix=None, twitter_api_config=None,
+                 rate_limit_account=None):
         from config import config_loader
         BOT_NAME = "auto_post_bot"
         self.config = config_loader.get_bot_config(BOT_NAME)
         if isinstance(logger_param, logging.Logger):
             self.logger = logger_param
         else:
-            self.logger = setup_logger('AutoPostBot_Global', logger_param)
+            self.logger = log_setup.setup_logging('AutoPostBot_Global', log_dir=logger_param)
         self.driver = None
         self.is_logged_in = False
+        # APIクライアントはアカウントごとにレジストリから取得する（プロセス内で再利用される）
+        self.api_v1 = None
+        self.api_v2_client = None
+        self.account_name = profile_name_suffix or "default"
+        # レート制限台帳のキー（X のユーザー名。posting_daemon.py と共通）
+        self.rate_limit_account = rate_limit_account or self.account_name
+        if USE_TWITTER_API:
+            api_config = twitter_api_config or self.config.get("twitter_api", {})
+            self.api_v1, self.api_v2_client = get_client_registry().get_clients(
+                self.rate_limit_account, api_config
+            )
         # account_idをprofile名に使う
         if profile_name_suffix is None:
             profile_name_suffix = "default"
@@ -243,6 +294,7 @@ class AutoPoster:
             f'chrome_profile_{profile_name_suffix}'
         )
         os.makedirs(self.chrome_profile_dir, exist_ok=True)
+        self.selectors = get_registry()
 
     def _initialize_webdriver(self):
         """WebDriverの初期化（Chromeプロファイルを固定）"""
@@ -257,8 +309,8 @@ class AutoPoster:
     def _check_login_status(self):
         """現在のセッションが有効かチェック"""
         try:
-            self.logger.info("[アクセスログ] _check_login_status: https://twitter.com/home にアクセスします")
-            self.driver.get("https://twitter.com/home")
+            self.logger.info(f"[アクセスログ] _check_login_status: {TWITTER_BASE_URL}/home にアクセスします")
+            self.driver.get(f"{TWITTER_BASE_URL}/home")
             time.sleep(2)
             WebDriverWait(self.driver, 5).until(
                 EC.presence_of_element_located((By.CSS_SELECTOR, "[data-testid='tweetTextarea_0']"))
@@ -286,9 +338,20 @@ class AutoPoster:
             )
         return True
 
-    def post_tweet_with_selenium(self, content, media_path=None):
+    def post_tweet_with_selenium(self, content, media_path=None, on_sending=None):
         try:
             self._initialize_webdriver()
+        except Exception as e:
+            self.logger.error(f"WebDriverの初期化に失敗しました: {e}", exc_info=True)
+            return False
+        # 1投稿あたりのWebDriverコマンド数を計測する
+        with WebDriverCommandCounter(self.driver) as command_counter:
+            result = self._post_tweet_with_selenium(content, media_path, on_sending)
+        self.logger.info(command_counter.summary())
+        return result
+
+    def _post_tweet_with_selenium(self, content, media_path=None, on_sending=None):
+        try:
             # ログイン状態チェックは1回だけ実行
             if not self._ensure_logged_in():
                 self.logger.error("ログインに失敗しました。")
@@ -315,42 +378,30 @@ class AutoPoster:
                         f.write(self.driver.page_source)
                     self.logger.info(f"エラー時のHTMLを保存しました: {html_path}")
                     # 既存のフォールバック（直接URLアクセスなど）に進む
-                    self.logger.info("[アクセスログ] post_tweet_with_selenium: https://twitter.com/compose/post にアクセスします（フォールバック）")
-                    self.driver.get("https://twitter.com/compose/post")
+                    self.logger.info(f"[アクセスログ] post_tweet_with_selenium: {TWITTER_BASE_URL}/compose/post にアクセスします（フォールバック）")
+                    self.driver.get(f"{TWITTER_BASE_URL}/compose/post")
                     time.sleep(3)
-                # 投稿画面の読み込みを待機（複数のセレクタを試行）
-                textarea_selectors = [
-                    'div[data-testid="tweetTextarea_0"]',
-                    'div[data-testid="tweetTextarea_1"]',
-                    'div[role="textbox"]',
-                    'div[aria-label="ポスト本文"]',
-                    'div[aria-label="Post text"]',
-                    'div[data-testid="tweetTextInput"]'  # 新しいセレクタを追加
-                ]
-                textarea = None
-                for selector in textarea_selectors:
-                    try:
-                        textarea = WebDriverWait(self.driver, 10).until(
-                            EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-                        )
-                        if textarea:
-                            self.logger.debug(f"テキストエリアを見つけました: {selector}")
-                            break
-                    except:
-                        continue
-                if not textarea:
+                # 投稿画面の読み込みを待機（全候補を一括で探索し、直近の成功順に優先）
+                textarea, matched = self.selectors.find(
+                    self.driver, "compose_textarea", TEXTAREA_SELECTORS, timeout=10
+                )
+                if textarea:
+                    self.logger.debug(f"テキストエリアを見つけました: {matched[1]}")
+                else:
                     raise Exception("テキストエリアが見つかりませんでした")
                 self.logger.debug("投稿画面に移動しました")
             except Exception as e:
                 self.logger.error(f"投稿画面への移動中にエラーが発生しました: {e}")
                 # 直接投稿URLにアクセスを試みる
                 try:
-                    self.logger.info("[アクセスログ] post_tweet_with_selenium: https://twitter.com/compose/post にアクセスします（直接URLアクセス）")
-                    self.driver.get("https://twitter.com/compose/post")
+                    self.logger.info(f"[アクセスログ] post_tweet_with_selenium: {TWITTER_BASE_URL}/compose/post にアクセスします（直接URLアクセス）")
+                    self.driver.get(f"{TWITTER_BASE_URL}/compose/post")
                     time.sleep(3)
-                    textarea = WebDriverWait(self.driver, 10).until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, 'div[data-testid="tweetTextarea_0"]'))
+                    textarea, _ = self.selectors.find(
+                        self.driver, "compose_textarea", TEXTAREA_SELECTORS, timeout=10
                     )
+                    if not textarea:
+                        raise TimeoutException("テキストエリアが見つかりませんでした（直接URLアクセス）")
                 except Exception as e2:
                     self.logger.error(f"直接URLでのアクセスも失敗しました: {e2}")
                     # 失敗時にHTMLも保存
@@ -373,47 +424,39 @@ class AutoPoster:
                     )
                     abs_media_path = os.path.abspath(media_path)  # 絶対パスに変換
                     file_input.send_keys(abs_media_path)
-                    WebDriverWait(self.driver, 30).until(
-                        EC.presence_of_element_located((By.XPATH, '//div[@data-testid="attachments"]//img[@alt="画像プレビュー"]|//div[@data-testid="attachments"]//video'))
-                    )
-                    self.logger.info("メディアのアップロードが完了したようです。")
-                    time.sleep(2)  # メディアアップロード後の待機を追加
-                self.logger.debug("投稿ボタンを探しています...")
-                # 投稿ボタンの活性化を待機
-                post_button = None
-                max_retries = 5
-                retry_count = 0
-                while retry_count < max_retries:
-                    try:
-                        post_button = WebDriverWait(self.driver, 5).until(
-                            EC.element_to_be_clickable((By.XPATH, '//button[@data-testid="tweetButton"]'))
+                    # 進捗表示と送信ボタンの状態からアップロード・処理完了を検知する
+                    upload_result = wait_for_media_ready(self.driver, abs_media_path)
+                    if not upload_result.ready:
+                        raise TimeoutException(
+                            f"メディアのアップロードが {upload_result.elapsed:.1f}秒 以内に完了しませんでした"
                         )
-                        if post_button and post_button.is_enabled():
-                            self.logger.debug("投稿ボタンが活性化しました")
-                            break
-                    except:
-                        retry_count += 1
-                        self.logger.debug(f"投稿ボタンの活性化待機中... ({retry_count}/{max_retries})")
-                        time.sleep(2)
-                        continue
-                if not post_button or not post_button.is_enabled():
+                    self.logger.info(f"メディアのアップロードが完了しました ({upload_result.elapsed:.1f}秒)。")
+                self.logger.debug("投稿ボタンを探しています...")
+                # 投稿ボタンの活性化を待機（表示中かつ有効な候補のみ）
+                post_button, matched = self.selectors.find(
+                    self.driver, "post_button", POST_BUTTON_SELECTORS,
+                    timeout=35, require_interactable=True
+                )
+                if not post_button:
                     raise Exception("投稿ボタンが活性化しませんでした")
+                self.logger.debug(f"投稿ボタンが活性化しました: {matched[1]}")
                 self.logger.debug("投稿ボタンをクリックします...")
+                # 押した後に落ちた場合に再投稿しないよう、クリックの直前に記録する
+                if on_sending:
+                    on_sending()
                 # JSクリックのフォールバック
                 self.driver.execute_script("arguments[0].click();", post_button)
                 time.sleep(3)
                 current_url = self.driver.current_url
-                if "/home" in current_url or "twitter.com/home" in current_url:
+                if "/home" in current_url:
                     self.logger.info("投稿後、/homeへの遷移を検知しました（JSクリック）。投稿成功とみなします。")
                     return True
-                try:
-                    WebDriverWait(self.driver, 10).until(
-                        EC.presence_of_element_located((By.XPATH, "//div[contains(text(), 'ポストを送信しました') or contains(text(), '投稿しました') or contains(text(), 'ツイートを投稿しました') or contains(text(), 'Your post was sent') or contains(text(), 'Your Tweet was sent')]"))
-                    )
+                popup, _ = self.selectors.find(
+                    self.driver, "success_popup", SUCCESS_POPUP_SELECTORS, timeout=10
+                )
+                if popup:
                     self.logger.info("ツイート投稿が成功したポップアップを検知しました（JSクリック）。")
                     return True
-                except Exception:
-                    pass
                 self.logger.error("投稿後、/home遷移もポップアップ検知もできませんでした（JSクリック）。投稿失敗とみなします。")
                 return False
             except TimeoutException as te:
@@ -441,35 +484,37 @@ class AutoPoster:
         mime_type = None
         actual_filename = filename_base
         try:
-            response = requests.get(url, stream=True, timeout=20)
-            response.raise_for_status()
-            mime_type = response.headers.get('content-type')
-            self.logger.info(f"検出されたMIMEタイプ: {mime_type}")
-
-            # MIMEタイプが動画または画像か確認
-            if not mime_type or not (mime_type.startswith('video/') or mime_type.startswith('image/')):
-                self.logger.error(f"無効なメディアタイプが検出されました: {mime_type} (URL: {url})。動画または画像ではありません。ダウンロードを中止します。")
-                return None, None # 無効なタイプなので失敗として扱う
-
-            # MIMEタイプから拡張子を推測
-            ext = mimetypes.guess_extension(mime_type) if mime_type else None
-            if not ext:
-                # フォールバック: URLから拡張子を試みる (限定的)
-                self.logger.warning(f"MIMEタイプから拡張子を推測できませんでした ({mime_type})。URLから試みます。")
-                original_filename_from_url, original_ext_from_url = os.path.splitext(url.split('/')[-1].split('?')[0])
-                if original_ext_from_url:
-                    ext = original_ext_from_url
-                else: # それでもダメならデフォルトの拡張子（画像と仮定）
-                    self.logger.warning("URLからも拡張子を特定できませんでした。デフォルトで .jpg を使用します。")
-                    ext = '.jpg'
+            with tracing.span("http.download_media") as sp:
+                response = requests.get(url, stream=True, timeout=20)
+                response.raise_for_status()
+                mime_type = response.headers.get('content-type')
+                self.logger.info(f"検出されたMIMEタイプ: {mime_type}")
+
+                # MIMEタイプが動画または画像か確認
+                if not mime_type or not (mime_type.startswith('video/') or mime_type.startswith('image/')):
+                    self.logger.error(f"無効なメディアタイプが検出されました: {mime_type} (URL: {url})。動画または画像ではありません。ダウンロードを中止します。")
+                    return None, None # 無効なタイプなので失敗として扱う
+
+                # MIMEタイプから拡張子を推測
+                ext = mimetypes.guess_extension(mime_type) if mime_type else None
+                if not ext:
+                    # フォールバック: URLから拡張子を試みる (限定的)
+                    self.logger.warning(f"MIMEタイプから拡張子を推測できませんでした ({mime_type})。URLから試みます。")
+                    original_filename_from_url, original_ext_from_url = os.path.splitext(url.split('/')[-1].split('?')[0])
+                    if original_ext_from_url:
+                        ext = original_ext_from_url
+                    else: # それでもダメならデフォルトの拡張子（画像と仮定）
+                        self.logger.warning("URLからも拡張子を特定できませんでした。デフォルトで .jpg を使用します。")
+                        ext = '.jpg'
             
-            actual_filename = f"{filename_base}{ext}"
-
-            with open(actual_filename, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            self.logger.info(f"メディアのダウンロードが完了しました: {actual_filename}")
-            return actual_filename, mime_type
+                actual_filename = f"{filename_base}{ext}"
+
+                with open(actual_filename, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        f.write(chunk)
+                        sp.add_bytes(len(chunk))
+                self.logger.info(f"メディアのダウンロードが完了しました: {actual_filename}")
+                return actual_filename, mime_type
         except requests.exceptions.RequestException as e:
             self.logger.error(f"メディアのダウンロードに失敗しました ({url}): {e}")
             return None, None
@@ -484,62 +529,135 @@ class AutoPoster:
             self.driver = None
 
     def post_tweet_with_api(self, text, media_path=None):
-        self.logger.info("APIを使用してツイートを投稿します...")
+        success, _ = self.post_thread_with_api([text], media_path)
+        return success
+
+    def _create_tweet_with_retry(self, text, media_ids=None, in_reply_to_tweet_id=None, on_sending=None):
+        """
+        API v2 でツイートを1件作成する。接続前の失敗だけを短い間隔で再試行する。
+        送信後の失敗（タイムアウト・接続断・サーバーエラー）は再送すると二重投稿になり得るため、
+        TweetSendUncertain を送出して呼び出し元（投稿台帳・再試行キュー）に判断を任せる。
+        on_sending を指定すると、create_tweet を呼ぶ直前に毎回呼ばれる（投稿台帳に送信中を記録する）。
+        """
+        kwargs = {"text": text}
+        if media_ids:
+            kwargs["media_ids"] = media_ids
+        if in_reply_to_tweet_id:
+            kwargs["in_reply_to_tweet_id"] = in_reply_to_tweet_id
+        delay = 1.0
+        for attempt in range(1, API_STEP_RETRIES + 1):
+            try:
+                if on_sending:
+                    on_sending()
+                with tracing.span("twitter_api.create_tweet", attempt=attempt, reply=bool(in_reply_to_tweet_id)):
+                    response = self.api_v2_client.create_tweet(**kwargs)
+            except (tweepy.TwitterServerError, requests.exceptions.RequestException) as e:
+                if not request_never_sent(e):
+                    raise TweetSendUncertain(str(e)) from e
+                if attempt == API_STEP_RETRIES:
+                    raise
+                self.logger.warning(f"ツイート作成に失敗 ({attempt}/{API_STEP_RETRIES})。{delay:.0f}秒後に再試行します: {e}")
+                time.sleep(delay)
+                delay *= 2
+                continue
+            if response.data and response.data.get("id"):
+                return response.data.get("id")
+            self.logger.error(f"API経由でのツイート投稿に失敗しました。レスポンス: {response.errors if response.errors else response}")
+            return None
+        return None
+
+    def post_thread_with_api(self, chunks, media_path=None, posted_tweet_ids=None, on_tweet_posted=None,
+                             on_sending=None, on_not_sent=None):
+        """
+        API v2 でスレッドを投稿する。先頭ツイートにメディアを添付し、以降は直前に返された
+        Tweet ID に in_reply_to_tweet_id でつなげる（プロフィール画面からのURL取得は不要）。
+        Args:
+            chunks (list): 投稿するテキストのリスト。
+            media_path (str, optional): 先頭ツイートに添付するメディアのパス。
+            posted_tweet_ids (list, optional): 前回の途中失敗までに投稿済みのTweet ID。
+                指定するとその続きのチャンクから再開する。
+            on_tweet_posted (callable, optional): 1件投稿するごとに on_tweet_posted(index, tweet_id) で呼ばれる。
+                送信したが作成されたか分からない場合は tweet_id=None で呼ばれる。
+            on_sending (callable, optional): 各ツイートの create_tweet の直前に on_sending(index) で呼ばれる。
+            on_not_sent (callable, optional): 送信されなかったと分かった場合（接続できなかった・API が
+                拒否した）に on_not_sent(index) で呼ばれる。on_sending の記録を取り消すのに使う。
+        Returns:
+            tuple: (success, tweet_ids)。tweet_ids は今回までに投稿済みの全Tweet ID。
+                失敗時も途中までのIDを返すので、次回の posted_tweet_ids に渡せば再開できる。
+        """
+        tweet_ids = list(posted_tweet_ids or [])
+        self.logger.info(f"APIを使用してツイートを投稿します... ({len(chunks)}件, 投稿済み {len(tweet_ids)}件)")
         if not self.api_v1 or not self.api_v2_client:
             self.logger.error("APIクライアントが初期化されていません。API投稿をスキップします。")
-            return False
-
-        media_id_str = None
-        media_ids_list = []
+            return False, tweet_ids
 
         try:
-            if media_path:
-                self.logger.info(f"API経由でメディアをアップロードします: {media_path}")
-                # media_upload はファイルタイプを自動判別してくれるはず
-                # 動画の場合は media_category='tweet_video' が必要になる場合がある
-                # シンプルな画像アップロードをまず試す
+            for index in range(len(tweet_ids), len(chunks)):
+                # レート制限に達している場合は送らずに中断する（投稿済みIDから再開できる）
+                blocked_until = get_rate_limit_ledger().blocked_until(self.rate_limit_account)
+                if blocked_until:
+                    reset_at = datetime.datetime.fromtimestamp(blocked_until).strftime('%H:%M:%S')
+                    self.logger.warning(f"レート制限のため {reset_at} まで投稿を見送ります ({index}/{len(chunks)} 件投稿済み)。")
+                    return False, tweet_ids
+                media_ids_list = []
+                if index == 0 and media_path:
+                    self.logger.info(f"API経由でメディアをアップロードします: {media_path}")
+                    # 動画・GIFはチャンクアップロード（INIT/APPEND/FINALIZE/STATUS）で送信し、
+                    # サーバー側の処理が完了してから添付する。失敗時は次回の呼び出しで再開される
+                    try:
+                        with tracing.span("twitter_api.media_upload") as sp:
+                            sp.add_bytes(os.path.getsize(media_path))
+                            media_id_str = ChunkedMediaUploader(self.api_v1).upload(media_path)
+                        media_ids_list.append(media_id_str)
+                        self.logger.info(f"メディアのアップロード成功。Media ID: {media_id_str}")
+                    except MediaUploadError as e_media:
+                        self.logger.error(f"APIでのメディアアップロード中にエラー: {e_media}", exc_info=True)
+                        # メディアアップロード失敗時は投稿全体を失敗とする
+                        return False, tweet_ids
+
+                reply_to = tweet_ids[-1] if tweet_ids else None
+                sending = (lambda i=index: on_sending(i)) if on_sending else None
                 try:
-                    media = self.api_v1.media_upload(filename=media_path)
-                    media_id_str = media.media_id_string
-                    media_ids_list.append(media_id_str)
-                    self.logger.info(f"メディアのアップロード成功。Media ID: {media_id_str}")
-                except tweepy.TweepyException as e_media:
-                    self.logger.error(f"APIでのメディアアップロード中にエラー: {e_media}", exc_info=True)
-                    # メディアアップロード失敗時はテキストのみで投稿するか、全体を失敗とするか
-                    # ここでは一旦、投稿全体を失敗とする
-                    return False
-            
-            # ツイート投稿 (API v2)
-            if media_ids_list:
-                response = self.api_v2_client.create_tweet(text=text, media_ids=media_ids_list)
-            else:
-                response = self.api_v2_client.create_tweet(text=text)
-            
-            if response.data and response.data.get("id"):
-                tweet_id = response.data.get("id")
-                self.logger.info(f"API経由でのツイート投稿成功。Tweet ID: {tweet_id}")
-                # tweepy.Response オブジェクトの構造を確認。 response.data['id'] が一般的
-                # https://docs.tweepy.org/en/stable/v2_models.html#tweet
-                return True
-            else:
-                self.logger.error(f"API経由でのツイート投稿に失敗しました。レスポンス: {response.errors if response.errors else response}")
-                return False
+                    tweet_id = self._create_tweet_with_retry(chunks[index], media_ids_list, reply_to, sending)
+                except TweetSendUncertain as e_uncertain:
+                    # 投稿済みかもしれないので、続きを投稿したり再送したりせずに止める
+                    self.logger.error(
+                        f"ツイート作成の応答を受け取れず、投稿されたか不明です ({index + 1}/{len(chunks)})。再送せずに中断します: {e_uncertain}"
+                    )
+                    if on_tweet_posted:
+                        on_tweet_posted(index, None)
+                    return False, tweet_ids
+                except Exception:
+                    # 接続できなかった・API が拒否した（4xx）場合はツイートは作成されていない
+                    if on_not_sent:
+                        on_not_sent(index)
+                    raise
+                if not tweet_id:
+                    if on_not_sent:
+                        on_not_sent(index)
+                    return False, tweet_ids
+                tweet_ids.append(tweet_id)
+                if on_tweet_posted:
+                    on_tweet_posted(index, tweet_id)
+                self.logger.info(f"API経由でのツイート投稿成功 ({index + 1}/{len(chunks)})。Tweet ID: {tweet_id}")
+            return True, tweet_ids
 
         except tweepy.TweepyException as e_tweet:
             self.logger.error(f"APIでのツイート投稿処理中にエラー: {e_tweet}", exc_info=True)
             # エラーレスポンスの詳細を取得 (e_tweet.api_codes, e_tweet.api_errorsなど)
             if hasattr(e_tweet, 'response') and e_tweet.response is not None:
                  self.logger.error(f"APIエラーレスポンス Status: {e_tweet.response.status_code}, Content: {e_tweet.response.text}")
-            return False
+            return False, tweet_ids
         except Exception as e:
             self.logger.error(f"API投稿中に予期せぬエラー: {e}", exc_info=True)
-            return False
+            return False, tweet_ids
 
+@run_history.recorded("post_tweet_sheets.post")
 def post_single_tweet(bot_config_param, post_data, logger_param, global_config=None):
     """単一の投稿データに基づいてツイートを試みる。SeleniumまたはAPI v2を使用。"""
     from config import config_loader  # 関数の先頭でインポート
     
-    logger_param.info(f"DEBUG: post_single_tweet called. Global USE_TWITTER_API is: {USE_TWITTER_API}")
+    logger_param.debug("post_single_tweet called. Global USE_TWITTER_API is: %s", USE_TWITTER_API)
 
     text_to_post = post_data.get("本文")
     media_url_original = post_data.get("画像/動画URL")
@@ -554,6 +672,7 @@ def post_single_tweet(bot_config_param, post_data, logger_param, global_config=N
 
     if not text_to_post:
         logger_param.warning(f"{log_identifier}: 本文が空のためスキップします。")
+        tracing.current_span().set(outcome=run_history.OUTCOME_SKIPPED)
         return False
 
     logger_param.info(f"--- {log_identifier} の処理開始 ---")
@@ -584,15 +703,13 @@ def post_single_tweet(bot_config_param, post_data, logger_param, global_config=N
             
             # ヘッダー行を取得
             sheet_header = gspread_sheet_obj.row_values(1)
-            logger_param.info(f"[DEBUG] スプレッドシート1行目: {sheet_header}")
-            print(f"[print] スプレッドシート1行目: {sheet_header}")
+            logger_param.debug("スプレッドシート1行目: %s", sheet_header)
             
             # ID列の名前を取得
             id_column_name = "ID"
             if post_id_for_log:
                 row_index_to_update = config_loader.find_row_index_by_id(gspread_sheet_obj, id_column_name, str(post_id_for_log))
-                logger_param.info(f"[DEBUG] row_index_to_update: {row_index_to_update}")
-                print(f"[print] row_index_to_update: {row_index_to_update}")
+                logger_param.debug("row_index_to_update: %s", row_index_to_update)
         except Exception as e:
             logger_param.error(f"gspreadクライアントの初期化または行インデックス取得に失敗: {e}", exc_info=True)
 
@@ -606,30 +723,155 @@ def post_single_tweet(bot_config_param, post_data, logger_param, global_config=N
     success = False
     media_path_local = None
     account_id = bot_config_param.get("account_id", "default")
-    poster = AutoPoster(config_path='config.yml', logger_param=logger_param, profile_name_suffix=account_id) 
+    rate_limit_account = account_key(bot_config_param, account_id)
+    tracing.current_span().set(account=account_id, post_id=post_id_for_log)
+
+    # 投稿台帳で送信済みかを確認する。シートの行は再投稿で使い回されるため、
+    # 行IDに最終投稿日時を加えたものを投稿元IDとする
+    ledger = get_posting_ledger()
+    source_id = f"{post_id_for_log or log_identifier}@{post_data.get('最終投稿日時') or ''}"
+    ledger_key, ledger_action, ledger_entry = ledger.begin(account_id, source_id, text_to_post)
+    if ledger_action == ACTION_SKIP:
+        logger_param.info(f"{log_identifier}: 投稿台帳で完了済みのためスキップします。")
+        tracing.current_span().set(outcome=run_history.OUTCOME_SKIPPED)
+        return True
+    sent = ledger_action != ACTION_POST
+    # 実行履歴用: 今回より前に試した回数（送信済みの記録なら前回の試行も再試行に数える）
+    attempts = ledger_entry.get("attempts") or 0
+    tracing.current_span().set(retries=attempts if sent else max(attempts - 1, 0))
+    outcome = run_history.OUTCOME_FAILED
+
+    phase = "upload"  # 失敗の分類に使う現在の処理段階
+    failure = None  # 送信前に失敗した場合のエラー内容
+
+    def on_tweet_posted(index, tweet_id):
+        # tweet_id が None（送信されたか不明）でも送信済みとして扱い、再送も続きからの再開もしない
+        nonlocal sent
+        sent = True
+        ledger.record_step(ledger_key, index, tweet_id=tweet_id)
+
+    def on_sending(index):
+        # 作成を要求する直前に記録し、応答前に落ちても次回は同じチャンクを投稿し直さない
+        ledger.mark_sending(ledger_key, index)
+
+    def on_not_sent(index):
+        ledger.cancel_sending(ledger_key, index)
+
+    twitter_api_config = bot_config_param.get("twitter_api") or global_config.get("twitter_api")
+    poster = AutoPoster(
+        config_path='config.yml', logger_param=logger_param, profile_name_suffix=account_id,
+        twitter_api_config=twitter_api_config, rate_limit_account=rate_limit_account,
+    )
 
     try:
-        if media_url_for_download:
-            temp_file_base = f"temp_media_{post_id_for_log or datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}"
-            media_path_local, downloaded_mime_type = poster.download_media(media_url_for_download, temp_file_base)
-            if not media_path_local:
-                logger_param.error(f"{log_identifier}: メディアのダウンロードに失敗しました。メディアなしで投稿を試みます。")
-        if USE_TWITTER_API:
-            if poster.api_v1 and poster.api_v2_client:
-                success = poster.post_tweet_with_api(text_to_post, media_path_local) 
+        if ledger_action == ACTION_RESUME:
+            # 前回スレッドの途中で失敗している → 保存した分割と投稿済みTweet IDから続きを投稿する。
+            # 再開できない場合も成功扱いにはせず（行を進めない）、再試行キューに入れる
+            progress = thread_progress(ledger_entry)
+            if not (USE_TWITTER_API and poster.api_v1 and poster.api_v2_client):
+                phase = "login"
+                failure = "スレッドの続きを投稿できない（API投稿が無効、またはAPIクライアントの初期化に失敗）"
+                logger_param.error(
+                    f"{log_identifier}: スレッドが途中 ({progress['next_index']}/{len(progress['chunks'])}) まで投稿済みですが、"
+                    "API投稿が使えないため再開できません。"
+                )
+            else:
+                phase = "api"
+                logger_param.info(f"{log_identifier}: スレッドを {progress['next_index'] + 1}/{len(progress['chunks'])} 件目から再開します。")
+                with tracing.span("post_tweet_sheets.api_thread", resumed=True):
+                    success, posted_tweet_ids = poster.post_thread_with_api(
+                        progress["chunks"], None, posted_tweet_ids=progress["posted"], on_tweet_posted=on_tweet_posted,
+                        on_sending=on_sending, on_not_sent=on_not_sent,
+                    )
+                if not success:
+                    failure = "スレッドの再開に失敗"
+        elif sent:
+            # 前回、送信後にシートの更新まで進まずに終了している → 送信はせず更新だけ行う。
+            # 送信ボタンを押した後に止まった（送信されたか不明）場合も、二重投稿を避けて再投稿しない
+            if ledger_action == ACTION_VERIFY:
+                logger_param.warning(
+                    f"{log_identifier}: 前回は送信中に中断しています。二重投稿を避けるため再投稿せず、シートの更新のみ行います（要確認）。"
+                )
             else:
-                logger_param.error(f"{log_identifier}: APIクライアントの初期化に失敗しているため、API投稿を実行できません。")
-                success = False 
+                logger_param.warning(
+                    f"{log_identifier}: 送信済み（Tweet ID: {ledger_entry.get('tweet_id') or '不明'}）のため再投稿せず、シートの更新のみ行います。"
+                )
+            success = True
+            outcome = run_history.OUTCOME_SKIPPED
         else:
-            if not poster._ensure_logged_in():
-                logger_param.error(f"{log_identifier}: Seleniumでのログインに失敗しました。")
-                success = False
+            if media_url_for_download:
+                temp_file_base = f"temp_media_{post_id_for_log or datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+                media_path_local, downloaded_mime_type = poster.download_media(media_url_for_download, temp_file_base)
+                if not media_path_local:
+                    logger_param.error(f"{log_identifier}: メディアのダウンロードに失敗しました。メディアなしで投稿を試みます。")
+            if USE_TWITTER_API:
+                if poster.api_v1 and poster.api_v2_client:
+                    # 長文はスレッドに分割し、API経由でリプライを連結して投稿する
+                    phase = "api"
+                    chunks = split_text(text_to_post)
+                    # 途中で失敗しても同じ分割で再開できるよう、チャンクを保存しておく
+                    ledger.start_thread(ledger_key, chunks)
+                    with tracing.span("post_tweet_sheets.api_thread", chunks=len(chunks)):
+                        success, posted_tweet_ids = poster.post_thread_with_api(
+                            chunks, media_path_local, on_tweet_posted=on_tweet_posted,
+                            on_sending=on_sending, on_not_sent=on_not_sent,
+                        )
+                    if not success and posted_tweet_ids:
+                        logger_param.error(f"{log_identifier}: スレッドの途中 ({len(posted_tweet_ids)}/{len(chunks)}) で失敗しました。投稿済みTweet ID: {posted_tweet_ids}")
+                        failure = "スレッドの途中で失敗"
+                    elif not success:
+                        failure = "API経由の投稿に失敗"
+                else:
+                    logger_param.error(f"{log_identifier}: APIクライアントの初期化に失敗しているため、API投稿を実行できません。")
+                    success = False 
+                    phase, failure = "login", "APIクライアントの初期化に失敗"
             else:
-                success = poster.post_tweet_with_selenium(text_to_post, media_path_local)
+                phase = "login"
+                with tracing.span("post_tweet_sheets.login"):
+                    logged_in = poster._ensure_logged_in()
+                if not logged_in:
+                    logger_param.error(f"{log_identifier}: Seleniumでのログインに失敗しました。")
+                    success = False
+                    failure = "Seleniumでのログインに失敗"
+                else:
+                    phase = "post"
+                    ledger.start_thread(ledger_key, [text_to_post])
+                    with tracing.span("post_tweet_sheets.selenium_post"):
+                        success = poster.post_tweet_with_selenium(
+                            text_to_post, media_path_local, on_sending=lambda: on_sending(0)
+                        )
+                    if success:
+                        sent = True
+                        ledger.record_step(ledger_key, 0)
+                    else:
+                        failure = "Seleniumでの投稿に失敗"
     except Exception as e:
         logger_param.error(f"{log_identifier}: 投稿処理中に予期せぬエラー: {e}", exc_info=True)
         success = False
+        failure = e
     finally:
+        if not sent or failure is not None:
+            ledger.mark_failed(ledger_key, failure or "送信前に失敗")
+        if post_id_for_log:
+            # 送信前の失敗と、続きから再開できるスレッドの途中失敗は再試行キューに入れる（シートの行は消費しない）
+            retry_queue = get_retry_queue()
+            resumable = sent and not success and is_resumable(ledger.get(ledger_key))
+            if sent and not resumable:
+                retry_queue.record_success(account_id, post_id_for_log)
+            elif failure is not None:
+                failure_class = classify_failure(phase, failure, rate_limit_account)
+                job = retry_queue.record_failure(
+                    account_id, post_id_for_log, failure_class, failure, rate_limit_account=rate_limit_account
+                )
+                if job["status"] == STATUS_DEAD:
+                    logger_param.error(f"{log_identifier}: {job['attempts']}回失敗したためデッドレターに移しました（{failure_class}）。")
+                else:
+                    outcome = run_history.OUTCOME_RETRY
+                    retry_at = datetime.datetime.fromtimestamp(job["next_attempt_at"]).strftime('%H:%M:%S')
+                    logger_param.warning(f"{log_identifier}: {failure_class} の失敗として {retry_at} 以降に再試行します（{job['attempts']}回目の失敗）。")
+        if success and outcome != run_history.OUTCOME_SKIPPED:
+            outcome = run_history.OUTCOME_SUCCESS
+        tracing.current_span().set(outcome=outcome)
         if not USE_TWITTER_API:
             poster.cleanup()
         if media_path_local and os.path.exists(media_path_local):
@@ -643,55 +885,44 @@ def post_single_tweet(bot_config_param, post_data, logger_param, global_config=N
     if success:
         logger.info(f"✅ {log_identifier}: 投稿成功")
         if slack_webhook_url:
-            notify_slack(f"✅ [{username}] {log_identifier}: 投稿成功", slack_webhook_url)
+            get_slack_notifier().notify(f"✅ {log_identifier}: 投稿成功", slack_webhook_url, account=username)
         # 最終投稿日時カラムを現在時刻で更新
         if row_index_to_update:
             try:
                 now_str = datetime.datetime.now(pytz.timezone('Asia/Tokyo')).strftime('%Y-%m-%d %H:%M:%S')
                 last_post_col = "最終投稿日時"  # 最終投稿日時カラム名を定義
-                logger.info(f"[DEBUG] column_settings: {column_settings}")
-                logger.info(f"[DEBUG] sheet_header: {sheet_header if gspread_sheet_obj else None}")
-                print(f"[print] column_settings: {column_settings}")
-                print(f"[print] sheet_header: {sheet_header if gspread_sheet_obj else None}")
+                logger.debug("column_settings: %s", column_settings)
+                logger.debug("sheet_header: %s", sheet_header if gspread_sheet_obj else None)
                 col_index = column_settings.index(last_post_col)+1
-                logger.info(f"[DEBUG] 最終投稿日時カラムのindex: {col_index}")
-                print(f"[print] 最終投稿日時カラムのindex: {col_index}")
+                logger.debug("最終投稿日時カラムのindex: %s", col_index)
                 gspread_sheet_obj.update_cell(row_index_to_update, col_index, now_str)
                 logger.info(f"[最終投稿日時] {row_index_to_update}行目を{now_str}で更新しました。")
+                # 行が次の投稿用に進んだので、この投稿は完了
+                ledger.mark_confirmed(ledger_key)
             except Exception as e:
                 logger.error(f"[最終投稿日時] 更新中にエラー: {e}")
-                print(f"[print] [最終投稿日時] 更新中にエラー: {e}")
         # 投稿済み回数カラムの更新
         try:
-            logger.info("[DEBUG] 投稿済み回数カラムの更新処理に入ります")
-            print("[print] 投稿済み回数カラムの更新処理に入ります")
+            logger.debug("投稿済み回数カラムの更新処理に入ります")
             post_count_col_name = "投稿済み回数"
             post_count_col_index = column_settings.index(post_count_col_name) + 1
-            logger.info(f"[DEBUG] 投稿済み回数カラムのindex: {post_count_col_index}")
-            print(f"[print] 投稿済み回数カラムのindex: {post_count_col_index}")
+            logger.debug("投稿済み回数カラムのindex: %s", post_count_col_index)
             current_val = gspread_sheet_obj.cell(row_index_to_update, post_count_col_index).value
-            logger.info(f"[DEBUG] 現在の投稿済み回数の値: {current_val}")
-            print(f"[print] 現在の投稿済み回数の値: {current_val}")
+            logger.debug("現在の投稿済み回数の値: %s", current_val)
             try:
                 current_count = int(current_val) if current_val else 0
                 new_count = current_count + 1
-                logger.info(f"[DEBUG] カウントを更新します。current_count: {current_count} -> new_count: {new_count}")
-                print(f"[print] カウントを更新します。current_count: {current_count} -> new_count: {new_count}")
+                logger.debug("カウントを更新します。current_count: %s -> new_count: %s", current_count, new_count)
                 gspread_sheet_obj.update_cell(row_index_to_update, post_count_col_index, str(new_count))
                 logger.info(f"[投稿済み回数] カウントアップ完了。new_count: {new_count}")
-                print(f"[print] [投稿済み回数] カウントアップ完了。new_count: {new_count}")
             except ValueError:
                 logger.error(f"[投稿済み回数] 現在の値 '{current_val}' を数値に変換できません。")
-                print(f"[print] [投稿済み回数] 現在の値 '{current_val}' を数値に変換できません。")
         except Exception as e:
-            logger.error(f"[投稿済み回数] 更新処理のtryブロック外で例外: {e}")
-            print(f"[print] [投稿済み回数] 更新処理のtryブロック外で例外: {e}")
             logger.error(f"[投稿済み回数] 更新中にエラー: {e}")
-            print(f"[print] [投稿済み回数] 更新中にエラー: {e}")
     else:
         logger_param.error(f"❌ {log_identifier}: 投稿失敗")
         if slack_webhook_url:
-            notify_slack(f"❌ [{username}] {log_identifier}: 投稿失敗", slack_webhook_url)
+            get_slack_notifier().notify(f"❌ {log_identifier}: 投稿失敗", slack_webhook_url, account=username)
     return success
 
 def parse_dt(dt_str):
@@ -715,6 +946,65 @@ def load_slack_webhook_url():
     slack_config = config.get("slack", {})
     return slack_config.get("webhook_url")
 
+def select_target_post(account):
+    """
+    アカウントの投稿ストックから今回投稿する行を選ぶ。再試行キューで時刻の来た行を最優先し、
+    再試行待ち・デッドレターの行は選ばない。それ以外は最終投稿日時が古いものから選ぶ。
+    Args:
+        account (dict): twitter_accounts の1件（columns 補完済み）。
+    Returns:
+        dict or None: 投稿データ。対象がなければNone。
+    """
+    posts_to_process = fetch_posts_from_google_sheets(account, logger, global_config=config)
+    logger.info(f"[{account.get('username')}] fetch_posts_from_google_sheetsで取得した件数: {len(posts_to_process)}")
+    if not posts_to_process:
+        logger.info(f"[{account.get('username')}] 投稿データが0件でした。スキップします。")
+        return None
+
+    last_post_col = "最終投稿日時"
+    # 再試行待ち・デッドレターの行は選ばず、再試行の時刻が来た行を最優先する
+    retry_queue = get_retry_queue()
+    account_id = account.get("account_id", "default")
+    held_ids = retry_queue.held_ids(account_id)
+    due_ids = [job["source_id"] for job in retry_queue.due(account_id)]
+    # 本文が空でない投稿のみ抽出
+    posts_with_body = [
+        p for p in posts_to_process
+        if p.get("本文") and str(p.get("本文")).strip() and str(p.get("ID")) not in held_ids
+    ]
+    posts_sorted = sorted(posts_with_body, key=lambda x: parse_dt(x.get(last_post_col)))
+    due_posts = sorted(
+        (p for p in posts_with_body if str(p.get("ID")) in due_ids),
+        key=lambda x: due_ids.index(str(x.get("ID"))),
+    )
+    if due_posts:
+        logger.info(f"[{account.get('username')}] 再試行キューの投稿ID '{due_posts[0].get('ID')}' を優先して投稿します。")
+    target_post = due_posts[0] if due_posts else (posts_sorted[0] if posts_sorted else None)
+
+    if not target_post:
+        logger.info(f"[{account.get('username')}] 投稿対象がありません。スキップします。")
+        return None
+    return target_post
+
+
+def defer_until_reset(account):
+    """
+    レート制限の解除まで待てないアカウントの投稿を、解除時刻以降に再試行キューから投稿されるよう登録する。
+    Args:
+        account (dict): twitter_accounts の1件（columns 補完済み）。
+    """
+    target_post = select_target_post(account)
+    if not target_post or not target_post.get("ID"):
+        return
+    account_id = account.get("account_id", "default")
+    job = get_retry_queue().record_failure(
+        account_id, target_post.get("ID"), FAILURE_RATE_LIMIT, "レート制限中のため延期",
+        rate_limit_account=account_key(account, account_id),
+    )
+    retry_at = datetime.datetime.fromtimestamp(job["next_attempt_at"]).strftime('%Y-%m-%d %H:%M:%S')
+    logger.info(f"[{account.get('username')}] 投稿ID '{target_post.get('ID')}' を {retry_at} 以降の実行に延期します。")
+
+
 def main():
     global logger
     logger.info("===== Auto Post Bot 開始 =====")
@@ -726,6 +1016,7 @@ def main():
     sheet_name = config.get("sheet_name")
     twitter_accounts = config.get("twitter_accounts", [])
     global_columns = config.get("columns")
+    deferred = []  # レート制限中のアカウント: (解除時刻, アカウント設定)
 
     for account in twitter_accounts:
         # columns補完処理
@@ -733,8 +1024,8 @@ def main():
         if "columns" not in gs_config or not gs_config["columns"]:
             gs_config["columns"] = global_columns
         account["google_sheets_source"] = gs_config
-        # デバッグログを追加
-        logger.info(f"[DEBUG] アカウント設定全体: {account}")
+        # アカウント設定（パスワード等を含む）は DEBUG のときだけ出す
+        logger.debug("アカウント設定全体: %s", account)
         
         worksheet_name = gs_config.get("worksheet_name")
         key_file_path = config_loader.get_common_config().get("file_paths", {}).get("google_key_file")
@@ -743,31 +1034,44 @@ def main():
         # sheet_nameはグローバルから取得するため、アカウントごとの必須チェックから除外
         if not all([worksheet_name, key_file_path, column_settings]):
             logger.error(f"アカウント {account.get('username')} の設定が不足しています。スキップします。")
-            logger.error(f"[DEBUG] アカウント設定内容: {account}")
-            logger.error(f"[DEBUG] worksheet_name: {worksheet_name}")
-            logger.error(f"[DEBUG] key_file_path: {key_file_path}")
-            logger.error(f"[DEBUG] column_settings: {column_settings}")
-            continue
-
-        posts_to_process = fetch_posts_from_google_sheets(account, logger, global_config=config)
-        logger.info(f"[{account.get('username')}] fetch_posts_from_google_sheetsで取得した件数: {len(posts_to_process)}")
-        if not posts_to_process:
-            logger.info(f"[{account.get('username')}] 投稿データが0件でした。スキップします。")
+            logger.debug("アカウント設定内容: %s", account)
+            logger.error(
+                "worksheet_name: %s / key_file_path: %s / column_settings: %s",
+                worksheet_name, key_file_path, column_settings,
+            )
             continue
 
-        last_post_col = "最終投稿日時"
-        # 本文が空でない投稿のみ抽出
-        posts_with_body = [p for p in posts_to_process if p.get("本文") and str(p.get("本文")).strip()]
-        posts_sorted = sorted(posts_with_body, key=lambda x: parse_dt(x.get(last_post_col)))
-        target_post = posts_sorted[0] if posts_sorted else None
-
-        if not target_post:
-            logger.info(f"[{account.get('username')}] 投稿対象がありません。スキップします。")
+        # API投稿ではレート制限台帳（X のユーザー名で引く）を確認し、上限に達していれば他のアカウントの後に回す
+        if USE_TWITTER_API:
+            blocked_until = get_rate_limit_ledger().blocked_until(
+                account_key(account, account.get("account_id", "default"))
+            )
+            if blocked_until:
+                reset_at = datetime.datetime.fromtimestamp(blocked_until).strftime('%Y-%m-%d %H:%M:%S')
+                logger.info(f"[{account.get('username')}] レート制限中（{reset_at} に解除）のため、解除後に投稿します。")
+                deferred.append((blocked_until, account))
+                continue
+
+        target_post = select_target_post(account)
+        if target_post:
+            post_single_tweet(account, target_post, logger, global_config=config)
+
+    # レート制限中だったアカウントは、解除が近ければ待ってから投稿し、先なら解除時刻に再試行キューで回す
+    for blocked_until, account in sorted(deferred, key=lambda item: item[0]):
+        wait_secs = blocked_until - time.time()
+        if wait_secs > RATE_LIMIT_MAX_WAIT_SECS:
+            defer_until_reset(account)
             continue
-
-        success = post_single_tweet(account, target_post, logger, global_config=config)
+        if wait_secs > 0:
+            logger.info(f"[{account.get('username')}] レート制限の解除まで {wait_secs:.0f} 秒待ちます。")
+            time.sleep(wait_secs + 1)
+        target_post = select_target_post(account)
+        if target_post:
+            post_single_tweet(account, target_post, logger, global_config=config)
 
     logger.info("===== Auto Post Bot 終了 =====")
 
 if __name__ == "__main__":
-    main()
+    metrics.install()
+    with profiling.profile_run("post_tweet"), tracing.span("post_tweet_sheets.run"):
+        main()
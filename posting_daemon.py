@@ -0,0 +1,515 @@
+"""
+全アカウントの投稿スケジュールを1つのプロセスで管理する常駐スケジューラー。
+
+これまでは投稿枠ごとに launchd が run_posting.sh → run_full_posting.py →
+promote_used_to_pending_minimum_batch.py / post_tweet 2.py と4つのプロセスを起動していた。
+このデーモンは accounts.json の全アカウントのスケジュールをメモリ上に持ち、
+各枠で「ストック補充 → 投稿」を asyncio のタスクとして実行する。
+ブラウザ（WebDriver）・Notion/Twitter クライアント・キャッシュはジョブ間で使い回す。
+
+スケジュールは従来の launchd 設定と同じく、12:00〜翌6:00 の間で約90分おき、
+アカウント間で均等にずらし、さらに各枠にジッター（既定 ±5分）を加える。
+再試行キュー（retry_queue.py）に次の枠より早く再試行するジョブがあれば、その時刻に実行する。
+
+操作は Unix ソケット経由で行う:
+    python3 posting_daemon.py run                      # 起動（フォアグラウンド）
+    python3 posting_daemon.py run --metrics-port 9464  # /metrics（metrics.py）も公開して起動
+    python3 posting_daemon.py status                   # 状態表示
+    python3 posting_daemon.py pause [--account 名前]    # 一時停止（全体またはアカウント単位）
+    python3 posting_daemon.py resume [--account 名前]   # 再開
+    python3 posting_daemon.py run-now --account 名前    # 次の枠を待たずに1回実行
+    python3 posting_daemon.py stop                     # 実行中のジョブの完了を待って終了
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import signal
+import asyncio
+import logging
+import argparse
+import datetime
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+import metrics
+import log_setup
+from rate_limit_ledger import account_key, get_rate_limit_ledger
+from retry_queue import get_retry_queue
+from state_store import get_state_store
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+POST_SCRIPT_PATH = os.path.join(SCRIPT_DIR, "post_tweet 2.py")
+ACCOUNTS_PATH = os.path.join(SCRIPT_DIR, "accounts.json")
+DEFAULT_SOCKET_PATH = os.path.join(SCRIPT_DIR, ".cache", "posting_daemon.sock")
+
+# 投稿時間帯（12:00〜翌6:00）と間隔
+WINDOW_START_HOUR = 12
+WINDOW_MINUTES = 18 * 60
+INTERVAL_MINUTES = 90
+JITTER_MINUTES = 5
+# 投稿待ちがこの件数未満ならストック補充を行う（promote_used_to_pending_minimum_batch.py と同じ）
+MINIMUM_PENDING_THRESHOLD = 1
+# ペーストにシステムのクリップボードを使うため、ブラウザ操作は既定で1つずつ実行する
+DEFAULT_MAX_CONCURRENT = 1
+
+
+def daily_slots(index, count, interval=INTERVAL_MINUTES, window=WINDOW_MINUTES):
+    """
+    アカウントの1日の投稿枠を、12:00 からの経過分のリストで返す。
+    Args:
+        index (int): アカウントの順番（0始まり）。
+        count (int): アカウント数。
+        interval (int, optional): 投稿間隔（分）。
+        window (int, optional): 投稿時間帯の長さ（分）。
+    Returns:
+        list: 12:00 からの経過分（float）のリスト。
+    """
+    offset = index * interval / max(1, count)
+    slots = []
+    minute = offset
+    while minute < window:
+        slots.append(minute)
+        minute += interval
+    return slots
+
+
+def next_slot_after(now, slots):
+    """
+    now より後で最も近い投稿枠の時刻を返す。
+    Args:
+        now (datetime.datetime): 基準時刻。
+        slots (list): daily_slots() の戻り値。
+    Returns:
+        datetime.datetime: 次の投稿枠の時刻。
+    """
+    today_start = now.replace(hour=WINDOW_START_HOUR, minute=0, second=0, microsecond=0)
+    candidates = []
+    # 0:00〜6:00 の枠は前日の 12:00 起点になる
+    for day in (-1, 0, 1):
+        start = today_start + datetime.timedelta(days=day)
+        candidates.extend(start + datetime.timedelta(minutes=m) for m in slots)
+    return min(c for c in candidates if c > now)
+
+
+def next_mode(account):
+    """状態ストアのカウンターを進めてモードを決める（run_posting.sh と同じカウンターを共有）。"""
+    return get_state_store().next_mode(account)
+
+
+def load_post_module(account):
+    """
+    post_tweet 2.py をアカウント専用のモジュールとして読み込む。
+    設定はモジュールのグローバル変数に持つため、アカウントごとに別のインスタンスにする。
+    """
+    spec = importlib.util.spec_from_file_location(f"post_tweet_notion_{account}", POST_SCRIPT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class AccountWorker:
+    """1アカウント分の投稿ジョブと、使い回すブラウザ・モジュールを保持する。"""
+
+    def __init__(self, name, slots, keep_browser=True, rate_limit_account=None):
+        self.name = name
+        # レート制限台帳のキー（X のユーザー名。rate_limit_ledger.account_key()）
+        self.rate_limit_account = rate_limit_account or name
+        self.slots = slots
+        self.keep_browser = keep_browser
+        self.paused = False
+        self.running = False
+        self.next_run = None
+        self.last_run = None
+        self.last_mode = None
+        self.last_result = None
+        self.last_duration = None
+        self.runs = 0
+        self.failures = 0
+        self._module = None
+        self._driver = None
+
+    def _promote_if_needed(self, module):
+        """configure() 済みのモジュールの Notion クライアントで、必要ならストック補充を行う。"""
+        import promote_used_to_pending_minimum_batch as promote
+
+        pending, promoted = promote.promote_if_needed(module.notion, module.DATABASE_ID, MINIMUM_PENDING_THRESHOLD)
+        if promoted:
+            logger.info(f"[{self.name}] ⚠️ 「投稿待ち」が {pending} 件だったため、{promoted} 件を補充しました。")
+
+    def run_job(self, mode=None, mode_selector=next_mode):
+        """
+        ストック補充と投稿を1回実行する（スレッドプール上で呼ばれる）。
+        run_posting.sh 経由の実行と重ならないよう、状態ストアの実行中マーカーを取ってから行う。
+        Args:
+            mode (str, optional): "question" または "joboffer"。None ならマーカー取得後に mode_selector で決める。
+            mode_selector (callable, optional): アカウント名を受け取りモードを返す関数。
+        Returns:
+            bool or None: 投稿に成功した場合はTrue。他のジョブが実行中でスキップした場合はNone。
+        """
+        store = get_state_store()
+        with store.job(self.name) as token:
+            if not token:
+                logger.warning(f"[{self.name}] ⏭️ 同じアカウントのジョブが実行中のため、スキップします。")
+                store.record_run(self.name, mode, "skipped")
+                return None
+            # ローテーションのカウンターはマーカーを取れた実行だけ進める
+            mode = mode or mode_selector(self.name)
+            self.last_mode = mode
+            logger.info(f"[{self.name}] 🚀 投稿ジョブ開始（モード: {mode}）")
+            with log_setup.bind(account=self.name, mode=mode):
+                return self._run_locked(store, mode)
+
+    def _run_locked(self, store, mode):
+        """実行中マーカーを持った状態でストック補充と投稿を行い、結果を記録する。"""
+        success = False
+        try:
+            with tracing.span("daemon.job", account=self.name, mode=mode) as job_span:
+                if self._module is None:
+                    self._module = load_post_module(self.name)
+                module = self._module
+                # クライアントは configure() の中でジョブをまたいで使い回される
+                module.configure(self.name, mode)
+                # 複数アカウントが同じファイル名で動画を保存しないようにする
+                module.VIDEO_FILE_NAME = f"notion_video_{self.name}.mp4"
+                with tracing.span("daemon.promote", account=self.name, mode=mode):
+                    self._promote_if_needed(module)
+                success, self._driver = module.run_posting(self._driver, keep_driver=self.keep_browser)
+                job_span.set(success=success)
+        finally:
+            store.record_run(self.name, mode, "success" if success else "failure")
+        return success
+
+    def close(self):
+        if self._driver is not None:
+            try:
+                self._driver.quit()
+            except Exception as e:
+                logger.warning(f"[{self.name}] WebDriverの終了に失敗: {e}")
+            self._driver = None
+
+    def status(self):
+        blocked = get_rate_limit_ledger().blocked_until(self.rate_limit_account)
+        return {
+            "paused": self.paused,
+            "running": self.running,
+            "next_run": self.next_run.isoformat(timespec="seconds") if self.next_run else None,
+            "last_run": self.last_run,
+            "last_mode": self.last_mode,
+            "last_result": self.last_result,
+            "last_duration": self.last_duration,
+            "runs": self.runs,
+            "failures": self.failures,
+            "state": get_state_store().get(self.name),
+            "retry": get_retry_queue().next_pending(self.name),
+            "browser_warm": self._driver is not None,
+            "rate_limited_until": (
+                datetime.datetime.fromtimestamp(blocked).isoformat(timespec="seconds")
+                if blocked else None
+            ),
+        }
+
+
+class PostingDaemon:
+    """全アカウントのスケジュールとジョブの実行を管理する。"""
+
+    def __init__(self, accounts, max_concurrent=DEFAULT_MAX_CONCURRENT,
+                 jitter_minutes=JITTER_MINUTES, socket_path=DEFAULT_SOCKET_PATH,
+                 keep_browser=True, mode_selector=next_mode):
+        names = list(accounts)
+        self.workers = {
+            name: AccountWorker(
+                name, daily_slots(i, len(names)), keep_browser,
+                rate_limit_account=account_key(accounts[name], name) if isinstance(accounts, dict) else None,
+            )
+            for i, name in enumerate(names)
+        }
+        self.max_concurrent = max_concurrent
+        self.jitter_minutes = jitter_minutes
+        self.socket_path = socket_path
+        self.mode_selector = mode_selector
+        self.paused = False
+        self.started_at = None
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="posting")
+        self._semaphore = None
+        self._stop = None
+
+    # --- スケジュール ---
+
+    def _plan_next_run(self, worker):
+        """
+        次の実行時刻とモードを決める。
+        Returns:
+            tuple: (実行時刻, モード)。モードが None なら通常の枠（ローテーションで決める）。
+        """
+        now = datetime.datetime.now()
+        slot = next_slot_after(now, worker.slots)
+        jitter = random.uniform(-self.jitter_minutes, self.jitter_minutes)
+        planned = slot + datetime.timedelta(minutes=jitter)
+        mode = None
+        retry = get_retry_queue().next_pending(worker.name)
+        if retry:
+            # 再試行できずに残った場合（一時停止・他ジョブ実行中など）に詰めて回らないよう、1分は空ける
+            retry_at = max(
+                datetime.datetime.fromtimestamp(retry["next_attempt_at"]),
+                now + datetime.timedelta(minutes=1),
+            )
+            if retry_at < planned:
+                # 再試行はローテーションを進めず、失敗したときと同じモードで行う
+                planned, mode = retry_at, retry["mode"] or worker.last_mode
+        return max(planned, now + datetime.timedelta(seconds=1)), mode
+
+    async def _sleep_until(self, when):
+        """指定時刻まで待つ。停止の指示があれば途中で戻る。"""
+        while not self._stop.is_set():
+            remaining = (when - datetime.datetime.now()).total_seconds()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=min(remaining, 60))
+            except asyncio.TimeoutError:
+                continue
+
+    async def _account_loop(self, worker):
+        while not self._stop.is_set():
+            worker.next_run, mode = self._plan_next_run(worker)
+            logger.info(
+                f"[{worker.name}] ⏰ 次回の投稿予定: {worker.next_run:%m/%d %H:%M:%S}"
+                f"{'（再試行）' if mode else ''}"
+            )
+            await self._sleep_until(worker.next_run)
+            if self._stop.is_set():
+                return
+            if self.paused or worker.paused:
+                logger.info(f"[{worker.name}] ⏸️ 一時停止中のため、この枠をスキップします。")
+                continue
+
+            # レート制限中ならリセット時刻ちょうどまで待ってから実行する
+            blocked = get_rate_limit_ledger().blocked_until(worker.rate_limit_account)
+            if blocked:
+                resume_at = datetime.datetime.fromtimestamp(blocked)
+                worker.next_run = resume_at
+                logger.warning(f"[{worker.name}] 🚫 レート制限中のため {resume_at:%H:%M:%S} まで待機します。")
+                await self._sleep_until(resume_at)
+                if self._stop.is_set():
+                    return
+            await self._dispatch(worker, mode)
+
+    async def _dispatch(self, worker, mode=None):
+        if worker.running:
+            logger.warning(f"[{worker.name}] 前回のジョブが実行中のため、この枠をスキップします。")
+            return
+        worker.running = True
+        try:
+            async with self._semaphore:
+                worker.last_run = datetime.datetime.now().isoformat(timespec="seconds")
+                started = time.monotonic()
+                loop = asyncio.get_running_loop()
+                try:
+                    success = await loop.run_in_executor(
+                        self._executor, worker.run_job, mode, self.mode_selector
+                    )
+                except Exception as e:
+                    logger.error(f"[{worker.name}] ❌ 投稿ジョブで例外発生: {e}", exc_info=True)
+                    success = False
+                worker.last_duration = round(time.monotonic() - started, 1)
+                if success is None:
+                    worker.last_result = "skipped"
+                    return
+                worker.last_result = "success" if success else "failure"
+                worker.runs += 1
+                worker.failures += 0 if success else 1
+                logger.info(
+                    f"[{worker.name}] {'✅' if success else '❌'} 投稿ジョブ終了"
+                    f"（{worker.last_duration} 秒）"
+                )
+        finally:
+            worker.running = False
+
+    # --- 操作用ソケット ---
+
+    def status(self):
+        return {
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "paused": self.paused,
+            "max_concurrent": self.max_concurrent,
+            "accounts": {name: w.status() for name, w in self.workers.items()},
+        }
+
+    def handle_command(self, request):
+        """
+        操作コマンドを処理する。
+        Args:
+            request (dict): {"command": ..., "account": ..., "mode": ...}
+        Returns:
+            dict: 応答。
+        """
+        command = request.get("command")
+        account = request.get("account")
+        if account and account not in self.workers:
+            return {"ok": False, "error": f"アカウント '{account}' は存在しません"}
+        targets = [self.workers[account]] if account else None
+
+        if command == "status":
+            return {"ok": True, "status": self.status()}
+        if command in ("pause", "resume"):
+            paused = command == "pause"
+            if targets:
+                for worker in targets:
+                    worker.paused = paused
+            else:
+                self.paused = paused
+            logger.info(f"{'⏸️ 一時停止' if paused else '▶️ 再開'}: {account or '全アカウント'}")
+            return {"ok": True}
+        if command == "run-now":
+            if not targets:
+                return {"ok": False, "error": "run-now には --account が必要です"}
+            asyncio.get_running_loop().create_task(self._dispatch(targets[0], request.get("mode")))
+            return {"ok": True}
+        if command == "stop":
+            self._stop.set()
+            return {"ok": True}
+        return {"ok": False, "error": f"不明なコマンド: {command}"}
+
+    async def _handle_client(self, reader, writer):
+        try:
+            line = await reader.readline()
+            try:
+                response = self.handle_command(json.loads(line.decode("utf-8") or "{}"))
+            except ValueError as e:
+                response = {"ok": False, "error": f"不正なリクエスト: {e}"}
+            writer.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+            await writer.drain()
+        finally:
+            writer.close()
+
+    # --- 起動・終了 ---
+
+    async def run(self):
+        self._stop = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self.started_at = datetime.datetime.now().isoformat(timespec="seconds")
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stop.set)
+            except (NotImplementedError, RuntimeError):
+                # メインスレッド以外で動かす場合（テストなど）はシグナルを扱わない
+                pass
+
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+        logger.info(f"🟢 スケジューラー起動: {len(self.workers)} アカウント / 同時実行 {self.max_concurrent}")
+
+        tasks = [loop.create_task(self._account_loop(w)) for w in self.workers.values()]
+        await self._stop.wait()
+        logger.info("🛑 停止指示を受け付けました。実行中のジョブの完了を待っています...")
+        server.close()
+        await server.wait_closed()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # 実行中のジョブはスレッド上で最後まで走らせる
+        await loop.run_in_executor(None, self._executor.shutdown, True)
+        for worker in self.workers.values():
+            worker.close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        logger.info("🏁 スケジューラーを終了しました。")
+
+
+def send_command(request, socket_path=DEFAULT_SOCKET_PATH, timeout=10):
+    """
+    起動中のデーモンに操作コマンドを送る。
+    Args:
+        request (dict): {"command": ..., "account": ..., "mode": ...}
+        socket_path (str, optional): デーモンのソケットのパス。
+        timeout (float, optional): 応答待ちのタイムアウト（秒）。
+    Returns:
+        dict: デーモンからの応答。
+    """
+
+    async def _send():
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        writer.write((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+        await writer.drain()
+        line = await asyncio.wait_for(reader.readline(), timeout)
+        writer.close()
+        return json.loads(line.decode("utf-8"))
+
+    return asyncio.run(_send())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全アカウントの投稿を管理する常駐スケジューラー")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="操作用 Unix ソケットのパス")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="スケジューラーを起動する")
+    run_parser.add_argument("--max-concurrent", type=int, default=DEFAULT_MAX_CONCURRENT, help="同時に実行する投稿ジョブ数")
+    run_parser.add_argument("--jitter", type=float, default=JITTER_MINUTES, help="各枠に加えるジッター（±分）")
+    run_parser.add_argument("--account", action="append", help="対象アカウント（省略時は accounts.json の全アカウント）")
+    run_parser.add_argument("--close-browsers", action="store_true", help="ジョブごとにブラウザを閉じる")
+    run_parser.add_argument("--metrics-port", type=int, help="指定したポートで /metrics を公開する（Prometheus 形式）")
+
+    subparsers.add_parser("status", help="状態を表示する")
+    for name in ("pause", "resume"):
+        sub = subparsers.add_parser(name, help="一時停止する" if name == "pause" else "再開する")
+        sub.add_argument("--account", help="対象アカウント（省略時は全体）")
+    run_now_parser = subparsers.add_parser("run-now", help="次の枠を待たずに1回実行する")
+    run_now_parser.add_argument("--account", required=True)
+    run_now_parser.add_argument("--mode", choices=["question", "joboffer"])
+    subparsers.add_parser("stop", help="スケジューラーを停止する")
+    args = parser.parse_args()
+
+    if args.command != "run":
+        logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(message)s", datefmt="%H:%M:%S")
+        request = {"command": args.command}
+        request.update({k: v for k, v in (("account", getattr(args, "account", None)),
+                                          ("mode", getattr(args, "mode", None))) if v})
+        try:
+            response = send_command(request, args.socket)
+        except (FileNotFoundError, ConnectionRefusedError):
+            print("❌ スケジューラーが起動していません。")
+            return 1
+        print(json.dumps(response, ensure_ascii=False, indent=2))
+        return 0 if response.get("ok") else 1
+
+    # ログはキュー経由で logs/posting_daemon.jsonl に書き出し、サイズでローテーションする
+    log_setup.setup_logging("posting_daemon")
+    # 相対パス（accounts.json、chrome_profiles/ など）はスクリプトの場所を基準にする
+    os.chdir(SCRIPT_DIR)
+    with open(ACCOUNTS_PATH, "r", encoding="utf-8") as f:
+        accounts = json.load(f)
+    if args.account:
+        missing = [a for a in args.account if a not in accounts]
+        if missing:
+            print(f"❌ アカウント {missing} は accounts.json に存在しません。")
+            return 1
+        accounts = {a: accounts[a] for a in args.account}
+
+    metrics.install()
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+    daemon = PostingDaemon(
+        accounts,
+        max_concurrent=args.max_concurrent,
+        jitter_minutes=args.jitter,
+        socket_path=args.socket,
+        keep_browser=not args.close_browsers,
+    )
+    asyncio.run(daemon.run())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
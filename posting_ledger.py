@@ -0,0 +1,390 @@
+"""
+投稿の「予定 → 送信済み → 確定」を記録する台帳（二重投稿の防止用）。
+
+キーは (アカウント, 投稿元ID, 本文のハッシュ)。投稿元IDは Notion のページID、
+またはスプレッドシートの行ID（＋最終投稿日時）を使う。
+
+    intent     投稿を始める前に記録する。この状態で止まった場合は、送信ボタンを押す前に止まっている。
+    sending    送信ボタン（または ⌘/Ctrl+Enter）を押す直前に記録する。この状態で止まった場合は、
+               送信されたかどうか分からない（送信後の成功判定・URL取得の途中で落ちた、判定が失敗を返した等）。
+    sent       送信できたことを確認した時点で記録する（取得できればツイートIDも保存）。
+    confirmed  投稿元のステータス更新（Notionの「使用済み」、シートの最終投稿日時など）まで完了。
+
+再実行時に intent なら投稿し直す。sending なら再投稿はせず、タイムラインで投稿を確認できれば
+そこから続け、確認できなければ投稿元の更新だけを行う（ACTION_VERIFY）。
+sent が残っていれば、送信はせずに投稿元の更新だけをやり直す。confirmed なら何もしない。
+
+スレッド投稿では、分割したチャンクと投稿済みの各ツイート（URLまたはID）も1件ごとに保存する。
+途中で失敗した場合は、次回最後に確認できたツイートへのリプライから再開する（先頭から投稿し直さない）。
+送信中に落ちたツイートは「不明」として残るため、その後は再開せずに投稿元の更新だけを行う。
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_LEDGER_PATH = os.path.join(SCRIPT_DIR, ".cache", "posting_ledger.sqlite3")
+
+STATE_INTENT = "intent"
+STATE_SENDING = "sending"
+STATE_SENT = "sent"
+STATE_CONFIRMED = "confirmed"
+
+# begin() の戻り値
+ACTION_POST = "post"        # 投稿する
+ACTION_RESUME = "resume"    # スレッドの途中まで送信済み。続きから投稿する
+ACTION_VERIFY = "verify"    # 送信したか不明。再投稿せず、タイムラインで確認するか投稿元の更新だけ行う
+ACTION_FINISH = "finish"    # 送信済み。投稿元の更新だけ行う
+ACTION_SKIP = "skip"        # 完了済み。何もしない
+
+_STATUS_ID_RE = re.compile(r"/status/(\d+)")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    account TEXT NOT NULL,
+    source_id TEXT NOT NULL,
+    content_sha TEXT NOT NULL,
+    state TEXT NOT NULL,
+    tweet_id TEXT,
+    tweet_url TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    chunks TEXT,
+    posted TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (account, source_id, content_sha)
+)
+"""
+
+# 以前のバージョンで作成した台帳に追加する列
+_ADDED_COLUMNS = (("chunks", "TEXT"), ("posted", "TEXT"))
+
+
+def content_hash(content):
+    """本文のハッシュ（前後の空白は無視する）。"""
+    return hashlib.sha256(content.strip().encode("utf-8")).hexdigest()
+
+
+def tweet_id_from_url(url):
+    """
+    ツイートURLからツイートIDを取り出す。
+    Args:
+        url (str): https://twitter.com/<user>/status/<id> 形式のURL。
+    Returns:
+        str or None: ツイートID。
+    """
+    match = _STATUS_ID_RE.search(url or "")
+    return match.group(1) if match else None
+
+
+def thread_progress(entry):
+    """
+    記録からスレッドの進み具合を取り出す。
+    Args:
+        entry (dict): begin() や get() が返した記録。
+    Returns:
+        dict or None: {"chunks", "posted", "next_index", "head", "last"}。
+                      チャンクを記録していなければNone。
+    """
+    if not entry or not entry.get("chunks"):
+        return None
+    chunks = json.loads(entry["chunks"])
+    posted = json.loads(entry.get("posted") or "[]")
+    return {
+        "chunks": chunks,
+        "posted": posted,
+        "next_index": len(posted),
+        "head": posted[0] if posted else None,
+        "last": posted[-1] if posted else None,
+    }
+
+
+def is_resumable(entry):
+    """スレッドが途中まで投稿済みで、最後のツイートが分かっている（続きから再開できる）か。"""
+    progress = thread_progress(entry)
+    return bool(
+        progress
+        and 0 < progress["next_index"] < len(progress["chunks"])
+        and progress["last"]
+    )
+
+
+class PostingLedger:
+    """投稿の進行状況を SQLite に記録する。"""
+
+    def __init__(self, path=DEFAULT_LEDGER_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute(_SCHEMA)
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(posts)")}
+            for name, column_type in _ADDED_COLUMNS:
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE posts ADD COLUMN {name} {column_type}")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # 送信済みの記録は落ちても失われないようにする
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def begin(self, account, source_id, content):
+        """
+        投稿を始める前に呼び、どう進めるかを返す。
+        Args:
+            account (str): アカウント名。
+            source_id (str): 投稿元のID（NotionページID、シートの行IDなど）。
+            content (str): 投稿する本文。
+        Returns:
+            tuple: (key, action, entry)
+                   key (tuple): 以降の mark_* に渡すキー。
+                   action (str): ACTION_POST / ACTION_RESUME / ACTION_VERIFY / ACTION_FINISH / ACTION_SKIP。
+                   entry (dict): 現在の記録。
+        """
+        key = (account, str(source_id), content_hash(content))
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM posts WHERE account = ? AND source_id = ? AND content_sha = ?", key
+            ).fetchone()
+            if row and row["state"] == STATE_CONFIRMED:
+                return key, ACTION_SKIP, dict(row)
+            if row and row["state"] == STATE_SENT:
+                if is_resumable(dict(row)):
+                    return key, ACTION_RESUME, dict(row)
+                return key, ACTION_FINISH, dict(row)
+            if row and row["state"] == STATE_SENDING:
+                return key, ACTION_VERIFY, dict(row)
+            if row:
+                conn.execute(
+                    "UPDATE posts SET attempts = attempts + 1, updated_at = ? "
+                    "WHERE account = ? AND source_id = ? AND content_sha = ?",
+                    (now,) + key,
+                )
+            else:
+                conn.execute(
+                    "INSERT INTO posts (account, source_id, content_sha, state, attempts, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, 1, ?, ?)",
+                    key + (STATE_INTENT, now, now),
+                )
+            row = conn.execute(
+                "SELECT * FROM posts WHERE account = ? AND source_id = ? AND content_sha = ?", key
+            ).fetchone()
+        return key, ACTION_POST, dict(row)
+
+    def mark_sending(self, key, index=0):
+        """
+        送信ボタンを押す（API ならツイート作成を要求する）直前に呼ぶ。以降に落ちた場合、次回は投稿し直さない。
+        先頭ツイートは状態を sending にし、2件目以降は投稿済みの一覧の index 番目を「不明」（None）にしておく
+        （最後のツイートが不明なスレッドは続きから再開せず、投稿元の更新だけを行う）。
+        Args:
+            key (tuple): begin() が返したキー。
+            index (int, optional): これから送るチャンクの番号（0 が先頭ツイート）。
+        """
+        with self._transaction() as conn:
+            if index == 0:
+                conn.execute(
+                    "UPDATE posts SET state = ?, updated_at = ? "
+                    "WHERE account = ? AND source_id = ? AND content_sha = ? AND state = ?",
+                    (STATE_SENDING, time.time()) + tuple(key) + (STATE_INTENT,),
+                )
+                return
+            row = conn.execute(
+                "SELECT posted FROM posts WHERE account = ? AND source_id = ? AND content_sha = ?", tuple(key)
+            ).fetchone()
+            if not row:
+                return
+            posted = json.loads(row["posted"] or "[]")[:index]
+            posted.extend([None] * (index + 1 - len(posted)))
+            conn.execute(
+                "UPDATE posts SET posted = ?, updated_at = ? WHERE account = ? AND source_id = ? AND content_sha = ?",
+                (json.dumps(posted), time.time()) + tuple(key),
+            )
+
+    def cancel_sending(self, key, index=0):
+        """
+        mark_sending() の後、送信されていないと分かった場合（接続できなかった・API が拒否した）に取り消す。
+        次回は index 番目から投稿し直せるようになる。
+        Args:
+            key (tuple): begin() が返したキー。
+            index (int, optional): mark_sending() に渡したチャンクの番号。
+        """
+        with self._transaction() as conn:
+            if index == 0:
+                conn.execute(
+                    "UPDATE posts SET state = ?, updated_at = ? "
+                    "WHERE account = ? AND source_id = ? AND content_sha = ? AND state = ?",
+                    (STATE_INTENT, time.time()) + tuple(key) + (STATE_SENDING,),
+                )
+                return
+            row = conn.execute(
+                "SELECT posted FROM posts WHERE account = ? AND source_id = ? AND content_sha = ?", tuple(key)
+            ).fetchone()
+            posted = json.loads(row["posted"] or "[]") if row else []
+            if len(posted) == index + 1 and posted[index] is None:
+                conn.execute(
+                    "UPDATE posts SET posted = ?, updated_at = ? "
+                    "WHERE account = ? AND source_id = ? AND content_sha = ?",
+                    (json.dumps(posted[:index]), time.time()) + tuple(key),
+                )
+
+    def mark_sent(self, key, tweet_id=None, tweet_url=None):
+        """
+        送信できたことを記録する。ツイートIDが後から分かった場合は再度呼んでよい。
+        Args:
+            key (tuple): begin() が返したキー。
+            tweet_id (str, optional): ツイートID。
+            tweet_url (str, optional): ツイートURL（IDはここからも取り出す）。
+        """
+        tweet_id = tweet_id or tweet_id_from_url(tweet_url)
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE posts SET state = CASE WHEN state = ? THEN state ELSE ? END, "
+                "tweet_id = COALESCE(?, tweet_id), tweet_url = COALESCE(?, tweet_url), updated_at = ? "
+                "WHERE account = ? AND source_id = ? AND content_sha = ?",
+                (STATE_CONFIRMED, STATE_SENT, tweet_id, tweet_url, time.time()) + tuple(key),
+            )
+
+    def start_thread(self, key, chunks):
+        """
+        投稿するチャンクを記録する（再開時に同じ分割で続きを投稿するため）。
+        Args:
+            key (tuple): begin() が返したキー。
+            chunks (list): 投稿するテキストのリスト。
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE posts SET chunks = ?, posted = '[]', updated_at = ? "
+                "WHERE account = ? AND source_id = ? AND content_sha = ? AND state = ?",
+                (json.dumps(chunks, ensure_ascii=False), time.time()) + tuple(key) + (STATE_INTENT,),
+            )
+
+    def record_step(self, key, index, tweet_url=None, tweet_id=None):
+        """
+        スレッドの index 番目のツイートを投稿できたことを記録する。
+        Args:
+            key (tuple): begin() が返したキー。
+            index (int): チャンクの番号（0 が先頭ツイート）。
+            tweet_url (str, optional): 投稿したツイートのURL。
+            tweet_id (str, optional): 投稿したツイートのID（API投稿時）。
+        """
+        ref = tweet_url or tweet_id
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT posted FROM posts WHERE account = ? AND source_id = ? AND content_sha = ?", tuple(key)
+            ).fetchone()
+            if not row:
+                return
+            posted = json.loads(row["posted"] or "[]")[:index]
+            posted.extend([None] * (index - len(posted)))
+            posted.append(ref)
+            head_id = (tweet_id or tweet_id_from_url(tweet_url)) if index == 0 else None
+            conn.execute(
+                "UPDATE posts SET posted = ?, state = CASE WHEN state = ? THEN state ELSE ? END, "
+                "tweet_id = COALESCE(?, tweet_id), tweet_url = COALESCE(?, tweet_url), updated_at = ? "
+                "WHERE account = ? AND source_id = ? AND content_sha = ?",
+                (json.dumps(posted), STATE_CONFIRMED, STATE_SENT, head_id,
+                 tweet_url if index == 0 else None, time.time()) + tuple(key),
+            )
+
+    def mark_confirmed(self, key):
+        """投稿元の更新まで完了したことを記録する。"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE posts SET state = ?, updated_at = ? "
+                "WHERE account = ? AND source_id = ? AND content_sha = ?",
+                (STATE_CONFIRMED, time.time()) + tuple(key),
+            )
+
+    def mark_failed(self, key, error):
+        """
+        失敗したことを記録する。状態は変えない（intent なら次回は投稿し直し、sending なら確認から行う）。
+        Args:
+            key (tuple): begin() が返したキー。
+            error (str): 失敗の内容。
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE posts SET last_error = ?, updated_at = ? "
+                "WHERE account = ? AND source_id = ? AND content_sha = ? AND state != ?",
+                (str(error)[:500], time.time()) + tuple(key) + (STATE_CONFIRMED,),
+            )
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT * FROM posts WHERE account = ? AND source_id = ? AND content_sha = ?", tuple(key)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def unfinished(self, account=None):
+        """
+        確定していない記録を返す（確認・手動対応用）。
+        Args:
+            account (str, optional): 対象アカウント。省略時は全アカウント。
+        Returns:
+            list: 記録のリスト。
+        """
+        query = "SELECT * FROM posts WHERE state != ?"
+        params = [STATE_CONFIRMED]
+        if account:
+            query += " AND account = ?"
+            params.append(account)
+        return [dict(row) for row in self._connection().execute(query + " ORDER BY updated_at", params)]
+
+
+_default_ledger = None
+_default_ledger_lock = threading.Lock()
+
+
+def get_posting_ledger():
+    """プロセス内で共有するデフォルトの台帳を返す。"""
+    global _default_ledger
+    with _default_ledger_lock:
+        if _default_ledger is None:
+            _default_ledger = PostingLedger()
+        return _default_ledger
+
+
+def main():
+    parser = argparse.ArgumentParser(description="投稿台帳の確認")
+    parser.add_argument("--account", help="対象アカウント（省略時は全アカウント）")
+    args = parser.parse_args()
+    rows = get_posting_ledger().unfinished(args.account)
+    if not rows:
+        print("✅ 未確定の投稿はありません。")
+    for row in rows:
+        print(json.dumps(row, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
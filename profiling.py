@@ -0,0 +1,278 @@
+"""
+1回の投稿実行を対象にした、オプトインのプロファイリング。
+
+実行が遅かったときに、時間が Python の CPU 処理（日付のパース、本文の正規化など）、
+ネットワーク I/O、Chrome（WebDriver）の応答待ちのどれに使われているかを後から調べるためのもの。
+有効にすると実行全体について次の3つを logs/profiles/ に書き出す。
+
+    <名前>_<日時>_<pid>.folded        サンプリングプロファイル（collapsed stack 形式。
+                                       speedscope / flamegraph.pl でそのまま開ける）
+    <名前>_<日時>_<pid>.summary.json  壁時計時間の内訳（CPU時間、待ち先の分類、スパンごとの時間、
+                                       自己時間の多い関数）と tracemalloc のスナップショット差分
+    <名前>_<日時>_<pid>.txt           上記の要約（人が読む用）
+
+有効にする方法:
+    AUTO_POST_PROFILE=1 python3 post_tweet.py
+    python3 run_full_posting.py --account 名前 --profile   # 起動する子プロセスも対象になる
+    python3 promote_used_to_pending_minimum_batch.py --profile
+サンプリング間隔は AUTO_POST_PROFILE_INTERVAL（秒、既定 0.005）、出力先は AUTO_POST_PROFILE_DIR で変えられる。
+tracemalloc は割り当ての多い処理を数倍〜数十倍遅くするため、CPU 時間を正確に見たいときは
+AUTO_POST_PROFILE_MEMORY=0 でメモリの計測だけを止める。
+無効時の profile_run() は何もしない。
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+import tracing
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PROFILE_DIR = os.path.join(SCRIPT_DIR, "logs", "profiles")
+PROFILE_ENV = "AUTO_POST_PROFILE"
+INTERVAL_ENV = "AUTO_POST_PROFILE_INTERVAL"
+DIR_ENV = "AUTO_POST_PROFILE_DIR"
+MEMORY_ENV = "AUTO_POST_PROFILE_MEMORY"
+DEFAULT_INTERVAL = 0.005
+# 差分は行単位で集計するので、保存するフレームは1つで足りる（多いほど計測が重くなる）
+TRACEMALLOC_FRAMES = 1
+TOP_N = 25
+
+# スタックに含まれるモジュールから、その時点で何を待っていたかを分類する（上から順に判定）。
+# どれにも当たらなければ "python"（Python の処理。C で実装された time.sleep などの待ちも含むため、
+# CPU 時間の割合 cpu_ratio と合わせて見る）
+_WAIT_CATEGORIES = (
+    ("chrome", ("selenium",)),
+    ("network", ("requests", "urllib3", "http", "socket", "ssl", "notion_client", "httpx",
+                 "gspread", "tweepy", "openai", "oauth2client")),
+    ("subprocess", ("subprocess",)),
+    ("thread_wait", ("threading", "concurrent", "queue")),
+)
+
+
+def profiling_enabled():
+    """プロファイリングが有効か（AUTO_POST_PROFILE）。"""
+    return os.getenv(PROFILE_ENV, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def enable():
+    """プロファイリングを有効にする（--profile 用）。この後に起動する子プロセスにも引き継がれる。"""
+    os.environ[PROFILE_ENV] = "1"
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """別スレッドから一定間隔で各スレッドのスタックを採取する。"""
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.stacks = {}      # "thread;frame;frame..." -> サンプル数
+        self.categories = {}  # 待ち先の分類 -> サンプル数
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _categorize(self, modules):
+        for category, prefixes in _WAIT_CATEGORIES:
+            if any(module == prefix or module.startswith(prefix + ".") for module in modules for prefix in prefixes):
+                return category
+        return "python"
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            labels, modules = [], set()
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                modules.add(frame.f_globals.get("__name__") or "")
+                frame = frame.f_back
+            labels.append(names.get(thread_id, str(thread_id)))
+            key = ";".join(reversed(labels))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            category = self._categorize(modules)
+            self.categories[category] = self.categories.get(category, 0) + 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded(self):
+        """collapsed stack 形式（1行に "フレーム;フレーム... 件数"）のテキスト。"""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def top_functions(self, limit=TOP_N):
+        """
+        サンプル数の多い関数を返す。
+        Returns:
+            dict: {"self": [(関数, 件数), ...], "total": [(関数, 件数), ...]}
+                  self はスタックの末端にいた回数、total はスタックに含まれていた回数。
+        """
+        self_counts, total_counts = {}, {}
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            self_counts[frames[-1]] = self_counts.get(frames[-1], 0) + count
+            for frame in set(frames):
+                total_counts[frame] = total_counts.get(frame, 0) + count
+
+        def top(counts):
+            return sorted(counts.items(), key=lambda item: -item[1])[:limit]
+
+        return {"self": top(self_counts), "total": top(total_counts)}
+
+
+class _SpanTotals:
+    """プロファイル中に閉じたスパンの時間をスパン名ごとに合計する（tracing のリスナー）。"""
+
+    def __init__(self):
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        with self._lock:
+            entry = self.totals.setdefault(record["name"], {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += record["dur_ms"]
+            entry["max_ms"] = max(entry["max_ms"], record["dur_ms"])
+
+    def ordered(self):
+        with self._lock:
+            return sorted(
+                ({"name": name, **entry} for name, entry in self.totals.items()),
+                key=lambda entry: -entry["total_ms"],
+            )
+
+
+def _memory_diff(before, after, limit=TOP_N):
+    stats = after.compare_to(before, "lineno")
+    return [
+        {
+            "where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size_diff_kb": round(stat.size_diff / 1024, 1),
+            "size_kb": round(stat.size / 1024, 1),
+            "count_diff": stat.count_diff,
+        }
+        for stat in stats[:limit]
+    ]
+
+
+def _format_text(summary):
+    lines = [
+        f"🔬 {summary['name']}  壁時計 {summary['wall_secs']:.2f}s / CPU {summary['cpu_secs']:.2f}s"
+        f"（{summary['cpu_ratio'] * 100:.0f}%）  サンプル {summary['samples']} 件",
+        "",
+        "■ 待ち先の内訳（サンプルの割合）",
+    ]
+    for category, ratio in summary["breakdown"].items():
+        lines.append(f"  {category:<12} {ratio * 100:5.1f}%")
+    lines += ["", "■ スパンごとの時間"]
+    for entry in summary["spans"][:TOP_N]:
+        lines.append(
+            f"  {entry['name']:<40} {entry['count']:>4} 回  計 {entry['total_ms'] / 1000:8.2f}s"
+            f"  最大 {entry['max_ms'] / 1000:7.2f}s"
+        )
+    lines += ["", "■ 自己時間の多い関数（サンプル数）"]
+    for frame, count in summary["top_functions"]["self"]:
+        lines.append(f"  {count:>6}  {frame}")
+    if not summary["memory"]:
+        return "\n".join(lines) + "\n"
+    lines += [
+        "",
+        f"■ メモリ（tracemalloc）ピーク {summary['memory']['peak_kb']:.0f} KB、増加の多い行"
+        "（計測中は割り当てが遅くなるため、上の時間は実際より長めに出る）",
+    ]
+    for entry in summary["memory"]["top_diff"]:
+        lines.append(f"  {entry['size_diff_kb']:>+10.1f} KB  {entry['count_diff']:>+7}  {entry['where']}")
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def profile_run(name, output_dir=None):
+    """
+    with 文の区間をプロファイルし、終了時に結果を書き出す。無効時は何もしない。
+    Args:
+        name (str): 出力ファイル名に使う実行の名前（"post_tweet" など）。
+        output_dir (str, optional): 出力先。省略時は AUTO_POST_PROFILE_DIR か logs/profiles。
+    """
+    if not profiling_enabled():
+        yield
+        return
+
+    interval = float(os.getenv(INTERVAL_ENV, DEFAULT_INTERVAL))
+    output_dir = output_dir or os.getenv(DIR_ENV) or DEFAULT_PROFILE_DIR
+    trace_memory = os.getenv(MEMORY_ENV, "1").strip().lower() not in ("0", "false", "no", "off")
+    started_tracemalloc = trace_memory and not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    before = tracemalloc.take_snapshot() if trace_memory else None
+    span_totals = _SpanTotals()
+    tracing.add_listener(span_totals)
+    profiler = SamplingProfiler(interval)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        wall_secs = time.perf_counter() - wall_start
+        cpu_secs = time.process_time() - cpu_start
+        tracing.remove_listener(span_totals)
+        memory = {}
+        if trace_memory:
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            memory = {"peak_kb": round(peak / 1024, 1), "top_diff": _memory_diff(before, after)}
+            if started_tracemalloc:
+                tracemalloc.stop()
+
+        total_samples = sum(profiler.categories.values()) or 1
+        summary = {
+            "name": name,
+            "pid": os.getpid(),
+            "started_at": time.time() - wall_secs,
+            "wall_secs": round(wall_secs, 3),
+            "cpu_secs": round(cpu_secs, 3),
+            "cpu_ratio": round(cpu_secs / wall_secs, 3) if wall_secs else 0.0,
+            "interval": interval,
+            "samples": profiler.samples,
+            "breakdown": {
+                category: round(count / total_samples, 3)
+                for category, count in sorted(profiler.categories.items(), key=lambda item: -item[1])
+            },
+            "spans": span_totals.ordered(),
+            "top_functions": profiler.top_functions(),
+            "memory": memory,
+        }
+        base = os.path.join(output_dir, f"{name}_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}")
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            with open(base + ".folded", "w", encoding="utf-8") as f:
+                f.write(profiler.folded())
+            with open(base + ".summary.json", "w", encoding="utf-8") as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+            with open(base + ".txt", "w", encoding="utf-8") as f:
+                f.write(_format_text(summary))
+            print(f"🔬 プロファイルを保存しました: {base}.txt", file=sys.stderr)
+        except OSError as e:
+            print(f"⚠️ プロファイルの保存に失敗しました: {e}", file=sys.stderr)
@@ -3,6 +3,13 @@ import json
 import argparse
 from notion_client import Client
 
+import tracing
+import metrics
+import profiling
+
+# 投稿待ちがこの件数未満なら移行を実行
+MINIMUM_PENDING_THRESHOLD = 1
+
 
 def load_account_config(account_name):
     """
@@ -47,26 +54,29 @@ def count_pending_posts(notion_client, db_id):
         # ただし、Notion APIの最大ページサイズは100なので、100件を超える場合は複数回クエリが必要
         # ここでは、投稿待ちが極端に多くない前提で、最初の100件で判断する
         # (より正確には、has_more と next_cursor を使ったページネーションが必要)
-        response = notion_client.databases.query(
-            database_id=db_id,
-            page_size=100,  # 投稿待ちの総数を把握するため、ある程度の数を取得
-            filter={
-                "and": [
-                    {"property": "ステータス", "select": {"equals": "投稿待ち"}},
-                    {"property": "動画", "files": {"is_not_empty": True}},
-                    {
-                        "property": "回答（編集済み）",
-                        "rich_text": {"is_not_empty": True},
-                    },
-                ]
-            },
-        )
+        with tracing.span("notion.query", filter="投稿待ち") as sp:
+            response = notion_client.databases.query(
+                database_id=db_id,
+                page_size=100,  # 投稿待ちの総数を把握するため、ある程度の数を取得
+                filter={
+                    "and": [
+                        {"property": "ステータス", "select": {"equals": "投稿待ち"}},
+                        {"property": "動画", "files": {"is_not_empty": True}},
+                        {
+                            "property": "回答（編集済み）",
+                            "rich_text": {"is_not_empty": True},
+                        },
+                    ]
+                },
+            )
+            sp.set(results=len(response.get("results", [])))
         return len(response.get("results", []))
     except Exception as e:
         print(f"❌ 投稿待ちの件数取得に失敗: {e}")
         return 0  # エラー時は0件として扱う
 
 
+@tracing.traced("promote.promote_all")
 def promote_all_used_to_pending(notion_client, db_id):
     """
     指定されたNotionデータベース内の「使用済み」ステータスで条件を満たす全ての投稿を
@@ -74,6 +84,8 @@ def promote_all_used_to_pending(notion_client, db_id):
     Args:
         notion_client (notion_client.Client): Notion APIクライアント。
         db_id (str): 対象のNotionデータベースID。
+    Returns:
+        int: 「投稿待ち」に変更した件数。
     """
     promoted_count = 0
     has_more = True
@@ -82,36 +94,38 @@ def promote_all_used_to_pending(notion_client, db_id):
     print("🔍 「使用済み」で条件を満たす投稿を検索中...")
     while has_more:
         try:
-            response = notion_client.databases.query(
-                database_id=db_id,
-                page_size=100,  # APIの最大値
-                start_cursor=start_cursor,
-                filter={
-                    "and": [
-                        {"property": "ステータス", "select": {"equals": "使用済み"}},
-                        {"property": "動画", "files": {"is_not_empty": True}},
-                        {
-                            "property": "回答（編集済み）",
-                            "rich_text": {"is_not_empty": True},
-                        },
-                    ]
-                },
-            )
+            with tracing.span("notion.query", filter="使用済み"):
+                response = notion_client.databases.query(
+                    database_id=db_id,
+                    page_size=100,  # APIの最大値
+                    start_cursor=start_cursor,
+                    filter={
+                        "and": [
+                            {"property": "ステータス", "select": {"equals": "使用済み"}},
+                            {"property": "動画", "files": {"is_not_empty": True}},
+                            {
+                                "property": "回答（編集済み）",
+                                "rich_text": {"is_not_empty": True},
+                            },
+                        ]
+                    },
+                )
         except Exception as e:
             print(f"❌ 使用済み投稿の取得中にエラーが発生しました: {e}")
-            return  # エラーが発生したら処理を中断
+            return promoted_count  # エラーが発生したら処理を中断
 
         results = response.get("results", [])
         if not results and start_cursor is None:  # 最初のクエリで結果がなければ終了
             print("⚠️ 「使用済み」に移行対象の投稿は見つかりませんでした。")
-            return
+            return promoted_count
 
         for page in results:
             try:
-                notion_client.pages.update(
-                    page_id=page["id"],
-                    properties={"ステータス": {"select": {"name": "投稿待ち"}}},
-                )
+                with tracing.span("notion.update", page_id=page["id"]):
+                    notion_client.pages.update(
+                        page_id=page["id"],
+                        properties={"ステータス": {"select": {"name": "投稿待ち"}}},
+                    )
                 print(
                     f"✅ ステータス変更成功: ページID {page['id']} を「投稿待ち」にしました。"
                 )
@@ -130,6 +144,28 @@ def promote_all_used_to_pending(notion_client, db_id):
         pass  # 上記の「見つかりませんでした」メッセージで対応済み
     else:  # ループはしたが、対象がなかった場合（通常は起こりにくい）
         print("ℹ️ 移行対象の「使用済み」投稿はありませんでした（ループ後確認）。")
+    return promoted_count
+
+
+def promote_if_needed(notion_client, db_id, threshold=MINIMUM_PENDING_THRESHOLD):
+    """
+    「投稿待ち」が threshold 件未満なら、「使用済み」の投稿を「投稿待ち」に戻す。
+    Args:
+        notion_client (notion_client.Client): Notion APIクライアント。
+        db_id (str): 対象のNotionデータベースID。
+        threshold (int, optional): 移行を行う「投稿待ち」件数の下限。
+    Returns:
+        tuple: (移行前の投稿待ち件数, 「投稿待ち」に変更した件数)
+    """
+    current_pending_count = count_pending_posts(notion_client, db_id)
+    tracing.current_span().set(pending=current_pending_count)
+    print(f"ℹ️ 現在の「投稿待ち」件数: {current_pending_count}")
+
+    if current_pending_count >= threshold:
+        print(f"✅ 「投稿待ち」の件数が {threshold} 件以上あります。移行処理はスキップします。")
+        return current_pending_count, 0
+    print(f"⚠️ 「投稿待ち」の件数が {threshold} 未満です。移行処理を開始します...")
+    return current_pending_count, promote_all_used_to_pending(notion_client, db_id)
 
 
 if __name__ == "__main__":
@@ -147,7 +183,14 @@ if __name__ == "__main__":
         default="question",
         help="処理対象のNotionデータベースのモード（'question' または 'joboffer'）。省略時は 'question'。",
     )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="この実行をプロファイルし、logs/profiles/ に保存する（profiling.py）。",
+    )
     args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
 
     print(f"🚀 スクリプト開始: アカウント='{args.account}', モード='{args.mode}'")
 
@@ -170,19 +213,8 @@ if __name__ == "__main__":
         exit(1)
 
     notion_api_client = Client(auth=NOTION_API_TOKEN)
+    metrics.install()
 
-    current_pending_count = count_pending_posts(notion_api_client, TARGET_DATABASE_ID)
-    print(f"ℹ️ 現在の「投稿待ち」件数: {current_pending_count}")
-
-    MINIMUM_PENDING_THRESHOLD = 1  # 投稿待ちがこの件数未満なら移行を実行
-    if current_pending_count < MINIMUM_PENDING_THRESHOLD:
-        print(
-            f"⚠️ 「投稿待ち」の件数が {MINIMUM_PENDING_THRESHOLD} 未満です。移行処理を開始します..."
-        )
-        promote_all_used_to_pending(notion_api_client, TARGET_DATABASE_ID)
-    else:
-        print(
-            f"✅ 「投稿待ち」の件数が {MINIMUM_PENDING_THRESHOLD} 件以上あります。移行処理はスキップします。"
-        )
-
-    print("🏁 スクリプト処理終了。")
+    with profiling.profile_run("promote"), tracing.span("promote.run", account=args.account, mode=args.mode):
+        promote_if_needed(notion_api_client, TARGET_DATABASE_ID)
+        print("🏁 スクリプト処理終了。")
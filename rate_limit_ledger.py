@@ -0,0 +1,247 @@
+"""
+Twitter API のレート制限を記録する台帳。
+
+tweepy が送受信する全レスポンスのヘッダー（x-rate-limit-*、x-app-limit-24hour-*、
+x-user-limit-24hour-*）を読み取り、アカウント・エンドポイントごとに残り回数と
+リセット時刻を .cache/rate_limits.sqlite3 に保存する（他の台帳と同じく WAL モードの SQLite で、
+レスポンスごとに変わった枠の行だけを更新する）。スケジューラーは投稿前に
+blocked_until() を確認し、上限に達している場合はリセット時刻まで投稿を見送る。
+"""
+
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_LEDGER_PATH = os.path.join(SCRIPT_DIR, ".cache", "rate_limits.sqlite3")
+
+# アプリ全体（全アカウント共通）の枠を記録するキー
+APP_ACCOUNT = "__app__"
+# 429 にリセット時刻が付いていない場合の待機時間（秒）
+DEFAULT_PENALTY_SECS = 15 * 60
+
+# 投稿時に確認するエンドポイント
+POST_ENDPOINTS = ("POST /2/tweets", "POST /1.1/media/upload.json")
+
+_OAUTH_TOKEN_RE = re.compile(r'oauth_token="([^"]+)"')
+_ID_SEGMENT_RE = re.compile(r"/\d+(?=/|$)")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limits (
+    account TEXT NOT NULL,
+    name TEXT NOT NULL,
+    limit_count INTEGER NOT NULL,
+    remaining INTEGER NOT NULL,
+    reset INTEGER NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (account, name)
+)
+"""
+
+
+def account_key(account_config, default="default"):
+    """
+    台帳に記録・照会するときのアカウントキーを返す。
+    レート制限は X のアカウント単位なので、設定ごとに付けた名前（accounts.json のキー、
+    Sheets 設定の account_id）ではなく X のユーザー名を使い、どの経路からも同じキーになるようにする。
+    Args:
+        account_config (dict): "username" を含むアカウント設定。
+        default (str, optional): ユーザー名がない場合に使う名前。
+    Returns:
+        str: 先頭の @ を除いて小文字にしたユーザー名。
+    """
+    username = str((account_config or {}).get("username") or "").strip().lstrip("@").lower()
+    return username or default
+
+
+def normalize_endpoint(method, url):
+    """
+    "POST /2/tweets" のようなエンドポイントキーを作る。数値IDは :id に置き換える。
+    Args:
+        method (str): HTTPメソッド。
+        url (str): リクエストURL。
+    Returns:
+        str: エンドポイントキー。
+    """
+    path = _ID_SEGMENT_RE.sub("/:id", urlparse(url).path)
+    return f"{method.upper()} {path}"
+
+
+def _parse_window(headers, prefix):
+    remaining = headers.get(f"{prefix}-remaining")
+    reset = headers.get(f"{prefix}-reset")
+    if remaining is None or reset is None:
+        return None
+    try:
+        return {
+            "limit": int(headers.get(f"{prefix}-limit", 0) or 0),
+            "remaining": int(remaining),
+            "reset": int(reset),
+            "updated": time.time(),
+        }
+    except ValueError:
+        return None
+
+
+class RateLimitLedger:
+    """アカウント・エンドポイント単位のレート制限状況を保持する。"""
+
+    def __init__(self, path=DEFAULT_LEDGER_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute(_SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def record(self, account, endpoint, headers, status_code=None):
+        """
+        レスポンスヘッダーからレート制限情報を記録する。
+        Args:
+            account (str): アカウント名。
+            endpoint (str): normalize_endpoint() で作ったキー。
+            headers (Mapping): レスポンスヘッダー（大文字小文字を区別しないもの）。
+            status_code (int, optional): HTTPステータス。429なら残り0として扱う。
+        """
+        windows = {}
+        endpoint_window = _parse_window(headers, "x-rate-limit")
+        user_window = _parse_window(headers, "x-user-limit-24hour")
+        app_window = _parse_window(headers, "x-app-limit-24hour")
+        if endpoint_window:
+            windows[(account, endpoint)] = endpoint_window
+        if user_window:
+            windows[(account, "user_24hour")] = user_window
+        if app_window:
+            windows[(APP_ACCOUNT, "app_24hour")] = app_window
+        if status_code == 429 and not (endpoint_window or user_window or app_window):
+            now = time.time()
+            windows[(account, endpoint)] = {
+                "limit": 0,
+                "remaining": 0,
+                "reset": int(now + DEFAULT_PENALTY_SECS),
+                "updated": now,
+            }
+        elif status_code == 429 and endpoint_window:
+            endpoint_window["remaining"] = 0
+        if not windows:
+            return
+        try:
+            with self._transaction() as conn:
+                # 他プロセスがより新しい値を書いていれば残す
+                conn.executemany(
+                    "INSERT INTO rate_limits (account, name, limit_count, remaining, reset, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(account, name) DO UPDATE SET limit_count = excluded.limit_count, "
+                    "remaining = excluded.remaining, reset = excluded.reset, updated = excluded.updated "
+                    "WHERE excluded.updated >= rate_limits.updated",
+                    [
+                        (owner, name, w["limit"], w["remaining"], w["reset"], w["updated"])
+                        for (owner, name), w in windows.items()
+                    ],
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"レート制限台帳の保存に失敗しました ({self.path}): {e}")
+
+    def blocked_until(self, account, endpoints=POST_ENDPOINTS, now=None):
+        """
+        指定アカウントのエンドポイントが上限に達していれば、リセット時刻を返す。
+        Args:
+            account (str): アカウント名。
+            endpoints (Iterable[str], optional): 確認するエンドポイント。
+            now (float, optional): 現在時刻（エポック秒）。
+        Returns:
+            float or None: 投稿を再開できる時刻（エポック秒）。制限がなければNone。
+        """
+        now = now or time.time()
+        names = [(account, e) for e in endpoints]
+        names += [(account, "user_24hour"), (APP_ACCOUNT, "app_24hour")]
+        condition = " OR ".join(["(account = ? AND name = ?)"] * len(names))
+        row = self._connection().execute(
+            f"SELECT MAX(reset) AS reset FROM rate_limits WHERE remaining <= 0 AND reset > ? AND ({condition})",
+            [now] + [value for pair in names for value in pair],
+        ).fetchone()
+        return row["reset"] if row and row["reset"] is not None else None
+
+    def snapshot(self, account=None):
+        """現在の記録内容を返す（表示・デバッグ用）。"""
+        query = "SELECT * FROM rate_limits"
+        params = ()
+        if account is not None:
+            query += " WHERE account = ?"
+            params = (account,)
+        entries = {}
+        for row in self._connection().execute(query, params):
+            entries.setdefault(row["account"], {})[row["name"]] = {
+                "limit": row["limit_count"],
+                "remaining": row["remaining"],
+                "reset": row["reset"],
+                "updated": row["updated"],
+            }
+        return entries if account is None else entries.get(account, {})
+
+    def make_response_hook(self, resolve_account):
+        """
+        requests.Session の response フックを作る。
+        Args:
+            resolve_account (callable): アクセストークンからアカウント名を返す関数。
+        Returns:
+            callable: session.hooks["response"] に登録する関数。
+        """
+
+        def hook(response, *args, **kwargs):
+            try:
+                request = response.request
+                authorization = request.headers.get("Authorization", "")
+                match = _OAUTH_TOKEN_RE.search(authorization)
+                account = (resolve_account(match.group(1)) if match else None) or APP_ACCOUNT
+                self.record(
+                    account,
+                    normalize_endpoint(request.method, request.url),
+                    response.headers,
+                    response.status_code,
+                )
+            except Exception as e:
+                logger.debug(f"レート制限ヘッダーの記録に失敗: {e}")
+            return response
+
+        return hook
+
+
+_default_ledger = None
+_default_ledger_lock = threading.Lock()
+
+
+def get_rate_limit_ledger():
+    """プロセス内で共有するデフォルトの台帳を返す。"""
+    global _default_ledger
+    with _default_ledger_lock:
+        if _default_ledger is None:
+            _default_ledger = RateLimitLedger()
+        return _default_ledger
@@ -0,0 +1,350 @@
+"""
+失敗した投稿ジョブを再試行するための永続キュー。
+
+投稿に失敗したジョブ（アカウント＋Notionページ／シート行）を失敗の種類ごとに分類し、
+種類ごとの指数バックオフ（ジッター付き）で次の再試行時刻を決めて .cache/retry_queue.sqlite3 に保存する。
+再試行の上限に達したジョブはデッドレターとして残し、手動で確認・再投入する。
+
+失敗の種類:
+    login       ログイン画面・認証の失敗
+    upload      動画のダウンロード・アップロードの失敗
+    selector    投稿画面の要素が見つからない・操作できない（UI変更など）
+    rate_limit  レート制限（台帳にリセット時刻があればそれまで待つ）
+    network     接続エラー・タイムアウト
+
+投稿処理は、期限が来た再試行ジョブを新しいネタより優先して処理し、
+待機中・デッドレターのジョブは新しいネタの選択から外す。
+
+    python3 retry_queue.py list [--account 名前]      # 待機中のジョブ
+    python3 retry_queue.py dead [--account 名前]      # デッドレター
+    python3 retry_queue.py requeue <アカウント名> <ID>  # デッドレターを再投入
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import random
+import sqlite3
+import logging
+import argparse
+import datetime
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from rate_limit_ledger import get_rate_limit_ledger
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_QUEUE_PATH = os.path.join(SCRIPT_DIR, ".cache", "retry_queue.sqlite3")
+
+STATUS_PENDING = "pending"
+STATUS_DEAD = "dead"
+
+FAILURE_LOGIN = "login"
+FAILURE_UPLOAD = "upload"
+FAILURE_SELECTOR = "selector"
+FAILURE_RATE_LIMIT = "rate_limit"
+FAILURE_NETWORK = "network"
+
+# base_secs * 2^(試行回数-1) を max_secs で頭打ちにし、その半分〜全体の範囲でジッターをかける
+RetryPolicy = namedtuple("RetryPolicy", ["base_secs", "max_secs", "max_attempts"])
+
+RETRY_POLICIES = {
+    FAILURE_LOGIN: RetryPolicy(10 * 60, 2 * 60 * 60, 4),
+    FAILURE_UPLOAD: RetryPolicy(2 * 60, 30 * 60, 5),
+    FAILURE_SELECTOR: RetryPolicy(5 * 60, 60 * 60, 3),
+    FAILURE_RATE_LIMIT: RetryPolicy(15 * 60, 3 * 60 * 60, 6),
+    FAILURE_NETWORK: RetryPolicy(60, 20 * 60, 6),
+}
+
+# 例外から分類できない場合に、失敗した処理段階から決める
+_PHASE_FAILURES = {
+    "login": FAILURE_LOGIN,
+    "upload": FAILURE_UPLOAD,
+    "post": FAILURE_SELECTOR,
+    "reply": FAILURE_SELECTOR,
+    "fetch": FAILURE_NETWORK,
+    "api": FAILURE_NETWORK,
+}
+
+_NETWORK_MODULES = ("requests", "urllib3", "http", "httpx", "notion_client")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS retry_jobs (
+    account TEXT NOT NULL,
+    source_id TEXT NOT NULL,
+    mode TEXT,
+    status TEXT NOT NULL,
+    failure_class TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (account, source_id)
+)
+"""
+
+
+def classify_failure(phase, error=None, account=None):
+    """
+    失敗の種類を決める。
+    Args:
+        phase (str): 失敗した処理段階（"login" / "upload" / "post" / "reply" / "fetch" / "api"）。
+        error (Exception or str, optional): 発生した例外、またはエラーメッセージ。
+        account (str, optional): レート制限台帳のキー（rate_limit_ledger.account_key()）。
+    Returns:
+        str: 失敗の種類（FAILURE_*）。
+    """
+    if account and get_rate_limit_ledger().blocked_until(account):
+        return FAILURE_RATE_LIMIT
+    if isinstance(error, BaseException):
+        names = [cls.__name__ for cls in type(error).__mro__]
+        modules = [cls.__module__.split(".")[0] for cls in type(error).__mro__]
+        if "TooManyRequests" in names:
+            return FAILURE_RATE_LIMIT
+        if "selenium" not in modules and (
+            isinstance(error, (ConnectionError, TimeoutError, socket.timeout, socket.gaierror))
+            or any(m in _NETWORK_MODULES for m in modules)
+        ):
+            return FAILURE_NETWORK
+    text = str(error or "").lower()
+    if "429" in text or "rate limit" in text or "too many requests" in text:
+        return FAILURE_RATE_LIMIT
+    return _PHASE_FAILURES.get(phase, FAILURE_SELECTOR)
+
+
+def backoff_secs(failure_class, attempts, rng=random):
+    """
+    次の再試行までの待ち時間（秒）を返す。
+    Args:
+        failure_class (str): 失敗の種類。
+        attempts (int): これまでの失敗回数（1以上）。
+        rng (random.Random, optional): 乱数生成器。
+    Returns:
+        float: 待ち時間（秒）。
+    """
+    policy = RETRY_POLICIES.get(failure_class, RETRY_POLICIES[FAILURE_SELECTOR])
+    delay = min(policy.max_secs, policy.base_secs * (2 ** max(0, attempts - 1)))
+    return delay / 2 + rng.uniform(0, delay / 2)
+
+
+class RetryQueue:
+    """再試行待ちのジョブを SQLite に保持する。"""
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute(_SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def record_failure(self, account, source_id, failure_class, error=None, mode=None, now=None,
+                       rate_limit_account=None):
+        """
+        失敗を記録し、次の再試行時刻を決める。上限に達した場合はデッドレターにする。
+        Args:
+            account (str): アカウント名。
+            source_id (str): 投稿元のID（NotionページID、シートの行ID）。
+            failure_class (str): 失敗の種類（classify_failure() の戻り値）。
+            error (str, optional): エラー内容。
+            mode (str, optional): 投稿モード（再試行時に同じDBを使うため）。
+            now (float, optional): 現在時刻（UNIX時間）。
+            rate_limit_account (str, optional): レート制限台帳のキー（rate_limit_ledger.account_key()）。
+                省略時は account。
+        Returns:
+            dict: 更新後のジョブ。status が "dead" ならデッドレター。
+        """
+        now = time.time() if now is None else now
+        key = (account, str(source_id))
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT attempts FROM retry_jobs WHERE account = ? AND source_id = ?", key
+            ).fetchone()
+            attempts = (row["attempts"] if row else 0) + 1
+            policy = RETRY_POLICIES.get(failure_class, RETRY_POLICIES[FAILURE_SELECTOR])
+            status = STATUS_DEAD if attempts >= policy.max_attempts else STATUS_PENDING
+            next_attempt_at = now + backoff_secs(failure_class, attempts)
+            if failure_class == FAILURE_RATE_LIMIT:
+                # リセット時刻が分かっていればそれより前には再試行しない
+                blocked_until = get_rate_limit_ledger().blocked_until(rate_limit_account or account)
+                next_attempt_at = max(next_attempt_at, blocked_until or 0)
+            conn.execute(
+                "INSERT INTO retry_jobs (account, source_id, mode, status, failure_class, attempts, "
+                "next_attempt_at, last_error, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(account, source_id) DO UPDATE SET mode = COALESCE(excluded.mode, mode), "
+                "status = excluded.status, failure_class = excluded.failure_class, attempts = excluded.attempts, "
+                "next_attempt_at = excluded.next_attempt_at, last_error = excluded.last_error, "
+                "updated_at = excluded.updated_at",
+                key + (mode, status, failure_class, attempts, next_attempt_at,
+                       str(error or "")[:500], now, now),
+            )
+            row = conn.execute(
+                "SELECT * FROM retry_jobs WHERE account = ? AND source_id = ?", key
+            ).fetchone()
+        return dict(row)
+
+    def record_success(self, account, source_id):
+        """投稿できた（または不要になった）ジョブをキューから外す。"""
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM retry_jobs WHERE account = ? AND source_id = ?", (account, str(source_id))
+            )
+
+    def due(self, account, mode=None, now=None):
+        """
+        再試行の時刻が来たジョブを古い順に返す。
+        Args:
+            account (str): アカウント名。
+            mode (str, optional): 指定した場合はそのモードのジョブのみ。
+            now (float, optional): 現在時刻（UNIX時間）。
+        Returns:
+            list: ジョブのリスト。
+        """
+        now = time.time() if now is None else now
+        query = "SELECT * FROM retry_jobs WHERE account = ? AND status = ? AND next_attempt_at <= ?"
+        params = [account, STATUS_PENDING, now]
+        if mode:
+            query += " AND (mode = ? OR mode IS NULL)"
+            params.append(mode)
+        rows = self._connection().execute(query + " ORDER BY next_attempt_at", params)
+        return [dict(row) for row in rows]
+
+    def next_pending(self, account):
+        """
+        次に再試行するジョブ（時刻が来ていないものを含む）を返す。
+        Returns:
+            dict or None: ジョブ。なければNone。
+        """
+        row = self._connection().execute(
+            "SELECT * FROM retry_jobs WHERE account = ? AND status = ? ORDER BY next_attempt_at LIMIT 1",
+            (account, STATUS_PENDING),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def held_ids(self, account, now=None):
+        """
+        新しいネタの選択から外すIDの集合を返す（再試行待ち・デッドレター）。
+        Args:
+            account (str): アカウント名。
+            now (float, optional): 現在時刻（UNIX時間）。
+        Returns:
+            set: 投稿元IDの集合。
+        """
+        now = time.time() if now is None else now
+        rows = self._connection().execute(
+            "SELECT source_id FROM retry_jobs WHERE account = ? AND (status = ? OR next_attempt_at > ?)",
+            (account, STATUS_DEAD, now),
+        )
+        return {row["source_id"] for row in rows}
+
+    def dead_letters(self, account=None):
+        """デッドレターのジョブを返す。"""
+        return self._list(STATUS_DEAD, account)
+
+    def pending(self, account=None):
+        """再試行待ちのジョブを返す。"""
+        return self._list(STATUS_PENDING, account)
+
+    def _list(self, status, account):
+        query = "SELECT * FROM retry_jobs WHERE status = ?"
+        params = [status]
+        if account:
+            query += " AND account = ?"
+            params.append(account)
+        return [dict(row) for row in self._connection().execute(query + " ORDER BY next_attempt_at", params)]
+
+    def requeue(self, account, source_id):
+        """
+        デッドレターのジョブを試行回数0からやり直す。
+        Returns:
+            bool: 対象のジョブがあった場合はTrue。
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE retry_jobs SET status = ?, attempts = 0, next_attempt_at = ?, updated_at = ? "
+                "WHERE account = ? AND source_id = ?",
+                (STATUS_PENDING, time.time(), time.time(), account, str(source_id)),
+            )
+        return cursor.rowcount > 0
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_retry_queue():
+    """プロセス内で共有するデフォルトのキューを返す。"""
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = RetryQueue()
+        return _default_queue
+
+
+def _format_job(job):
+    next_at = datetime.datetime.fromtimestamp(job["next_attempt_at"]).strftime("%m/%d %H:%M:%S")
+    return (
+        f"[{job['account']}] {job['source_id']} ({job['mode'] or '-'}) "
+        f"{job['failure_class']} ×{job['attempts']} 次回 {next_at}: {job['last_error']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="投稿の再試行キュー")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("list", "再試行待ちのジョブを表示する"), ("dead", "デッドレターを表示する")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("--account")
+        sub.add_argument("--json", action="store_true", help="JSONで出力する")
+    requeue_parser = subparsers.add_parser("requeue", help="デッドレターを再投入する")
+    requeue_parser.add_argument("account")
+    requeue_parser.add_argument("source_id")
+    args = parser.parse_args()
+
+    queue = get_retry_queue()
+    if args.command == "requeue":
+        if not queue.requeue(args.account, args.source_id):
+            print(f"❌ [{args.account}] {args.source_id} はキューにありません。")
+            return 1
+        print(f"🔁 [{args.account}] {args.source_id} を再投入しました。")
+        return 0
+
+    jobs = queue.pending(args.account) if args.command == "list" else queue.dead_letters(args.account)
+    if args.json:
+        print(json.dumps(jobs, ensure_ascii=False, indent=2))
+        return 0
+    if not jobs:
+        print("✅ 該当するジョブはありません。")
+    for job in jobs:
+        print(_format_job(job))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,459 @@
+"""
+OpenAI による投稿文リライトを、投稿時ではなく事前に行うためのモジュール。
+
+リライト結果は (本文, スタイルプロンプト, モデル) のハッシュをキーにして
+.cache/rewrites.sqlite3 に保存する。投稿時は lookup() でキャッシュを引くだけなので
+OpenAI の呼び出しによる待ち時間は発生せず、同じ本文を二重に課金することもない。
+
+事前リライト（prefetch）は並列数と1件あたりのタイムアウト、全体の時間予算を指定して行い、
+予算を超えた分や失敗した分はキャッシュせず元の本文のまま扱う（次回の prefetch で再試行される）。
+
+使用例:
+    python3 rewrite_stage.py prefetch --account アカウント名1 --mode question
+    python3 rewrite_stage.py stats
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import tracing
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_PATH = os.path.join(SCRIPT_DIR, ".cache", "rewrites.sqlite3")
+DEFAULT_MODEL = os.getenv("OPENAI_REWRITE_MODEL", "gpt-4o-mini")
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_REQUEST_TIMEOUT = 30
+DEFAULT_BUDGET_SECS = 300
+
+STYLE_PROMPT_FILES = {
+    "question": "style_prompts_questions.json",
+    "joboffer": "style_prompts_joboffers.json",
+}
+# style_prompts_*.json がない場合に使う指示
+FALLBACK_STYLE_PROMPT = (
+    "以下のテキストを、意味を変えずに読みやすいTwitter投稿文に整えてください。"
+    "書き換えた本文のみを出力してください。"
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rewrites (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    style_sha TEXT NOT NULL,
+    content_sha TEXT NOT NULL,
+    rewritten TEXT NOT NULL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    source TEXT NOT NULL,
+    created_at REAL NOT NULL
+)
+"""
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def rewrite_key(content, style_prompt, model):
+    """
+    リライト結果のキャッシュキーを作る。
+    Args:
+        content (str): 元の本文。
+        style_prompt (str): スタイルプロンプト。
+        model (str): モデル名。
+    Returns:
+        str: (本文, スタイルプロンプト, モデル) の SHA-256。
+    """
+    payload = json.dumps(
+        [content.strip(), style_prompt, model], ensure_ascii=False, separators=(",", ":")
+    )
+    return _sha256(payload)
+
+
+def load_style_prompt(account="default", mode="question", base_dir=SCRIPT_DIR):
+    """
+    モードに対応する style_prompts_*.json から、アカウントのスタイルプロンプトを読み込む。
+    ファイルやアカウントの定義がない場合は default、それもなければ汎用の指示を返す。
+    Args:
+        account (str, optional): アカウント名。
+        mode (str, optional): "question" または "joboffer"。
+        base_dir (str, optional): style_prompts_*.json を置いているディレクトリ。
+    Returns:
+        str: スタイルプロンプト。
+    """
+    path = os.path.join(base_dir, STYLE_PROMPT_FILES.get(mode, STYLE_PROMPT_FILES["question"]))
+    if not os.path.exists(path):
+        return FALLBACK_STYLE_PROMPT
+    with open(path, "r", encoding="utf-8") as f:
+        styles = json.load(f)
+    if account in styles:
+        return styles[account]
+    if "default" in styles:
+        logger.info(f"⚠️ アカウント '{account}' 用のスタイルが見つかりません。defaultを使用します。")
+        return styles["default"]
+    return FALLBACK_STYLE_PROMPT
+
+
+def build_messages(content, style_prompt):
+    """Chat Completions に渡すメッセージを作る（バッチ投入でも同じものを使う）。"""
+    return [
+        {"role": "system", "content": style_prompt},
+        {"role": "user", "content": content.strip()},
+    ]
+
+
+def rewrite_with_gpt(client, content, style_prompt, model=DEFAULT_MODEL, timeout=DEFAULT_REQUEST_TIMEOUT):
+    """
+    OpenAI で本文を1件リライトする。
+    Args:
+        client (openai.OpenAI): OpenAI クライアント。
+        content (str): 元の本文。
+        style_prompt (str): スタイルプロンプト。
+        model (str, optional): モデル名。
+        timeout (float, optional): リクエストのタイムアウト（秒）。
+    Returns:
+        tuple: (リライト後の本文, usage)。usage は prompt_tokens / completion_tokens を持つ dict。
+    """
+    with tracing.span("openai.chat", model=model):
+        response = client.chat.completions.create(
+            model=model,
+            messages=build_messages(content, style_prompt),
+            timeout=timeout,
+        )
+    rewritten = (response.choices[0].message.content or "").strip()
+    usage = getattr(response, "usage", None)
+    return rewritten, {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+    }
+
+
+class RewriteCache:
+    """リライト結果を保存する SQLite のキャッシュ。"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def get(self, key):
+        """
+        キャッシュ済みのリライト結果を返す。
+        Returns:
+            str or None: リライト後の本文。未登録ならNone。
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT rewritten FROM rewrites WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def contains(self, keys):
+        """指定したキーのうち、キャッシュ済みのものの集合を返す。"""
+        keys = list(keys)
+        found = set()
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i : i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key FROM rewrites WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+
+    def put(self, content, style_prompt, model, rewritten, usage=None, source="sync"):
+        """
+        リライト結果を保存する。
+        Args:
+            content (str): 元の本文。
+            style_prompt (str): スタイルプロンプト。
+            model (str): モデル名。
+            rewritten (str): リライト後の本文。
+            usage (dict, optional): prompt_tokens / completion_tokens。
+            source (str, optional): 取得方法（"sync" / "batch" など）。
+        Returns:
+            str: 保存したキー。
+        """
+        usage = usage or {}
+        key = rewrite_key(content, style_prompt, model)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO rewrites VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    model,
+                    _sha256(style_prompt),
+                    _sha256(content.strip()),
+                    rewritten,
+                    usage.get("prompt_tokens"),
+                    usage.get("completion_tokens"),
+                    source,
+                    time.time(),
+                ),
+            )
+            self._conn.commit()
+        return key
+
+    def stats(self):
+        """モデル・取得方法ごとの件数とトークン数を返す。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT model, source, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens) "
+                "FROM rewrites GROUP BY model, source ORDER BY model, source"
+            ).fetchall()
+        return [
+            {
+                "model": model,
+                "source": source,
+                "count": count,
+                "prompt_tokens": prompt_tokens or 0,
+                "completion_tokens": completion_tokens or 0,
+            }
+            for model, source, count, prompt_tokens, completion_tokens in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RewriteStage:
+    """
+    キャッシュを使ったリライト処理。
+
+    - lookup(): キャッシュを引くだけ。未登録なら元の本文を返す（投稿時に使う）。
+    - prefetch(): 未登録の本文だけを並列でリライトしてキャッシュに保存する。
+    """
+
+    def __init__(self, client=None, cache=None, model=DEFAULT_MODEL,
+                 max_workers=DEFAULT_MAX_WORKERS, request_timeout=DEFAULT_REQUEST_TIMEOUT):
+        self.client = client
+        self.cache = cache or RewriteCache()
+        self.model = model
+        self.max_workers = max_workers
+        self.request_timeout = request_timeout
+
+    def lookup(self, content, style_prompt):
+        """
+        キャッシュ済みのリライト結果を返す。OpenAI は呼ばない。
+        Args:
+            content (str): 元の本文。
+            style_prompt (str): スタイルプロンプト。
+        Returns:
+            tuple: (投稿に使う本文, キャッシュにあったか)。
+        """
+        rewritten = self.cache.get(rewrite_key(content, style_prompt, self.model))
+        if rewritten:
+            return rewritten, True
+        return content, False
+
+    def prefetch(self, items, budget_secs=DEFAULT_BUDGET_SECS, max_calls=None):
+        """
+        未登録の本文をまとめてリライトし、キャッシュに保存する。
+        Args:
+            items (Iterable[tuple]): (本文, スタイルプロンプト) のリスト。
+            budget_secs (float, optional): 全体の時間予算（秒）。超えた分は諦める。
+            max_calls (int, optional): OpenAI を呼ぶ最大件数。
+        Returns:
+            dict: cached（既存）/ rewritten（新規）/ failed / skipped（予算超過）の件数と所要時間。
+        """
+        if self.client is None:
+            raise ValueError("prefetch には OpenAI クライアントが必要です")
+        started = time.monotonic()
+        deadline = started + budget_secs
+
+        unique = {}
+        for content, style_prompt in items:
+            if content and content.strip():
+                unique.setdefault(rewrite_key(content, style_prompt, self.model), (content, style_prompt))
+        cached = self.cache.contains(unique.keys())
+        pending = [item for key, item in unique.items() if key not in cached]
+        skipped = 0
+        if max_calls is not None and len(pending) > max_calls:
+            skipped = len(pending) - max_calls
+            pending = pending[:max_calls]
+        result = {"cached": len(cached), "rewritten": 0, "failed": 0, "skipped": skipped}
+        logger.info(
+            f"📝 リライト対象: {len(unique)} 件（キャッシュ済み {len(cached)} 件、新規 {len(pending)} 件）"
+        )
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        queue = list(pending)
+        running = {}
+        try:
+            while queue or running:
+                # 残り時間があるうちだけ新しいリクエストを出す
+                while queue and len(running) < self.max_workers and time.monotonic() < deadline:
+                    content, style_prompt = queue.pop(0)
+                    future = executor.submit(
+                        rewrite_with_gpt, self.client, content, style_prompt,
+                        self.model, self.request_timeout,
+                    )
+                    running[future] = (content, style_prompt)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not running:
+                    break
+                done, _ = wait(list(running), timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    content, style_prompt = running.pop(future)
+                    try:
+                        rewritten, usage = future.result()
+                    except Exception as e:
+                        result["failed"] += 1
+                        logger.warning(f"⚠️ リライトに失敗しました（元の本文を使用）: {e}")
+                        continue
+                    if not rewritten:
+                        result["failed"] += 1
+                        continue
+                    self.cache.put(content, style_prompt, self.model, rewritten, usage)
+                    result["rewritten"] += 1
+        finally:
+            # 予算切れで残ったリクエストは結果を待たない
+            result["skipped"] += len(queue) + len(running)
+            for future in running:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+        result["elapsed"] = time.monotonic() - started
+        if result["skipped"]:
+            logger.warning(
+                f"⏱️ 予算内に終わらなかった {result['skipped']} 件は元の本文のまま投稿されます。"
+            )
+        return result
+
+
+def fetch_pending_contents(notion, database_id):
+    """
+    Notion データベースから「投稿待ち」の本文をすべて取得する（ページネーション対応）。
+    Args:
+        notion (notion_client.Client): Notion クライアント。
+        database_id (str): データベースID。
+    Returns:
+        list: (page_id, 本文) のリスト。
+    """
+    contents = []
+    start_cursor = None
+    while True:
+        query = {
+            "database_id": database_id,
+            "page_size": 100,
+            "filter": {
+                "and": [
+                    {"property": "ステータス", "select": {"equals": "投稿待ち"}},
+                    {"property": "動画", "files": {"is_not_empty": True}},
+                    {"property": "回答（編集済み）", "rich_text": {"is_not_empty": True}},
+                ]
+            },
+        }
+        if start_cursor:
+            query["start_cursor"] = start_cursor
+        response = notion.databases.query(**query)
+        for page in response.get("results", []):
+            content = "".join(
+                block["text"]["content"]
+                for block in page["properties"]["回答（編集済み）"]["rich_text"]
+            )
+            contents.append((page["id"], content))
+        if not response.get("has_more"):
+            return contents
+        start_cursor = response.get("next_cursor")
+
+
+def _load_accounts(path=os.path.join(SCRIPT_DIR, "accounts.json")):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="投稿文リライトの事前実行とキャッシュ管理")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    prefetch_parser = subparsers.add_parser("prefetch", help="投稿待ちの本文を事前にリライトする")
+    prefetch_parser.add_argument("--account", action="append", help="対象アカウント（省略時は accounts.json の全アカウント）")
+    prefetch_parser.add_argument("--mode", choices=["question", "joboffer"], action="append", help="対象モード（省略時は両方）")
+    prefetch_parser.add_argument("--model", default=DEFAULT_MODEL)
+    prefetch_parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="同時リクエスト数")
+    prefetch_parser.add_argument("--timeout", type=float, default=DEFAULT_REQUEST_TIMEOUT, help="1件あたりのタイムアウト（秒）")
+    prefetch_parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECS, help="全体の時間予算（秒）")
+    prefetch_parser.add_argument("--max-calls", type=int, help="OpenAI を呼ぶ最大件数")
+
+    subparsers.add_parser("stats", help="キャッシュの件数とトークン数を表示する")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(message)s", datefmt="%H:%M:%S")
+
+    cache = RewriteCache()
+    if args.command == "stats":
+        for row in cache.stats():
+            print(
+                f"{row['model']:<20} {row['source']:<6} {row['count']:>6} 件 "
+                f"(prompt {row['prompt_tokens']} / completion {row['completion_tokens']} tokens)"
+            )
+        return 0
+
+    from dotenv import load_dotenv
+    from notion_client import Client
+    from openai import OpenAI
+
+    metrics.install()
+
+    load_dotenv()
+    if not os.getenv("OPENAI_API_KEY"):
+        print("❌ OPENAI_API_KEY が .env に定義されていません")
+        return 1
+
+    accounts = _load_accounts()
+    modes = args.mode or list(STYLE_PROMPT_FILES)
+    items = []
+    for account in args.account or list(accounts):
+        config = accounts.get(account)
+        if not config:
+            print(f"❌ アカウント '{account}' は accounts.json に存在しません。")
+            continue
+        notion = Client(auth=config["notion_token"])
+        for mode in modes:
+            database_id = config.get("database_ids", {}).get(mode)
+            if not database_id:
+                continue
+            style_prompt = load_style_prompt(account, mode)
+            try:
+                pending = fetch_pending_contents(notion, database_id)
+            except Exception as e:
+                print(f"❌ [{account}/{mode}] 投稿待ちの取得に失敗: {e}")
+                continue
+            print(f"📦 [{account}/{mode}] 投稿待ち {len(pending)} 件")
+            items.extend((content, style_prompt) for _, content in pending)
+
+    stage = RewriteStage(
+        client=OpenAI(api_key=os.getenv("OPENAI_API_KEY")),
+        cache=cache,
+        model=args.model,
+        max_workers=args.workers,
+        request_timeout=args.timeout,
+    )
+    result = stage.prefetch(items, budget_secs=args.budget, max_calls=args.max_calls)
+    print(
+        f"✅ リライト完了: 新規 {result['rewritten']} 件 / キャッシュ済み {result['cached']} 件 / "
+        f"失敗 {result['failed']} 件 / 予算超過 {result['skipped']} 件 ({result['elapsed']:.1f} 秒)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
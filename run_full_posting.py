@@ -2,6 +2,11 @@ import subprocess
 import argparse
 import os
 import sys
+from contextlib import ExitStack
+
+import tracing
+import profiling
+from state_store import get_state_store
 
 """
 このスクリプトは、Notionからの自動投稿処理全体を順次実行します。
@@ -28,61 +33,99 @@ parser.add_argument(
 parser.add_argument(
     "--mode",
     choices=["question", "joboffer"],
-    default="question",
-    help="投稿モード（'question' または 'joboffer'）。Notionデータベースの選択に使用。",
+    default=None,
+    help="投稿モード（'question' または 'joboffer'）。Notionデータベースの選択に使用。"
+    "省略時は実行中マーカーを取得してから状態ストアのローテーションで決める。",
+)
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="この実行と子プロセスをプロファイルし、logs/profiles/ に保存する（profiling.py）。",
 )
 args = parser.parse_args()
+if args.profile:
+    profiling.enable()
 
-# ==== promote_used_to_pending_minimum_batch.py 実行 ====
-print(
-    f"🚀 Step1: 「使用済み」から「投稿待ち」への移行処理を開始 (アカウント: {args.account}, モード: {args.mode})"
+# ==== 実行中マーカーの取得（同じアカウントの重複実行を防ぐ） ====
+state_store = get_state_store()
+job_token = state_store.acquire(args.account)
+if not job_token:
+    print(f"⏭️ アカウント {args.account} の投稿ジョブが実行中のため、今回はスキップします。")
+    state_store.record_run(args.account, args.mode, "skipped")
+    sys.exit(0)
+# ローテーションのカウンターはマーカーを取れた実行だけ進める（スキップした回でモードがずれないように）
+if args.mode is None:
+    args.mode = state_store.next_mode(args.account)
+
+run_result = "failure"
+# 実行全体のスパン。子プロセスには AUTO_POST_TRACE_PARENT で引き継ぐ
+trace_stack = ExitStack()
+trace_stack.enter_context(profiling.profile_run("run_full_posting"))
+run_span = trace_stack.enter_context(
+    tracing.span("run_full_posting.run", account=args.account, mode=args.mode)
 )
 try:
-    subprocess.run(
-        [
-            PYTHON_EXECUTABLE,
-            PROMOTE_SCRIPT_PATH,
-            "--account",
-            args.account,
-            "--mode",
-            args.mode,
-        ],
-        check=True,
-    )
-    print("✅ Step1: 移行処理 正常終了")
-except FileNotFoundError:
-    print(f"❌ Step1 エラー: スクリプト '{PROMOTE_SCRIPT_PATH}' が見つかりません。")
-    sys.exit(1)
-except subprocess.CalledProcessError as e:
+    # ==== promote_used_to_pending_minimum_batch.py 実行 ====
     print(
-        f"❌ Step1 エラー: 移行処理スクリプトがエラーコード {e.returncode} で終了しました。"
+        f"🚀 Step1: 「使用済み」から「投稿待ち」への移行処理を開始 (アカウント: {args.account}, モード: {args.mode})"
     )
-    # サブスクリプトからの出力は既にコンソールに表示されているはずです
-    sys.exit(1)
+    try:
+        with tracing.span("run_full_posting.promote"):
+            subprocess.run(
+                [
+                    PYTHON_EXECUTABLE,
+                    PROMOTE_SCRIPT_PATH,
+                    "--account",
+                    args.account,
+                    "--mode",
+                    args.mode,
+                ],
+                check=True,
+                env=tracing.child_env(),
+            )
+        print("✅ Step1: 移行処理 正常終了")
+    except FileNotFoundError:
+        print(f"❌ Step1 エラー: スクリプト '{PROMOTE_SCRIPT_PATH}' が見つかりません。")
+        sys.exit(1)
+    except subprocess.CalledProcessError as e:
+        print(
+            f"❌ Step1 エラー: 移行処理スクリプトがエラーコード {e.returncode} で終了しました。"
+        )
+        # サブスクリプトからの出力は既にコンソールに表示されているはずです
+        sys.exit(1)
 
+    # ==== post_tweet.py 実行 ====
+    print(f"🚀 Step2: 投稿処理を開始 (アカウント: {args.account}, モード: {args.mode})")
+    try:
+        with tracing.span("run_full_posting.post"):
+            subprocess.run(
+                [
+                    PYTHON_EXECUTABLE,
+                    POST_SCRIPT_PATH,
+                    "--account",
+                    args.account,
+                    "--mode",
+                    args.mode,
+                ],
+                check=True,
+                env=tracing.child_env(),
+            )
+        print("✅ Step2: 投稿処理 正常終了")
+    except FileNotFoundError:
+        print(f"❌ Step2 エラー: スクリプト '{POST_SCRIPT_PATH}' が見つかりません。")
+        sys.exit(1)
+    except subprocess.CalledProcessError as e:
+        print(
+            f"❌ Step2 エラー: 投稿処理スクリプトがエラーコード {e.returncode} で終了しました。"
+        )
+        sys.exit(1)
 
-# ==== post_tweet.py 実行 ====
-print(f"🚀 Step2: 投稿処理を開始 (アカウント: {args.account}, モード: {args.mode})")
-try:
-    subprocess.run(
-        [
-            PYTHON_EXECUTABLE,
-            POST_SCRIPT_PATH,
-            "--account",
-            args.account,
-            "--mode",
-            args.mode,
-        ],
-        check=True,
-    )
-    print("✅ Step2: 投稿処理 正常終了")
-except FileNotFoundError:
-    print(f"❌ Step2 エラー: スクリプト '{POST_SCRIPT_PATH}' が見つかりません。")
-    sys.exit(1)
-except subprocess.CalledProcessError as e:
-    print(
-        f"❌ Step2 エラー: 投稿処理スクリプトがエラーコード {e.returncode} で終了しました。"
-    )
-    sys.exit(1)
-
-print("🎉 全処理が正常に完了しました。")
+    print("🎉 全処理が正常に完了しました。")
+    run_result = "success"
+finally:
+    state_store.record_run(args.account, args.mode, run_result)
+    state_store.release(args.account, job_token)
+    run_span.set(result=run_result)
+    if run_result != "success":
+        run_span.fail()
+    trace_stack.close()
@@ -0,0 +1,476 @@
+"""
+投稿の実行履歴（処理段階ごとの所要時間）を SQLite に残し、パーセンタイルで集計する。
+
+1回の投稿を record_run() で囲むと、その中で閉じたトレーススパン（tracing.py）を集め、
+終了時に .cache/run_history.sqlite3 へ1件の実行として保存する。
+AUTO_POST_TRACE の設定に関係なく記録される（ファイルへのトレース出力は行わない）。
+
+    runs    アカウント・モード・ページ/行ID・結果・再試行回数・セレクタのフォールバック回数
+    phases  直下の子スパンごとの所要時間（同じ段階が複数回あれば合計）
+
+段階名はスパン名から実行スパンと同じ接頭辞を除いたもの（"post_tweet.login" → "login"）。
+別の接頭辞のスパンはそのまま（"notion.query" など）。実行全体の所要時間は "total" として集計する。
+
+    python3 run_history.py report [--since 7d] [--account 名前] [--phase login]
+    python3 run_history.py recent [--limit 20]
+
+Twitter の UI 変更後に login / post の p95 が伸びていないか、フォールバックが増えていないかを見る。
+AUTO_POST_RUN_HISTORY=0 で記録を止められる。
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import datetime
+import functools
+import threading
+from contextlib import contextmanager
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_HISTORY_PATH = os.path.join(SCRIPT_DIR, ".cache", "run_history.sqlite3")
+HISTORY_ENV = "AUTO_POST_RUN_HISTORY"
+
+OUTCOME_SUCCESS = "success"
+OUTCOME_FAILED = "failed"
+OUTCOME_RETRY = "retry"      # 失敗して再試行キューに入った
+OUTCOME_SKIPPED = "skipped"  # 投稿済み・投稿対象なしなどで送信しなかった
+
+TOTAL_PHASE = "total"
+PERCENTILES = (50, 95, 99)
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        account TEXT,
+        mode TEXT,
+        source_id TEXT,
+        outcome TEXT NOT NULL,
+        started_at REAL NOT NULL,
+        duration_ms REAL NOT NULL,
+        retries INTEGER NOT NULL DEFAULT 0,
+        selector_fallbacks INTEGER NOT NULL DEFAULT 0,
+        fallbacks TEXT,
+        error TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS runs_started ON runs (started_at)",
+    """
+    CREATE TABLE IF NOT EXISTS phases (
+        run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+        phase TEXT NOT NULL,
+        duration_ms REAL NOT NULL,
+        PRIMARY KEY (run_id, phase)
+    )
+    """,
+)
+
+_WINDOW_RE = re.compile(r"^(\d+(?:\.\d+)?)\s*([mhd])$")
+_WINDOW_UNITS = {"m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+
+def parse_window(value):
+    """
+    "90m" / "24h" / "7d" 形式の期間を秒数に変換する。
+    Args:
+        value (str): 期間。
+    Returns:
+        float: 秒数。
+    """
+    match = _WINDOW_RE.match(value.strip().lower())
+    if not match:
+        raise ValueError(f"期間の形式が正しくありません（例: 90m, 24h, 7d）: {value}")
+    return float(match.group(1)) * _WINDOW_UNITS[match.group(2)]
+
+
+def percentile(sorted_values, pct):
+    """
+    ソート済みの値のパーセンタイル（線形補間）。
+    Args:
+        sorted_values (list): 昇順に並べた値。
+        pct (float): 0〜100。
+    Returns:
+        float or None: 値がなければNone。
+    """
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * pct / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize_run(root, records):
+    """
+    実行スパンとその配下のスパンの記録から、保存する1件分の内容を作る。
+    Args:
+        root (dict): 実行スパンの記録。
+        records (list): 同じトレースで閉じたスパンの記録。
+    Returns:
+        dict: runs の列と "phases"（{段階名: ミリ秒}）。
+    """
+    # 実行スパンの子孫だけを対象にする（同じトレースに別の実行が含まれる場合に備える）
+    children = {}
+    for record in records:
+        children.setdefault(record.get("parent"), []).append(record)
+    descendants, stack = [], [root["span"]]
+    while stack:
+        for record in children.get(stack.pop(), []):
+            descendants.append(record)
+            stack.append(record["span"])
+
+    prefix = root["name"].rsplit(".", 1)[0] + "."
+    phases = {}
+    for record in children.get(root["span"], []):
+        name = record["name"]
+        if name.startswith(("selector.", "webdriver.")):
+            continue
+        phase = name[len(prefix):] if name.startswith(prefix) else name
+        phases[phase] = phases.get(phase, 0.0) + record["dur_ms"]
+
+    fallbacks = [
+        {"page_type": r.get("attrs", {}).get("page_type"), "index": r["attrs"]["fallback"]}
+        for r in descendants
+        if r["name"] == "selector.find" and r.get("attrs", {}).get("fallback")
+    ]
+
+    attrs = root.get("attrs", {})
+    outcome = attrs.get("outcome")
+    if not outcome:
+        if "success" in attrs:
+            outcome = OUTCOME_SUCCESS if attrs["success"] else OUTCOME_FAILED
+        else:
+            outcome = OUTCOME_SUCCESS if root["status"] == "ok" else OUTCOME_FAILED
+    source_id = attrs.get("page_id") or attrs.get("post_id")
+    return {
+        "name": root["name"],
+        "account": attrs.get("account"),
+        "mode": attrs.get("mode"),
+        "source_id": str(source_id) if source_id is not None else None,
+        "outcome": outcome,
+        "started_at": root["start"],
+        "duration_ms": root["dur_ms"],
+        "retries": int(attrs.get("retries") or 0),
+        "selector_fallbacks": len(fallbacks),
+        "fallbacks": json.dumps(fallbacks, ensure_ascii=False) if fallbacks else None,
+        "error": root.get("error"),
+        "phases": phases,
+    }
+
+
+class RunHistory:
+    """実行履歴を SQLite に保存・集計する。"""
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._transaction() as conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def add(self, run):
+        """
+        1件の実行を保存する。
+        Args:
+            run (dict): summarize_run() の戻り値。
+        Returns:
+            int: 保存した実行のID。
+        """
+        columns = [key for key in run if key != "phases"]
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f"INSERT INTO runs ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [run[key] for key in columns],
+            )
+            run_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO phases (run_id, phase, duration_ms) VALUES (?, ?, ?)",
+                [(run_id, phase, duration) for phase, duration in run["phases"].items()],
+            )
+        return run_id
+
+    def recent(self, limit=20, account=None):
+        """直近の実行を新しい順に返す（段階ごとの所要時間を "phases" に含める）。"""
+        query = "SELECT * FROM runs"
+        params = []
+        if account:
+            query += " WHERE account = ?"
+            params.append(account)
+        rows = [dict(row) for row in self._connection().execute(
+            query + " ORDER BY started_at DESC LIMIT ?", params + [limit]
+        )]
+        for row in rows:
+            row["phases"] = {
+                phase["phase"]: phase["duration_ms"]
+                for phase in self._connection().execute(
+                    "SELECT phase, duration_ms FROM phases WHERE run_id = ?", (row["id"],)
+                )
+            }
+        return rows
+
+    def report(self, since, account=None, phase=None, outcome=None):
+        """
+        期間内の実行をアカウント・段階ごとに集計する。
+        Args:
+            since (float): 集計を始める時刻（UNIX時刻）。
+            account (str, optional): 対象アカウント。
+            phase (str, optional): 対象の段階。
+            outcome (str, optional): 対象の結果（OUTCOME_*）。
+        Returns:
+            list: {"account", "phase", "count", "p50", "p95", "p99", "max",
+                   "failed", "retries", "selector_fallbacks"} のリスト。
+                   failed / retries / selector_fallbacks は段階 "total" の行にだけ入る。
+        """
+        where = ["runs.started_at >= ?"]
+        params = [since]
+        if account:
+            where.append("runs.account = ?")
+            params.append(account)
+        if outcome:
+            where.append("runs.outcome = ?")
+            params.append(outcome)
+        where_sql = " AND ".join(where)
+        conn = self._connection()
+
+        durations = {}
+        totals = {}
+        for row in conn.execute(
+            f"SELECT account, outcome, duration_ms, retries, selector_fallbacks FROM runs WHERE {where_sql}",
+            params,
+        ):
+            key = (row["account"] or "-", TOTAL_PHASE)
+            durations.setdefault(key, []).append(row["duration_ms"])
+            total = totals.setdefault(key, {"failed": 0, "retries": 0, "selector_fallbacks": 0})
+            total["failed"] += row["outcome"] in (OUTCOME_FAILED, OUTCOME_RETRY)
+            total["retries"] += row["retries"]
+            total["selector_fallbacks"] += row["selector_fallbacks"]
+        for row in conn.execute(
+            f"SELECT runs.account, phases.phase, phases.duration_ms FROM phases "
+            f"JOIN runs ON runs.id = phases.run_id WHERE {where_sql}",
+            params,
+        ):
+            durations.setdefault((row["account"] or "-", row["phase"]), []).append(row["duration_ms"])
+
+        results = []
+        for (account_name, phase_name), values in sorted(durations.items()):
+            if phase and phase_name != phase:
+                continue
+            values.sort()
+            entry = {"account": account_name, "phase": phase_name, "count": len(values), "max": values[-1]}
+            for pct in PERCENTILES:
+                entry[f"p{pct}"] = percentile(values, pct)
+            entry.update(totals.get((account_name, phase_name), {}))
+            results.append(entry)
+        return results
+
+    def prune(self, older_than):
+        """
+        古い実行を削除する。
+        Args:
+            older_than (float): この時刻（UNIX時刻）より前の実行を削除する。
+        Returns:
+            int: 削除した件数。
+        """
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM runs WHERE started_at < ?", (older_than,)).rowcount
+
+
+_default_history = None
+_default_history_lock = threading.Lock()
+
+
+def get_run_history():
+    """プロセス内で共有するデフォルトの実行履歴を返す。"""
+    global _default_history
+    with _default_history_lock:
+        if _default_history is None:
+            _default_history = RunHistory()
+        return _default_history
+
+
+def history_enabled():
+    """実行履歴を記録するか（AUTO_POST_RUN_HISTORY=0 で無効）。"""
+    return os.getenv(HISTORY_ENV, "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+class RunRecorder:
+    """実行スパンの配下で閉じたスパンを集め、終了時に実行履歴へ保存する。record_run() から使う。"""
+
+    def __init__(self, name, history=None, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.history = history
+        self._records = []
+        self._span = None
+
+    def _collect(self, record):
+        if self._span is not None and record["trace"] == self._span.trace_id:
+            self._records.append(record)
+
+    def __enter__(self):
+        if history_enabled():
+            tracing.add_listener(self._collect)
+        self._span = tracing.span(self.name, **self.attrs)
+        return self._span.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            return self._span.__exit__(exc_type, exc, tb)
+        finally:
+            tracing.remove_listener(self._collect)
+            self._save()
+
+    def _save(self):
+        root = next((r for r in self._records if r["span"] == getattr(self._span, "span_id", None)), None)
+        if root is None:
+            return
+        try:
+            (self.history or get_run_history()).add(summarize_run(root, self._records))
+        except Exception as e:
+            # 計測のために本処理を止めない
+            logger.warning(f"⚠️ 実行履歴の保存に失敗しました: {e}")
+        finally:
+            self._records = []
+
+
+def record_run(name, history=None, **attrs):
+    """
+    1回の投稿を実行スパンで囲み、終了時に実行履歴へ保存する。
+    with 文では tracing.span() と同じくスパンを返すので、結果は属性で渡す。
+
+        with run_history.record_run("post_tweet.run", account=account, mode=mode) as sp:
+            sp.set(page_id=page_id, retries=1, outcome=run_history.OUTCOME_SUCCESS)
+
+    保存に使う属性: account, mode, page_id / post_id, retries,
+    outcome（省略時は success 属性、なければ例外の有無で決める）。
+    Args:
+        name (str): 実行スパンの名前。
+        history (RunHistory, optional): 保存先。省略時は get_run_history()。
+        **attrs: 実行スパンの属性。
+    Returns:
+        RunRecorder: with 文で使う。
+    """
+    return RunRecorder(name, history, **attrs)
+
+
+def recorded(name):
+    """
+    関数全体を record_run() で囲むデコレーター。
+    Args:
+        name (str): 実行スパンの名前。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with record_run(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _format_ms(value):
+    if value is None:
+        return "-"
+    return f"{value / 1000:.1f}s" if value >= 1000 else f"{value:.0f}ms"
+
+
+def _print_report(rows, since):
+    since_str = datetime.datetime.fromtimestamp(since).strftime("%Y-%m-%d %H:%M")
+    print(f"📊 {since_str} 以降の実行履歴")
+    if not rows:
+        print("✅ 該当する実行はありません。")
+        return
+    header = f"{'account':<16} {'phase':<24} {'n':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        line = (
+            f"{row['account']:<16} {row['phase']:<24} {row['count']:>5} "
+            f"{_format_ms(row['p50']):>8} {_format_ms(row['p95']):>8} "
+            f"{_format_ms(row['p99']):>8} {_format_ms(row['max']):>8}"
+        )
+        if row["phase"] == TOTAL_PHASE:
+            line += (
+                f"  失敗 {row['failed']} / 再試行 {row['retries']}"
+                f" / フォールバック {row['selector_fallbacks']}"
+            )
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="投稿の実行履歴")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="段階ごとの所要時間のパーセンタイルを表示する")
+    report_parser.add_argument("--since", default="7d", help="集計期間（例: 90m, 24h, 7d）")
+    report_parser.add_argument("--account")
+    report_parser.add_argument("--phase")
+    report_parser.add_argument(
+        "--outcome", choices=[OUTCOME_SUCCESS, OUTCOME_FAILED, OUTCOME_RETRY, OUTCOME_SKIPPED]
+    )
+    report_parser.add_argument("--json", action="store_true", help="JSONで出力する")
+    recent_parser = subparsers.add_parser("recent", help="直近の実行を表示する")
+    recent_parser.add_argument("--limit", type=int, default=20)
+    recent_parser.add_argument("--account")
+    prune_parser = subparsers.add_parser("prune", help="古い実行を削除する")
+    prune_parser.add_argument("--older-than", default="90d", help="保持期間（例: 30d）")
+    args = parser.parse_args()
+
+    history = get_run_history()
+    if args.command == "prune":
+        deleted = history.prune(time.time() - parse_window(args.older_than))
+        print(f"🧹 {deleted} 件の実行を削除しました。")
+        return 0
+    if args.command == "recent":
+        for row in history.recent(args.limit, args.account):
+            print(json.dumps(row, ensure_ascii=False))
+        return 0
+
+    try:
+        since = time.time() - parse_window(args.since)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    rows = history.report(since, args.account, args.phase, args.outcome)
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        _print_report(rows, since)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
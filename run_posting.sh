@@ -14,38 +14,12 @@ if [ -z "$ACCOUNT_NAME" ]; then
     exit 1
 fi
 
-# カウントファイル（アカウント毎）
-COUNTER_FILE="posting_counter_${ACCOUNT_NAME}.txt"
-if [ ! -f "$COUNTER_FILE" ]; then
-    touch "$COUNTER_FILE" 2>/dev/null || {
-        echo "エラー: カウンターファイル '$COUNTER_FILE' の作成に失敗しました。"
-        exit 1
-    }
-    echo 0 > "$COUNTER_FILE"
-fi
-
-# 現在のカウントを読み取り、不正な場合は0にフォールバック
-count_raw=$(cat "$COUNTER_FILE")
-if [[ "$count_raw" =~ ^[0-9]+$ ]]; then
-    count=$count_raw
-else
-    echo "警告: カウンターファイル '$COUNTER_FILE' の内容が不正です。カウントを0にリセットします。"
-    count=0
-fi
-
-# カウントアップして保存
-count=$((count + 1))
-echo "$count" > "$COUNTER_FILE"
-
-# 3で割り切れるならjoboffer、そうでなければquestion
-if [ $((count % 3)) -eq 0 ]; then
-    mode="joboffer"
-else
-    mode="question"
-fi
+# モードのローテーション（3回に1回 joboffer）は状態ストア（.cache/state.sqlite3）で管理する
+# 旧 posting_counter_<アカウント名>.txt の値は初回実行時に自動で引き継がれる
+# カウンターは run_full_posting.py が実行中マーカーを取得してから進める（重複実行でスキップした回は数えない）
 
 # === パス設定 ===
 # ...existing code...
 SCRIPT_PATH="$SCRIPT_DIR/run_full_posting.py"
 # ...existing code...
-python3 "$SCRIPT_PATH" --account "$ACCOUNT_NAME" --mode "$mode"
+python3 "$SCRIPT_PATH" --account "$ACCOUNT_NAME"
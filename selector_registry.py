@@ -0,0 +1,210 @@
+"""
+複数候補のセレクタ（フォールバックチェーン）を解決するためのレジストリ。
+
+ページ種別ごとに「どの候補で要素が見つかったか」を記録し、直近で成功した候補を
+先頭に並べ替える。要素の探索は全候補を1回の execute_script でまとめて調べるため、
+候補ごとに WebDriverWait を回す場合と違い、後ろの候補が正解でも待ち時間が積み上がらない。
+ヒット状況は JSON ファイルに保存され、次回実行時にも引き継がれる。
+"""
+
+import os
+import json
+import time
+import threading
+import logging
+
+from selenium.webdriver.common.by import By
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STATS_PATH = os.path.join(SCRIPT_DIR, ".cache", "selector_stats.json")
+
+# 全候補を一度に調べるスクリプト。
+# arguments[0]: [[by, value], ...]  arguments[1]: 表示・有効状態を要求するか
+# 最初に条件を満たした候補の [index, element] を返す。
+_PROBE_SCRIPT = """
+var candidates = arguments[0];
+var requireInteractable = arguments[1];
+for (var i = 0; i < candidates.length; i++) {
+    var by = candidates[i][0], value = candidates[i][1], el = null;
+    try {
+        if (by === 'xpath') {
+            el = document.evaluate(value, document, null,
+                XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+        } else {
+            el = document.querySelector(value);
+        }
+    } catch (e) {
+        el = null;
+    }
+    if (!el) { continue; }
+    if (requireInteractable) {
+        var rect = el.getBoundingClientRect();
+        if (rect.width === 0 && rect.height === 0) { continue; }
+        if (el.disabled || el.getAttribute('aria-disabled') === 'true') { continue; }
+    }
+    return [i, el];
+}
+return null;
+"""
+
+_SUPPORTED_BY = (By.CSS_SELECTOR, By.XPATH)
+
+
+class SelectorRegistry:
+    """
+    ページ種別（例: "compose_textarea", "reply_button"）ごとのセレクタ候補の
+    成功履歴を保持し、候補の並べ替えと一括探索を行う。
+    """
+
+    def __init__(self, stats_path=DEFAULT_STATS_PATH):
+        self.stats_path = stats_path
+        self._lock = threading.Lock()
+        self._stats = self._load()
+
+    def _load(self):
+        if not self.stats_path or not os.path.exists(self.stats_path):
+            return {}
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"セレクタ統計の読み込みに失敗しました ({self.stats_path}): {e}")
+            return {}
+
+    def save(self):
+        """統計を一時ファイル経由でアトミックに保存する。"""
+        if not self.stats_path:
+            return
+        with self._lock:
+            payload = json.dumps(self._stats, ensure_ascii=False, indent=2)
+        try:
+            os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
+            tmp_path = f"{self.stats_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, self.stats_path)
+        except OSError as e:
+            logger.warning(f"セレクタ統計の保存に失敗しました ({self.stats_path}): {e}")
+
+    @staticmethod
+    def _key(by, value):
+        return f"{by}::{value}"
+
+    def ordered(self, page_type, candidates):
+        """
+        候補を直近の成功順に並べ替える。一度も成功していない候補は元の順序を保つ。
+        Args:
+            page_type (str): ページ種別。
+            candidates (list): (by, value) のリスト。
+        Returns:
+            list: 並べ替えた (by, value) のリスト。
+        """
+        with self._lock:
+            stats = self._stats.get(page_type, {})
+
+            def sort_key(indexed):
+                index, (by, value) = indexed
+                entry = stats.get(self._key(by, value), {})
+                return (-entry.get("last_hit", 0), -entry.get("hits", 0), index)
+
+            return [c for _, c in sorted(enumerate(candidates), key=sort_key)]
+
+    def record(self, page_type, candidates, winner_index):
+        """
+        探索結果を記録する。winner_index より前に試した候補は外れとして数える。
+        Args:
+            page_type (str): ページ種別。
+            candidates (list): 探索に使った順の (by, value) のリスト。
+            winner_index (int or None): 見つかった候補の位置。見つからなければNone。
+        """
+        now = time.time()
+        with self._lock:
+            stats = self._stats.setdefault(page_type, {})
+            tried = candidates if winner_index is None else candidates[: winner_index + 1]
+            for i, (by, value) in enumerate(tried):
+                entry = stats.setdefault(
+                    self._key(by, value), {"hits": 0, "lookups": 0, "last_hit": 0}
+                )
+                entry["lookups"] += 1
+                if i == winner_index:
+                    entry["hits"] += 1
+                    entry["last_hit"] = now
+
+    def hit_rates(self, page_type):
+        """
+        ページ種別ごとの候補のヒット率を返す。
+        Returns:
+            dict: {"by::value": hits / lookups}
+        """
+        with self._lock:
+            stats = self._stats.get(page_type, {})
+            return {
+                key: (entry["hits"] / entry["lookups"]) if entry.get("lookups") else 0.0
+                for key, entry in stats.items()
+            }
+
+    def find(self, driver, page_type, candidates, timeout=10, poll_interval=0.25,
+             require_interactable=False):
+        """
+        全候補を1回のJS実行でまとめて調べ、最初に見つかった要素を返す。
+        見つかるまで poll_interval 間隔で再試行し、timeout 秒で諦める。
+        Args:
+            driver (selenium.webdriver.chrome.webdriver.WebDriver): WebDriverインスタンス。
+            page_type (str): ページ種別（統計のキー）。
+            candidates (list): (by, value) のリスト。by は By.CSS_SELECTOR か By.XPATH。
+            timeout (float, optional): 最大待機秒数。
+            poll_interval (float, optional): 再試行間隔（秒）。
+            require_interactable (bool, optional): Trueなら表示中かつ有効な要素のみを対象にする。
+        Returns:
+            tuple: (element, (by, value))。見つからなければ (None, None)。
+        """
+        for by, _ in candidates:
+            if by not in _SUPPORTED_BY:
+                raise ValueError(f"未対応のセレクタ種別です: {by}")
+
+        with tracing.span("selector.find", page_type=page_type) as sp:
+            ordered = self.ordered(page_type, candidates)
+            payload = [["xpath" if by == By.XPATH else "css", value] for by, value in ordered]
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    result = driver.execute_script(_PROBE_SCRIPT, payload, require_interactable)
+                except Exception as e:
+                    logger.debug(f"セレクタ一括探索のスクリプト実行に失敗: {e}")
+                    result = None
+                if result:
+                    index, element = result[0], result[1]
+                    self.record(page_type, ordered, index)
+                    self.save()
+                    # 定義順で先頭以外の候補が当たった場合はフォールバックとして記録する（run_history.py 用）
+                    declared_index = candidates.index(ordered[index])
+                    sp.set(found=True)
+                    if declared_index > 0:
+                        sp.set(fallback=declared_index)
+                    return element, ordered[index]
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(poll_interval)
+
+            self.record(page_type, ordered, None)
+            self.save()
+            sp.set(found=False)
+            return None, None
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """プロセス内で共有するデフォルトのレジストリを返す。"""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = SelectorRegistry()
+        return _default_registry
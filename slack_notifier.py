@@ -0,0 +1,232 @@
+"""
+Slack 通知をバックグラウンドのスレッドからまとめて送るための通知キュー。
+
+notify() はメッセージをキューに積むだけで、すぐに戻る（投稿処理が Slack の応答を待たない）。
+送信は専用スレッドが行い、Webhook URL ごとに一定時間（既定30秒）内のメッセージを
+アカウント別に並べた1通のダイジェストにまとめる。1回の実行で送る取得失敗・ダウンロード失敗・
+最終結果などの通知は、複数アカウントをまとめて動かす常駐スケジューラーでも1通にまとまる。
+
+送信はタイムアウト付きで、429（Retry-After に従う）・5xx・接続エラーは間隔をあけて再試行する。
+送れなかった通知はログに残すだけで、投稿処理には影響させない。
+プロセス終了時には、キューに残った通知を最大 DRAIN_TIMEOUT 秒かけて送ってから終了する。
+
+    notifier = get_slack_notifier()
+    notifier.notify("✅ 投稿成功", webhook_url, account="アカウント名")
+
+まとめる時間は AUTO_POST_SLACK_DIGEST_SECS で変えられる（0 なら溜めずにすぐ送る）。
+"""
+
+import os
+import time
+import queue
+import atexit
+import logging
+import datetime
+import threading
+
+import requests
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+DIGEST_ENV = "AUTO_POST_SLACK_DIGEST_SECS"
+DEFAULT_DIGEST_SECS = 30
+# この件数に達したら時間を待たずに送る
+MAX_BATCH_MESSAGES = 30
+# (接続, 読み込み) のタイムアウト（秒）
+REQUEST_TIMEOUT = (3.05, 10)
+MAX_ATTEMPTS = 3
+RETRY_BASE_SECS = 1.0
+# Slack のメッセージ1通あたりの文字数の目安（超える場合は行単位で分けて送る）
+MAX_TEXT_CHARS = 3500
+DRAIN_TIMEOUT = 15
+
+_STOP = object()
+
+
+class _Flush:
+    """キューに積む「溜まっている分をすぐ送る」指示。"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+def format_digest(messages):
+    """
+    メッセージをアカウント別に並べた1通のテキストにする。1件だけなら「[アカウント] 本文」を返す。
+    Args:
+        messages (list): (時刻, アカウント, 本文) のリスト。
+    Returns:
+        str: 送信するテキスト。
+    """
+    if len(messages) == 1:
+        _, account, text = messages[0]
+        return f"[{account}] {text}" if account else text
+    by_account = {}
+    for created_at, account, text in messages:
+        by_account.setdefault(account or "-", []).append((created_at, text))
+    lines = [f"📬 通知まとめ（{len(messages)}件）"]
+    for account, entries in by_account.items():
+        lines.append(f"*{account}*")
+        for created_at, text in entries:
+            stamp = datetime.datetime.fromtimestamp(created_at).strftime("%H:%M:%S")
+            lines.append(f"• `{stamp}` {text}")
+    return "\n".join(lines)
+
+
+def split_text(text, limit=MAX_TEXT_CHARS):
+    """長いテキストを行単位で limit 文字以内に分ける（1行が長すぎる場合は途中で切る）。"""
+    parts, current = [], ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            parts.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
+
+class SlackNotifier:
+    """Slack 通知をキューに積み、バックグラウンドのスレッドからダイジェストにして送る。"""
+
+    def __init__(self, digest_secs=None, session=None):
+        if digest_secs is None:
+            digest_secs = float(os.getenv(DIGEST_ENV, DEFAULT_DIGEST_SECS))
+        self.digest_secs = digest_secs
+        self._session = session or requests.Session()
+        self._queue = queue.Queue()
+        self._batches = {}  # webhook_url -> {"deadline": ..., "messages": [...]}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="slack-notifier", daemon=True)
+                self._thread.start()
+
+    def notify(self, message, webhook_url, account=None):
+        """
+        通知をキューに積む（送信は待たない）。
+        Args:
+            message (str): 通知する本文。
+            webhook_url (str): Slack の Incoming Webhook の URL。
+            account (str, optional): ダイジェストで見出しにするアカウント名。
+        Returns:
+            bool: キューに積んだ場合はTrue（Webhook URL がなければFalse）。
+        """
+        if not webhook_url:
+            return False
+        self._ensure_worker()
+        self._queue.put((webhook_url, time.time(), account, message))
+        return True
+
+    def flush(self, timeout=None):
+        """
+        溜まっている通知をすぐに送り、送り終わるまで待つ。
+        Args:
+            timeout (float, optional): 最大待機秒数。
+        Returns:
+            bool: 時間内に送り終えた場合はTrue。
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        marker = _Flush()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def close(self, timeout=DRAIN_TIMEOUT):
+        """残りの通知を送ってからスレッドを止める（プロセス終了時に呼ばれる）。"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"⚠️ Slack通知の送信が {timeout} 秒以内に終わらなかったため、残りを破棄します。")
+
+    def _run(self):
+        while True:
+            deadlines = [batch["deadline"] for batch in self._batches.values()]
+            wait = max(0.0, min(deadlines) - time.time()) if deadlines else None
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._send_due(force=True)
+                return
+            if isinstance(item, _Flush):
+                self._send_due(force=True)
+                item.done.set()
+                continue
+            if item is not None:
+                webhook_url, created_at, account, message = item
+                batch = self._batches.setdefault(
+                    webhook_url, {"deadline": created_at + self.digest_secs, "messages": []}
+                )
+                batch["messages"].append((created_at, account, message))
+                if len(batch["messages"]) >= MAX_BATCH_MESSAGES:
+                    batch["deadline"] = 0
+            self._send_due()
+
+    def _send_due(self, force=False):
+        now = time.time()
+        for webhook_url in list(self._batches):
+            batch = self._batches[webhook_url]
+            if force or batch["deadline"] <= now:
+                del self._batches[webhook_url]
+                for text in split_text(format_digest(batch["messages"])):
+                    self._post(webhook_url, text, len(batch["messages"]))
+
+    def _post(self, webhook_url, text, message_count):
+        """1通を送る。失敗してもログに残すだけで例外は投げない。"""
+        with tracing.span("slack.notify", messages=message_count) as sp:
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                delay = RETRY_BASE_SECS * (2 ** (attempt - 1))
+                try:
+                    res = self._session.post(webhook_url, json={"text": text}, timeout=REQUEST_TIMEOUT)
+                    if res.status_code == 429:
+                        delay = float(res.headers.get("Retry-After", delay))
+                        raise requests.HTTPError(f"429 Too Many Requests（{delay:.0f}秒後に再試行）")
+                    if 400 <= res.status_code < 500:
+                        # Webhook の設定誤りなど。再試行しても変わらない
+                        sp.fail(f"HTTP {res.status_code}")
+                        logger.error(f"❌ Slack通知に失敗（HTTP {res.status_code}）: {res.text[:200]}")
+                        return False
+                    res.raise_for_status()
+                    sp.set(attempts=attempt)
+                    logger.info(f"✅ Slack通知送信成功（{message_count}件）")
+                    return True
+                except requests.RequestException as e:
+                    if attempt == MAX_ATTEMPTS:
+                        sp.fail(e)
+                        logger.error(f"❌ Slack通知に失敗（{attempt}回試行）: {e}")
+                        return False
+                    logger.warning(f"⚠️ Slack通知に失敗したため {delay:.0f} 秒後に再試行します: {e}")
+                    time.sleep(delay)
+        return False
+
+
+_default_notifier = None
+_default_notifier_lock = threading.Lock()
+
+
+def get_slack_notifier():
+    """プロセス内で共有するデフォルトの通知キューを返す（初回にプロセス終了時の送信を登録する）。"""
+    global _default_notifier
+    with _default_notifier_lock:
+        if _default_notifier is None:
+            _default_notifier = SlackNotifier()
+            atexit.register(_default_notifier.close)
+        return _default_notifier
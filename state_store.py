@@ -0,0 +1,303 @@
+"""
+アカウントごとの実行状態を保存する SQLite のストア。
+
+モードのローテーション用カウンター（旧 posting_counter_<アカウント>.txt）、最終実行日時・結果、
+最後に投稿したページ・ツイートのID、実行中ジョブのマーカーを .cache/state.sqlite3 に持つ。
+
+- WAL モードで開くため、読み取りは書き込み中でも待たされない。
+- 更新は BEGIN IMMEDIATE の短いトランザクションで行い、読み取り→加算→書き込みを
+  1つの操作として実行する（シェルの cat / 加算 / echo のような競合が起きない）。
+- SQLite に行ロックはないため、ジョブ単位の排他は実行中マーカー（期限付きのリース）で行う。
+  マーカーを持つプロセスが落ちた場合は、PID の生存確認と期限切れで自動的に解放される。
+
+run_posting.sh からは CLI として使う:
+    python3 state_store.py next-mode <アカウント名>   # カウンターを進めてモードを表示
+    python3 state_store.py show [<アカウント名>]      # 状態をJSONで表示
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import logging
+import argparse
+import threading
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STATE_PATH = os.path.join(SCRIPT_DIR, ".cache", "state.sqlite3")
+# 実行中マーカーの既定の有効期間（秒）
+DEFAULT_LEASE_SECS = 60 * 60
+# 3回に1回 joboffer にする（run_posting.sh と同じ規則）
+JOBOFFER_EVERY = 3
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS account_state (
+        account TEXT PRIMARY KEY,
+        rotation_counter INTEGER NOT NULL DEFAULT 0,
+        last_run_at REAL,
+        last_mode TEXT,
+        last_result TEXT,
+        last_page_id TEXT,
+        last_tweet_id TEXT,
+        updated_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS inflight_jobs (
+        account TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        token TEXT NOT NULL,
+        host TEXT NOT NULL,
+        pid INTEGER NOT NULL,
+        started_at REAL NOT NULL,
+        expires_at REAL NOT NULL,
+        PRIMARY KEY (account, kind)
+    )
+    """,
+)
+
+
+def mode_for_count(count):
+    """カウンターの値からモードを決める（3の倍数なら joboffer）。"""
+    return "joboffer" if count % JOBOFFER_EVERY == 0 else "question"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class StateStore:
+    """アカウントごとの状態を読み書きする。スレッド間・プロセス間で共有してよい。"""
+
+    def __init__(self, path=DEFAULT_STATE_PATH, legacy_counter_dir=SCRIPT_DIR):
+        self.path = path
+        self.legacy_counter_dir = legacy_counter_dir
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._transaction() as conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+
+    def _connection(self):
+        # sqlite3 の接続はスレッドごとに持つ
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _ensure_row(self, conn, account):
+        """アカウントの行がなければ作る。旧カウンターファイルがあればその値を引き継ぐ。"""
+        if conn.execute("SELECT 1 FROM account_state WHERE account = ?", (account,)).fetchone():
+            return
+        counter = 0
+        legacy_path = os.path.join(self.legacy_counter_dir, f"posting_counter_{account}.txt")
+        if os.path.exists(legacy_path):
+            try:
+                with open(legacy_path, "r", encoding="utf-8") as f:
+                    raw = f.read().strip()
+                if raw.isdigit():
+                    counter = int(raw)
+                    logger.info(f"📦 [{account}] {legacy_path} のカウンター ({counter}) を引き継ぎました。")
+            except OSError as e:
+                logger.warning(f"⚠️ [{account}] 旧カウンターファイルの読み込みに失敗: {e}")
+        conn.execute(
+            "INSERT INTO account_state (account, rotation_counter, updated_at) VALUES (?, ?, ?)",
+            (account, counter, time.time()),
+        )
+
+    # --- ローテーション ---
+
+    def next_mode(self, account):
+        """
+        カウンターを1進め、今回の投稿モードを返す。
+        Args:
+            account (str): アカウント名。
+        Returns:
+            str: "question" または "joboffer"。
+        """
+        with self._transaction() as conn:
+            self._ensure_row(conn, account)
+            conn.execute(
+                "UPDATE account_state SET rotation_counter = rotation_counter + 1, updated_at = ? "
+                "WHERE account = ?",
+                (time.time(), account),
+            )
+            count = conn.execute(
+                "SELECT rotation_counter FROM account_state WHERE account = ?", (account,)
+            ).fetchone()[0]
+        return mode_for_count(count)
+
+    # --- 実行結果 ---
+
+    def record_run(self, account, mode, result, page_id=None, tweet_id=None):
+        """
+        実行結果を記録する。
+        Args:
+            account (str): アカウント名。
+            mode (str): 実行したモード。
+            result (str): "success" / "failure" / "skipped" など。
+            page_id (str, optional): 投稿したNotionページ（またはシート行）のID。
+            tweet_id (str, optional): 投稿したツイートのID。
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            self._ensure_row(conn, account)
+            conn.execute(
+                "UPDATE account_state SET last_run_at = ?, last_mode = ?, last_result = ?, "
+                "last_page_id = COALESCE(?, last_page_id), "
+                "last_tweet_id = COALESCE(?, last_tweet_id), updated_at = ? WHERE account = ?",
+                (now, mode, result, page_id, tweet_id, now, account),
+            )
+
+    def get(self, account):
+        """
+        アカウントの状態を返す。
+        Returns:
+            dict or None: 状態。記録がなければNone。
+        """
+        row = self._connection().execute(
+            "SELECT * FROM account_state WHERE account = ?", (account,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def all(self):
+        """全アカウントの状態と実行中マーカーを返す。"""
+        conn = self._connection()
+        states = {row["account"]: dict(row) for row in conn.execute("SELECT * FROM account_state")}
+        for row in conn.execute("SELECT * FROM inflight_jobs"):
+            states.setdefault(row["account"], {"account": row["account"]}).setdefault(
+                "inflight", []
+            ).append(dict(row))
+        return states
+
+    # --- 実行中マーカー ---
+
+    def acquire(self, account, kind="post", lease_secs=DEFAULT_LEASE_SECS):
+        """
+        実行中マーカーを取得する。他のプロセスが有効なマーカーを持っていれば取得できない。
+        Args:
+            account (str): アカウント名。
+            kind (str, optional): ジョブの種類。
+            lease_secs (float, optional): マーカーの有効期間（秒）。
+        Returns:
+            str or None: 解放に使うトークン。取得できなければNone。
+        """
+        now = time.time()
+        host = socket.gethostname()
+        token = uuid.uuid4().hex
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM inflight_jobs WHERE account = ? AND kind = ?", (account, kind)
+            ).fetchone()
+            if row:
+                stale = row["expires_at"] <= now or (
+                    row["host"] == host and not _pid_alive(row["pid"])
+                )
+                if not stale:
+                    return None
+                logger.warning(
+                    f"⚠️ [{account}] 残っていた実行中マーカー（pid={row['pid']}）を解放します。"
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO inflight_jobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (account, kind, token, host, os.getpid(), now, now + lease_secs),
+            )
+        return token
+
+    def release(self, account, token, kind="post"):
+        """
+        取得した実行中マーカーを解放する。
+        Args:
+            account (str): アカウント名。
+            token (str): acquire() が返したトークン。
+            kind (str, optional): ジョブの種類。
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM inflight_jobs WHERE account = ? AND kind = ? AND token = ?",
+                (account, kind, token),
+            )
+
+    @contextmanager
+    def job(self, account, kind="post", lease_secs=DEFAULT_LEASE_SECS):
+        """
+        実行中マーカーを持った状態で処理を行うためのコンテキストマネージャ。
+        マーカーを取得できなかった場合は None を返す（呼び出し側でスキップする）。
+        """
+        token = self.acquire(account, kind, lease_secs)
+        try:
+            yield token
+        finally:
+            if token:
+                self.release(account, token, kind)
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_state_store():
+    """プロセス内で共有するデフォルトのストアを返す。"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = StateStore()
+        return _default_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="アカウントごとの実行状態ストア")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    next_mode_parser = subparsers.add_parser("next-mode", help="カウンターを進めて今回のモードを表示する")
+    next_mode_parser.add_argument("account")
+    show_parser = subparsers.add_parser("show", help="状態をJSONで表示する")
+    show_parser.add_argument("account", nargs="?")
+    record_parser = subparsers.add_parser("record-run", help="実行結果を記録する")
+    record_parser.add_argument("account")
+    record_parser.add_argument("--mode", required=True)
+    record_parser.add_argument("--result", required=True)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(message)s", datefmt="%H:%M:%S", stream=sys.stderr)
+    store = get_state_store()
+    if args.command == "next-mode":
+        print(store.next_mode(args.account))
+    elif args.command == "record-run":
+        store.record_run(args.account, args.mode, args.result)
+    else:
+        state = store.get(args.account) if args.account else store.all()
+        print(json.dumps(state, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import pytest
+import requests
+
+from mock_backends import MockNotionServer, MockSlackServer, STATUS_PROPERTY
+
+PENDING_FILTER = {"and": [
+    {"property": "ステータス", "select": {"equals": "投稿待ち"}},
+    {"property": "動画", "files": {"is_not_empty": True}},
+    {"property": "回答（編集済み）", "rich_text": {"is_not_empty": True}},
+]}
+
+
+@pytest.fixture
+def notion():
+    server = MockNotionServer(latency="none", seed=0, rps=0, media_mb=0.01).start()
+    yield server
+    server.stop()
+
+
+def _query(server, database_id, token="secret"):
+    return requests.post(
+        f"{server.url}/v1/databases/{database_id}/query",
+        json={"filter": PENDING_FILTER, "page_size": 100},
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=5,
+    )
+
+
+def test_mock_notion_query_update_and_file(notion):
+    ids = notion.add_database("db", ["本文1", "本文2"])
+    notion.add_database("db", ["使用済みの本文"], status="使用済み")
+
+    response = _query(notion, "db")
+    assert response.status_code == 200
+    assert [page["id"] for page in response.json()["results"]] == ids
+
+    update = requests.patch(
+        f"{notion.url}/v1/pages/{ids[0]}",
+        json={"properties": {STATUS_PROPERTY: {"select": {"name": "使用済み"}}}},
+        timeout=5,
+    )
+    assert update.status_code == 200
+    assert notion.status_counts("db") == {"投稿待ち": 1, "使用済み": 2}
+
+    video = requests.get(f"{notion.url}/files/{ids[1]}.mp4", timeout=5)
+    assert video.status_code == 200 and len(video.content) == len(notion.media)
+    assert notion.stats()["requests"] == {"query": 1, "update": 1, "file": 1}
+
+
+def test_mock_notion_rate_limits_per_token():
+    server = MockNotionServer(latency="none", seed=0, rps=1, burst=1).start()
+    try:
+        server.add_database("db", ["本文"])
+        assert _query(server, "db", "a").status_code == 200
+        limited = _query(server, "db", "a")
+        assert limited.status_code == 429
+        assert int(limited.headers["Retry-After"]) >= 1
+        # 別のトークンは別の枠
+        assert _query(server, "db", "b").status_code == 200
+        assert server.stats()["errors"] == {"query:429": 1}
+    finally:
+        server.stop()
+
+
+def test_mock_slack_keeps_messages_per_webhook():
+    server = MockSlackServer(latency="none").start()
+    try:
+        assert requests.post(f"{server.url}/services/lt001", json={"text": "✅ 投稿成功"}, timeout=5).text == "ok"
+        assert server.messages == {"/services/lt001": ["✅ 投稿成功"]}
+    finally:
+        server.stop()
+
+
+def test_load_test_report_helpers():
+    # load_test.py は bench_browser_flow 経由で selenium を読み込む
+    pytest.importorskip("selenium")
+    import load_test
+
+    text = load_test.page_text("lt001", 1, "一文目。二文目。")
+    assert load_test.TAG_PATTERN.findall(text) == ["lt001", "lt001"]
+
+    class State:
+        def snapshot(self):
+            return {"tweets": [
+                {"username": "lt001", "reply_to": None, "text": text},
+                {"username": "lt002", "reply_to": None, "text": text},
+                {"username": "lt001", "reply_to": "1", "text": text},
+            ]}
+
+    result = load_test.verify_posts(State(), ["lt001", "lt002"])
+    assert result["clipboard_mixups"] == 1
+    assert result["duplicates"] == 1
+    assert result["per_account"]["lt001"] == {"posts": 2, "threads": 1}
+
+    summary = load_test.summarize_jobs(
+        [{"result": "success", "job_secs": 2.0, "wait_secs": 0.5}, {"result": "failure", "job_secs": 4.0}], 60
+    )
+    assert summary["error_rate"] == 0.5
+    assert summary["posts_per_min"] == 1.0
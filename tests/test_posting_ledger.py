@@ -0,0 +1,132 @@
+import pytest
+
+from posting_ledger import (
+    ACTION_FINISH, ACTION_POST, ACTION_RESUME, ACTION_SKIP, ACTION_VERIFY,
+    STATE_CONFIRMED, STATE_INTENT, STATE_SENDING, STATE_SENT,
+    PostingLedger, is_resumable, thread_progress,
+)
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return PostingLedger(str(tmp_path / "ledger.sqlite3"))
+
+
+def test_new_post_starts_as_intent(ledger):
+    key, action, entry = ledger.begin("acc", "page", "本文")
+    assert action == ACTION_POST
+    assert entry["state"] == STATE_INTENT
+    assert entry["attempts"] == 1
+
+
+def test_intent_is_posted_again(ledger):
+    ledger.begin("acc", "page", "本文")
+    key, action, entry = ledger.begin("acc", "page", "本文")
+    assert action == ACTION_POST
+    assert entry["attempts"] == 2
+
+
+def test_sending_is_verified_not_reposted(ledger):
+    key, _, _ = ledger.begin("acc", "page", "本文")
+    ledger.mark_sending(key)
+    ledger.mark_failed(key, "送信後にタイムアウト")
+    _, action, entry = ledger.begin("acc", "page", "本文")
+    assert action == ACTION_VERIFY
+    assert entry["state"] == STATE_SENDING
+    assert entry["attempts"] == 1
+
+
+def test_mark_sending_only_moves_from_intent(ledger):
+    key, _, _ = ledger.begin("acc", "page", "本文")
+    ledger.mark_sent(key, tweet_url="https://x.com/user/status/123")
+    ledger.mark_sending(key)
+    assert ledger.get(key)["state"] == STATE_SENT
+
+
+def test_sent_then_confirmed(ledger):
+    key, _, _ = ledger.begin("acc", "page", "本文")
+    ledger.mark_sending(key)
+    ledger.mark_sent(key, tweet_url="https://x.com/user/status/123")
+    entry = ledger.get(key)
+    assert entry["state"] == STATE_SENT
+    assert entry["tweet_id"] == "123"
+    assert ledger.begin("acc", "page", "本文")[1] == ACTION_FINISH
+
+    ledger.mark_confirmed(key)
+    assert ledger.get(key)["state"] == STATE_CONFIRMED
+    assert ledger.begin("acc", "page", "本文")[1] == ACTION_SKIP
+
+
+def test_other_content_is_a_new_post(ledger):
+    key, _, _ = ledger.begin("acc", "page", "本文")
+    ledger.mark_sent(key)
+    assert ledger.begin("acc", "page", "別の本文")[1] == ACTION_POST
+
+
+def test_thread_failed_midway_resumes_from_last_tweet(ledger):
+    key, _, _ = ledger.begin("acc", "page", "長い本文")
+    ledger.start_thread(key, ["1", "2", "3"])
+    ledger.mark_sending(key)
+    ledger.record_step(key, 0, tweet_url="https://x.com/user/status/1")
+    ledger.record_step(key, 1, tweet_url="https://x.com/user/status/2")
+
+    _, action, entry = ledger.begin("acc", "page", "長い本文")
+    assert action == ACTION_RESUME
+    progress = thread_progress(entry)
+    assert progress["next_index"] == 2
+    assert progress["head"] == "https://x.com/user/status/1"
+    assert progress["last"] == "https://x.com/user/status/2"
+    assert entry["tweet_id"] == "1"
+
+
+def test_thread_with_unknown_last_tweet_is_not_resumed(ledger):
+    key, _, _ = ledger.begin("acc", "page", "長い本文")
+    ledger.start_thread(key, ["1", "2", "3"])
+    ledger.record_step(key, 0, tweet_id="1")
+    # 送信したが作成されたか分からないツイートは ID なしで記録される
+    ledger.record_step(key, 1, tweet_id=None)
+    _, action, entry = ledger.begin("acc", "page", "長い本文")
+    assert not is_resumable(entry)
+    assert action == ACTION_FINISH
+
+
+def test_mark_failed_keeps_state(ledger):
+    key, _, _ = ledger.begin("acc", "page", "本文")
+    ledger.mark_failed(key, "ログイン失敗")
+    entry = ledger.get(key)
+    assert entry["state"] == STATE_INTENT
+    assert entry["last_error"] == "ログイン失敗"
+
+
+def test_cancel_sending_allows_posting_again(ledger):
+    key, _, _ = ledger.begin("acc", "page", "本文")
+    ledger.mark_sending(key)
+    ledger.cancel_sending(key)
+    assert ledger.begin("acc", "page", "本文")[1] == ACTION_POST
+
+
+def test_thread_chunk_in_flight_is_not_resumed(ledger):
+    key, _, _ = ledger.begin("acc", "page", "長い本文")
+    ledger.start_thread(key, ["1", "2", "3"])
+    ledger.mark_sending(key, 0)
+    ledger.record_step(key, 0, tweet_id="1")
+    ledger.mark_sending(key, 1)
+    # 2件目の応答を受け取る前に落ちた → 続きから再開しない
+    _, action, entry = ledger.begin("acc", "page", "長い本文")
+    assert action == ACTION_FINISH
+    assert thread_progress(entry)["posted"] == ["1", None]
+
+
+def test_cancelled_thread_chunk_is_resumed(ledger):
+    key, _, _ = ledger.begin("acc", "page", "長い本文")
+    ledger.start_thread(key, ["1", "2", "3"])
+    ledger.record_step(key, 0, tweet_id="1")
+    ledger.mark_sending(key, 1)
+    ledger.cancel_sending(key, 1)
+    _, action, entry = ledger.begin("acc", "page", "長い本文")
+    assert action == ACTION_RESUME
+    assert thread_progress(entry)["next_index"] == 1
+
+    ledger.mark_sending(key, 1)
+    ledger.record_step(key, 1, tweet_id="2")
+    assert thread_progress(ledger.get(key))["posted"] == ["1", "2"]
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+import rate_limit_ledger
+from retry_queue import (
+    FAILURE_NETWORK, FAILURE_RATE_LIMIT, FAILURE_SELECTOR, RETRY_POLICIES, STATUS_DEAD, STATUS_PENDING,
+    RetryQueue, backoff_secs,
+)
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    # レート制限台帳もテスト用のものを使う
+    monkeypatch.setattr(
+        rate_limit_ledger, "_default_ledger", rate_limit_ledger.RateLimitLedger(str(tmp_path / "rate_limits.sqlite3"))
+    )
+    return RetryQueue(str(tmp_path / "retry_queue.sqlite3"))
+
+
+def test_backoff_doubles_and_stays_within_jitter_range():
+    policy = RETRY_POLICIES[FAILURE_NETWORK]
+    rng = random.Random(0)
+    for attempts in range(1, 8):
+        delay = min(policy.max_secs, policy.base_secs * 2 ** (attempts - 1))
+        for _ in range(20):
+            assert delay / 2 <= backoff_secs(FAILURE_NETWORK, attempts, rng) <= delay
+
+
+def test_backoff_is_capped_at_max_secs():
+    policy = RETRY_POLICIES[FAILURE_NETWORK]
+    assert backoff_secs(FAILURE_NETWORK, 50, random.Random(0)) <= policy.max_secs
+
+
+def test_unknown_failure_class_uses_selector_policy():
+    rng_a, rng_b = random.Random(1), random.Random(1)
+    assert backoff_secs("unknown", 2, rng_a) == backoff_secs(FAILURE_SELECTOR, 2, rng_b)
+
+
+def test_failure_is_held_until_next_attempt(queue):
+    job = queue.record_failure("acc", "page", FAILURE_NETWORK, "timeout", now=1000.0)
+    assert job["status"] == STATUS_PENDING
+    assert job["attempts"] == 1
+    assert 1000.0 + 30 <= job["next_attempt_at"] <= 1000.0 + 60
+    assert queue.held_ids("acc", now=1000.0) == {"page"}
+    assert queue.due("acc", now=1000.0) == []
+    assert [j["source_id"] for j in queue.due("acc", now=job["next_attempt_at"])] == ["page"]
+    assert queue.held_ids("acc", now=job["next_attempt_at"]) == set()
+
+
+def test_dead_letter_after_max_attempts(queue):
+    policy = RETRY_POLICIES[FAILURE_SELECTOR]
+    for _ in range(policy.max_attempts):
+        job = queue.record_failure("acc", "page", FAILURE_SELECTOR, now=1000.0)
+    assert job["status"] == STATUS_DEAD
+    assert queue.due("acc", now=10 ** 10) == []
+    assert queue.held_ids("acc", now=10 ** 10) == {"page"}
+
+    queue.requeue("acc", "page")
+    assert queue.next_pending("acc")["source_id"] == "page"
+
+
+def test_rate_limit_waits_for_reset(queue):
+    reset = 10 ** 10
+    rate_limit_ledger.get_rate_limit_ledger().record(
+        "acc", "POST /2/tweets", {"x-rate-limit-remaining": "0", "x-rate-limit-reset": str(reset)}
+    )
+    job = queue.record_failure("acc", "page", FAILURE_RATE_LIMIT)
+    assert job["next_attempt_at"] >= reset
+
+
+def test_rate_limit_uses_shared_account_key(queue):
+    # 台帳は X のユーザー名で引くので、キューのアカウント名（Sheets の account_id）と違っても解除時刻を待つ
+    reset = 10 ** 10
+    key = rate_limit_ledger.account_key({"username": "@Bot_User"}, "sheet-1")
+    assert key == "bot_user"
+    rate_limit_ledger.get_rate_limit_ledger().record(
+        key, "POST /2/tweets", {"x-rate-limit-remaining": "0", "x-rate-limit-reset": str(reset)}
+    )
+    assert queue.record_failure("sheet-1", "page", FAILURE_RATE_LIMIT)["next_attempt_at"] < reset
+    job = queue.record_failure("sheet-1", "page", FAILURE_RATE_LIMIT, rate_limit_account=key)
+    assert job["next_attempt_at"] >= reset
+
+
+def test_success_removes_job(queue):
+    queue.record_failure("acc", "page", FAILURE_NETWORK)
+    queue.record_success("acc", "page")
+    assert queue.next_pending("acc") is None
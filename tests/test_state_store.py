@@ -0,0 +1,55 @@
+import pytest
+
+from state_store import StateStore, mode_for_count
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    def make():
+        return StateStore(str(tmp_path / "state.sqlite3"), legacy_counter_dir=str(tmp_path))
+    return make
+
+
+def test_mode_rotation_every_third_run(make_store):
+    store = make_store()
+    assert [store.next_mode("acc") for _ in range(6)] == [
+        "question", "question", "joboffer", "question", "question", "joboffer",
+    ]
+
+
+def test_next_mode_continues_from_legacy_counter_file(tmp_path, make_store):
+    # run_posting.sh が使っていた posting_counter_<アカウント>.txt の続きから数える
+    (tmp_path / "posting_counter_acc.txt").write_text("5\n", encoding="utf-8")
+    store = make_store()
+    assert store.next_mode("acc") == mode_for_count(6) == "joboffer"
+    assert store.next_mode("acc") == "question"
+    assert store.get("acc")["rotation_counter"] == 7
+
+
+def test_legacy_counter_is_read_only_once(tmp_path, make_store):
+    (tmp_path / "posting_counter_acc.txt").write_text("5", encoding="utf-8")
+    make_store().next_mode("acc")
+    (tmp_path / "posting_counter_acc.txt").write_text("100", encoding="utf-8")
+    make_store().next_mode("acc")
+    assert make_store().get("acc")["rotation_counter"] == 7
+
+
+def test_broken_legacy_counter_starts_from_zero(tmp_path, make_store):
+    (tmp_path / "posting_counter_acc.txt").write_text("abc", encoding="utf-8")
+    store = make_store()
+    assert store.next_mode("acc") == "question"
+    assert store.get("acc")["rotation_counter"] == 1
+
+
+def test_skipped_daemon_job_does_not_advance_rotation(make_store, monkeypatch):
+    # 実行中マーカーを取れずにスキップした回はカウンターを進めない
+    import posting_daemon
+
+    store = make_store()
+    monkeypatch.setattr(posting_daemon, "get_state_store", lambda: store)
+    token = store.acquire("acc")
+    worker = posting_daemon.AccountWorker("acc", [0])
+    assert worker.run_job(mode_selector=store.next_mode) is None
+    assert store.get("acc")["rotation_counter"] == 0
+    store.release("acc", token)
+    assert store.next_mode("acc") == mode_for_count(1)
@@ -0,0 +1,42 @@
+from text_splitter import (
+    MAX_WEIGHTED_LENGTH, TRANSFORMED_URL_LENGTH, iter_graphemes, split_for_twitter, weighted_length
+)
+
+
+def test_url_followed_by_japanese_counts_japanese_separately():
+    # URL は23、続く日本語7文字は1文字2
+    assert weighted_length("https://example.com詳しくはこちら") == TRANSFORMED_URL_LENGTH + 7 * 2
+
+
+def test_weighted_length_counts_cjk_as_two_and_latin_as_one():
+    assert weighted_length("abc") == 3
+    assert weighted_length("あいう") == 6
+
+
+def test_weighted_length_counts_any_url_as_23():
+    assert weighted_length("https://example.com/" + "a" * 100) == TRANSFORMED_URL_LENGTH
+
+
+def test_graphemes_keep_zwj_emoji_together():
+    family = "\U0001F468‍\U0001F469‍\U0001F467"
+    assert list(iter_graphemes(family + "a")) == [family, "a"]
+
+
+def test_short_text_is_not_split():
+    assert split_for_twitter("  こんにちは  ") == ["こんにちは"]
+    assert split_for_twitter("   ") == []
+
+
+def test_split_respects_limit_and_prefers_sentence_end():
+    sentence = "あ" * 100 + "。"
+    chunks = split_for_twitter(sentence * 3)
+    assert len(chunks) == 3
+    assert all(weighted_length(chunk) <= MAX_WEIGHTED_LENGTH for chunk in chunks)
+    assert all(chunk.endswith("。") for chunk in chunks)
+    assert "".join(chunks) == sentence * 3
+
+
+def test_split_does_not_break_urls():
+    url = "https://example.com/" + "a" * 300
+    chunks = split_for_twitter("あ" * 130 + " " + url + " " + "い" * 130)
+    assert any(url in chunk for chunk in chunks)
@@ -0,0 +1,246 @@
+"""
+投稿内容の比較・判定に使うテキスト正規化モジュール。
+
+絵文字の除去・非表示文字の除去・BMP外の文字の除去・実質的に空かどうかの判定を、
+事前にコンパイルした正規表現で行う（文字ごとの unicodedata.category 呼び出しをしない）。
+非表示文字の文字クラスは初回利用時に一度だけ unicodedata から作成し、以降は使い回す。
+TextNormalizer を使うと、これらの処理を設定に応じて1回の走査にまとめて適用できる。
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+# 従来の remove_emojis() と同じ範囲
+_EMOJI_RANGES = (
+    (0x1F600, 0x1F64F),
+    (0x1F300, 0x1F5FF),
+    (0x1F680, 0x1F6FF),
+    (0x1F1E0, 0x1F1FF),
+    (0x2700, 0x27BF),
+    (0x1F900, 0x1F9FF),
+    (0x2600, 0x26FF),
+    (0x200D, 0x200D),
+    (0x2640, 0x2642),
+    (0xFE0F, 0xFE0F),
+)
+
+_EMOJI_RE = re.compile(
+    "[" + "".join(f"\\U{start:08x}-\\U{end:08x}" for start, end in _EMOJI_RANGES) + "]+"
+)
+_NON_BMP_RE = re.compile("[\\U00010000-\\U0010ffff]+")
+_NON_BMP_CHAR_RE = re.compile("[\\U00010000-\\U0010ffff]")
+
+_BMP_MAX = "\uffff"
+
+
+def _is_control_or_separator(ch):
+    return unicodedata.category(ch)[0] in ("C", "Z")
+
+
+def _is_emoji(cp):
+    return any(start <= cp <= end for start, end in _EMOJI_RANGES)
+
+
+@lru_cache(maxsize=None)
+def _bmp_delete_re(invisible, spaces, emojis):
+    """
+    BMP内で削除する文字をまとめた正規表現を作る（フラグの組み合わせごとに1回）。
+    BMP内だけの文字クラスは re がビットマップに最適化するため、1文字あたりの判定が定数時間になる。
+    Args:
+        invisible (bool): 制御文字・区切り文字（U+0020 以外）を削除するか。
+        spaces (bool): U+0020 を削除するか。
+        emojis (bool): 絵文字を削除するか。
+    Returns:
+        re.Pattern: 削除対象の文字の連続にマッチするパターン。
+    """
+    targets = set()
+    if invisible:
+        targets.update(
+            cp for cp in range(0x10000)
+            if cp != 0x20 and _is_control_or_separator(chr(cp))
+        )
+    if spaces:
+        targets.add(0x20)
+    if emojis:
+        for start, end in _EMOJI_RANGES:
+            targets.update(range(start, min(end, 0xFFFF) + 1))
+    return _char_class_re(tuple(sorted(targets)))
+
+
+def _char_class_re(codepoints):
+    """ソート済みのコードポイント列から、連続する範囲をまとめた文字クラスの正規表現を作る。"""
+    ranges = []
+    for cp in codepoints:
+        if ranges and ranges[-1][1] == cp - 1:
+            ranges[-1][1] = cp
+        else:
+            ranges.append([cp, cp])
+    if not ranges:
+        return None
+    return re.compile(
+        "[" + "".join(f"\\U{start:08x}-\\U{end:08x}" for start, end in ranges) + "]+"
+    )
+
+
+@lru_cache(maxsize=256)
+def _non_bmp_delete_re(codepoints):
+    return _char_class_re(codepoints)
+
+
+def _delete_non_bmp(text, invisible, emojis):
+    """
+    BMP外の文字のうち削除対象のものを取り除く。
+    BMP外の全範囲を1つの文字クラスにすると照合が遅いため、テキストに含まれる
+    BMP外の文字だけを判定し、その文字だけの正規表現で削除する。
+    """
+    doomed = tuple(sorted(
+        ord(ch)
+        for ch in set(_NON_BMP_CHAR_RE.findall(text))
+        if (invisible and _is_control_or_separator(ch)) or (emojis and _is_emoji(ord(ch)))
+    ))
+    if not doomed:
+        return text
+    return _non_bmp_delete_re(doomed).sub("", text)
+
+
+def remove_non_bmp(text):
+    """
+    テキストからBMP（基本多言語面）以外の文字を除去する。
+    Args:
+        text (str): 対象のテキスト。
+    Returns:
+        str: BMP外の文字が除去されたテキスト。
+    """
+    if not text or max(text) <= _BMP_MAX:
+        return text
+    return _NON_BMP_RE.sub("", text)
+
+
+def remove_emojis(text):
+    """
+    テキストから絵文字を除去する。
+    Args:
+        text (str): 対象のテキスト。
+    Returns:
+        str: 絵文字が除去されたテキスト。
+    """
+    return _EMOJI_RE.sub("", text)
+
+
+def strip_invisible(text):
+    """
+    テキストから非表示文字（制御文字、および半角スペース以外の区切り文字）を除去する。
+    Args:
+        text (str): 対象のテキスト。
+    Returns:
+        str: 非表示文字が除去されたテキスト。
+    """
+    return _STRIP_INVISIBLE(text)
+
+
+def is_effectively_empty(text):
+    """
+    テキストが実質的に空かどうか（空白や制御文字のみでないか）を判定する。
+    Args:
+        text (str): 判定対象のテキスト。
+    Returns:
+        bool: 実質的に空であればTrue、そうでなければFalse。
+    """
+    stripped = text.strip()
+    if not stripped:
+        return True
+    # ほとんどの場合は先頭の1文字で判定できる
+    if not _is_control_or_separator(stripped[0]):
+        return False
+    return not _STRIP_ALL_BLANK(stripped)
+
+
+class TextNormalizer:
+    """
+    設定した正規化処理をまとめて適用する。
+
+    処理順は「BMP外の除去 → Unicode正規化 → 絵文字・非表示文字・半角スペースの除去」。
+    最後の削除処理は1つの正規表現にまとめ、BMP内の文字は1回の置換で取り除く。
+
+    使用例:
+        normalize = TextNormalizer(bmp_only=True, unicode_form="NFKC",
+                                   strip_emojis=True, strip_invisible=True,
+                                   remove_spaces=True)
+        key = normalize(text)
+    """
+
+    def __init__(self, bmp_only=False, unicode_form=None, strip_emojis=False,
+                 strip_invisible=False, remove_spaces=False):
+        self.bmp_only = bmp_only
+        self.unicode_form = unicode_form
+        self.strip_emojis = strip_emojis
+        self.strip_invisible = strip_invisible
+        self.remove_spaces = remove_spaces
+        self._deletes = strip_emojis or strip_invisible or remove_spaces
+        self._deletes_non_bmp = not bmp_only and (strip_emojis or strip_invisible)
+
+    def __call__(self, text):
+        """
+        設定に従ってテキストを正規化する。
+        Args:
+            text (str): 対象のテキスト。
+        Returns:
+            str: 正規化されたテキスト。
+        """
+        if not text:
+            return text
+        has_non_bmp = max(text) > _BMP_MAX
+        if self.bmp_only and has_non_bmp:
+            text = _NON_BMP_RE.sub("", text)
+            has_non_bmp = False
+        if self.unicode_form:
+            text = unicodedata.normalize(self.unicode_form, text)
+            has_non_bmp = bool(text) and max(text) > _BMP_MAX
+        if self._deletes:
+            # パターンの作成は初回呼び出しまで遅らせる（import時のコストをなくす）
+            pattern = _bmp_delete_re(
+                self.strip_invisible, self.remove_spaces, self.strip_emojis
+            )
+            text = pattern.sub("", text)
+            if has_non_bmp and self._deletes_non_bmp:
+                text = _delete_non_bmp(text, self.strip_invisible, self.strip_emojis)
+        return text
+
+    def is_effectively_empty(self, text):
+        """
+        正規化後のテキストが実質的に空かどうかを判定する。
+        Args:
+            text (str): 判定対象のテキスト。
+        Returns:
+            bool: 実質的に空であればTrue。
+        """
+        return is_effectively_empty(self(text))
+
+
+_STRIP_INVISIBLE = TextNormalizer(strip_invisible=True)
+_STRIP_ALL_BLANK = TextNormalizer(strip_invisible=True, remove_spaces=True)
+
+# 投稿済みツイートと投稿内容の照合に使う正規化（旧コードの組み合わせと同じ処理順）
+COMPARE_NORMALIZER = TextNormalizer(
+    bmp_only=True,
+    unicode_form="NFKC",
+    strip_emojis=True,
+    strip_invisible=True,
+    remove_spaces=True,
+)
+_COMPARE_PREPARE = TextNormalizer(bmp_only=True, unicode_form="NFKC")
+_COMPARE_CLEANUP = TextNormalizer(strip_emojis=True, strip_invisible=True, remove_spaces=True)
+
+
+def compare_prefix(text, length):
+    """
+    投稿内容の先頭から照合用のキーを作る。旧コードと同じく、Unicode正規化の後・
+    絵文字/非表示文字/半角スペースの除去の前に length 文字で切り詰める。
+    Args:
+        text (str): 投稿内容。
+        length (int): 切り詰める文字数。
+    Returns:
+        str: 照合用のキー。
+    """
+    return _COMPARE_CLEANUP(_COMPARE_PREPARE(text)[:length])
@@ -0,0 +1,251 @@
+"""
+Twitter の重み付き文字数で長さを測り、スレッドのチャンク数が最小になるように
+テキストを分割するモジュール。
+
+- 長さは twitter-text (v3) と同じ規則で数える。Latin などは1、CJK などは2、
+  絵文字は1つの書記素クラスタで2、URLは長さに関係なく23。
+- 分割位置は書記素クラスタの境界に限る（結合文字・異体字セレクタ・ZWJ絵文字を分断しない）。
+- 動的計画法で「チャンク数が最小、その中で区切りの悪さ（ペナルティ）の合計が最小」
+  となる区切り位置を選ぶ。段落・改行・文末・句読点・空白の順に区切りやすい。
+"""
+
+import re
+import unicodedata
+
+# twitter-text v3 の設定値
+MAX_WEIGHTED_LENGTH = 280
+DEFAULT_WEIGHT = 200
+SCALE = 100
+TRANSFORMED_URL_LENGTH = 23
+_WEIGHT_100_RANGES = (
+    (0x0000, 0x10FF),
+    (0x2000, 0x200D),
+    (0x2010, 0x201F),
+    (0x2032, 0x2037),
+)
+
+# twitter-text と同じく URL は ASCII の印字可能文字だけで構成されるとみなす（直後の日本語を含めない）
+_URL_RE = re.compile(r"https?://[!-~]+")
+
+# 区切り位置のペナルティ（小さいほど区切りとして自然）
+PENALTY_PARAGRAPH = 0
+PENALTY_NEWLINE = 1
+PENALTY_SENTENCE = 2
+PENALTY_CLAUSE = 6
+PENALTY_SPACE = 10
+PENALTY_ANYWHERE = 60
+
+_SENTENCE_END = set("。！？!?．…")
+_CLOSING = set("」』）)】〉》\"'”’")
+_CLAUSE_END = set("、，,；;：:・")
+
+
+def _is_extend(ch):
+    cp = ord(ch)
+    return (
+        unicodedata.category(ch) in ("Mn", "Me", "Mc")
+        or 0xFE00 <= cp <= 0xFE0F
+        or 0xE0100 <= cp <= 0xE01EF
+        or 0x1F3FB <= cp <= 0x1F3FF
+        or 0xE0020 <= cp <= 0xE007F
+        or cp == 0x20E3
+    )
+
+
+def _is_regional_indicator(ch):
+    return 0x1F1E6 <= ord(ch) <= 0x1F1FF
+
+
+def _is_emoji_start(ch):
+    cp = ord(ch)
+    return (
+        0x1F000 <= cp <= 0x1FAFF
+        or 0x2600 <= cp <= 0x27BF
+        or 0x2B00 <= cp <= 0x2BFF
+        or cp in (0x00A9, 0x00AE, 0x203C, 0x2049, 0x2122, 0x2139, 0x3030, 0x303D)
+    )
+
+
+def iter_graphemes(text):
+    """
+    テキストを書記素クラスタ（見た目上の1文字）単位に分割する。
+    Unicode の拡張書記素クラスタの主要な規則（CRLF、結合文字、異体字セレクタ、
+    肌色修飾子、ZWJ 連結、国旗の地域指示子ペア、キーキャップ）に対応する。
+    Args:
+        text (str): 対象のテキスト。
+    Returns:
+        list: 書記素クラスタの文字列のリスト。
+    """
+    clusters = []
+    i = 0
+    n = len(text)
+    while i < n:
+        j = i + 1
+        if text[i] == "\r" and j < n and text[j] == "\n":
+            clusters.append("\r\n")
+            i = j + 1
+            continue
+        if _is_regional_indicator(text[i]) and j < n and _is_regional_indicator(text[j]):
+            j += 1
+        while j < n:
+            ch = text[j]
+            if _is_extend(ch):
+                j += 1
+            elif ch == "\u200d":
+                j += 1
+                if j < n:
+                    j += 1
+            else:
+                break
+        clusters.append(text[i:j])
+        i = j
+    return clusters
+
+
+def _code_point_weight(ch):
+    cp = ord(ch)
+    for start, end in _WEIGHT_100_RANGES:
+        if start <= cp <= end:
+            return 100
+    return DEFAULT_WEIGHT
+
+
+def _cluster_weight(cluster):
+    if _is_emoji_start(cluster[0]) or _is_regional_indicator(cluster[0]):
+        return DEFAULT_WEIGHT
+    return sum(_code_point_weight(ch) for ch in cluster)
+
+
+def _tokenize(text):
+    """テキストを (文字列, 重み) の単位に分ける。URL は1単位として扱う。"""
+    units = []
+    position = 0
+    for match in _URL_RE.finditer(text):
+        for cluster in iter_graphemes(text[position : match.start()]):
+            units.append((cluster, _cluster_weight(cluster)))
+        units.append((match.group(0), TRANSFORMED_URL_LENGTH * SCALE))
+        position = match.end()
+    for cluster in iter_graphemes(text[position:]):
+        units.append((cluster, _cluster_weight(cluster)))
+    return units
+
+
+def weighted_length(text):
+    """
+    Twitter の重み付き文字数を返す（280 が上限）。
+    Args:
+        text (str): 対象のテキスト。
+    Returns:
+        int: 重み付き文字数。
+    """
+    text = unicodedata.normalize("NFC", text)
+    return sum(weight for _, weight in _tokenize(text)) // SCALE
+
+
+def weighted_limit(char_limit):
+    """
+    全角文字数で指定された上限を重み付きの上限に換算する（全角1文字 = 2）。
+    Args:
+        char_limit (int): 1チャンクあたりの全角文字数。
+    Returns:
+        int: 重み付き文字数の上限（MAX_WEIGHTED_LENGTH を超えない）。
+    """
+    return min(MAX_WEIGHTED_LENGTH, char_limit * 2)
+
+
+def _break_penalty(units, index):
+    """units[index - 1] の直後で区切る場合のペナルティ。"""
+    previous = units[index - 1][0]
+    following = units[index][0] if index < len(units) else ""
+    if previous in ("\n", "\r\n"):
+        if following in ("\n", "\r\n"):
+            return PENALTY_NEWLINE
+        before = units[index - 2][0] if index >= 2 else ""
+        return PENALTY_PARAGRAPH if before in ("\n", "\r\n") else PENALTY_NEWLINE
+    last = previous[-1]
+    if last in _SENTENCE_END and following not in _SENTENCE_END | _CLOSING:
+        return PENALTY_SENTENCE
+    if last in _CLOSING and index >= 2 and units[index - 2][0][-1] in _SENTENCE_END:
+        return PENALTY_SENTENCE
+    if last == "." and (following.isspace() or not following):
+        return PENALTY_SENTENCE
+    if last in _CLAUSE_END:
+        return PENALTY_CLAUSE
+    if previous.isspace():
+        return PENALTY_SPACE
+    return PENALTY_ANYWHERE
+
+
+def split_for_twitter(text, max_weight=MAX_WEIGHTED_LENGTH):
+    """
+    重み付き文字数が max_weight 以下のチャンクに、チャンク数が最小になるよう分割する。
+    同じチャンク数の分割が複数ある場合は、文末・句読点など自然な位置で区切る方を選ぶ。
+    各チャンクの前後の空白は取り除き、空のチャンクは返さない。
+    Args:
+        text (str): 分割対象のテキスト。
+        max_weight (int, optional): 1チャンクあたりの重み付き文字数の上限。
+    Returns:
+        list: 分割されたテキストのリスト。
+    """
+    text = unicodedata.normalize("NFC", text).strip()
+    if not text:
+        return []
+    units = _tokenize(text)
+    n = len(units)
+    limit = max_weight * SCALE
+
+    # 累積重みと、各単位の前後の空白を除いた重みを計算するための準備
+    prefix = [0] * (n + 1)
+    for i, (_, weight) in enumerate(units):
+        prefix[i + 1] = prefix[i] + weight
+    # first_solid[i]: i 以降で最初の空白でない単位の位置
+    # solid_end[j]: j より前で最後の空白でない単位の直後の位置
+    first_solid = [n] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        first_solid[i] = first_solid[i + 1] if units[i][0].isspace() else i
+    solid_end = [0] * (n + 1)
+    for j in range(1, n + 1):
+        solid_end[j] = solid_end[j - 1] if units[j - 1][0].isspace() else j
+
+    def chunk_weight(start, end):
+        trimmed_start = first_solid[start]
+        trimmed_end = solid_end[end]
+        if trimmed_end <= trimmed_start:
+            return 0
+        return prefix[trimmed_end] - prefix[trimmed_start]
+
+    penalties = [0] * (n + 1)
+    for index in range(1, n):
+        penalties[index] = _break_penalty(units, index)
+
+    inf = (float("inf"), float("inf"))
+    best = [inf] * (n + 1)
+    previous_break = [0] * (n + 1)
+    best[0] = (0, 0)
+    for end in range(1, n + 1):
+        start = end - 1
+        # 後ろから start を広げ、上限を超えたら打ち切る
+        while start >= 0:
+            if chunk_weight(start, end) > limit:
+                break
+            if best[start] != inf:
+                count, penalty = best[start]
+                candidate = (count + 1, penalty + penalties[end])
+                if candidate < best[end]:
+                    best[end] = candidate
+                    previous_break[end] = start
+            start -= 1
+
+    if best[n] == inf:
+        raise ValueError("上限内に収まらない単位が含まれているため分割できません")
+
+    chunks = []
+    end = n
+    while end > 0:
+        start = previous_break[end]
+        chunk = "".join(unit for unit, _ in units[start:end]).strip()
+        if chunk:
+            chunks.append(chunk)
+        end = start
+    chunks.reverse()
+    return chunks
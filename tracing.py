@@ -0,0 +1,261 @@
+"""
+処理段階ごとの所要時間を JSON Lines で記録する軽量なトレース。
+
+実行（run）→ アカウント → 処理段階（login / fetch / upload / post ...）→ WebDriver・HTTP の呼び出し
+という入れ子のスパンを、終了時に1行1スパンの JSON として書き出す。
+
+    {"trace": "...", "span": "...", "parent": "...", "name": "post_tweet.login",
+     "start": 1700000000.123, "dur_ms": 5321.4, "status": "ok", "attrs": {"account": "..."}}
+
+環境変数 AUTO_POST_TRACE が設定されている場合のみ有効になる。
+    AUTO_POST_TRACE=1                    .cache/traces/<日付>.jsonl に書き出す
+    AUTO_POST_TRACE=/path/to/file.jsonl  指定したファイルに書き出す
+無効時の span() は共有の何もしないスパンを返すだけなので、計測のオーバーヘッドはほぼない。
+
+add_listener() で登録した関数には、ファイル出力の有無にかかわらず終了したスパンの記録が渡される
+（run_history.py が処理段階ごとの所要時間を集めるのに使う）。リスナーがある間はスパンも有効になる。
+
+run_full_posting.py から起動する子プロセスには AUTO_POST_TRACE_PARENT で親スパンを渡し、
+プロセスをまたいでも1つのトレースとしてつながるようにする。
+
+使用例:
+    with tracing.span("post_tweet.download", url=video_url) as sp:
+        ...
+        sp.add_bytes(len(chunk))
+"""
+
+import os
+import json
+import time
+import uuid
+import functools
+import threading
+import contextvars
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TRACE_DIR = os.path.join(SCRIPT_DIR, ".cache", "traces")
+TRACE_ENV = "AUTO_POST_TRACE"
+PARENT_ENV = "AUTO_POST_TRACE_PARENT"
+
+_current_span = contextvars.ContextVar("auto_post_current_span", default=None)
+_write_lock = threading.Lock()
+_state = {"enabled": None, "path": None}
+_listeners = []
+
+
+def _resolve_path(value):
+    if value in ("1", "true", "yes", "on"):
+        return os.path.join(DEFAULT_TRACE_DIR, time.strftime("%Y%m%d") + ".jsonl")
+    return value
+
+
+def configure(path=None, enabled=None):
+    """
+    トレースの出力先を設定する（省略時は環境変数 AUTO_POST_TRACE から決める）。
+    Args:
+        path (str, optional): 出力する JSON Lines ファイルのパス。
+        enabled (bool, optional): False を指定すると無効にする。
+    """
+    value = path or os.getenv(TRACE_ENV, "").strip()
+    _state["path"] = _resolve_path(value) if value else None
+    _state["enabled"] = bool(_state["path"]) if enabled is None else (enabled and bool(_state["path"]))
+
+
+def enabled():
+    """トレースが有効か。"""
+    if _state["enabled"] is None:
+        configure()
+    return _state["enabled"]
+
+
+def _active():
+    """スパンを作るか（ファイル出力が有効、またはリスナーが登録されている）。"""
+    return enabled() or bool(_listeners)
+
+
+def add_listener(listener):
+    """
+    終了したスパンの記録（dict）を受け取る関数を登録する。
+    Args:
+        listener (callable): listener(record) の形で呼ばれる。スパンを閉じたスレッドで呼ばれる。
+    """
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    """add_listener() で登録した関数を外す。"""
+    try:
+        _listeners.remove(listener)
+    except ValueError:
+        pass
+
+
+def _write(record):
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    path = _state["path"]
+    with _write_lock:
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError:
+            # 計測のために本処理を止めない
+            pass
+
+
+class Span:
+    """1つの処理区間。with 文で使い、終了時に1行書き出す。"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attrs", "start", "_t0", "_token", "status", "error")
+
+    def __init__(self, name, trace_id, parent_id, attrs):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.status = "ok"
+        self.error = None
+
+    def set(self, **attrs):
+        """属性を追加する（結果の件数、ページIDなど）。"""
+        self.attrs.update(attrs)
+        return self
+
+    def add_bytes(self, count):
+        """送受信したバイト数を加算する。"""
+        self.attrs["bytes"] = self.attrs.get("bytes", 0) + count
+
+    def fail(self, error=None):
+        """例外を投げずに失敗として記録する（戻り値で失敗を返す関数用）。"""
+        self.status = "error"
+        if error is not None:
+            self.error = str(error)[:300]
+
+    def __enter__(self):
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_ms = (time.perf_counter() - self._t0) * 1000
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.status = "error"
+            self.error = f"{exc_type.__name__}: {exc}"[:300]
+        record = {
+            "trace": self.trace_id,
+            "span": self.span_id,
+            "parent": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 3),
+            "dur_ms": round(duration_ms, 1),
+            "status": self.status,
+            "pid": os.getpid(),
+        }
+        if self.error:
+            record["error"] = self.error
+        if self.attrs:
+            record["attrs"] = self.attrs
+        if _state["enabled"]:
+            _write(record)
+        for listener in list(_listeners):
+            try:
+                listener(record)
+            except Exception:
+                # 計測のために本処理を止めない
+                pass
+        return False
+
+
+class _NoopSpan:
+    """無効時に返す何もしないスパン。"""
+
+    __slots__ = ()
+
+    def set(self, **attrs):
+        return self
+
+    def add_bytes(self, count):
+        pass
+
+    def fail(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _parent_from_env():
+    value = os.getenv(PARENT_ENV, "")
+    if ":" in value:
+        trace_id, span_id = value.split(":", 1)
+        return trace_id, span_id
+    return None, None
+
+
+def span(name, **attrs):
+    """
+    スパンを作る。現在のスパンがあればその子に、なければ新しいトレースの起点になる。
+    Args:
+        name (str): スパン名（"<スクリプト>.<処理段階>" の形にする）。
+        **attrs: 記録する属性。
+    Returns:
+        Span: with 文で使うスパン。無効時は NOOP_SPAN。
+    """
+    if not _active():
+        return NOOP_SPAN
+    parent = _current_span.get()
+    if parent is not None:
+        return Span(name, parent.trace_id, parent.span_id, attrs)
+    trace_id, parent_id = _parent_from_env()
+    return Span(name, trace_id or uuid.uuid4().hex, parent_id, attrs)
+
+
+def traced(name=None):
+    """
+    関数全体をスパンで囲むデコレーター。
+    Args:
+        name (str, optional): スパン名。省略時は "<モジュール>.<関数名>"。
+    """
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _active():
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def current_span():
+    """現在のスパン（なければ NOOP_SPAN）を返す。"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def child_env(env=None):
+    """
+    子プロセスに渡す環境変数を返す。現在のスパンを親として引き継ぐ。
+    Args:
+        env (dict, optional): 元にする環境変数。省略時は os.environ。
+    Returns:
+        dict: 環境変数。
+    """
+    env = dict(os.environ if env is None else env)
+    current = _current_span.get()
+    if enabled() and current is not None:
+        env[TRACE_ENV] = _state["path"]
+        env[PARENT_ENV] = f"{current.trace_id}:{current.span_id}"
+    return env
@@ -0,0 +1,221 @@
+"""
+アカウントごとの Twitter API クライアント（v1.1 の tweepy.API と v2 の tweepy.Client）を
+プロセス内で使い回すためのレジストリ。
+
+クライアントは1プロセスにつき1回だけ生成し、全アカウントで1つの HTTP セッション
+（コネクションプール）を共有する。verify_credentials() の結果は TTL 付きで
+.cache/twitter_verify.json に保存するため、実行ごとに認証確認の通信が発生しない。
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+import requests
+import tweepy
+from requests.adapters import HTTPAdapter
+
+from rate_limit_ledger import get_rate_limit_ledger
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_VERIFY_CACHE_PATH = os.path.join(SCRIPT_DIR, ".cache", "twitter_verify.json")
+# 認証確認結果の有効期間（秒）
+VERIFY_TTL = 6 * 60 * 60
+POOL_MAXSIZE = 20
+
+REQUIRED_V1_KEYS = ("consumer_key", "consumer_secret", "access_token", "access_token_secret")
+
+
+def credential_key(twitter_api_config):
+    """
+    認証情報を識別するキーを返す。秘密鍵は含めず、ハッシュ化した値だけを使う。
+    Args:
+        twitter_api_config (dict): consumer_key, access_token などを含む設定。
+    Returns:
+        str: キャッシュ用のキー。
+    """
+    raw = f"{twitter_api_config.get('consumer_key')}:{twitter_api_config.get('access_token')}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class TwitterClientRegistry:
+    """アカウントごとの API クライアントと認証確認結果をキャッシュする。"""
+
+    def __init__(self, verify_ttl=VERIFY_TTL, cache_path=DEFAULT_VERIFY_CACHE_PATH):
+        self.verify_ttl = verify_ttl
+        self.cache_path = cache_path
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+        self.session.mount("https://", adapter)
+        # 辞書の読み書きだけを守る。認証確認の通信は認証情報ごとのロックで行う
+        self._lock = threading.RLock()
+        self._key_locks = {}
+        self._v1_clients = {}
+        self._v2_clients = {}
+        self._account_keys = {}
+        self._verified = self._load_verify_cache()
+
+    def _load_verify_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save_verify_cache(self):
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._verified, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"認証確認キャッシュの保存に失敗しました ({self.cache_path}): {e}")
+
+    def _is_verified(self, key):
+        entry = self._verified.get(key)
+        return bool(entry) and time.time() - entry.get("checked_at", 0) < self.verify_ttl
+
+    def _lock_for(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def account_for_access_token(self, access_token):
+        """アクセストークンから登録済みのアカウント名を引く（レスポンスの振り分け用）。"""
+        with self._lock:
+            return self._account_keys.get(access_token)
+
+    def get_v1(self, account, twitter_api_config, verify=True):
+        """
+        v1.1 の tweepy.API を返す。初回（または TTL 切れ）のみ verify_credentials() を呼ぶ。
+        Args:
+            account (str): アカウント名（ログ・キャッシュ用）。
+            twitter_api_config (dict): 認証情報。
+            verify (bool, optional): 認証確認を行うか。
+        Returns:
+            tweepy.API or None: 認証情報不足や認証失敗の場合はNone。
+        """
+        if not all(twitter_api_config.get(k) for k in REQUIRED_V1_KEYS):
+            logger.error(f"[{account}] Twitter API (v1.1) の認証情報が不足しています。")
+            return None
+        key = credential_key(twitter_api_config)
+        with self._lock:
+            api = self._v1_clients.get(key)
+            if api is None:
+                auth = tweepy.OAuth1UserHandler(
+                    *(twitter_api_config.get(k) for k in REQUIRED_V1_KEYS)
+                )
+                api = tweepy.API(auth=auth)
+                api.session = self.session
+                self._v1_clients[key] = api
+                self._account_keys[twitter_api_config.get("access_token")] = account
+        if not verify:
+            return api
+
+        # 同じ認証情報の確認は1回にまとめ、他のアカウントの取得やレスポンスの記録は待たせない
+        with self._lock_for(key):
+            with self._lock:
+                if self._is_verified(key):
+                    return api
+            error = None
+            try:
+                user = api.verify_credentials()
+            except tweepy.TweepyException as e:
+                user, error = None, e
+            if not user:
+                detail = f": {error}" if error else "。"
+                logger.error(f"[{account}] Twitter API v1.1 クライアントの認証に失敗しました{detail}")
+            with self._lock:
+                if not user:
+                    self._v1_clients.pop(key, None)
+                    return None
+                self._verified[key] = {
+                    "account": account,
+                    "screen_name": getattr(user, "screen_name", None),
+                    "checked_at": time.time(),
+                }
+                self._save_verify_cache()
+        logger.info(f"[{account}] Twitter API v1.1 クライアントの認証に成功しました。")
+        return api
+
+    def get_v2(self, account, twitter_api_config):
+        """
+        v2 の tweepy.Client を返す。同じ認証情報には同じインスタンスを返す。
+        Args:
+            account (str): アカウント名。
+            twitter_api_config (dict): 認証情報。
+        Returns:
+            tweepy.Client or None: 作成に失敗した場合はNone。
+        """
+        key = credential_key(twitter_api_config)
+        with self._lock:
+            client = self._v2_clients.get(key)
+            if client is not None:
+                return client
+            try:
+                client = tweepy.Client(
+                    bearer_token=twitter_api_config.get("bearer_token"),
+                    consumer_key=twitter_api_config.get("consumer_key"),
+                    consumer_secret=twitter_api_config.get("consumer_secret"),
+                    access_token=twitter_api_config.get("access_token"),
+                    access_token_secret=twitter_api_config.get("access_token_secret"),
+                )
+            except Exception as e:
+                logger.error(f"[{account}] Twitter API v2 クライアントの作成に失敗: {e}", exc_info=True)
+                return None
+            client.session = self.session
+            self._v2_clients[key] = client
+            self._account_keys[twitter_api_config.get("access_token")] = account
+            return client
+
+    def get_clients(self, account, twitter_api_config):
+        """
+        v1.1 と v2 のクライアントをまとめて返す。
+        Returns:
+            tuple: (tweepy.API or None, tweepy.Client or None)
+        """
+        if not twitter_api_config:
+            logger.error(f"[{account}] twitter_api の設定がありません。")
+            return None, None
+        return (
+            self.get_v1(account, twitter_api_config),
+            self.get_v2(account, twitter_api_config),
+        )
+
+    def invalidate(self, twitter_api_config):
+        """認証情報が変わった・失効した場合にキャッシュを破棄する。"""
+        key = credential_key(twitter_api_config)
+        with self._lock:
+            self._v1_clients.pop(key, None)
+            self._v2_clients.pop(key, None)
+            if self._verified.pop(key, None) is not None:
+                self._save_verify_cache()
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_client_registry():
+    """プロセス内で共有するデフォルトのレジストリを返す。"""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = TwitterClientRegistry()
+            # 全レスポンスのレート制限ヘッダーをアカウント別に台帳へ記録する
+            _default_registry.session.hooks["response"].append(
+                get_rate_limit_ledger().make_response_hook(
+                    _default_registry.account_for_access_token
+                )
+            )
+        return _default_registry
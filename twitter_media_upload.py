@@ -0,0 +1,254 @@
+"""
+Twitter API (v1.1) のチャンクアップロード（INIT / APPEND / FINALIZE / STATUS）を行うモジュール。
+
+ファイルはメモリマップしたバッファから固定サイズのチャンク単位で送信し、
+APPEND は上限付きの並列数で実行する。送信済みのセグメントはファイル内容のハッシュをキーに
+.cache/media_uploads/ に記録するため、途中で失敗しても次回（ダウンロードし直して
+パスや更新日時が変わった場合も）は media_id を再利用して残りのセグメントから再開できる。
+FINALIZE 後はサーバーが返す check_after_secs に従って STATUS をポーリングし、
+処理が完了（succeeded）した media_id だけを返す。
+"""
+
+import os
+import json
+import mmap
+import time
+import hashlib
+import logging
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STATE_DIR = os.path.join(SCRIPT_DIR, ".cache", "media_uploads")
+
+# APIの上限はセグメントあたり5MB
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+MAX_CHUNK_SIZE = 5 * 1024 * 1024
+DEFAULT_MAX_WORKERS = 3
+SEGMENT_RETRIES = 4
+PROCESSING_TIMEOUT = 600
+# 画像はこのサイズ以下なら単発アップロードで済ませる
+SIMPLE_UPLOAD_MAX_BYTES = 5 * 1024 * 1024
+
+
+class MediaUploadError(Exception):
+    """メディアのアップロードまたはサーバー側の処理に失敗したことを表す。"""
+
+
+def media_category_for(mime_type):
+    """
+    MIMEタイプから media_category を決める。
+    Args:
+        mime_type (str): MIMEタイプ。
+    Returns:
+        str: "tweet_video" / "tweet_gif" / "tweet_image" のいずれか。
+    """
+    if mime_type and mime_type.startswith("video/"):
+        return "tweet_video"
+    if mime_type == "image/gif":
+        return "tweet_gif"
+    return "tweet_image"
+
+
+class ChunkedMediaUploader:
+    """
+    tweepy.API を使ってチャンクアップロードを行うクラス。
+
+    使用例:
+        uploader = ChunkedMediaUploader(api_v1)
+        media_id = uploader.upload("video.mp4")
+    """
+
+    def __init__(self, api, chunk_size=DEFAULT_CHUNK_SIZE, max_workers=DEFAULT_MAX_WORKERS,
+                 state_dir=DEFAULT_STATE_DIR, processing_timeout=PROCESSING_TIMEOUT):
+        if chunk_size > MAX_CHUNK_SIZE:
+            raise ValueError(f"chunk_size は {MAX_CHUNK_SIZE} バイト以下にしてください")
+        self.api = api
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.state_dir = state_dir
+        self.processing_timeout = processing_timeout
+        self._state_lock = threading.Lock()
+
+    # --- 再開用の状態ファイル ---
+
+    def _state_path(self, media_path, size):
+        # 投稿のたびにダウンロードし直すため、パスや更新日時ではなく内容で同じファイルかを判断する
+        digest = hashlib.sha1(str(size).encode("utf-8"))
+        with open(media_path, "rb") as f:
+            for block in iter(lambda: f.read(self.chunk_size), b""):
+                digest.update(block)
+        return os.path.join(self.state_dir, f"{digest.hexdigest()}.json")
+
+    def _load_state(self, path):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # media_id の有効期限切れ、またはチャンクサイズが変わった場合は最初からやり直す
+        if state.get("expires_at", 0) <= time.time() + 60:
+            return None
+        if state.get("chunk_size") != self.chunk_size:
+            return None
+        return state
+
+    def _save_state(self, path, state):
+        with self._state_lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+
+    @staticmethod
+    def _clear_state(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # --- アップロード本体 ---
+
+    def upload(self, media_path, mime_type=None, media_category=None):
+        """
+        メディアをアップロードし、処理完了後の media_id を返す。
+        Args:
+            media_path (str): アップロードするファイルのパス。
+            mime_type (str, optional): MIMEタイプ。省略時は拡張子から推測する。
+            media_category (str, optional): 省略時はMIMEタイプから決める。
+        Returns:
+            str: 添付可能になった media_id。
+        Raises:
+            MediaUploadError: アップロードまたはサーバー側の処理に失敗した場合。
+        """
+        mime_type = mime_type or mimetypes.guess_type(media_path)[0] or "application/octet-stream"
+        media_category = media_category or media_category_for(mime_type)
+        size = os.path.getsize(media_path)
+        if size == 0:
+            raise MediaUploadError(f"空のファイルはアップロードできません: {media_path}")
+
+        if media_category == "tweet_image" and size <= SIMPLE_UPLOAD_MAX_BYTES:
+            try:
+                media = self.api.media_upload(filename=media_path, media_category=media_category)
+            except Exception as e:
+                raise MediaUploadError(f"画像のアップロードに失敗しました: {e}") from e
+            return media.media_id_string
+
+        state_path = self._state_path(media_path, size)
+        state = self._load_state(state_path)
+        total_segments = (size + self.chunk_size - 1) // self.chunk_size
+
+        if state:
+            logger.info(
+                f"前回のアップロードを再開します: media_id={state['media_id']} "
+                f"({len(state['done_segments'])}/{total_segments} セグメント送信済み)"
+            )
+        else:
+            try:
+                init = self.api.chunked_upload_init(
+                    size, mime_type, media_category=media_category
+                )
+            except Exception as e:
+                raise MediaUploadError(f"INIT に失敗しました: {e}") from e
+            expires_after = getattr(init, "expires_after_secs", None) or 86400
+            state = {
+                "media_id": init.media_id_string,
+                "chunk_size": self.chunk_size,
+                "total_segments": total_segments,
+                "done_segments": [],
+                "finalized": False,
+                "expires_at": time.time() + expires_after,
+            }
+            self._save_state(state_path, state)
+
+        media_id = state["media_id"]
+        if not state["finalized"]:
+            self._append_segments(media_path, size, state, state_path)
+            try:
+                finalize = self.api.chunked_upload_finalize(media_id)
+            except Exception as e:
+                raise MediaUploadError(f"FINALIZE に失敗しました: {e}") from e
+            state["finalized"] = True
+            self._save_state(state_path, state)
+            processing_info = getattr(finalize, "processing_info", None)
+        else:
+            processing_info = {"state": "pending", "check_after_secs": 0}
+
+        self._wait_for_processing(media_id, processing_info)
+        self._clear_state(state_path)
+        return media_id
+
+    def _append_segments(self, media_path, size, state, state_path):
+        done = set(state["done_segments"])
+        pending = [i for i in range(state["total_segments"]) if i not in done]
+        if not pending:
+            return
+
+        with open(media_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+
+            def send(segment_index):
+                start = segment_index * self.chunk_size
+                chunk = buffer[start : min(start + self.chunk_size, size)]
+                delay = 1.0
+                for attempt in range(1, SEGMENT_RETRIES + 1):
+                    try:
+                        self.api.chunked_upload_append(state["media_id"], chunk, segment_index)
+                        return segment_index
+                    except Exception as e:
+                        if attempt == SEGMENT_RETRIES:
+                            raise MediaUploadError(
+                                f"APPEND (segment {segment_index}) に失敗しました: {e}"
+                            ) from e
+                        logger.warning(
+                            f"APPEND (segment {segment_index}) 失敗 ({attempt}/{SEGMENT_RETRIES})。"
+                            f"{delay:.0f}秒後に再試行します: {e}"
+                        )
+                        time.sleep(delay)
+                        delay *= 2
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(send, i) for i in pending]
+                for future in as_completed(futures):
+                    # 失敗したセグメントがあっても、成功した分は記録して次回の再開に使う
+                    try:
+                        segment_index = future.result()
+                    except MediaUploadError:
+                        for other in futures:
+                            other.cancel()
+                        raise
+                    with self._state_lock:
+                        state["done_segments"].append(segment_index)
+                    self._save_state(state_path, state)
+
+    def _wait_for_processing(self, media_id, processing_info):
+        deadline = time.monotonic() + self.processing_timeout
+        while processing_info:
+            processing_state = processing_info.get("state")
+            if processing_state == "succeeded":
+                return
+            if processing_state == "failed":
+                error = processing_info.get("error", {})
+                raise MediaUploadError(
+                    f"メディアの処理に失敗しました: {error.get('name')} {error.get('message')}"
+                )
+            wait = processing_info.get("check_after_secs", 1)
+            if time.monotonic() + wait > deadline:
+                raise MediaUploadError(
+                    f"メディアの処理が {self.processing_timeout} 秒以内に完了しませんでした"
+                )
+            logger.info(
+                f"メディア処理中 (state={processing_state}, "
+                f"progress={processing_info.get('progress_percent')}%)。{wait}秒後に確認します。"
+            )
+            time.sleep(wait)
+            try:
+                status = self.api.get_media_upload_status(media_id)
+            except Exception as e:
+                raise MediaUploadError(f"STATUS の取得に失敗しました: {e}") from e
+            processing_info = getattr(status, "processing_info", None)
@@ -0,0 +1,179 @@
+"""
+投稿画面でのメディアアップロード完了を検知するモニター。
+
+固定秒数の sleep の代わりに、投稿画面の状態（添付プレビューの有無、進捗バー、
+送信ボタンの活性状態）と upload.twitter.com / upload.x.com へのリクエスト
+（Resource Timing の記録）をまとめてポーリングし、メディアの準備ができた時点で戻る。
+観測したアップロード時間は .cache/upload_metrics.jsonl に記録する。
+"""
+
+import os
+import json
+import time
+import datetime
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_METRICS_PATH = os.path.join(SCRIPT_DIR, ".cache", "upload_metrics.jsonl")
+
+# ファイルサイズからタイムアウトを決める際の想定スループット（バイト/秒）と上下限
+ASSUMED_THROUGHPUT = 256 * 1024
+MIN_TIMEOUT = 30
+MAX_TIMEOUT = 600
+
+UploadResult = namedtuple(
+    "UploadResult", ["ready", "elapsed", "progress", "upload_requests", "state"]
+)
+
+# 投稿画面のアップロード状態を1回のJS実行でまとめて取得するスクリプト
+_UPLOAD_STATE_SCRIPT = """
+var attachments = document.querySelector('[data-testid="attachments"]');
+var hasMedia = !!(attachments && attachments.querySelector('img, video'));
+var progressBar = (attachments && attachments.querySelector('[role="progressbar"]'))
+    || document.querySelector('[role="progressbar"][aria-valuenow]');
+var progress = null;
+if (progressBar) {
+    var now = parseFloat(progressBar.getAttribute('aria-valuenow'));
+    var max = parseFloat(progressBar.getAttribute('aria-valuemax') || '100');
+    if (!isNaN(now) && max > 0) { progress = now / max; }
+}
+var processing = false;
+if (attachments) {
+    var label = attachments.innerText || '';
+    processing = /\\d+%|処理中|アップロード中|Uploading|Processing/i.test(label);
+}
+var button = document.querySelector(
+    '[data-testid="tweetButton"], [data-testid="tweetButtonInline"]');
+var buttonEnabled = !!button
+    && !(button.disabled || button.getAttribute('aria-disabled') === 'true');
+var uploads = 0, finalized = false;
+try {
+    var entries = performance.getEntriesByType('resource');
+    for (var i = 0; i < entries.length; i++) {
+        var name = entries[i].name;
+        if (/upload\\.(twitter|x)\\.com/.test(name)) {
+            uploads++;
+            if (/command=FINALIZE/.test(name)) { finalized = true; }
+        }
+    }
+} catch (e) {}
+return {
+    has_media: hasMedia,
+    progress_bar: !!progressBar,
+    progress: progress,
+    processing: processing,
+    button_enabled: buttonEnabled,
+    upload_requests: uploads,
+    finalized: finalized
+};
+"""
+
+
+def timeout_for_file(media_path):
+    """
+    ファイルサイズから妥当な待機上限（秒）を見積もる。
+    Args:
+        media_path (str): メディアファイルのパス。
+    Returns:
+        float: タイムアウト秒数。
+    """
+    try:
+        size = os.path.getsize(media_path)
+    except OSError:
+        return MIN_TIMEOUT
+    return max(MIN_TIMEOUT, min(MAX_TIMEOUT, 15 + size / ASSUMED_THROUGHPUT))
+
+
+def is_media_ready(state):
+    """
+    状態dictからメディアの準備が完了しているかを判定する。
+    添付プレビューがあり、進捗表示が消え、送信ボタンが有効になっていれば完了とみなす。
+    """
+    if not state:
+        return False
+    return (
+        state.get("has_media")
+        and not state.get("progress_bar")
+        and not state.get("processing")
+        and state.get("button_enabled")
+    )
+
+
+def wait_for_media_ready(driver, media_path=None, timeout=None, poll_interval=0.25,
+                         metrics_path=DEFAULT_METRICS_PATH):
+    """
+    メディアのアップロードと処理が完了するまで投稿画面の状態をポーリングする。
+    Args:
+        driver (selenium.webdriver.chrome.webdriver.WebDriver): WebDriverインスタンス。
+        media_path (str, optional): アップロードしたファイルのパス（タイムアウト見積もりと記録用）。
+        timeout (float, optional): 最大待機秒数。省略時はファイルサイズから見積もる。
+        poll_interval (float, optional): ポーリング間隔（秒）。
+        metrics_path (str, optional): 計測結果を追記するJSONLファイル。Noneなら記録しない。
+    Returns:
+        UploadResult: ready, elapsed（秒）, progress, upload_requests, state。
+    """
+    if timeout is None:
+        timeout = timeout_for_file(media_path) if media_path else MIN_TIMEOUT
+
+    started = time.monotonic()
+    deadline = started + timeout
+    state = None
+    last_progress = None
+    while True:
+        try:
+            state = driver.execute_script(_UPLOAD_STATE_SCRIPT)
+        except Exception as e:
+            logger.debug(f"アップロード状態の取得に失敗: {e}")
+            state = None
+        if state and state.get("progress") is not None:
+            last_progress = state["progress"]
+        if is_media_ready(state):
+            break
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(poll_interval)
+
+    elapsed = time.monotonic() - started
+    result = UploadResult(
+        ready=bool(is_media_ready(state)),
+        elapsed=elapsed,
+        progress=last_progress,
+        upload_requests=(state or {}).get("upload_requests", 0),
+        state=state,
+    )
+    if metrics_path:
+        record_upload_metric(result, media_path, metrics_path)
+    return result
+
+
+def record_upload_metric(result, media_path=None, metrics_path=DEFAULT_METRICS_PATH):
+    """
+    アップロード計測結果をJSONLファイルに1行追記する。
+    Args:
+        result (UploadResult): wait_for_media_ready の結果。
+        media_path (str, optional): アップロードしたファイルのパス。
+        metrics_path (str, optional): 追記先のファイル。
+    """
+    size = None
+    if media_path:
+        try:
+            size = os.path.getsize(media_path)
+        except OSError:
+            size = None
+    record = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "file": os.path.basename(media_path) if media_path else None,
+        "bytes": size,
+        "ready": result.ready,
+        "elapsed_sec": round(result.elapsed, 3),
+        "upload_requests": result.upload_requests,
+    }
+    try:
+        os.makedirs(os.path.dirname(metrics_path), exist_ok=True)
+        with open(metrics_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logger.warning(f"アップロード計測結果の記録に失敗しました ({metrics_path}): {e}")